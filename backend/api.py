@@ -2,7 +2,10 @@ from flask import Flask
 from flask_cors import CORS
 from flask import Flask, jsonify
 
-from database import close_db
+import os
+
+from database import close_db, driver
+from fuzzy_compiler import ensure_indexes, warm_up_plans
 from routes.search import search_routes
 from routes.collections import collections_routes
 from routes.neo4j_queries import neo4j_routes
@@ -34,12 +37,43 @@ app.register_blueprint(script_routes, url_prefix="/scripts")
 app.register_blueprint(files_routes, url_prefix="/files")
 print(app.url_map)  # 🔥 Affiche toutes les routes de Flask
 
+# ============================= Index de la BDD =============================#
+def create_indexes():
+    """ Crée les index des requêtes floues (désactivable avec NEO4J_CREATE_INDEXES=0) """
+    if os.environ.get("NEO4J_CREATE_INDEXES", "1") != "0":
+        ensure_indexes(driver)
+
+@app.cli.command("create-indexes")
+def create_indexes_command():
+    """ Crée les index des requêtes floues (étape de déploiement) : flask --app api create-indexes """
+    ensure_indexes(driver)
+
+# ============================= Warm-up des plans =============================#
+def warm_up():
+    """ Met en cache les plans des requêtes courantes avant les premières recherches (désactivable avec FUZZY_WARMUP=0) """
+    if os.environ.get("FUZZY_WARMUP", "1") != "0":
+        warm_up_plans(driver)
+
+@app.cli.command("warm-up")
+def warm_up_command():
+    """ Met en cache les plans des requêtes courantes : flask --app api warm-up """
+    warm_up_plans(driver)
+
+# ============================= Démarrage =============================#
+def startup():
+    """ Étapes à exécuter une seule fois avant de servir : index, puis warm-up des plans """
+    create_indexes()
+    warm_up()
+
 # ============================= Gestion propre de la BDD =============================#
 @app.teardown_appcontext
 def shutdown_session(exception=None):
-    """ Ferme proprement la connexion à la BDD """
-    close_db()
+    """ Ferme la session de la requête (le driver et son pool restent ouverts jusqu'à l'arrêt du process) """
+    close_db(exception)
 
 # ============================= Lancer l'API =============================#
 if __name__ == '__main__':
+    # Sous le reloader de debug, seul le process enfant sert les requêtes : le démarrage n'a lieu qu'une fois
+    if not app.debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        startup()
     app.run(debug=True, port=5000)
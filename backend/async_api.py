@@ -0,0 +1,81 @@
+# async_api.py
+# ⚡ Variante asynchrone de `api.py` : mêmes blueprints et mêmes URLs, servis par Quart sur une boucle d'événements,
+# avec le driver asynchrone de Neo4j. Une requête lente n'occupe plus un thread : elle attend la base sans bloquer les autres.
+#
+# Lancement : hypercorn async_api:app --bind 0.0.0.0:5000   (ou `python async_api.py` en développement)
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from neo4j import GraphDatabase
+from quart import Quart, jsonify
+from quart_cors import cors
+
+from db_config import NEO4J_URI, NEO4J_USER, read_password
+from async_database import init_driver, close_driver, close_db
+from fuzzy_compiler import ensure_indexes, warm_up_plans
+from async_routes.search import search_routes
+from async_routes.collections import collections_routes
+from async_routes.neo4j_queries import neo4j_routes
+from async_routes.scripts import script_routes
+from async_routes.files import files_routes
+
+# Nombre de threads pour le classement des résultats (calcul des degrés)
+RANKING_WORKERS = int(os.environ.get("RANKING_WORKERS", os.cpu_count() or 4))
+
+# ============================= Init Quart =============================#
+app = Quart(__name__)
+app = cors(app, allow_origin="*")  # ✅ Autorise toutes les requêtes CORS
+
+@app.errorhandler(403)
+async def forbidden(error):
+    return jsonify({"error": "403 Forbidden - Accès refusé"}), 403
+
+# ============================= Enregistrement des Routes =============================#
+app.register_blueprint(search_routes, url_prefix="/search")
+app.register_blueprint(collections_routes, url_prefix="/collections")
+app.register_blueprint(neo4j_routes, url_prefix="/neo4j")
+app.register_blueprint(script_routes, url_prefix="/scripts")
+app.register_blueprint(files_routes, url_prefix="/files")
+
+# ============================= Cycle de vie du driver =============================#
+@app.before_serving
+async def startup():
+    """ Crée le driver (et son pool) dans la boucle d'événements du serveur, et l'exécuteur du classement """
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(RANKING_WORKERS, thread_name_prefix="ranking"))
+    await init_driver()
+
+    # Création des index et warm-up des plans (mêmes étapes que `api.startup`)
+    create_indexes = os.environ.get("NEO4J_CREATE_INDEXES", "1") != "0"
+    warm_up = os.environ.get("FUZZY_WARMUP", "1") != "0"
+    if create_indexes or warm_up:
+        await loop.run_in_executor(None, run_startup_steps, create_indexes, warm_up)
+
+def run_startup_steps(create_indexes, warm_up):
+    """
+    Crée les index et met en cache les plans avec un driver synchrone temporaire, fermé ensuite
+    (le cache de plans est celui du serveur, partagé avec le driver asynchrone).
+    """
+    sync_driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, read_password()))
+    try:
+        if create_indexes:
+            ensure_indexes(sync_driver)
+        if warm_up:
+            warm_up_plans(sync_driver)
+    finally:
+        sync_driver.close()
+
+@app.after_serving
+async def shutdown():
+    """ Ferme le driver à l'arrêt du serveur """
+    await close_driver()
+
+@app.teardown_appcontext
+async def shutdown_session(exception=None):
+    """ Ferme la session de la requête (le driver et son pool restent ouverts) """
+    await close_db(exception)
+
+# ============================= Lancer l'API =============================#
+if __name__ == '__main__':
+    app.run(debug=True, port=5000)
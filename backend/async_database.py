@@ -0,0 +1,101 @@
+# async_database.py
+from neo4j import AsyncGraphDatabase
+from quart import g
+import time
+
+# Mêmes réglages que le driver synchrone (variables d'environnement NEO4J_*)
+from db_config import (
+    NEO4J_URI, NEO4J_USER, NEO4J_MAX_POOL_SIZE, NEO4J_ACQUISITION_TIMEOUT, NEO4J_CONNECTION_TIMEOUT,
+    NEO4J_LIVENESS_CHECK, NEO4J_MAX_CONNECTION_LIFETIME, PoolMetrics, read_password,
+)
+
+
+class AsyncPoolMetrics(PoolMetrics):
+    """ 📊 `PoolMetrics` pour le pool du driver asynchrone (acquisition et ouverture des connexions sont des coroutines) """
+
+    def instrument(self, driver):
+        pool = getattr(driver, "_pool", None)
+        if pool is None or not callable(getattr(pool, "acquire", None)) or not callable(getattr(pool, "opener", None)):
+            return
+
+        acquire, opener = pool.acquire, pool.opener
+
+        async def timed_acquire(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                connection = await acquire(*args, **kwargs)
+            except Exception:
+                self._record_acquisition((time.perf_counter() - start) * 1000, failed=True)
+                raise
+            self._record_acquisition((time.perf_counter() - start) * 1000)
+            return connection
+
+        async def counted_opener(*args, **kwargs):
+            try:
+                connection = await opener(*args, **kwargs)
+            except Exception:
+                with self._lock:
+                    self.connection_failures += 1
+                raise
+            with self._lock:
+                self.connections_created += 1
+            return connection
+
+        pool.acquire = timed_acquire
+        pool.opener = counted_opener
+        self.instrumented = True
+
+    def snapshot(self, driver):
+        # Le pool asynchrone n'est modifié que depuis la boucle d'événements : pas de verrou à prendre
+        pool = getattr(driver, "_pool", None)
+        servers = self.occupancy(pool) if getattr(pool, "connections", None) is not None else {}
+        return self._report(servers)
+
+
+# Driver asynchrone : créé au démarrage du serveur (il doit l'être dans la boucle d'événements qui l'utilise)
+driver = None
+pool_metrics = AsyncPoolMetrics()
+
+
+async def init_driver():
+    """ Crée le driver asynchrone (un seul pour tout le process) """
+    global driver
+    if driver is None:
+        driver = AsyncGraphDatabase.driver(
+            NEO4J_URI,
+            auth=(NEO4J_USER, read_password()),
+            max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+            connection_acquisition_timeout=NEO4J_ACQUISITION_TIMEOUT,
+            connection_timeout=NEO4J_CONNECTION_TIMEOUT,
+            liveness_check_timeout=NEO4J_LIVENESS_CHECK,
+            max_connection_lifetime=NEO4J_MAX_CONNECTION_LIFETIME,
+        )
+        pool_metrics.instrument(driver)
+    return driver
+
+
+async def close_driver():
+    """ Ferme le driver (et toutes les connexions du pool) à l'arrêt du serveur """
+    global driver
+    if driver is not None:
+        await driver.close()
+        driver = None
+
+
+def get_db():
+    """ Retourne la session Neo4j asynchrone de la requête HTTP en cours (créée au premier appel, fermée par `close_db`) """
+    if "neo4j_session" not in g:
+        g.neo4j_session = driver.session()
+    return g.neo4j_session
+
+
+async def close_db(exception=None):
+    """ Ferme la session de la requête en cours : la connexion retourne dans le pool, le driver reste ouvert """
+    session = g.pop("neo4j_session", None)
+    if session is not None:
+        await session.close()
+
+
+def get_pool_metrics():
+    """ Occupation et compteurs du pool de connexions """
+    return pool_metrics.snapshot(driver)
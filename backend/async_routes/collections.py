@@ -0,0 +1,41 @@
+from quart import Blueprint, request, jsonify
+from async_database import get_db  # ✅ Session Neo4j asynchrone de la requête
+import os
+
+collections_routes = Blueprint("collections", __name__)
+
+DATA_PATH = os.path.join(os.getcwd(), "data")  # 📂 `/backend/data/`
+
+@collections_routes.route("/", methods=["GET"])
+async def get_collections():
+    try:
+        query = "MATCH (s:Score) RETURN DISTINCT s.collection"
+        result = await get_db().run(query)
+        authors = [record["s.collection"] async for record in result]
+
+        response = jsonify({"authors": authors})
+        response.headers["Access-Control-Allow-Origin"] = "*"
+        return response
+    except Exception as e:
+        print(f"❌ Erreur /collections: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@collections_routes.route("/getCollectionByAuthor", methods=["GET"])
+async def get_collection_by_author():
+    author = request.args.get("author")
+    if not author:
+        return jsonify({"error": "Author parameter is required"}), 400
+
+    author_folder = os.path.normpath(os.path.join(DATA_PATH, author, "svg"))
+
+    if not os.path.exists(author_folder):
+        return jsonify({"error": f"Author SVG folder not found: {author_folder}"}), 404
+
+    svg_files = [
+        {"collection": author, "source": f"/data/{author}/svg/{file}"}
+        for file in os.listdir(author_folder)
+        if file.endswith(".svg")
+    ]
+
+    return jsonify({"results": svg_files})
@@ -0,0 +1,15 @@
+from quart import Blueprint, send_from_directory, abort
+import os
+
+files_routes = Blueprint("files", __name__)
+
+# 📂 Servir les fichiers statiques depuis `/backend/data/`
+@files_routes.route("/data/<author>/<subfolder>/<filename>", methods=["GET"])
+async def serve_file(author, subfolder, filename):
+    """ 📌 Servir un fichier SVG ou MEI depuis /backend/data/author/svg/ """
+    data_folder = os.path.join(os.getcwd(), "data", author, subfolder)
+
+    if not os.path.exists(os.path.join(data_folder, filename)):
+        abort(404)
+
+    return await send_from_directory(data_folder, filename)
@@ -0,0 +1,23 @@
+from quart import Blueprint, request, jsonify
+from async_database import get_db, get_pool_metrics
+
+neo4j_routes = Blueprint("neo4j", __name__)
+
+@neo4j_routes.route("/query", methods=["POST"])
+async def execute_query():
+    query = (await request.get_json(silent=True) or {}).get("query", "")
+    if any(kw in query.lower() for kw in ["create", "delete", "set", "remove", "detach", "load"]):
+        return jsonify({"error": "Operation not allowed."}), 403
+    try:
+        result = await get_db().run(query)
+        results = [record.values() async for record in result]
+        return jsonify({"results": results})
+    except Exception as e:
+        print(f"Erreur /query: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@neo4j_routes.route("/pool", methods=["GET"])
+async def pool_metrics():
+    """ 📊 Occupation du pool de connexions Neo4j (driver asynchrone) """
+    return jsonify(get_pool_metrics())
@@ -0,0 +1,22 @@
+import asyncio
+
+from quart import Blueprint, request, jsonify
+from fuzzy_compiler import compile_fuzzy_query, get_compile_cache_stats, FuzzyCompilationError
+
+script_routes = Blueprint("scripts", __name__)
+
+@script_routes.route("/compileFuzzy", methods=["POST"])
+async def compile_fuzzy():
+    payload = await request.get_json(silent=True) or {}
+    query = payload.get("query", "")
+    try:
+        # La compilation est du calcul pur : dans l'exécuteur, pour ne pas bloquer la boucle
+        compiled = await asyncio.get_running_loop().run_in_executor(None, compile_fuzzy_query, query)
+    except FuzzyCompilationError as e:
+        return jsonify({"error": e.to_dict(), "compile_time_ms": e.compile_time_ms}), 400
+    return jsonify({"results": compiled["query"], "compile_time_ms": compiled["compile_time_ms"]})
+
+@script_routes.route("/compileCache", methods=["GET"])
+async def compile_cache_stats():
+    """ 📊 Statistiques du cache de compilation """
+    return jsonify(get_compile_cache_stats())
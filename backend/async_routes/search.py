@@ -0,0 +1,44 @@
+import asyncio
+import json
+
+from quart import Blueprint, request, jsonify, Response
+import async_database
+from async_database import get_db
+from fuzzy_compiler import FuzzyCompilationError
+from fuzzy_search import prepare_fuzzy_search, aiter_fuzzy_search
+
+search_routes = Blueprint("search", __name__)
+
+@search_routes.route("/", methods=["GET"])
+async def search():
+    query_text = request.args.get("query", "")
+    results = []
+    try:
+        search_query = "MATCH (s:Score) WHERE s.source CONTAINS $query RETURN s ORDER BY s.source DESC"
+        result = await get_db().run(search_query, {"query": query_text})
+        results = [record["s"] async for record in result]
+    except Exception as e:
+        print(f"Erreur /search: {e}")
+    return jsonify({"results": results})
+
+@search_routes.route("/fuzzy", methods=["POST"])
+async def fuzzy_search():
+    """
+    🔎 Recherche floue (même entrée et même sortie NDJSON que `routes.search.fuzzy_search`).
+    La requête est compilée et les records classés dans l'exécuteur, les records sont lus sans bloquer la boucle
+    d'événements.
+    """
+    payload = await request.get_json(silent=True) or {}
+    try:
+        # L'analyse et la compilation sont du calcul pur : dans l'exécuteur, pour ne pas bloquer la boucle
+        fuzzy_query, compiled, top_k = await asyncio.get_running_loop().run_in_executor(None, prepare_fuzzy_search, payload)
+    except FuzzyCompilationError as e:
+        return jsonify({"error": e.to_dict(), "compile_time_ms": e.compile_time_ms}), 400
+
+    async def generate():
+        # Session propre au flux : elle vit tant que les résultats sont envoyés
+        async with async_database.driver.session() as session:
+            async for line in aiter_fuzzy_search(session, fuzzy_query, compiled, top_k):
+                yield json.dumps(line) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
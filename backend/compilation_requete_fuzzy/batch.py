@@ -0,0 +1,135 @@
+'''
+Batched execution of many fuzzy queries : the queries of the same shape are sent in a single statement.
+
+The parameterized crisp queries (see `reformulation_V3.reformulate_fuzzy_query_parameterized`) of the same shape have
+the same text, and only differ by their parameters. `make_batch_query` rewrites such a query to run it once per row of
+a `$batch` list, each row holding the parameters of one query and its id :
+    UNWIND $batch AS q
+    CALL {
+    WITH q
+    MATCH ... WHERE f0.duration = q.f0_duration AND ...
+    RETURN q.id AS query_id, ...
+    }
+    RETURN query_id, ...
+
+The subquery is run separately for each row, so the `ORDER BY degree DESC LIMIT $k` of the ranking queries still
+applies per query (`$k` is the same for the whole batch).
+'''
+
+import re
+
+from compile_cache import compile_cache
+from fuzzy_query import parse_fuzzy_query
+
+# Maximum number of queries sent in one statement
+BATCH_SIZE = 100
+
+# Parameters shared by all the queries of a batch (given once, not in the rows)
+SHARED_PARAMETERS = ('k',)
+
+def return_columns(crisp_query):
+    '''
+    Return the names of the columns of the final RETURN clause of a compiled query.
+
+    - crisp_query : the crisp query (as generated by `reformulation_V3`).
+    '''
+
+    return_clause = crisp_query[crisp_query.rindex('RETURN') + len('RETURN'):]
+    return_clause = return_clause.split('\nORDER BY')[0]
+
+    return [item.split(' AS ')[-1].strip() for item in return_clause.split(',')]
+
+def make_batch_query(crisp_query, params):
+    '''
+    Rewrite a parameterized crisp query to run it for each row of `$batch` (see the module documentation).
+
+    - crisp_query : the parameterized crisp query ;
+    - params      : the names of its parameters given in each row (the others, e.g `$k`, stay shared).
+    '''
+
+    columns = return_columns(crisp_query)
+
+    # Read the parameters of each query from its row
+    body = re.sub(r'\$(\w+)', lambda match: f'q.{match.group(1)}' if match.group(1) in params else match.group(0), crisp_query)
+
+    # Tag the results with the id of the query
+    idx = body.rindex('RETURN') + len('RETURN')
+    body = body[:idx] + ' q.id AS query_id,' + body[idx:]
+
+    return 'UNWIND $batch AS q\nCALL {\nWITH q\n' + body + '\n}\nRETURN query_id, ' + ', '.join(columns)
+
+def group_by_shape(queries, ranking=False, batch_size=BATCH_SIZE):
+    '''
+    Compile the fuzzy queries and group them by shape.
+
+    Returns `(batches, fuzzy_queries, errors)` :
+        - batches       : list of `(batch_query, rows)`, each with at most `batch_size` rows ;
+        - fuzzy_queries : dict `{query_id: FuzzyQuery}` of the compiled queries ;
+        - errors        : dict `{query_id: error message}` of the queries that could not be compiled.
+
+    - queries    : dict `{query_id: fuzzy query}` ;
+    - ranking    : if True, compile the ranking version of the queries (see `reformulate_fuzzy_query`) ;
+    - batch_size : the maximum number of queries per batch.
+    '''
+
+    if batch_size < 1:
+        raise ValueError(f'The batch size should be a strictly positive integer, but {batch_size} was given')
+
+    shapes = {}
+    fuzzy_queries = {}
+    errors = {}
+
+    for query_id, query in queries.items():
+        try:
+            fuzzy_query = parse_fuzzy_query(query)
+            crisp_query, params = compile_cache.compile(fuzzy_query, ranking, parameterized=True)
+        except Exception as e:
+            errors[query_id] = str(e) or type(e).__name__
+            continue
+
+        fuzzy_queries[query_id] = fuzzy_query
+        for name in SHARED_PARAMETERS:
+            params.pop(name, None)
+
+        shapes.setdefault(crisp_query, []).append({'id': query_id, **params})
+
+    batches = []
+    for crisp_query, rows in shapes.items():
+        batch_query = make_batch_query(crisp_query, {name for row in rows for name in row if name != 'id'})
+
+        for start in range(0, len(rows), batch_size):
+            batches.append((batch_query, rows[start:start + batch_size]))
+
+    return batches, fuzzy_queries, errors
+
+def run_batch(driver, queries, ranking=False, top_k=None, batch_size=BATCH_SIZE):
+    '''
+    Run many fuzzy queries with one statement per batch of queries of the same shape (see `group_by_shape`).
+
+    Returns `(results, fuzzy_queries, errors)`, where `results` is the dict `{query_id: records}`
+    (the records of each query, with a `query_id` column) and the others are as in `group_by_shape`.
+
+    - driver     : the neo4j driver ;
+    - queries    : dict `{query_id: fuzzy query}` ;
+    - ranking    : if True, the degrees are computed in the database, and only the `top_k` best records of each
+                   query are returned ;
+    - top_k      : the number of records per query, with `ranking` ;
+    - batch_size : the maximum number of queries per statement.
+    '''
+
+    if ranking and top_k is None:
+        raise ValueError('The ranking version of the queries needs `top_k`')
+
+    batches, fuzzy_queries, errors = group_by_shape(queries, ranking, batch_size)
+    results = {query_id: [] for query_id in fuzzy_queries}
+
+    with driver.session() as session:
+        for batch_query, rows in batches:
+            parameters = {'batch': rows}
+            if ranking:
+                parameters['k'] = top_k
+
+            for record in session.run(batch_query, parameters):
+                results[record['query_id']].append(record)
+
+    return results, fuzzy_queries, errors
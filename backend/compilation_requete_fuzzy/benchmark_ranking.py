@@ -0,0 +1,96 @@
+'''
+Benchmark of the ranking of fuzzy results : scalar path (`process_results.get_ranked_results`)
+against the numpy kernel (`vectorized_ranking.get_ordered_results_vectorized`).
+
+The records are generated randomly (same columns as the ones returned by the compiled queries),
+so no database is needed. Both paths are checked to give the same results.
+
+Usage : python3 benchmark_ranking.py [-s 10000 1000000] [-p 1.0] [-f 2.0] [-g 0.125] [-a 0.0] [-t]
+'''
+
+import argparse
+import random
+import time
+
+from utils import create_query_from_list_of_notes
+from process_results import get_ranked_results
+
+NOTES = [[('c', 5), 4], [('d', 5), 8, 1], [('e', 5), 8], [('f', 5), 4], [('g', 5), 2]]
+PITCHES = ['c', 'c#', 'd', 'eb', 'e', 'f', 'f#', 'g', 'ab', 'a', 'bb', 'b']
+DURATIONS = [0.0625, 0.125, 0.1875, 0.25, 0.375, 0.5, 1.0]
+
+def generate_records(nb_records, nb_notes, seed=0):
+    '''
+    Generate `nb_records` random records of `nb_notes` notes, with the aliases of the compiled queries.
+
+    - nb_records : the number of records ;
+    - nb_notes   : the number of notes in each record ;
+    - seed       : the random seed.
+    '''
+
+    rng = random.Random(seed)
+
+    records = []
+    for r in range(nb_records):
+        record = {'source': f'score_{r % 500}.mei', 'start': 0.0, 'end': 0.0}
+        time_ = rng.choice(DURATIONS) * rng.randint(0, 64)
+        record['start'] = time_
+
+        for i in range(nb_notes):
+            duration = rng.choice(DURATIONS)
+            record[f'pitch_{i}'] = rng.choice(PITCHES)
+            record[f'octave_{i}'] = rng.choice((4, 5, 5, 6))
+            record[f'duration_{i}'] = duration
+            record[f'dots_{i}'] = 0
+            record[f'start_{i}'] = time_
+            record[f'end_{i}'] = time_ + duration
+            record[f'id_{i}'] = f'{r}_{i}'
+            if i > 0:
+                record[f'interval_{i - 1}'] = rng.choice((-2.5, -1.0, -0.5, 0.0, 0.5, 1.0, 2.5))
+
+            time_ += duration + rng.choice((0.0, 0.0, 0.0625, 0.125))
+
+        record['end'] = time_
+        records.append(record)
+
+    return records
+
+def time_ranking(records, query, vectorized):
+    '''Return `(results, elapsed_seconds)` for one ranking of `records`.'''
+
+    start = time.perf_counter()
+    results = get_ranked_results(records, query, vectorized=vectorized)
+    return results, time.perf_counter() - start
+
+def check_same_results(scalar, vectorized):
+    '''Raise an `AssertionError` if the two rankings differ (order, degrees, notes).'''
+
+    assert len(scalar) == len(vectorized), f'{len(scalar)} != {len(vectorized)} results'
+
+    for s, v in zip(scalar, vectorized):
+        assert s[:4] == v[:4], f'{s[:4]} != {v[:4]}'
+        for note_s, note_v in zip(s[4], v[4]):
+            assert note_s[0].__dict__ == note_v[0].__dict__ and note_s[1:] == note_v[1:], f'{note_s} != {note_v}'
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the scalar and the vectorized ranking of fuzzy results.')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[10_000, 1_000_000], help='the numbers of records to rank. Default is 10000 1000000.')
+    parser.add_argument('-n', '--nb-notes', type=int, default=3, choices=range(2, len(NOTES) + 1), help='the number of notes of the query. Default is 3.')
+    parser.add_argument('-p', '--pitch-distance', type=float, default=1.0, help='the pitch distance. Default is 1.0.')
+    parser.add_argument('-f', '--duration-factor', type=float, default=2.0, help='the duration factor. Default is 2.0.')
+    parser.add_argument('-g', '--duration-gap', type=float, default=0.125, help='the duration gap. Default is 0.125.')
+    parser.add_argument('-a', '--alpha', type=float, default=0.0, help='the alpha cut. Default is 0.0.')
+    parser.add_argument('-t', '--allow-transposition', action='store_true', help='rank on the intervals.')
+    args = parser.parse_args()
+
+    query = create_query_from_list_of_notes(NOTES[:args.nb_notes], args.pitch_distance, args.duration_factor, args.duration_gap, args.alpha, args.allow_transposition, False)
+
+    print(f'{"records":>10} | {"results":>10} | {"scalar (s)":>10} | {"numpy (s)":>10} | {"speedup":>8}')
+    for size in args.sizes:
+        records = generate_records(size, args.nb_notes)
+
+        scalar_results, scalar_time = time_ranking(records, query, False)
+        vectorized_results, vectorized_time = time_ranking(records, query, True)
+        check_same_results(scalar_results, vectorized_results)
+
+        print(f'{size:>10} | {len(scalar_results):>10} | {scalar_time:>10.3f} | {vectorized_time:>10.3f} | {scalar_time / vectorized_time:>7.1f}x')
@@ -0,0 +1,168 @@
+import os
+import re
+import sys
+from collections import OrderedDict
+from threading import Lock
+
+from reformulation_V3 import reformulate_fuzzy_query, reformulate_fuzzy_query_parameterized
+from fuzzy_query import FuzzyQuery
+
+def _default_cache_size(fallback=256):
+    '''Return the cache size of the `FUZZY_COMPILE_CACHE_SIZE` environment variable, or `fallback` if it is unset or invalid.'''
+
+    value = os.environ.get('FUZZY_COMPILE_CACHE_SIZE')
+    if value is None:
+        return fallback
+
+    try:
+        size = int(value)
+    except ValueError:
+        size = -1
+
+    if size < 0:
+        print(f'compile_cache: invalid FUZZY_COMPILE_CACHE_SIZE "{value}", using {fallback}', file=sys.stderr)
+        return fallback
+
+    return size
+
+# Default number of compiled queries kept in memory. Can be overridden with the `FUZZY_COMPILE_CACHE_SIZE` environment variable.
+DEFAULT_CACHE_SIZE = _default_cache_size()
+
+# The quoted string literals (their whitespaces are kept in the cache key), and the whitespaces outside of them
+LITERAL_OR_WHITESPACE_RE = re.compile(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\")|\s+")
+
+def canonicalize_fuzzy_query(query):
+    '''
+    Return the canonical form of a fuzzy query, used as the cache key.
+
+    Every sequence of whitespace outside of the quoted literals is collapsed into a single space (the literals are
+    kept as they are : `'Bach  Chorales'` and `'Bach Chorales'` are different collections). The variables are not
+    renamed : the compiled query uses the names of the fuzzy query, so `(a:Event)` and `(e0:Event)` are different keys.
+
+    - query : the fuzzy query.
+    '''
+
+    return LITERAL_OR_WHITESPACE_RE.sub(lambda match: match.group(1) or ' ', query).strip()
+
+class CompileCache:
+    '''Bounded LRU cache of compiled crisp queries, keyed by the canonical form of the fuzzy query.'''
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        '''
+        Initiate the cache.
+
+        - max_size : the maximum number of compiled queries to keep. With 0, nothing is cached.
+        '''
+
+        if max_size < 0:
+            raise ValueError(f'The cache size should be a positive integer, but {max_size} was given')
+
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def compile(self, query, ranking=False, parameterized=False):
+        '''
+        Return the crisp query corresponding to the fuzzy `query`, compiling it only if it is not in the cache.
+
+        - query         : the fuzzy query (string or `FuzzyQuery`). A parsed query is compiled without being parsed again ;
+        - ranking       : if True, compile the ranking version of the query (see `reformulate_fuzzy_query`). Cached separately ;
+        - parameterized : if True, return the couple `(crisp_query, params)` (see `reformulate_fuzzy_query_parameterized`).
+                          Cached separately. The returned `params` is a copy, that the caller can complete (e.g with `k`).
+        '''
+
+        key = (canonicalize_fuzzy_query(query.source if isinstance(query, FuzzyQuery) else query), ranking, parameterized)
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._copy(self._entries[key])
+
+            self.misses += 1
+
+        # Compile outside of the lock : the compilation can take some time and does not touch the cache.
+        if parameterized:
+            crisp_query = reformulate_fuzzy_query_parameterized(query, ranking)
+        else:
+            crisp_query = reformulate_fuzzy_query(query, ranking)
+
+        with self._lock:
+            self._store(key, crisp_query)
+
+        return self._copy(crisp_query)
+
+    @staticmethod
+    def _copy(entry):
+        '''Return the cached entry, with a copy of the parameters for the parameterized ones.'''
+
+        if isinstance(entry, tuple):
+            crisp_query, params = entry
+            return crisp_query, dict(params)
+
+        return entry
+
+    def _store(self, key, crisp_query):
+        '''Add an entry and evict the least recently used ones if needed. The lock must be held.'''
+
+        if self.max_size == 0:
+            return
+
+        self._entries[key] = crisp_query
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, max_size):
+        '''Change the maximum size of the cache, evicting the least recently used entries if needed.'''
+
+        if max_size < 0:
+            raise ValueError(f'The cache size should be a positive integer, but {max_size} was given')
+
+        with self._lock:
+            self.max_size = max_size
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        '''Empty the cache and reset the counters.'''
+
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        '''Return the cache counters as a dict.'''
+
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups > 0 else 0.0
+            }
+
+# Cache shared by every user of the compiler in the process (Flask routes, `main_parser.Parser`, ...)
+compile_cache = CompileCache()
+
+def compile_fuzzy_query_cached(query, ranking=False, parameterized=False):
+    '''Compile `query` using the shared cache.'''
+
+    return compile_cache.compile(query, ranking, parameterized)
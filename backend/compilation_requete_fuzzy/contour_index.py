@@ -0,0 +1,385 @@
+'''
+Contour string index, to answer the contour queries (see `utils.create_query_from_contour`) without scoring every
+`NEXT` relationship.
+
+The membership predicates of a contour query (`n0.interval IS stepUp`) can not be pruned by the database. Instead, the
+melody of each voice (each chain of `NEXT` relationships, see `interval_index.next_chains`) is encoded once as a
+string of contour symbols (`CONTOUR_SYMBOLS`, from `*D` to `*U`) : the symbol of an interval is the contour term of
+highest degree, with the same trapezoids as `create_query_from_contour` (see `contour_symbol`). The strings of all
+the voices are indexed with a suffix automaton (`build_suffix_automaton`),
+saved as `.npy` files and read back memory-mapped (`ContourIndex.load`).
+
+A contour query is a sequence of sets of symbols : for each interval of the query, the symbols whose intervals (as
+observed at build time) intersect the support of its membership function. The windows matching these sets are read
+by walking the automaton, then the compiled query is restricted to them (see `interval_index.anchor_query`), so the
+database only returns the candidate windows, and the degrees are only computed for them (`process_results`).
+The index is static : it should be rebuilt after an import or an ingestion (`main_parser.py contour-index`).
+'''
+
+import json
+import os
+
+import numpy as np
+
+from fuzzy_query import parse_fuzzy_query
+from interval_index import HIT_KEY, anchor_query, fetch_interval_sequences, make_text
+from utils import create_query_from_contour
+
+# Default directory of the index. Can be overridden with the `FUZZY_CONTOUR_INDEX` environment variable.
+DEFAULT_CONTOUR_INDEX_DIR = os.environ.get(
+    'FUZZY_CONTOUR_INDEX',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'contour_index')
+)
+
+# The contour symbols, from the lowest intervals to the highest ones
+CONTOUR_SYMBOLS = ('*D', 'D', 'd', 'R', 'u', 'U', '*U')
+
+# Symbol of a `NEXT` without interval (e.g a rest), and of the end of a chain
+REST = len(CONTOUR_SYMBOLS)
+SEPARATOR = REST + 1
+ALPHABET_SIZE = SEPARATOR + 1
+
+def contour_membership_functions():
+    '''Return the membership functions of the contour symbols (list, in the order of `CONTOUR_SYMBOLS`).'''
+
+    # The same definitions as the contour queries : the names are read from the conditions of the generated query
+    fuzzy_query = parse_fuzzy_query(create_query_from_contour(''.join(CONTOUR_SYMBOLS)))
+    names = {variable: name for variable, _, name in fuzzy_query.attributes_with_membership_functions}
+
+    return [fuzzy_query.membership_functions[names[f'n{idx}']] for idx in range(len(CONTOUR_SYMBOLS))]
+
+_functions = contour_membership_functions()
+
+def contour_symbol(interval):
+    '''
+    Return the index (in `CONTOUR_SYMBOLS`) of the contour term of highest degree for an interval, or `REST` if it
+    is None.
+
+    - interval : the interval (in tones), or None.
+    '''
+
+    if interval is None:
+        return REST
+
+    degrees = [function(interval) for function in _functions]
+    return degrees.index(max(degrees))
+
+def build_suffix_automaton(text):
+    '''
+    Build the suffix automaton of `text` (each state is a class of substrings with the same end positions).
+
+    Returns `(transitions, links, firstpos, clones)` :
+        - transitions : array (states x `ALPHABET_SIZE`), the next state for each symbol, or -1 ;
+        - links       : the suffix link of each state (-1 for the initial state 0) ;
+        - firstpos    : the first end position (in the text) of the substrings of each state ;
+        - clones      : True for the states created by splitting an other one (their end positions are those of
+                        their descendants in the suffix link tree).
+
+    - text : the symbols (1d integer array, values < `ALPHABET_SIZE`).
+    '''
+
+    transitions = [[-1] * ALPHABET_SIZE]
+    links, lengths, firstpos, clones = [-1], [0], [-1], [False]
+    last = 0
+
+    for pos, symbol in enumerate(text.tolist()):
+        current = len(lengths)
+        transitions.append([-1] * ALPHABET_SIZE)
+        links.append(0)
+        lengths.append(lengths[last] + 1)
+        firstpos.append(pos)
+        clones.append(False)
+
+        state = last
+        while state != -1 and transitions[state][symbol] == -1:
+            transitions[state][symbol] = current
+            state = links[state]
+
+        if state != -1:
+            target = transitions[state][symbol]
+
+            if lengths[state] + 1 == lengths[target]:
+                links[current] = target
+            else:
+                clone = len(lengths)
+                transitions.append(list(transitions[target]))
+                links.append(links[target])
+                lengths.append(lengths[state] + 1)
+                firstpos.append(firstpos[target])
+                clones.append(True)
+
+                while state != -1 and transitions[state][symbol] == target:
+                    transitions[state][symbol] = clone
+                    state = links[state]
+
+                links[target] = clone
+                links[current] = clone
+
+        last = current
+
+    return (
+        np.array(transitions, dtype=np.int32),
+        np.array(links, dtype=np.int32),
+        np.array(firstpos, dtype=np.int64),
+        np.array(clones, dtype=bool)
+    )
+
+def link_tree(links):
+    '''
+    Return `(offsets, children)`, the children of each state in the suffix link tree : the children of the state `s`
+    are `children[offsets[s]:offsets[s + 1]]`.
+
+    - links : the suffix links (see `build_suffix_automaton`).
+    '''
+
+    order = np.argsort(links, kind='stable')
+    order = order[links[order] >= 0]
+    counts = np.bincount(links[order], minlength=len(links))
+
+    return np.concatenate(([0], np.cumsum(counts))).astype(np.int64), order.astype(np.int32)
+
+class ContourIndex:
+    '''Suffix automaton over the contour strings of the scores (see the module documentation).'''
+
+    FILES = ('text', 'scores', 'ids', 'transitions', 'firstpos', 'clones', 'offsets', 'children')
+
+    def __init__(self, text, scores, ids, transitions, firstpos, clones, offsets, children, sources, ranges):
+        '''
+        Initiate the index from its arrays.
+
+        - text        : the contour symbols ;
+        - scores      : the index of the score of each position ;
+        - ids         : the id of the event of each position ;
+        - transitions, firstpos, clones : the automaton (see `build_suffix_automaton`) ;
+        - offsets, children             : its suffix link tree (see `link_tree`) ;
+        - sources     : the list of the sources ;
+        - ranges      : for each contour symbol, the `(min, max)` of its intervals in the corpus (None if it does not
+                        occur).
+        '''
+
+        self.text = text
+        self.scores = scores
+        self.ids = ids
+        self.transitions = transitions
+        self.firstpos = firstpos
+        self.clones = clones
+        self.offsets = offsets
+        self.children = children
+        self.sources = sources
+        self.ranges = ranges
+
+    @classmethod
+    def from_sequences(cls, sequences):
+        '''Build the index from the sequences returned by `interval_index.fetch_interval_sequences`.'''
+
+        text, scores, ids, sources = make_text(sequences, contour_symbol, SEPARATOR)
+        text = text.astype(np.int8)
+
+        ranges = [None] * len(CONTOUR_SYMBOLS)
+        for chains in sequences.values():
+            for _, interval in (step for chain in chains for step in chain):
+                if interval is None:
+                    continue
+
+                symbol = contour_symbol(interval)
+                low, high = ranges[symbol] or (interval, interval)
+                ranges[symbol] = (min(low, interval), max(high, interval))
+
+        transitions, links, firstpos, clones = build_suffix_automaton(text)
+        offsets, children = link_tree(links)
+
+        return cls(text, scores, ids, transitions, firstpos, clones, offsets, children, sources, ranges)
+
+    def save(self, directory=None):
+        '''
+        Save the index in `directory` (`DEFAULT_CONTOUR_INDEX_DIR` if None) : one `.npy` file per array, and `meta.json`.
+        '''
+
+        directory = directory or DEFAULT_CONTOUR_INDEX_DIR
+        os.makedirs(directory, exist_ok=True)
+
+        for name in self.FILES:
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, name))
+
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({'symbols': CONTOUR_SYMBOLS, 'hit_key': HIT_KEY, 'sources': self.sources, 'ranges': self.ranges}, f)
+
+    @classmethod
+    def load(cls, directory=None):
+        '''
+        Load an index saved with `save`. The arrays are memory-mapped, not read.
+
+        - directory : the directory of the index (`DEFAULT_CONTOUR_INDEX_DIR` if None).
+        '''
+
+        directory = directory or DEFAULT_CONTOUR_INDEX_DIR
+
+        with open(os.path.join(directory, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+
+        if tuple(meta['symbols']) != CONTOUR_SYMBOLS:
+            raise ValueError(f'The index in {directory} was built with other contour symbols, it should be rebuilt')
+        if meta.get('hit_key') != HIT_KEY:
+            raise ValueError(f'The index in {directory} was built by an older version (hits by start), it should be rebuilt')
+
+        arrays = [np.load(os.path.join(directory, name + '.npy'), mmap_mode='r') for name in cls.FILES]
+        ranges = [tuple(r) if r is not None else None for r in meta['ranges']]
+
+        return cls(*arrays, meta['sources'], ranges)
+
+    def __len__(self):
+        return len(self.text)
+
+    def symbols_in(self, low, high):
+        '''
+        Return the contour symbols (indexes) of the intervals that can be in `[low, high]`.
+
+        - low, high : the bounds (can be infinite).
+        '''
+
+        return [
+            symbol for symbol, bounds in enumerate(self.ranges)
+            if bounds is not None and bounds[0] <= high and bounds[1] >= low
+        ]
+
+    def end_positions(self, state):
+        '''Return the end positions of the substrings of a state (the first ones of its non clone descendants).'''
+
+        positions = []
+        stack = [state]
+
+        while stack:
+            state = stack.pop()
+            if not self.clones[state]:
+                positions.append(int(self.firstpos[state]))
+
+            stack.extend(self.children[self.offsets[state]:self.offsets[state + 1]].tolist())
+
+        return positions
+
+    def positions(self, symbol_sets):
+        '''
+        Return the sorted start positions of the windows of the text matching a sequence of sets of symbols.
+
+        - symbol_sets : for each interval of the window, the list of the allowed symbols.
+        '''
+
+        # Each state is reached by a single string of a given length : the windows of the frontier states are distinct
+        states = [0]
+        for symbols in symbol_sets:
+            states = [
+                int(self.transitions[state, symbol])
+                for state in states
+                for symbol in symbols
+                if self.transitions[state, symbol] >= 0
+            ]
+
+            if not states:
+                return []
+
+        m = len(symbol_sets)
+        return sorted(end - m + 1 for state in states for end in self.end_positions(state))
+
+    def search(self, symbol_sets):
+        '''
+        Find the windows matching a sequence of sets of symbols.
+
+        Returns the list of `{'source', 'id'}` of the first event of each window.
+
+        - symbol_sets : for each interval of the window, the list of the allowed symbols.
+        '''
+
+        positions = np.array(self.positions(symbol_sets), dtype=np.int64)
+
+        return [
+            {'source': self.sources[score], 'id': str(event)}
+            for score, event in zip(np.asarray(self.scores[positions]).tolist(), np.asarray(self.ids[positions]).tolist())
+        ]
+
+def build_contour_index(driver, directory=None):
+    '''
+    Build the index from the database and save it (see `ContourIndex.save`). Returns the index.
+
+    - driver    : the neo4j driver ;
+    - directory : the directory of the index (`DEFAULT_CONTOUR_INDEX_DIR` if None).
+    '''
+
+    index = ContourIndex.from_sequences(fetch_interval_sequences(driver))
+    index.save(directory)
+
+    return index
+
+def contour_chain(fuzzy_query):
+    '''
+    Return `(events, intervals)` : the variables of the events and of the `NEXT` relationships of the chain of a
+    contour query (e.g `['e0', 'e1', 'e2']` and `['n0', 'n1']`), or None if the query is not a single chain of
+    `NEXT` relationships.
+
+    - fuzzy_query : the parsed fuzzy query.
+    '''
+
+    chains = [pattern for pattern in fuzzy_query.patterns if any(element.type == 'NEXT' for element in pattern.relationships)]
+    if len(chains) != 1:
+        return None
+
+    chain = chains[0]
+    if any(element.type != 'NEXT' for element in chain.relationships):
+        return None
+
+    return [element.variable for element in chain.nodes], [element.variable for element in chain.relationships]
+
+def contour_symbol_sets(index, fuzzy_query):
+    '''
+    Return `(first_event, symbol_sets)` : the variable of the first event of the chain of a contour query and, for
+    each of its intervals, the symbols that can satisfy its membership predicates (all the symbols, rests included,
+    if it has none). Returns None if the query can not be answered with the index.
+
+    - index       : the `ContourIndex` ;
+    - fuzzy_query : the parsed fuzzy query.
+    '''
+
+    # The branch of `process_results.get_ranked_results` that uses the contour degrees
+    if not fuzzy_query.contour or fuzzy_query.allow_transposition:
+        return None
+
+    chain = contour_chain(fuzzy_query)
+    if chain is None:
+        return None
+
+    events, intervals = chain
+    symbol_sets = {variable: list(range(REST + 1)) for variable in intervals}
+
+    for variable, attribute, name in fuzzy_query.attributes_with_membership_functions:
+        if variable not in symbol_sets:
+            continue
+
+        if attribute != 'interval':
+            return None
+
+        low, high = fuzzy_query.membership_functions[name].support
+        symbol_sets[variable] = [symbol for symbol in index.symbols_in(low, high) if symbol in symbol_sets[variable]]
+
+    return events[0], [symbol_sets[variable] for variable in intervals]
+
+def contour_indexed_query(index, crisp_query, fuzzy_query, parameters=None):
+    '''
+    Use the index to restrict a compiled contour query to its candidate windows.
+
+    Returns `(crisp_query, parameters, nb_hits)`, with the anchored query and its parameters (with `hits`), or
+    None if the query can not be answered with the index (see `contour_symbol_sets`).
+
+    - index       : the `ContourIndex` ;
+    - crisp_query : the compiled query ;
+    - fuzzy_query : the parsed fuzzy query ;
+    - parameters  : the parameters of the compiled query, or None.
+    '''
+
+    anchor = contour_symbol_sets(index, fuzzy_query)
+    if anchor is None:
+        return None
+
+    first_event, symbol_sets = anchor
+    hits = index.search(symbol_sets)
+
+    offset = fuzzy_query.events.index(first_event)
+    return anchor_query(crisp_query, fuzzy_query, offset), {**(parameters or {}), 'hits': hits}, len(hits)
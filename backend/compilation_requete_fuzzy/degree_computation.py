@@ -1,3 +1,7 @@
+# Half tones from C of the natural notes, and half tones added by the MEI accidentals
+NATURAL_SEMITONES_FROM_C = {'c': 0, 'd': 2, 'e': 4, 'f': 5, 'g': 7, 'a': 9, 'b': 11}
+ACCIDENTAL_SEMITONES = {'s': 1, 'f': -1, 'ss': 2, 'x': 2, 'ff': -2, 'xs': 3, 'ts': 3, 'tf': -3, 'n': 0, 'nf': -1, 'ns': 1}
+
 def convert_note_to_sharp(note: str) -> str:
     '''
     Convert a note to its equivalent in sharp (if it is a flat).
@@ -18,6 +22,17 @@ def convert_note_to_sharp(note: str) -> str:
 
     return note
 
+def half_tones_from_a4(pname, octave, accid):
+    '''
+    Return the number of half tones from A4 (e.g 3 for C5, -1 for G#4).
+
+    - pname  : the note class, without accidental ;
+    - octave : the octave ;
+    - accid  : the MEI accidental (e.g 's', 'f', 'n'), or None.
+    '''
+
+    return NATURAL_SEMITONES_FROM_C[pname] + ACCIDENTAL_SEMITONES.get(accid, 0) + 12 * octave - 57
+
 def note_distance_in_tones(note1, octave1, note2, octave2):
     '''Calculate the distance (in tones) between two notes.'''
 
@@ -68,7 +83,7 @@ def pitch_degree(note1, octave1, note2, octave2, pitch_gap):
 
     # d = 1 - (note_distance_in_tones(note1, octave1, note2, octave2) / (pitch_gap + pitch_gap*0.1))
     d = 1 - (note_distance_in_tones(note1, octave1, note2, octave2) / pitch_gap)
-    return max(d, 0)
+    return max(d, 0.0)
 
 def pitch_degree_with_intervals(interval1, interval2, pitch_gap):
     if pitch_gap == 0 or interval1 == None or interval2 == None:
@@ -76,7 +91,27 @@ def pitch_degree_with_intervals(interval1, interval2, pitch_gap):
 
     # d = 1 - (abs(interval1 - interval2) / (pitch_gap + pitch_gap*0.1))
     d = 1 - (abs(interval1 - interval2) / pitch_gap)
-    return max(d, 0)
+    return max(d, 0.0)
+
+def chord_degree(chord, pitches, pitch_gap, reference=0):
+    '''
+    Degree of the other notes of a chord : each note takes the degree of the closest pitch of the event, and the
+    chord takes the degree of its farthest note.
+
+    - chord     : the other notes of the chord of the query, in half tones (see `utils.calculate_chord_pitches`) ;
+    - pitches   : the pitches of the event (`Event.pitches`) ;
+    - pitch_gap : the pitch distance, in tones ;
+    - reference : the pitch the chord is relative to (the note of the event with transposition, 0 otherwise).
+    '''
+
+    if pitch_gap == 0 or not chord:
+        return 1.0
+    if not pitches:
+        return 0.0
+
+    distance = max(min(abs(y - reference - x) for y in pitches) for x in chord)
+    d = 1 - ((distance / 2.0) / pitch_gap)
+    return max(d, 0.0)
   
 
 def duration_degree(duration1, duration2, max_duration_distance):
@@ -87,7 +122,7 @@ def duration_degree(duration1, duration2, max_duration_distance):
     
     # Calculate the degree based on the duration gap
     # degree = max(1 - (duration_difference / (max_duration_distance + max_duration_distance*0.1)), 0)
-    degree = max(1 - (duration_difference / max_duration_distance), 0)
+    degree = max(1 - (duration_difference / max_duration_distance), 0.0)
     
     return degree
 
@@ -128,7 +163,7 @@ def sequencing_degree(end_time1, start_time2, max_gap):
     
     # Calculate the degree based on the maximum allowed gap
     # degree = max(1 - (time_gap / (max_gap + max_gap*0.1)), 0)
-    degree = max(1 - (time_gap / max_gap), 0)
+    degree = max(1 - (time_gap / max_gap), 0.0)
     
     return degree
 
@@ -0,0 +1,285 @@
+'''
+Index of the durations of the facts of all the scores, to find the candidate windows of the queries with durations
+without expanding the graph.
+
+The compiled query checks the duration of each note on every path (`fI.duration >= $fI_duration_min AND
+fI.duration <= $fI_duration_max`, see `reformulation_V3.make_duration_condition`). The index is built offline
+(`build_duration_index`) : the events are numbered along the chains of `NEXT` relationships of each score (one per
+voice, see `interval_index.next_chains`), and the facts of each score are kept in a posting list sorted by
+`log2(duration)`. The posting lists of all the scores are saved one after the other, with their keys
+`score + 1j * log2(duration)` : numpy orders the complex numbers on their real part, then on their imaginary part,
+so that the range of a duration window in every posting list is found with two binary searches over the keys
+(`DurationIndex.note_events`).
+
+The windows of a query are found before any traversal : the events of each note of the query with a duration are
+looked up in the index, shifted back by the position of the note in the query, and the windows are the intersection
+of these sets, without crossing the end of a chain (`DurationIndex.search`). The occurrences are a superset of the
+matches : the compiled query is restricted to them as with the interval index (see `interval_index.anchor_query`),
+and still checks every condition. The index is static : it should be rebuilt after an import or an ingestion (`main_parser.py duration-index`).
+'''
+
+import json
+import os
+
+import numpy as np
+
+from find_duration_range import find_duration_range_multiplicative_factor_sym
+from interval_index import HIT_KEY, NEXT_QUERY, anchor_query, next_chains, next_events_by_score
+from neo4j_connection import run_query
+from onset_search import concatenated_ranges
+
+# Default directory of the index. Can be overridden with the `FUZZY_DURATION_INDEX` environment variable.
+DEFAULT_DURATION_INDEX_DIR = os.environ.get(
+    'FUZZY_DURATION_INDEX',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'duration_index')
+)
+
+DURATIONS_QUERY = '''
+MATCH (tp:TopRhythmic)-[:RHYTHMIC]->(m:Measure), (m)-[:HAS]->(e:Event), (e)--(f:Fact)
+RETURN tp.collection AS collection, e.source AS source, e.start AS start, e.id AS id, f.duration AS duration
+'''
+
+def duration_windows(fuzzy_query):
+    '''
+    Return the list of `(idx, min_duration, max_duration)` of the notes of a query with a duration (same bounds as
+    `reformulation_V3.make_duration_condition`), or None if the query can not be answered with the index : the query
+    should not have a duration gap (the notes are consecutive events), be a chain of events `e0, e1, ...` with one
+    fact each (`f0, f1, ...`), and have at least one duration.
+
+    - fuzzy_query : the parsed fuzzy query.
+    '''
+
+    if fuzzy_query.duration_gap > 0:
+        return None
+
+    facts = list(fuzzy_query.facts)
+    if fuzzy_query.events != [f'e{idx}' for idx in range(len(facts))] or facts != [f'f{idx}' for idx in range(len(facts))]:
+        return None
+
+    windows = []
+    for idx, name in enumerate(facts):
+        attributes = fuzzy_query.nodes[name]
+        if attributes.get('dur') is None:
+            continue
+
+        duration = 1.0 / attributes['dur']
+        if attributes.get('dots'):
+            duration *= 1.5
+
+        if fuzzy_query.duration_factor != 1:
+            windows.append((idx, *find_duration_range_multiplicative_factor_sym(duration, fuzzy_query.duration_factor, fuzzy_query.alpha)))
+        else:
+            windows.append((idx, duration, duration))
+
+    return windows or None
+
+class DurationIndex:
+    '''Per score posting lists of the facts sorted by duration (see the module documentation).'''
+
+    FILES = ('chain_events', 'event_score', 'event_id', 'keys', 'postings')
+
+    def __init__(self, chain_events, event_score, event_id, keys, postings, sources, collections):
+        '''
+        Initiate the index from its arrays.
+
+        - chain_events : the offsets of the events of each chain (the events of a chain being in `NEXT` order) ;
+        - event_score  : the score of each event ;
+        - event_id     : the id of each event ;
+        - keys         : the `score + 1j * log2(duration)` of each posting, sorted ;
+        - postings     : the event of each posting ;
+        - sources      : the list of the sources ;
+        - collections  : the collection of each score.
+        '''
+
+        self.chain_events = chain_events
+        self.event_score = event_score
+        self.event_id = event_id
+        self.keys = keys
+        self.postings = postings
+        self.sources = sources
+        self.collections = collections
+
+    @classmethod
+    def from_records(cls, records, next_records):
+        '''
+        Build the index from the records of `DURATIONS_QUERY` (one per fact) and of `interval_index.NEXT_QUERY`.
+
+        - records      : the records (or dicts) of the facts ;
+        - next_records : the records (or dicts) of the `NEXT` relationships.
+        '''
+
+        scores = {}
+        for record in records:
+            score = scores.setdefault(record['source'], {'collection': record['collection'], 'starts': {}, 'durations': {}})
+            score['starts'][record['id']] = record['start']
+            score['durations'].setdefault(record['id'], []).append(record['duration'])
+
+        next_events = next_events_by_score(next_records)
+
+        sources = sorted(scores)
+        event_scores, event_ids, sizes, posting_scores, postings, durations = [], [], [], [], [], []
+
+        for score_idx, source in enumerate(sources):
+            score = scores[source]
+
+            for chain in next_chains(score['starts'], next_events.get(source, {})):
+                for event in chain:
+                    for duration in score['durations'][event]:
+                        posting_scores.append(score_idx)
+                        postings.append(len(event_ids))
+                        durations.append(np.nan if duration is None else duration)
+                    event_scores.append(score_idx)
+                    event_ids.append(str(event))
+
+                sizes.append(len(chain))
+
+        # A fact without duration can not satisfy a duration condition (the bounds are strictly positive)
+        posting_scores, postings, durations = np.array(posting_scores), np.array(postings, dtype=np.int64), np.array(durations, dtype=np.float64)
+        known = durations > 0
+
+        keys = posting_scores[known] + 1j * np.log2(durations[known])
+        order = np.argsort(keys, kind='stable')
+
+        return cls(
+            np.concatenate(([0], np.cumsum(sizes))).astype(np.int64),
+            np.array(event_scores, dtype=np.int32),
+            np.array(event_ids, dtype=str),
+            keys[order],
+            postings[known][order],
+            sources,
+            [scores[source]['collection'] for source in sources]
+        )
+
+    def save(self, directory=None):
+        '''
+        Save the index in `directory` (`DEFAULT_DURATION_INDEX_DIR` if None) : one `.npy` file per array, and `scores.json`.
+        '''
+
+        directory = directory or DEFAULT_DURATION_INDEX_DIR
+        os.makedirs(directory, exist_ok=True)
+
+        for name in self.FILES:
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, name))
+
+        with open(os.path.join(directory, 'scores.json'), 'w') as f:
+            json.dump({'hit_key': HIT_KEY, 'sources': self.sources, 'collections': self.collections}, f)
+
+    @classmethod
+    def load(cls, directory=None):
+        '''
+        Load an index saved with `save`. The arrays are memory-mapped, not read.
+
+        - directory : the directory of the index (`DEFAULT_DURATION_INDEX_DIR` if None).
+        '''
+
+        directory = directory or DEFAULT_DURATION_INDEX_DIR
+
+        with open(os.path.join(directory, 'scores.json'), 'r') as f:
+            meta = json.load(f)
+
+        if meta.get('hit_key') != HIT_KEY:
+            raise ValueError(f'The index in {directory} was built by an older version (hits by start), it should be rebuilt')
+
+        arrays = [np.load(os.path.join(directory, name + '.npy'), mmap_mode='r') for name in cls.FILES]
+
+        return cls(*arrays, meta['sources'], meta['collections'])
+
+    def __len__(self):
+        return len(self.postings)
+
+    def scores(self, collection=None):
+        '''Return the indexes of the scores (of the collection `collection` if not None).'''
+
+        if collection is None:
+            return np.arange(len(self.sources))
+
+        return np.array([idx for idx, c in enumerate(self.collections) if c == collection], dtype=np.int64)
+
+    def note_events(self, min_duration, max_duration, scores):
+        '''
+        Return the sorted events with a fact whose duration is in `[min_duration, max_duration]`, in the given scores.
+
+        The bounds are widened by one ulp in the log space, so that the rounding of `log2` can not drop an event.
+
+        - min_duration, max_duration : the duration window ;
+        - scores                     : the indexes of the scores.
+        '''
+
+        low = np.nextafter(np.log2(min_duration), -np.inf)
+        high = np.nextafter(np.log2(max_duration), np.inf)
+
+        first = np.searchsorted(self.keys, scores + 1j * low, 'left')
+        last = np.searchsorted(self.keys, scores + 1j * high, 'right')
+
+        return np.unique(np.asarray(self.postings)[concatenated_ranges(first, last - first)])
+
+    def search(self, windows, nb_notes, collection=None):
+        '''
+        Return the first events of the windows of `nb_notes` consecutive events of a chain whose events are in the
+        duration windows of their note.
+
+        - windows    : the duration windows (see `duration_windows`) ;
+        - nb_notes   : the number of notes of the query ;
+        - collection : if not None, only search the scores of this collection.
+        '''
+
+        scores = self.scores(collection)
+        chain_events = np.asarray(self.chain_events)
+
+        # Number of the chain of each event, to check that a window does not cross the end of its chain
+        event_chain = np.repeat(np.arange(len(chain_events) - 1), np.diff(chain_events))
+
+        starts = None
+        for idx, min_duration, max_duration in windows:
+            events = self.note_events(min_duration, max_duration, scores)
+
+            # The window of an event of the note `idx` starts `idx` events before, in the same chain
+            events = events[events - idx >= chain_events[event_chain[events]]] - idx
+            starts = events if starts is None else np.intersect1d(starts, events, assume_unique=True)
+
+            if len(starts) == 0:
+                break
+
+        return starts[starts + nb_notes <= chain_events[event_chain[starts] + 1]]
+
+    def hits(self, starts):
+        '''Return the list of `{'source', 'id'}` of events.'''
+
+        return [
+            {'source': self.sources[score], 'id': str(event)}
+            for score, event in zip(np.asarray(self.event_score)[starts].tolist(), np.asarray(self.event_id)[starts].tolist())
+        ]
+
+def build_duration_index(driver, directory=None):
+    '''
+    Build the index from the database and save it (see `DurationIndex.save`). Returns the index.
+
+    - driver    : the neo4j driver ;
+    - directory : the directory of the index (`DEFAULT_DURATION_INDEX_DIR` if None).
+    '''
+
+    index = DurationIndex.from_records(run_query(driver, DURATIONS_QUERY), run_query(driver, NEXT_QUERY))
+    index.save(directory)
+
+    return index
+
+def duration_indexed_query(index, crisp_query, fuzzy_query, parameters=None):
+    '''
+    Use the index to restrict a compiled query to the windows whose events are in the duration windows of the query.
+
+    Returns `(crisp_query, parameters, nb_hits)`, with the anchored query and its parameters (with `hits`), or
+    None if the query can not be answered with the index (see `duration_windows`).
+
+    - index       : the `DurationIndex` ;
+    - crisp_query : the compiled query ;
+    - fuzzy_query : the parsed fuzzy query ;
+    - parameters  : the parameters of the compiled query, or None.
+    '''
+
+    windows = duration_windows(fuzzy_query)
+    if windows is None:
+        return None
+
+    hits = index.hits(index.search(windows, len(fuzzy_query.events), fuzzy_query.collection))
+
+    return anchor_query(crisp_query, fuzzy_query, 0), {**(parameters or {}), 'hits': hits}, len(hits)
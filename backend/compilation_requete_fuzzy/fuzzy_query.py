@@ -0,0 +1,719 @@
+import re
+
+from extract_notes_from_query import create_trapezoidal_function, create_ascending_function, create_descending_function
+
+##-Tokenizer
+TOKEN_SPECIFICATION = [
+    ('STRING', r"'[^']*'|\"[^\"]*\""),
+    ('NUMBER', r'\d+(?:\.\d+)?'),
+    ('IDENT', r'[A-Za-z_][A-Za-z0-9_]*'),
+    ('ARROW', r'<--|-->|<-|->|--'),
+    ('OP', r'<=|>=|<>|!=|=|<|>'),
+    ('PUNCT', r'[()\[\]{}:,.*+\-/$;|]'),
+    ('SKIP', r'\s+'),
+    ('MISMATCH', r'.'),
+]
+TOKEN_REGEX = re.compile('|'.join(f'(?P<{name}>{regex})' for name, regex in TOKEN_SPECIFICATION))
+
+# Keywords that end a clause (`ORDER` and `OPTIONAL` only when followed by `BY` / `MATCH`).
+CLAUSE_KEYWORDS = ('MATCH', 'WHERE', 'RETURN', 'WITH', 'ORDER', 'LIMIT', 'SKIP', 'UNION', 'OPTIONAL', 'DETACH', 'DELETE', 'SET', 'CREATE')
+
+class FuzzyQuerySyntaxError(ValueError):
+    '''Raised when a fuzzy query cannot be parsed.'''
+
+class Token:
+    '''A lexical token of a fuzzy query.'''
+
+    __slots__ = ('kind', 'value', 'start', 'end')
+
+    def __init__(self, kind, value, start, end):
+        self.kind = kind
+        self.value = value
+        self.start = start
+        self.end = end
+
+    def is_keyword(self, *keywords):
+        '''Return True iff the token is an identifier equal (case insensitive) to one of `keywords`.'''
+
+        return self.kind == 'IDENT' and self.value.upper() in keywords
+
+    def __repr__(self):
+        return f'Token({self.kind}, {self.value!r}, {self.start})'
+
+def tokenize(query):
+    '''
+    Split `query` into a list of `Token`s (whitespaces are dropped).
+
+    Raises a `FuzzyQuerySyntaxError` on an unexpected character.
+    '''
+
+    tokens = []
+    for m in TOKEN_REGEX.finditer(query):
+        kind = m.lastgroup
+
+        if kind == 'SKIP':
+            continue
+
+        if kind == 'MISMATCH':
+            raise FuzzyQuerySyntaxError(f'Unexpected character "{m.group()}" at position {m.start()}')
+
+        tokens.append(Token(kind, m.group(), m.start(), m.end()))
+
+    return tokens
+
+##-AST
+class MembershipFunction:
+    '''A fuzzy term defined with `DEFINETRAP`, `DEFINEASC` or `DEFINEDESC`.'''
+
+    def __init__(self, name, kind, parameters):
+        '''
+        - name       : the name of the fuzzy term (e.g 'stepUp') ;
+        - kind       : 'TRAP', 'ASC' or 'DESC' ;
+        - parameters : the breakpoints (4 for 'TRAP', 2 otherwise).
+        '''
+
+        self.name = name
+        self.kind = kind
+        self.parameters = tuple(parameters)
+
+        if kind == 'TRAP':
+            self._function = create_trapezoidal_function(*self.parameters)
+        elif kind == 'ASC':
+            self._function = create_ascending_function(*self.parameters)
+        else:
+            self._function = create_descending_function(*self.parameters)
+
+    def __call__(self, x):
+        return self._function(x)
+
+    @property
+    def support(self):
+        '''The support interval `(min_value, max_value)` of the function (can be infinite).'''
+
+        if self.kind == 'TRAP':
+            return self.parameters[0], self.parameters[3]
+        elif self.kind == 'ASC':
+            return self.parameters[0], float('inf')
+        else:
+            return float('-inf'), self.parameters[1]
+
+    def __repr__(self):
+        return f'MembershipFunction({self.name}, {self.kind}, {self.parameters})'
+
+class PatternElement:
+    '''A node `(var:Type{props})` or a relationship `[var:Type{props}]` of the MATCH clause.'''
+
+    __slots__ = ('variable', 'type', 'properties', 'is_relationship', 'fixed', 'start', 'end')
+
+    def __init__(self, variable, type_, properties, is_relationship, start, end):
+        self.variable = variable
+        self.type = type_
+        self.properties = properties # list of (key, value, value_text)
+        self.is_relationship = is_relationship
+        self.fixed = False
+        self.start = start
+        self.end = end
+
+    def canonical_text(self):
+        '''The element without its properties (e.g `(f0:Fact)`).'''
+
+        content = self.variable if self.type is None else f'{self.variable}:{self.type}'
+
+        if self.is_relationship:
+            return f'[{content}]'
+        return f'({content})'
+
+    def __repr__(self):
+        return self.canonical_text()
+
+class PathPattern:
+    '''A comma separated part of the MATCH clause, e.g `(e0:Event)-[n0:NEXT]->(e1:Event)`.'''
+
+    __slots__ = ('elements', 'text')
+
+    def __init__(self, elements, text):
+        self.elements = elements
+        self.text = text # normalized text (without properties)
+
+    @property
+    def nodes(self):
+        return [element for element in self.elements if not element.is_relationship]
+
+    @property
+    def relationships(self):
+        return [element for element in self.elements if element.is_relationship]
+
+class Condition:
+    '''
+    A condition of the WHERE clause (conditions are separated by `AND`).
+
+    `text` is always set. When the condition has the form `var.attribute <op> value` (or `var.attribute IS term`),
+    `variable`, `attribute`, `operator` and `value` are also set, otherwise they are None.
+    '''
+
+    __slots__ = ('text', 'variable', 'attribute', 'operator', 'value')
+
+    def __init__(self, text, variable=None, attribute=None, operator=None, value=None):
+        self.text = text
+        self.variable = variable
+        self.attribute = attribute
+        self.operator = operator
+        self.value = value
+
+    def __repr__(self):
+        return f'Condition({self.text!r})'
+
+class FuzzyQuery:
+    '''
+    Parsed fuzzy query.
+
+    The query text is tokenized and parsed once. The compiler (`reformulation_V3`) and the ranking (`process_results`)
+    both work on this object instead of extracting information from the text again.
+
+    Attributes :
+        - source                 : the original text of the query ;
+        - pitch_distance, duration_factor, duration_gap, alpha, allow_transposition : the fuzzy parameters ;
+        - membership_functions   : dict name -> `MembershipFunction` ;
+        - patterns               : list of `PathPattern` (the MATCH clause, without the properties) ;
+        - nodes                  : dict variable -> attributes (with 'type'), as `extract_notes_from_query_dict` ;
+        - conditions             : list of `Condition` of the WHERE clause (properties from the MATCH clause included) ;
+        - chords                 : dict event -> attributes of the other notes of its chord (see `_Parser.collect_chords`) ;
+        - match_body             : the text of the MATCH clause after the fuzzy parameters, without the properties ;
+        - return_clause          : the text of the RETURN clause (and what follows), '' if there is none.
+    '''
+
+    def __init__(self, source):
+        self.source = source
+
+        self.pitch_distance = 0.0
+        self.duration_factor = 1.0
+        self.duration_gap = 0.0
+        self.alpha = 0.0
+        self.allow_transposition = False
+
+        self.membership_functions = {}
+        self.patterns = []
+        self.nodes = {}
+        self.conditions = []
+        self.chords = {}
+        self.match_body = ''
+        self.return_clause = ''
+
+    @property
+    def contour(self):
+        '''True iff the query uses membership functions (contour query).'''
+
+        return len(self.membership_functions) > 0
+
+    @property
+    def events(self):
+        '''The names of the Event nodes, in order of appearance.'''
+
+        return [name for name, attrs in self.nodes.items() if attrs.get('type') == 'Event']
+
+    @property
+    def facts(self):
+        '''The Fact nodes (dict name -> attributes), in order of appearance.'''
+
+        return {name: attrs for name, attrs in self.nodes.items() if attrs.get('type') == 'Fact'}
+
+    @property
+    def fixed_notes(self):
+        '''For each Fact node, True iff it is marked as `FIXED`.'''
+
+        fixed = {}
+        for pattern in self.patterns:
+            for element in pattern.nodes:
+                if self.nodes.get(element.variable, {}).get('type') == 'Fact':
+                    fixed[element.variable] = fixed.get(element.variable, False) or element.fixed
+
+        return list(fixed.values())
+
+    @property
+    def collection(self):
+        '''The collection filter (value of a `x.collection = '...'` condition), or None.'''
+
+        for condition in self.conditions:
+            if condition.attribute == 'collection' and condition.operator == '=':
+                return condition.value
+
+        return None
+
+    @property
+    def attributes_with_membership_functions(self):
+        '''List of `[node_name, attribute_name, membership_function_name]`, as `extract_attributes_with_membership_functions`.'''
+
+        return [
+            [condition.variable, condition.attribute, condition.value]
+            for condition in self.conditions
+            if condition.operator == 'IS' and condition.value in self.membership_functions
+        ]
+
+    @property
+    def support_intervals(self):
+        '''dict name -> support interval of the membership function, as `extract_membership_function_support_intervals`.'''
+
+        return {name: function.support for name, function in self.membership_functions.items()}
+
+    def parameters(self):
+        '''The fuzzy parameters, in the same format as `extract_fuzzy_parameters`.'''
+
+        return (
+            self.pitch_distance, self.duration_factor, self.duration_gap, self.alpha,
+            self.allow_transposition, self.contour, self.fixed_notes, self.collection
+        )
+
+    def __repr__(self):
+        return f'FuzzyQuery(events={self.events}, pitch={self.pitch_distance}, duration={self.duration_factor}, gap={self.duration_gap}, alpha={self.alpha})'
+
+##-Parser
+class _Parser:
+    '''Recursive descent parser building a `FuzzyQuery` from its tokens.'''
+
+    def __init__(self, query):
+        self.query = query
+        self.tokens = tokenize(query)
+        self.pos = 0
+        self.fuzzy_query = FuzzyQuery(query)
+
+        # Variable -> type, to check that every node / relationship is typed at its first occurrence
+        self.node_variables = {}
+        self.relationship_variables = {}
+        self.property_conditions = []
+
+    #---Helpers
+    def peek(self, offset=0):
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else None
+
+    def advance(self):
+        token = self.peek()
+        if token is None:
+            raise FuzzyQuerySyntaxError('Unexpected end of query')
+        self.pos += 1
+        return token
+
+    def expect(self, kind, value=None):
+        token = self.peek()
+        if token is None:
+            raise FuzzyQuerySyntaxError(f'Expected "{value or kind}" but the query ended')
+        if token.kind != kind or (value != None and token.value.upper() != value.upper()):
+            raise FuzzyQuerySyntaxError(f'Expected "{value or kind}" but found "{token.value}" at position {token.start}')
+        self.pos += 1
+        return token
+
+    def at(self, kind, value=None):
+        token = self.peek()
+        return token != None and token.kind == kind and (value == None or token.value == value)
+
+    def at_clause_keyword(self, offset=0):
+        '''Return True iff the token at `offset` starts a new clause.'''
+
+        token = self.peek(offset)
+        if token is None or token.kind != 'IDENT' or token.value.upper() not in CLAUSE_KEYWORDS:
+            return False
+
+        # An attribute name (e.g `e0.set`) is not a keyword
+        previous = self.tokens[self.pos + offset - 1] if self.pos + offset > 0 else None
+        if previous != None and previous.kind == 'PUNCT' and previous.value == '.':
+            return False
+
+        next_token = self.peek(offset + 1)
+        if token.value.upper() == 'ORDER':
+            return next_token != None and next_token.is_keyword('BY')
+        if token.value.upper() == 'OPTIONAL':
+            return next_token != None and next_token.is_keyword('MATCH')
+
+        return True
+
+    def number(self):
+        '''Parse a (possibly negative) number.'''
+
+        sign = 1
+        if self.at('PUNCT', '-'):
+            self.advance()
+            sign = -1
+
+        return sign * float(self.expect('NUMBER').value)
+
+    #---Query
+    def parse(self):
+        self.parse_definitions()
+
+        if not (self.peek() and self.peek().is_keyword('MATCH')):
+            raise ValueError('No MATCH clause found in the query')
+        self.advance()
+
+        self.parse_match()
+
+        if self.peek() != None and not self.at_clause_keyword():
+            raise FuzzyQuerySyntaxError(f'Unexpected "{self.peek().value}" at position {self.peek().start}')
+
+        if self.peek() != None and self.peek().is_keyword('WHERE'):
+            self.advance()
+            self.parse_where()
+
+        # Conditions given as properties in the MATCH clause come after the ones from the WHERE clause
+        self.fuzzy_query.conditions.extend(self.property_conditions)
+        for condition in self.property_conditions:
+            self.add_node_attribute(condition)
+
+        self.collect_chords()
+
+        if self.peek() != None:
+            self.fuzzy_query.return_clause = self.query[self.peek().start:].strip()
+
+        return self.fuzzy_query
+
+    def parse_definitions(self):
+        '''Parse the `DEFINETRAP` / `DEFINEASC` / `DEFINEDESC` definitions before MATCH.'''
+
+        nb_parameters = {'DEFINETRAP': 4, 'DEFINEASC': 2, 'DEFINEDESC': 2}
+
+        while self.peek() != None and self.peek().is_keyword(*nb_parameters):
+            keyword = self.advance().value.upper()
+            name = self.expect('IDENT').value
+            self.expect('IDENT', 'AS')
+            self.expect('PUNCT', '(')
+
+            parameters = [self.number()]
+            for _ in range(nb_parameters[keyword] - 1):
+                self.expect('PUNCT', ',')
+                parameters.append(self.number())
+
+            self.expect('PUNCT', ')')
+
+            self.fuzzy_query.membership_functions[name] = MembershipFunction(name, keyword[len('DEFINE'):], parameters)
+
+    #---MATCH
+    def parse_match(self):
+        '''Parse the fuzzy parameters and the patterns of the MATCH clause.'''
+
+        fuzzy_query = self.fuzzy_query
+
+        #---Fuzzy parameters
+        while not self.at('PUNCT', '('):
+            token = self.peek()
+
+            if token is None or self.at_clause_keyword():
+                raise ValueError('No node patterns found in MATCH clause')
+
+            if token.is_keyword('ALLOW_TRANSPOSITION'):
+                self.advance()
+                fuzzy_query.allow_transposition = True
+
+            elif token.is_keyword('TOLERANT'):
+                self.advance()
+                while True:
+                    name = self.expect('IDENT').value.lower()
+                    self.expect('OP', '=')
+                    value = self.number()
+
+                    if name == 'pitch':
+                        fuzzy_query.pitch_distance = value
+                    elif name == 'duration':
+                        fuzzy_query.duration_factor = value
+                    elif name == 'gap':
+                        fuzzy_query.duration_gap = value
+                    else:
+                        raise FuzzyQuerySyntaxError(f'Unknown TOLERANT parameter "{name}" at position {token.start}')
+
+                    if not self.at('PUNCT', ','):
+                        break
+                    self.advance()
+
+            elif token.is_keyword('ALPHA'):
+                self.advance()
+                fuzzy_query.alpha = self.number()
+
+            else:
+                raise FuzzyQuerySyntaxError(f'Unexpected "{token.value}" in MATCH clause at position {token.start}')
+
+        #---Patterns
+        body_start = self.peek().start
+        elements = []
+
+        while True:
+            pattern_elements = self.parse_path()
+            elements.extend(pattern_elements)
+            fuzzy_query.patterns.append(PathPattern(pattern_elements, None))
+
+            if not self.at('PUNCT', ','):
+                break
+            self.advance()
+
+        body_end = self.tokens[self.pos - 1].end
+
+        #---Normalized text (properties and FIXED removed)
+        fuzzy_query.match_body = self.normalize_text(body_start, body_end, elements).strip()
+        for pattern in fuzzy_query.patterns:
+            first, last = pattern.elements[0], pattern.elements[-1]
+            pattern.text = self.normalize_text(first.start, last.end, pattern.elements).strip()
+
+    def normalize_text(self, start, end, elements):
+        '''Return the text between `start` and `end`, where `elements` are replaced by their canonical text.'''
+
+        res = ''
+        current = start
+        for element in elements:
+            if element.start < start or element.end > end:
+                continue
+
+            res += self.query[current:element.start] + element.canonical_text()
+            current = element.end
+
+        res += self.query[current:end]
+
+        # FIXED is a fuzzy keyword : not part of the crisp pattern
+        return re.sub(r'\)\s*FIXED\b', ')', res)
+
+    def parse_path(self):
+        '''Parse a path : `node (relationship node)*`.'''
+
+        elements = [self.parse_element(False)]
+
+        while True:
+            token = self.peek()
+            if token is None:
+                break
+
+            if token.kind == 'ARROW' and token.value in ('--', '-->', '<--'):
+                self.advance()
+
+            elif (token.kind == 'PUNCT' and token.value == '-') or (token.kind == 'ARROW' and token.value == '<-'):
+                self.advance()
+                elements.append(self.parse_element(True))
+
+                closing = self.peek()
+                if closing is None or not ((closing.kind == 'ARROW' and closing.value == '->') or (closing.kind == 'PUNCT' and closing.value == '-')):
+                    raise FuzzyQuerySyntaxError(f'Unterminated relationship at position {token.start}')
+                self.advance()
+
+            else:
+                break
+
+            elements.append(self.parse_element(False))
+
+        return elements
+
+    def parse_element(self, is_relationship):
+        '''Parse a node `(var:Type{props}) [FIXED]` or a relationship `[var:Type{props}]`.'''
+
+        open_bracket, close_bracket = ('[', ']') if is_relationship else ('(', ')')
+        start = self.expect('PUNCT', open_bracket).start
+
+        variable = ''
+        if self.at('IDENT'):
+            variable = self.advance().value
+
+        #---Type (kept as raw text, e.g 'NEXT*1..5')
+        type_ = None
+        if self.at('PUNCT', ':'):
+            type_start = self.advance().end
+            while not (self.at('PUNCT', '{') or self.at('PUNCT', close_bracket)):
+                self.advance()
+            type_ = self.query[type_start:self.peek().start].strip() or None
+
+        #---Properties
+        properties = []
+        if self.at('PUNCT', '{'):
+            self.advance()
+            while not self.at('PUNCT', '}'):
+                key = self.expect('IDENT').value
+                if not (self.at('PUNCT', ':') or self.at('OP', '=')):
+                    raise FuzzyQuerySyntaxError(f'Invalid property format for "{key}" at position {self.peek().start}')
+                self.advance()
+                properties.append((key, *self.property_value()))
+
+                if self.at('PUNCT', ','):
+                    self.advance()
+            self.advance()
+
+        end = self.expect('PUNCT', close_bracket).end
+        element = PatternElement(variable, type_, properties, is_relationship, start, end)
+
+        if not is_relationship and self.peek() != None and self.peek().is_keyword('FIXED'):
+            self.advance()
+            element.fixed = True
+
+        self.declare(element)
+
+        return element
+
+    def property_value(self):
+        '''Parse the value of a property. Return `(value, value_text)`, `value_text` being its Cypher text.'''
+
+        token = self.advance()
+
+        if token.kind == 'STRING':
+            value = token.value[1:-1]
+            return (None if value == 'None' else value), token.value
+
+        if token.kind == 'PUNCT' and token.value == '-':
+            number = self.expect('NUMBER')
+            text = '-' + number.value
+            return convert_number(text), text
+
+        if token.kind == 'NUMBER':
+            return convert_number(token.value), token.value
+
+        if token.kind == 'IDENT':
+            if token.value.lower() in ('true', 'false', 'null'):
+                return token.value, token.value
+            # Unquoted string
+            return (None if token.value == 'None' else token.value), f"'{token.value}'"
+
+        raise FuzzyQuerySyntaxError(f'Invalid property value "{token.value}" at position {token.start}')
+
+    def declare(self, element):
+        '''Check the type of `element` and register it in the nodes and property conditions.'''
+
+        variables = self.relationship_variables if element.is_relationship else self.node_variables
+
+        if element.variable not in variables:
+            if element.type is None:
+                element_name = 'Relationship' if element.is_relationship else 'Node'
+                raise ValueError(f'{element_name} "{element.variable}" is not typed in the MATCH clause')
+            variables[element.variable] = element.type
+
+        attrs = self.fuzzy_query.nodes.setdefault(element.variable, {})
+        if element.type:
+            attrs['type'] = element.type
+
+        for key, value, value_text in element.properties:
+            self.property_conditions.append(Condition(f'{element.variable}.{key} = {value_text}', element.variable, key, '=', value))
+
+    def collect_chords(self):
+        '''
+        Separate the notes of the chords : when several Facts are linked to an Event (`(e0)--(f0:Fact), (e0)--(f0_1:Fact)`),
+        the first one is the note of the event, and the other ones are the other notes of its chord. They are removed
+        from the nodes, patterns and conditions, and kept (in order) in `chords`, so that the query has one Fact per
+        Event, and the compiler checks the chord with a single condition on the event.
+        '''
+
+        fuzzy_query = self.fuzzy_query
+        notes = {}
+        removed = set()
+
+        for pattern in fuzzy_query.patterns:
+            variables = [node.variable for node in pattern.nodes]
+            if len(variables) != 2 or pattern.relationships:
+                continue
+
+            types = [fuzzy_query.nodes[variable].get('type') for variable in variables]
+            if types == ['Fact', 'Event']:
+                variables.reverse()
+            elif types != ['Event', 'Fact']:
+                continue
+
+            event, fact = variables
+            if event not in notes:
+                notes[event] = fact
+            elif fact != notes[event]:
+                fuzzy_query.chords.setdefault(event, []).append(fuzzy_query.nodes[fact])
+                removed.add(fact)
+
+        if not removed:
+            return
+
+        for fact in removed:
+            del fuzzy_query.nodes[fact]
+
+        fuzzy_query.patterns = [
+            pattern for pattern in fuzzy_query.patterns if not any(node.variable in removed for node in pattern.nodes)
+        ]
+        fuzzy_query.conditions = [condition for condition in fuzzy_query.conditions if condition.variable not in removed]
+        fuzzy_query.match_body = ',\n '.join(pattern.text for pattern in fuzzy_query.patterns)
+
+    #---WHERE
+    def parse_where(self):
+        '''Parse the WHERE clause into a list of conditions separated by `AND`.'''
+
+        while self.peek() != None and not self.at_clause_keyword():
+            first = self.pos
+            depth = 0
+
+            while self.peek() != None and not self.at_clause_keyword():
+                token = self.peek()
+                if token.kind == 'PUNCT' and token.value in '([':
+                    depth += 1
+                elif token.kind == 'PUNCT' and token.value in ')]':
+                    depth -= 1
+                elif depth == 0 and token.is_keyword('AND'):
+                    break
+                self.advance()
+
+            if self.pos > first:
+                condition = self.make_condition(self.tokens[first:self.pos])
+                self.fuzzy_query.conditions.append(condition)
+                self.add_node_attribute(condition)
+
+            if self.peek() != None and self.peek().is_keyword('AND'):
+                self.advance()
+
+    def make_condition(self, tokens):
+        '''Build a `Condition` from its tokens, recognizing `var.attr <op> value` and `var.attr IS term`.'''
+
+        text = self.query[tokens[0].start:tokens[-1].end]
+        values = [(t.kind, t.value) for t in tokens]
+
+        # Optional parentheses around `var.attr` (e.g `(n0.interval) IS stepUp`)
+        if len(values) >= 5 and values[0] == ('PUNCT', '(') and values[4] == ('PUNCT', ')'):
+            values = values[1:4] + values[5:]
+
+        if len(values) < 4 or values[0][0] != 'IDENT' or values[1] != ('PUNCT', '.') or values[2][0] != 'IDENT':
+            return Condition(text)
+
+        variable, attribute = values[0][1], values[2][1]
+        operator_token, rest = values[3], values[4:]
+
+        if operator_token[0] == 'IDENT' and operator_token[1].upper() == 'IS':
+            if len(rest) == 1 and rest[0][0] == 'IDENT':
+                return Condition(text, variable, attribute, 'IS', rest[0][1])
+            if len(rest) == 2 and rest[0][0] == 'IDENT' and rest[0][1].upper() == 'NOT' and rest[1][0] == 'IDENT':
+                return Condition(text, variable, attribute, 'IS NOT', rest[1][1])
+            return Condition(text)
+
+        if operator_token[0] != 'OP':
+            return Condition(text)
+
+        if len(rest) == 1 and rest[0][0] == 'STRING':
+            value = rest[0][1][1:-1]
+            value = None if value == 'None' else value
+        elif len(rest) == 1 and rest[0][0] == 'NUMBER':
+            value = convert_number(rest[0][1])
+        elif len(rest) == 2 and rest[0] == ('PUNCT', '-') and rest[1][0] == 'NUMBER':
+            value = convert_number('-' + rest[1][1])
+        elif len(rest) == 1 and rest[0][0] == 'IDENT':
+            value = None if rest[0][1] == 'None' else rest[0][1]
+        else:
+            return Condition(text)
+
+        return Condition(text, variable, attribute, operator_token[1], value)
+
+    def add_node_attribute(self, condition):
+        '''Record the value of an equality condition in the attributes of its node.'''
+
+        if condition.operator != '=':
+            return
+
+        self.fuzzy_query.nodes.setdefault(condition.variable, {})[condition.attribute] = condition.value
+
+def convert_number(text):
+    '''Convert `text` to an int, or to a float if it contains a dot.'''
+
+    return float(text) if '.' in text else int(text)
+
+def parse_fuzzy_query(query):
+    '''
+    Parse a fuzzy query.
+
+    - query : the fuzzy query, as a string. If it is already a `FuzzyQuery`, it is returned unchanged.
+
+    Out: a `FuzzyQuery`.
+    '''
+
+    if isinstance(query, FuzzyQuery):
+        return query
+
+    return _Parser(query).parse()
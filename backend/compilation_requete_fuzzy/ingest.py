@@ -0,0 +1,186 @@
+'''
+Incremental ingestion : add, replace or remove a single score, without rebuilding the database.
+
+`ingest_mei_file` parses one MEI file (see `mei_import.parse_mei_file`, which computes the derived properties :
+timings, `halfTonesFromA4`, `frequency`, `NEXT.interval`, ...) and, in a single transaction, removes the previous
+version of the score (if any), writes the new one and links its events to the interval n-grams
+(see `interval_ngrams`). `remove_score` removes a score the same way.
+
+The previous version is found from the `source` of its events (and of its `Score`), so that a score written with
+another model (e.g without `TopRhythmic`) is removed entirely, instead of leaving its events and facts behind.
+
+The gram counts are updated with the difference between the removed and the added grams, both in the `IntervalGram`
+nodes and in the catalog file (which also clears the compile cache). The schema indexes (see `schema`) are maintained
+by neo4j, but not the indexes saved on disk (`interval_index`, `contour_index`, `duration_index` and the scan corpus
+of `pitch_scan`) : they are built from a snapshot of the database, and should be rebuilt after an ingestion or a
+removal (`main_parser.py interval-index`, `contour-index`, `duration-index` and `scan-corpus`).
+'''
+
+import time
+
+from interval_ngrams import get_catalog, interval_gram_key, save_catalog
+from mei_import import WRITE_KEYS, WRITE_SCORES_QUERY, parse_mei_file
+
+REMOVE_GRAM_LINKS_QUERY = '''
+MATCH (g:IntervalGram)-[s:STARTS]->(e:Event {source: $source})
+DELETE s
+WITH g, g.key AS key, count(*) AS removed
+SET g.count = g.count - removed
+WITH g, key, removed, g.count AS count
+FOREACH (_ IN CASE WHEN count <= 0 THEN [1] ELSE [] END | DELETE g)
+RETURN key, removed
+'''
+
+REMOVE_SCORE_QUERY = '''
+OPTIONAL MATCH (e:Event {source: $source})
+OPTIONAL MATCH (e)--(f:Fact)
+OPTIONAL MATCH (m:Measure)-[:HAS]->(e)
+OPTIONAL MATCH (tr:TopRhythmic)-[:RHYTHMIC]->(m)
+WITH collect(DISTINCT e) AS events, collect(DISTINCT f) AS facts, collect(DISTINCT m) AS measures, collect(DISTINCT tr) AS tops
+OPTIONAL MATCH (score:Score {source: $source})
+OPTIONAL MATCH (score)-[:timeSeries]->(top)
+WITH events, facts, measures, tops, collect(DISTINCT top) AS roots, collect(DISTINCT score) AS scores
+FOREACH (node IN facts + events + measures + tops + roots + scores | DETACH DELETE node)
+RETURN size(scores) AS scores, size(events) AS events
+'''
+
+ADD_GRAM_LINKS_QUERY = '''
+UNWIND $grams AS gram
+MATCH (e:Event {source: $source, id: gram.id})
+MERGE (g:IntervalGram {k: $k, key: gram.key})
+ON CREATE SET g.count = 0
+MERGE (g)-[:STARTS]->(e)
+SET g.count = g.count + 1
+'''
+
+def score_grams(score, k):
+    '''
+    Return the interval grams of size `k` of a parsed score (see `mei_import.parse_mei_file`) :
+    the list of `{'key', 'id'}`, `id` being the id of the first event of the gram.
+
+    As in `interval_ngrams.build_interval_gram_index`, the grams are taken along the `NEXT` chains (one per voice),
+    and the chains with a `NEXT` without interval are not indexed.
+
+    - score : the parsed score ;
+    - k     : the number of intervals in a gram.
+    '''
+
+    events = [event['event'] for measure in score['measures'] for event in measure['events']]
+    next_events = {next_['a']: next_ for next_ in score['next']}
+
+    grams = []
+    for voice in score['voices']:
+        # The events of the voice, and the intervals between them
+        chain, intervals = [voice['first']], []
+        while chain[-1] in next_events:
+            intervals.append(next_events[chain[-1]]['interval'])
+            chain.append(next_events[chain[-1]]['b'])
+
+        for idx in range(len(intervals) - k + 1):
+            gram = intervals[idx:idx + k]
+            if any(interval is None for interval in gram):
+                continue
+
+            grams.append({'key': interval_gram_key(gram), 'id': events[chain[idx]]['id']})
+
+    return grams
+
+def _remove(tx, source, catalog):
+    '''Remove the score `source` in the transaction `tx`. Returns `(nb of events, {key: nb of removed grams})`.'''
+
+    removed = {}
+    if catalog is not None:
+        for record in tx.run(REMOVE_GRAM_LINKS_QUERY, {'source': source}):
+            removed[record['key']] = record['removed']
+
+    record = tx.run(REMOVE_SCORE_QUERY, {'source': source}).single()
+
+    return (record['events'] if record is not None else 0), removed
+
+def _update_catalog(catalog, removed, added):
+    '''Apply the removed and added gram counts to the catalog, and save it (which clears the compile cache).'''
+
+    counts = dict(catalog['counts'])
+
+    for key, nb in removed.items():
+        counts[key] = counts.get(key, 0) - nb
+    for key, nb in added.items():
+        counts[key] = counts.get(key, 0) + nb
+
+    save_catalog({key: count for key, count in counts.items() if count > 0}, catalog['k'])
+
+def ingest_mei_file(driver, path, collection=None):
+    '''
+    Add a score from an MEI file, or replace it if a score with the same source (file name) already exists.
+
+    - driver     : the neo4j driver ;
+    - path       : the MEI file ;
+    - collection : the collection of the score (by default, the name of the directory above `mei/`).
+
+    Returns a dict with the source, the numbers of added and removed events, the numbers of added and removed
+    interval grams, and the time spent (in ms).
+    '''
+
+    start = time.perf_counter()
+
+    score = parse_mei_file(path, collection)
+    source = score['source']
+
+    catalog = get_catalog()
+    grams = score_grams(score, catalog['k']) if catalog is not None else []
+
+    def work(tx):
+        removed_events, removed = _remove(tx, source, catalog)
+
+        row = {key: score[key] for key in WRITE_KEYS}
+        tx.run(WRITE_SCORES_QUERY, {'scores': [row]}).consume()
+
+        if grams:
+            tx.run(ADD_GRAM_LINKS_QUERY, {'source': source, 'k': catalog['k'], 'grams': grams}).consume()
+
+        return removed_events, removed
+
+    with driver.session() as session:
+        removed_events, removed = session.execute_write(work)
+
+    added = {}
+    for gram in grams:
+        added[gram['key']] = added.get(gram['key'], 0) + 1
+
+    if catalog is not None:
+        _update_catalog(catalog, removed, added)
+
+    return {
+        'source': source,
+        'events': score['nb_events'],
+        'removed_events': removed_events,
+        'grams': len(grams),
+        'removed_grams': sum(removed.values()),
+        'elapsed_ms': (time.perf_counter() - start) * 1000
+    }
+
+def remove_score(driver, source):
+    '''
+    Remove a score (with its measures, events and facts) and its interval grams.
+
+    - driver : the neo4j driver ;
+    - source : the source of the score (e.g 'Air_n_83.mei').
+
+    Returns a dict with the source, the number of removed events and grams, and the time spent (in ms).
+    '''
+
+    start = time.perf_counter()
+    catalog = get_catalog()
+
+    with driver.session() as session:
+        removed_events, removed = session.execute_write(lambda tx: _remove(tx, source, catalog))
+
+    if catalog is not None and removed:
+        _update_catalog(catalog, removed, {})
+
+    return {
+        'source': source,
+        'removed_events': removed_events,
+        'removed_grams': sum(removed.values()),
+        'elapsed_ms': (time.perf_counter() - start) * 1000
+    }
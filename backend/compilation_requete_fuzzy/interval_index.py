@@ -0,0 +1,425 @@
+'''
+Suffix array over the interval sequences of all the scores, to answer the exact transposition queries without
+expanding the graph.
+
+The index is built offline (`build_interval_index`) from the `NEXT.interval` values : the chains of `NEXT`
+relationships of each score (one per voice, see `next_chains`) are followed from their first event, and their
+intervals are written one after the other in a single text of integer symbols (see `interval_symbol`), the chains
+being separated by `SEPARATOR` (also used for the `NEXT` without interval, e.g a rest). The suffixes of the text are sorted
+once (prefix doubling, see `suffix_array`), and the index is saved as `.npy` files, read back memory-mapped
+(`IntervalIndex.load`), so that only the pages touched by a search are read.
+
+A pattern of `m` intervals is found with two binary searches over the sorted suffixes, in O(m log n) : the hits are the
+`(source, id)` of the event each occurrence starts from. `anchor_query` restricts a compiled query to the hits :
+    UNWIND $hits AS h
+    MATCH ...
+    WHERE
+    e1.source = h.source AND e1.id = h.id AND
+    ...
+so that its records feed straight into `process_results`. The index is static : it should be rebuilt after an import or
+an ingestion (`main_parser.py interval-index`).
+'''
+
+import json
+import os
+
+import numpy as np
+
+from neo4j_connection import run_query
+from utils import calculate_intervals_dict
+
+# Default directory of the index. Can be overridden with the `FUZZY_INTERVAL_INDEX` environment variable.
+DEFAULT_INDEX_DIR = os.environ.get(
+    'FUZZY_INTERVAL_INDEX',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'interval_index')
+)
+
+# Number of symbols per tone : the intervals are multiples of a quarter tone
+SYMBOLS_PER_TONE = 4
+
+# Property of the events the hits are keyed by (see `anchor_query`)
+HIT_KEY = 'id'
+
+# Symbol of the end of a chain (or of a `NEXT` without interval). It is smaller than every interval symbol.
+SEPARATOR = np.iinfo(np.int32).min
+
+INTERVALS_QUERY = '''
+MATCH (e0:Event)-[n0:NEXT]->(e1:Event)
+RETURN e0.source AS source, e0.id AS id, e0.start AS start, e1.id AS next_id, e1.start AS next_start, n0.interval AS interval
+'''
+
+NEXT_QUERY = '''
+MATCH (e0:Event)-[:NEXT]->(e1:Event)
+RETURN e0.source AS source, e0.id AS id, e1.id AS next_id
+'''
+
+def interval_symbol(interval):
+    '''
+    Return the symbol of an interval in the text of the index (e.g 1.0 -> 4, -0.5 -> -2), or `SEPARATOR` if it is None.
+
+    - interval : the interval (in tones), or None.
+    '''
+
+    if interval is None:
+        return SEPARATOR
+
+    return int(round(float(interval) * SYMBOLS_PER_TONE))
+
+def next_chains(starts, next_events):
+    '''
+    Return the chains of `NEXT` relationships of a score, as lists of event ids in `NEXT` order. A chain starts from
+    an event without incoming `NEXT` (the first event of a voice) and is followed to its end, so that the voices of a
+    polyphonic score are never mixed. The chains are ordered by the start of their first event.
+
+    - starts      : the dict `{id: start}` of the events of the score (a chain stops before an event that is not in it,
+                    and starts again after it) ;
+    - next_events : the dict `{id: next id}` of its `NEXT` relationships.
+    '''
+
+    targets = set(next_events.values())
+    visited = set()
+    chains = []
+
+    # The first events of the chains come first (the events of a cycle, without first event, are walked last)
+    for event in sorted(starts, key=lambda event: (event in targets, starts[event], str(event))):
+        chain = []
+        while event in starts and event not in visited:
+            visited.add(event)
+            chain.append(event)
+            event = next_events.get(event)
+
+        if chain:
+            chains.append(chain)
+
+    return chains
+
+def next_events_by_score(records):
+    '''
+    Return the dict `{source: {id: next id}}` of the `NEXT` relationships of the records of `NEXT_QUERY` (or of
+    `INTERVALS_QUERY`).
+
+    - records : the records (or dicts).
+    '''
+
+    scores = {}
+    for record in records:
+        scores.setdefault(record['source'], {})[record['id']] = record['next_id']
+
+    return scores
+
+def interval_sequences(records):
+    '''
+    Group the `NEXT` relationships of `INTERVALS_QUERY` into the interval sequences of each score.
+
+    Returns the dict `{source: [[(id, interval), ...], ...]}` : for each chain of `NEXT` relationships (see
+    `next_chains`), the id of the event each relationship starts from and its interval, in `NEXT` order.
+
+    - records : the records (or dicts).
+    '''
+
+    scores = {}
+    for record in records:
+        starts, next_events, intervals = scores.setdefault(record['source'], ({}, {}, {}))
+        starts[record['id']] = record['start']
+        starts.setdefault(record['next_id'], record['next_start'])
+        next_events[record['id']] = record['next_id']
+        intervals[record['id']] = record['interval']
+
+    return {
+        source: [
+            [(event, intervals[event]) for event in chain if event in next_events]
+            for chain in next_chains(starts, next_events) if len(chain) > 1
+        ]
+        for source, (starts, next_events, intervals) in scores.items()
+    }
+
+def fetch_interval_sequences(driver):
+    '''
+    Read the intervals of all the scores (see `interval_sequences`).
+
+    - driver : the neo4j driver.
+    '''
+
+    return interval_sequences(run_query(driver, INTERVALS_QUERY))
+
+def make_text(sequences, symbol=interval_symbol, separator=SEPARATOR):
+    '''
+    Concatenate the interval sequences into the text of the index.
+
+    Returns `(text, scores, ids, sources)` :
+        - text    : the symbols (int32), each chain being followed by `separator` ;
+        - scores  : for each position, the index of its score in `sources` (int32) ;
+        - ids     : for each position, the id of the event its interval starts from ('' for a separator) ;
+        - sources : the sorted list of the sources.
+
+    - sequences : the sequences, as returned by `fetch_interval_sequences` ;
+    - symbol    : the function giving the symbol of an interval (see `interval_symbol`) ;
+    - separator : the symbol of the end of a chain.
+    '''
+
+    sources = sorted(sequences)
+    text, scores, ids = [], [], []
+
+    for score_idx, source in enumerate(sources):
+        for chain in sequences[source]:
+            for event, interval in chain:
+                text.append(symbol(interval))
+                scores.append(score_idx)
+                ids.append(str(event))
+
+            text.append(separator)
+            scores.append(score_idx)
+            ids.append('')
+
+    return (
+        np.array(text, dtype=np.int32),
+        np.array(scores, dtype=np.int32),
+        np.array(ids, dtype=str),
+        sources
+    )
+
+def suffix_array(text):
+    '''
+    Sort the suffixes of `text` (prefix doubling : at each step, the suffixes are sorted on their first `2k` symbols
+    using the ranks of their first `k` ones). Returns the start positions of the sorted suffixes (int64).
+
+    - text : the symbols (1d integer array).
+    '''
+
+    n = len(text)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    rank = np.unique(text, return_inverse=True)[1].astype(np.int64)
+    k = 1
+
+    while True:
+        # Rank of the symbols `k` positions further (-1 past the end : a shorter suffix comes first)
+        second = np.full(n, -1, dtype=np.int64)
+        second[:n - k] = rank[k:]
+
+        order = np.lexsort((second, rank))
+
+        changes = (rank[order][1:] != rank[order][:-1]) | (second[order][1:] != second[order][:-1])
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.concatenate(([0], np.cumsum(changes)))
+
+        if rank[order[-1]] == n - 1 or k >= n:
+            return order
+
+        k *= 2
+
+class IntervalIndex:
+    '''Suffix array over the interval sequences (see the module documentation).'''
+
+    FILES = ('text', 'suffixes', 'scores', 'ids')
+
+    def __init__(self, text, suffixes, scores, ids, sources):
+        '''
+        Initiate the index from its arrays.
+
+        - text     : the symbols ;
+        - suffixes : the start positions of the sorted suffixes (the suffixes starting on a separator are left out) ;
+        - scores   : the index of the score of each position ;
+        - ids      : the id of the event of each position ;
+        - sources  : the list of the sources.
+        '''
+
+        self.text = text
+        self.suffixes = suffixes
+        self.scores = scores
+        self.ids = ids
+        self.sources = sources
+
+    @classmethod
+    def from_sequences(cls, sequences):
+        '''Build the index from the sequences returned by `fetch_interval_sequences`.'''
+
+        text, scores, ids, sources = make_text(sequences)
+        suffixes = suffix_array(text)
+        suffixes = suffixes[text[suffixes] != SEPARATOR]
+
+        return cls(text, suffixes, scores, ids, sources)
+
+    def save(self, directory=None):
+        '''
+        Save the index in `directory` (`DEFAULT_INDEX_DIR` if None) : one `.npy` file per array, and `sources.json`.
+        '''
+
+        directory = directory or DEFAULT_INDEX_DIR
+        os.makedirs(directory, exist_ok=True)
+
+        for name in self.FILES:
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, name))
+
+        with open(os.path.join(directory, 'sources.json'), 'w') as f:
+            json.dump({'symbols_per_tone': SYMBOLS_PER_TONE, 'hit_key': HIT_KEY, 'sources': self.sources}, f)
+
+    @classmethod
+    def load(cls, directory=None):
+        '''
+        Load an index saved with `save`. The arrays are memory-mapped, not read.
+
+        - directory : the directory of the index (`DEFAULT_INDEX_DIR` if None).
+        '''
+
+        directory = directory or DEFAULT_INDEX_DIR
+
+        with open(os.path.join(directory, 'sources.json'), 'r') as f:
+            meta = json.load(f)
+
+        if meta['symbols_per_tone'] != SYMBOLS_PER_TONE:
+            raise ValueError(f'The index in {directory} was built with another interval resolution, it should be rebuilt')
+        if meta.get('hit_key') != HIT_KEY:
+            raise ValueError(f'The index in {directory} was built by an older version (hits by start), it should be rebuilt')
+
+        arrays = [np.load(os.path.join(directory, name + '.npy'), mmap_mode='r') for name in cls.FILES]
+
+        return cls(*arrays, meta['sources'])
+
+    def __len__(self):
+        return len(self.suffixes)
+
+    def _bound(self, pattern, upper):
+        '''
+        Binary search of the first suffix that is greater than the pattern (`upper`), or greater or equal (not `upper`),
+        comparing only the first `len(pattern)` symbols of the suffixes.
+        '''
+
+        m = len(pattern)
+        lo, hi = 0, len(self.suffixes)
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = int(self.suffixes[mid])
+            prefix = self.text[pos:pos + m].tolist()
+
+            if prefix < pattern or (upper and prefix == pattern):
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo
+
+    def positions(self, intervals):
+        '''
+        Return the sorted positions of the text where the intervals occur.
+
+        - intervals : the intervals to find (in tones), none of them None.
+        '''
+
+        pattern = [interval_symbol(interval) for interval in intervals]
+        if not pattern or SEPARATOR in pattern:
+            raise ValueError('The pattern should be a non empty list of intervals, without None')
+
+        lo = self._bound(pattern, False)
+        hi = self._bound(pattern, True)
+
+        return np.sort(np.asarray(self.suffixes[lo:hi]))
+
+    def search(self, intervals):
+        '''
+        Find the occurrences of a sequence of intervals (transposition invariant, exact).
+
+        Returns the list of `{'source', 'id'}` of the event each occurrence starts from.
+
+        - intervals : the intervals to find (in tones).
+        '''
+
+        positions = self.positions(intervals)
+
+        return [
+            {'source': self.sources[score], 'id': str(event)}
+            for score, event in zip(np.asarray(self.scores[positions]).tolist(), np.asarray(self.ids[positions]).tolist())
+        ]
+
+def build_interval_index(driver, directory=None):
+    '''
+    Build the index from the database and save it (see `IntervalIndex.save`). Returns the index.
+
+    - driver    : the neo4j driver ;
+    - directory : the directory of the index (`DEFAULT_INDEX_DIR` if None).
+    '''
+
+    index = IntervalIndex.from_sequences(fetch_interval_sequences(driver))
+    index.save(directory)
+
+    return index
+
+def longest_interval_run(intervals):
+    '''
+    Return `(offset, run)` : the longest run of fully specified intervals of a query (e.g not after a note without
+    pitch), and the index of its first interval, or None if no interval is specified.
+
+    - intervals : the intervals of the query (as returned by `utils.calculate_intervals_dict`).
+    '''
+
+    best = None
+    offset = 0
+
+    for idx in range(len(intervals) + 1):
+        if idx == len(intervals) or intervals[idx] is None or intervals[idx] == 'NA':
+            if idx > offset and (best is None or idx - offset > len(best[1])):
+                best = (offset, intervals[offset:idx])
+            offset = idx + 1
+
+    return best
+
+def index_anchor(fuzzy_query):
+    '''
+    Return `(offset, intervals)` : the intervals of the query to find in the index, and the index of the event they
+    start from, or None if the query can not be answered with the index.
+
+    As for the n-gram anchor (see `reformulation_V3.make_interval_gram_anchor`), only the exact transposition queries
+    (pitch distance 0, no duration gap, no rest) can be.
+
+    - fuzzy_query : the parsed fuzzy query.
+    '''
+
+    if not fuzzy_query.allow_transposition or fuzzy_query.pitch_distance != 0 or fuzzy_query.duration_gap > 0:
+        return None
+
+    if any(attrs.get('type') == 'rest' for attrs in fuzzy_query.nodes.values()):
+        return None
+
+    return longest_interval_run(calculate_intervals_dict(fuzzy_query.nodes))
+
+def anchor_query(crisp_query, fuzzy_query, offset):
+    '''
+    Restrict a compiled query to the events given in the `$hits` parameter (see the module documentation).
+
+    - crisp_query : the compiled query (as generated by `reformulation_V3`) ;
+    - fuzzy_query : the parsed fuzzy query ;
+    - offset      : the index of the event of the query the hits start from (see `index_anchor`).
+    '''
+
+    event = fuzzy_query.events[offset]
+    idx = crisp_query.index('\nWHERE\n') + len('\nWHERE\n')
+
+    return (
+        'UNWIND $hits AS h\n' + crisp_query[:idx]
+        + f'{event}.source = h.source AND {event}.id = h.id AND\n'
+        + crisp_query[idx:]
+    )
+
+def indexed_query(index, crisp_query, fuzzy_query, parameters=None):
+    '''
+    Use the index to restrict a compiled query to the occurrences of the intervals of the fuzzy query.
+
+    Returns `(crisp_query, parameters, nb_hits)`, with the anchored query and its parameters (with `hits`), or
+    None if the query can not be answered with the index (see `index_anchor`).
+
+    - index       : the `IntervalIndex` ;
+    - crisp_query : the compiled query ;
+    - fuzzy_query : the parsed fuzzy query ;
+    - parameters  : the parameters of the compiled query, or None.
+    '''
+
+    anchor = index_anchor(fuzzy_query)
+    if anchor is None:
+        return None
+
+    offset, intervals = anchor
+    hits = index.search(intervals)
+
+    return anchor_query(crisp_query, fuzzy_query, offset), {**(parameters or {}), 'hits': hits}, len(hits)
@@ -0,0 +1,192 @@
+'''
+Interval n-gram index, to anchor the transposition queries on an index lookup.
+
+At ingestion time (`build_interval_gram_index`), every chain of `k` consecutive `NEXT` relationships gets an
+`(:IntervalGram {k, key})` node, where `key` is the sequence of their `interval` values (see `interval_gram_key`),
+linked to the first `Event` of the chain : `(:IntervalGram)-[:STARTS]->(:Event)`.
+Each gram node also stores the number of chains it starts (`count`).
+
+The counts are saved in a catalog file (JSON). When it exists, `reformulation_V3.create_match_clause` anchors the
+exact transposition queries (pitch distance 0, no duration gap) on the rarest gram of the query :
+    MATCH
+     (ig:IntervalGram {k: 3, key: '1.0,1.0,-0.5'})-[:STARTS]->(e1),
+     (e0:Event)-[n0:NEXT]->(e1:Event)-[n1:NEXT]-> ...
+The intervals are still checked by the WHERE clause, the gram only reduces the events to expand.
+'''
+
+import json
+import os
+
+from neo4j_connection import run_query
+
+# Default number of intervals in a gram
+NGRAM_SIZE = 3
+
+# Catalog of the gram counts. Can be overridden with the `FUZZY_INTERVAL_GRAM_CATALOG` environment variable.
+DEFAULT_CATALOG_PATH = os.environ.get(
+    'FUZZY_INTERVAL_GRAM_CATALOG',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'interval_grams.json')
+)
+
+# Catalog loaded by `get_catalog` (False : not loaded yet)
+_catalog = False
+
+def interval_gram_key(intervals):
+    '''
+    Return the key of a sequence of intervals, e.g [1, 1.0, -0.5] -> '1.0,1.0,-0.5'.
+
+    The intervals are written as floats, the same way as Cypher's `toString(toFloat(x))` for the interval values
+    (multiples of 0.5), so that a key computed in python is equal to the one stored in the database.
+
+    - intervals : the list of intervals (in tones).
+    '''
+
+    return ','.join(repr(float(interval)) for interval in intervals)
+
+def build_interval_gram_index(driver, k=NGRAM_SIZE, source=None, batch_size=10000):
+    '''
+    Create the `IntervalGram` nodes of size `k` (the previous ones are removed), and return their counts.
+
+    Chains that contain a `NEXT` without interval (e.g a rest) are not indexed.
+
+    - driver     : the neo4j driver ;
+    - k          : the number of intervals in a gram ;
+    - source     : if not None, only (re)index the events of this score ;
+    - batch_size : the number of events handled per transaction.
+
+    Returns the dict `{key: count}` of the grams of size `k`.
+    '''
+
+    if k < 1:
+        raise ValueError(f'k should be a strictly positive integer, but {k} was given')
+
+    event_filter = 'WHERE e.source = $source' if source is not None else ''
+
+    # Remove the links of the indexed events, and the grams that do not start anything anymore
+    run_query(driver, f'''
+        MATCH (e:Event) {event_filter}
+        CALL {{
+            WITH e
+            MATCH (:IntervalGram {{k: $k}})-[s:STARTS]->(e)
+            DELETE s
+        }} IN TRANSACTIONS OF {batch_size} ROWS''', {'k': k, 'source': source})
+
+    run_query(driver, f'''
+        MATCH (e:Event) {event_filter}
+        CALL {{
+            WITH e
+            MATCH p = (e)-[:NEXT*{k}]->(:Event)
+            WITH e, [r IN relationships(p) | r.interval] AS intervals
+            WHERE none(interval IN intervals WHERE interval IS NULL)
+            WITH e, reduce(key = toString(toFloat(head(intervals))), interval IN tail(intervals) | key + ',' + toString(toFloat(interval))) AS key
+            MERGE (g:IntervalGram {{k: $k, key: key}})
+            MERGE (g)-[:STARTS]->(e)
+        }} IN TRANSACTIONS OF {batch_size} ROWS''', {'k': k, 'source': source})
+
+    run_query(driver, f'''
+        MATCH (g:IntervalGram {{k: $k}})
+        WHERE NOT (g)-[:STARTS]->()
+        CALL {{
+            WITH g
+            DELETE g
+        }} IN TRANSACTIONS OF {batch_size} ROWS''', {'k': k})
+
+    run_query(driver, f'''
+        MATCH (g:IntervalGram {{k: $k}})
+        CALL {{
+            WITH g
+            SET g.count = size([(g)-[:STARTS]->() | 1])
+        }} IN TRANSACTIONS OF {batch_size} ROWS''', {'k': k})
+
+    records = run_query(driver, 'MATCH (g:IntervalGram {k: $k}) RETURN g.key AS key, g.count AS count', {'k': k})
+
+    return {record['key']: record['count'] for record in records}
+
+def save_catalog(counts, k=NGRAM_SIZE, path=None):
+    '''
+    Save the gram counts (as returned by `build_interval_gram_index`) in the catalog file, and load it.
+
+    - counts : the dict `{key: count}` ;
+    - k      : the size of the grams ;
+    - path   : the catalog file (`DEFAULT_CATALOG_PATH` if None).
+    '''
+
+    path = path or DEFAULT_CATALOG_PATH
+
+    with open(path, 'w') as f:
+        json.dump({'k': k, 'counts': counts}, f)
+
+    return load_catalog(path)
+
+def read_catalog(path=None):
+    '''
+    Read the catalog file. Returns the catalog (dict with `k` and `counts`), or None if there is no catalog.
+
+    - path : the catalog file (`DEFAULT_CATALOG_PATH` if None).
+    '''
+
+    path = path or DEFAULT_CATALOG_PATH
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def load_catalog(path=None):
+    '''
+    Reload the catalog file (see `read_catalog`), e.g after the index has been rebuilt, and return it.
+
+    The compile cache is cleared, as the compiled transposition queries depend on the catalog.
+
+    - path : the catalog file (`DEFAULT_CATALOG_PATH` if None).
+    '''
+
+    global _catalog
+
+    _catalog = read_catalog(path)
+
+    # Imported here as compile_cache imports the compiler, which imports this module
+    from compile_cache import compile_cache
+    compile_cache.clear()
+
+    return _catalog
+
+def get_catalog():
+    '''Return the catalog (read on first use), or None if the index has not been built.'''
+
+    global _catalog
+
+    if _catalog is False:
+        _catalog = read_catalog()
+
+    return _catalog
+
+def rarest_interval_gram(intervals, catalog):
+    '''
+    Choose the gram of the query to anchor on : the one that starts the fewest chains in the corpus.
+
+    Returns `(offset, key)`, where `offset` is the index of the first interval of the gram (and so of the event
+    it starts from), or None if no gram of the query is fully specified.
+
+    - intervals : the intervals of the query (as returned by `utils.calculate_intervals_dict`) ;
+    - catalog   : the catalog (see `load_catalog`).
+    '''
+
+    k = catalog['k']
+    counts = catalog['counts']
+
+    best = None
+    for offset in range(len(intervals) - k + 1):
+        gram = intervals[offset:offset + k]
+        if any(interval is None or interval == 'NA' for interval in gram):
+            continue
+
+        key = interval_gram_key(gram)
+        # A gram absent from the corpus is the best anchor : the query has no match at all
+        count = counts.get(key, 0)
+
+        if best is None or count < best[0]:
+            best = (count, offset, key)
+
+    return None if best is None else best[1:]
@@ -5,17 +5,34 @@
 #---General
 import argparse
 from os.path import exists
-from ast import literal_eval # safer than eval
+import json
+import sys
 import re
 
 # import neo4j.exceptions.CypherSyntaxError
 import neo4j
 
 #---Project
-from reformulation_V3 import reformulate_fuzzy_query
-from neo4j_connection import connect_to_neo4j, run_query
+from compile_cache import compile_cache
+from fuzzy_query import parse_fuzzy_query
+from neo4j_connection import MEMORY_URI_PREFIX, connect_to_neo4j, run_query, iter_query
 from process_results import process_results_to_text, process_results_to_mp3, process_results_to_json, process_crisp_results_to_json
+from process_results import get_ranked_results, sequence_details_to_text, sequence_detail_to_dict, process_results_to_dict
 from utils import get_first_k_notes_of_each_score, create_query_from_list_of_notes, create_query_from_contour
+from utils import check_notes_input_format, check_pitch_distance
+from schema import index_statements, create_indexes, explain_queries, format_explain_report
+from interval_ngrams import NGRAM_SIZE, build_interval_gram_index, save_catalog
+from warmup import WARMUP_LENGTHS, WARMUP_MODES, warm_up, format_warmup_report
+from profiling import PhaseTimer, profile_query, format_profile_report
+from batch import BATCH_SIZE, run_batch
+from mei_import import DEFAULT_DATA_DIR, BATCH_EVENTS, find_mei_files, import_mei_files, format_import_report, set_event_pitches
+from ingest import ingest_mei_file, remove_score
+from memory_graph import UnsupportedQueryError
+from interval_index import DEFAULT_INDEX_DIR, IntervalIndex, build_interval_index, indexed_query
+from contour_index import DEFAULT_CONTOUR_INDEX_DIR, ContourIndex, build_contour_index, contour_indexed_query
+from duration_index import DEFAULT_DURATION_INDEX_DIR, DurationIndex, build_duration_index, duration_indexed_query
+from pitch_scan import DEFAULT_SCAN_DIR, ScanCorpus, build_scan_corpus, scan_query
+from onset_search import gap_query
 
 #---Performance tests
 from testing_utilities import PerformanceLogger
@@ -52,19 +69,17 @@ def restricted_float(x, mn=None, mx=None):
     return x
 
 def semi_int(x):
-    r'''Defines a new type : \N / 2 (int or half an int).'''
+    r'''Defines a new type : \N / 2 (positive int or half an int, see `utils.check_pitch_distance`).'''
 
     try:
         x = float(x)
     except ValueError:
         raise argparse.ArgumentTypeError(f'"{x}" is not a float')
 
-    is_int = lambda x : int(x) == x
-
-    if not (is_int(x) or is_int(2 * x)):
-        raise argparse.ArgumentTypeError(f'"{x}" is not an integer or half an integer')
-
-    return x
+    try:
+        return check_pitch_distance(x)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
 
 def get_file_content(fn, parser=None):
     '''
@@ -94,111 +109,6 @@ def write_to_file(fn, content):
     with open(fn, 'w') as f:
         f.write(content)
 
-def check_notes_input_format(notes_input: str) -> list[list[tuple[str|None, int|None] | int|float|None]]:
-    '''
-    Ensure that `notes_input` is in the correct format (see below for a description of the format).
-    If not, raise an argparse.ArgumentTypeError.
-
-    Input :
-        - notes_input : the user input (a string, not a list).
-
-    Output :
-        - a list of (char, int, int)  if the format is right ;
-        - argparse.ArgumentTypeError  otherwise.
-
-    Description for the format of `notes` :
-        `notes` should be a list of `note`s.
-        A `note` is a list of the following format : `[(class_1, octave_1), ..., (class_n, octave_n), duration, dots (optional)]`
-
-        For example : `[[('c', 5), 4, 0], [('b', 4), 8, 1], [('b', 4), 8], [('a', 4), ('d', 5), 16, 2]]`.
-
-        duration is in the following format: 1 for whole, 2 for half, ...
-        dots is an optional integer representing the number of dots.
-    '''
-
-    #---Init (functions to test each part)
-    def check_class(class_: str|None) -> bool:
-        '''Return True iff `class_` is in correct format.'''
-
-        return (
-            class_ == None
-            or (
-                isinstance(class_, str)
-                and (
-                    len(class_) == 1 or
-                    (len(class_) == 2 and class_[1] in '#sbf')
-                )
-                and
-                class_[0] in 'abcdefgr'
-            )
-        )
-
-    def check_octave(octave: int|None) -> bool:
-        '''Return True iff `octave` is in correct format.'''
-
-        return isinstance(octave, (int, type(None)))
-
-    def check_duration(duration: int|float|None) -> bool:
-        '''Return True iff `duration` is in correct format.'''
-
-        return isinstance(duration, (int, float, type(None)))
-
-    def check_dots(dots: int|None) -> bool:
-        '''Return True iff `dots` is in correct format.'''
-
-        return isinstance(dots, (int, type(None))) and (dots is None or dots >= 0)
-
-    format_notes = "Notes format: list of [(class, octave), duration, dots]: [[(class, octave), ..., duration, dots], ...]. E.g `[[(\'c\', 5), 4, 0], [(\'b\', 4), 8, 1], [(\'b\', 4), 8], [(\'a\', 4), (\'d\', 5), 16, 2]]`. It is possible to use \"None\" to ignore a criteria. Dots are optinal, with default value of 0."
-
-    #---Convert string to list
-    notes_input = notes_input.replace("\\", "")
-    notes = literal_eval(notes_input)
-
-    #---Check
-    for i, note_or_chord in enumerate(notes):
-        #-Check type of the current note/chord (e.g [('c', 5), 8])
-        if type(note_or_chord) != list:
-            raise argparse.ArgumentTypeError(f'error with note {i}: should be a a list, but "{note_or_chord}", of type {type(note_or_chord)} found !\n' + format_notes)
-
-        #-Check the length of the current note/chord (e.g [('c', 5), 8])
-        if len(note_or_chord) < 2:
-            raise argparse.ArgumentTypeError(f'error with note {i}: there should be at least two elements in the list, for example `[(\'c\', 5), 4]`, but "{note_or_chord}", with length {len(note_or_chord)} found !\n' + format_notes)
-
-        #-Check the duration
-        duration = note_or_chord[1]
-        if not check_duration(duration):
-            raise argparse.ArgumentTypeError(f'error with note {i}: "{note_or_chord}": "{duration}" (duration) is not a float (or None)\n' + format_notes)
-
-        #-Check the dots (if provided)
-        if len(note_or_chord) > 2:
-            dots = note_or_chord[-1]
-            if not check_dots(dots):
-                raise argparse.ArgumentTypeError(f'error with note {i}: "{note_or_chord}": "{dots}" (dots) is not a non-negative integer or None\n' + format_notes)
-        else:
-            dots = 0  # Default to 0 if dots are not provided
-
-        #-Check each note
-        for j, note in enumerate(note_or_chord[:-2]):
-            #-Check type of note tuple
-            if type(note) != tuple:
-                raise argparse.ArgumentTypeError(f'error with note {i}, element {j}: should be a tuple (e.g `(\'c\', 5)`), but "{note}", of type {type(note)} found !\n' + format_notes)
-
-            #-Check length of note tuple
-            if len(note) != 2:
-                raise argparse.ArgumentTypeError(f'error with note {i}, element {j}: note tuple should have 2 elements (class, octave), but {len(note_or_chord)} found !\n' + format_notes)
-
-            #-Check note class
-            if not check_class(note[0]):
-                raise argparse.ArgumentTypeError(f'error with note {i}, element {j}: "{note}": "{note[0]}" is not a note class.\n' + format_notes)
-
-            #-Check note octave
-            if not check_octave(note[1]):
-                raise argparse.ArgumentTypeError(f'error with note {i}, element {j}: "{note}": "{note[1]}" (octave) is not an int, or a float, or None.\n' + format_notes)
-
-    return notes
-
-
-
 def list_available_songs(driver, collection=None):
     '''
     Return a list of all the available songs.
@@ -238,7 +148,26 @@ class Parser:
             \twrite a query from file   : python3 main_parser.py w \"$(python3 main_parser.py g \"10343_Avant_deux.mei\" 9)\" -p 2
             \tget notes from a song     : python3 main_parser.py get Air_n_83.mei 5 -o notes
             \tlist all songs            : python3 main_parser.py l
-            \tlist all songs (compact)  : python3 main_parser.py l -n 0''',
+            \tlist all songs (compact)  : python3 main_parser.py l -n 0
+            \tcreate the indexes        : python3 main_parser.py schema -e
+            \tbuild the n-gram index    : python3 main_parser.py ngrams -k 3
+            \tbuild the interval index  : python3 main_parser.py interval-index
+            \tsearch with the index     : python3 main_parser.py send -f -F fuzzy_query.cypher -X
+            \tbuild the contour index   : python3 main_parser.py contour-index
+            \tsearch a contour          : python3 main_parser.py send -f -F contour_query.cypher -C
+            \tbuild the duration index  : python3 main_parser.py duration-index
+            \tsearch with the durations : python3 main_parser.py send -f -F fuzzy_query.cypher -D
+            \tbuild the scan corpus     : python3 main_parser.py scan-corpus
+            \tscan for a melody         : python3 main_parser.py send -f -F fuzzy_query.cypher -P -k 10
+            \tsearch a melody with gaps : python3 main_parser.py send -f -F gap_query.cypher -P -k 10
+            \twarm up the query plans   : python3 main_parser.py warmup -m plain gap
+            \tprofile a fuzzy query     : python3 main_parser.py send -f -F fuzzy_query.cypher --profile
+            \tsend many fuzzy queries   : python3 main_parser.py batch test_queries/*.cypher -k 10 -o results.json
+            \timport the MEI files      : python3 main_parser.py import -d ../data -w 8
+            \tadd or update a score     : python3 main_parser.py ingest ../data/author/mei/Air_n_83.mei
+            \tremove a score            : python3 main_parser.py remove Air_n_83.mei
+            \tset the pitches of chords : python3 main_parser.py pitches
+            \tsearch without a database : python3 main_parser.py -U memory://../data send -f -F fuzzy_query.cypher''',
             formatter_class=argparse.RawDescriptionHelpFormatter
         )
 
@@ -253,7 +182,7 @@ class Parser:
         self.parser.add_argument(
             '-U', '--URI',
             default='bolt://localhost:7687',
-            help='the uri to the neo4j database'
+            help='the uri to the neo4j database, or memory://DATA_DIR to load the MEI files of DATA_DIR in an in-memory engine (no database needed)'
         )
         self.parser.add_argument(
             '-u', '--user',
@@ -265,6 +194,11 @@ class Parser:
             default='12345678',
             help='the password to access the database'
         )
+        self.parser.add_argument(
+            '-S', '--cache-size',
+            type=int,
+            help='the maximum number of compiled queries kept in the compile cache (default: $FUZZY_COMPILE_CACHE_SIZE or 256)'
+        )
 
         #------Sub-parsers
         self.subparsers = self.parser.add_subparsers(required=True, dest='subparser')
@@ -274,6 +208,18 @@ class Parser:
         self.create_write();
         self.create_get();
         self.create_list();
+        self.create_schema();
+        self.create_ngrams();
+        self.create_interval_index();
+        self.create_contour_index();
+        self.create_duration_index();
+        self.create_scan_corpus();
+        self.create_warmup();
+        self.create_batch();
+        self.create_import();
+        self.create_ingest();
+        self.create_remove();
+        self.create_pitches();
 
     def init_driver(self, uri, user, password):
         '''
@@ -313,6 +259,16 @@ class Parser:
             '-o', '--output',
             help='give a filename where to write result. If not set, just print it.'
         )
+        self.parser_c.add_argument(
+            '-r', '--ranking',
+            action='store_true',
+            help='compile the ranking version of the query : the degrees are computed in the database, and the query returns the `$k` best results (`ORDER BY degree DESC LIMIT $k`).'
+        )
+        self.parser_c.add_argument(
+            '-P', '--parameterized',
+            action='store_true',
+            help='pass the values of the query (notes, durations, bounds, ...) as parameters (`$f0_duration`, ...). The parameters are written as json in a comment before the query.'
+        )
 
     def create_send(self):
         '''Creates the send subparser and add its arguments.'''
@@ -350,6 +306,55 @@ class Parser:
             type=int,
             help='save the result as mp3 files. MP3 is the maximum number of files to write.'
         )
+        self.parser_s.add_argument(
+            '-k', '--top-k',
+            type=int,
+            help='only keep the TOP_K best results (fuzzy queries only). The records are read lazily and only the best ones are kept in memory.'
+        )
+        self.parser_s.add_argument(
+            '-V', '--vectorized',
+            action='store_true',
+            help='rank the results of a fuzzy query with the numpy kernel (same results, faster on large results).'
+        )
+        self.parser_s.add_argument(
+            '-R', '--rank-in-db',
+            action='store_true',
+            help='compute the degrees and keep the TOP_K best results in the database (needs `-k`). Only TOP_K records are sent back.'
+        )
+        self.parser_s.add_argument(
+            '-I', '--inline',
+            action='store_true',
+            help='write the values in the compiled query instead of passing them as parameters (fuzzy queries only). By default, queries of the same shape share the same cypher text, so the database reuses its query plan.'
+        )
+        self.parser_s.add_argument(
+            '-X', '--interval-index',
+            nargs='?',
+            const=DEFAULT_INDEX_DIR,
+            help=f'find the occurrences of the intervals in the suffix array of the directory INTERVAL_INDEX (default: {DEFAULT_INDEX_DIR}, see `interval-index`), and only expand these events (fuzzy exact transposition queries only, the others are sent as usual).'
+        )
+        self.parser_s.add_argument(
+            '-C', '--contour-index',
+            nargs='?',
+            const=DEFAULT_CONTOUR_INDEX_DIR,
+            help=f'read the candidate windows of a contour query in the contour index of the directory CONTOUR_INDEX (default: {DEFAULT_CONTOUR_INDEX_DIR}, see `contour-index`), and only score these windows (fuzzy contour queries only, the others are sent as usual).'
+        )
+        self.parser_s.add_argument(
+            '-D', '--duration-index',
+            nargs='?',
+            const=DEFAULT_DURATION_INDEX_DIR,
+            help=f'intersect the duration ranges of the notes in the duration index of the directory DURATION_INDEX (default: {DEFAULT_DURATION_INDEX_DIR}, see `duration-index`), and only expand the windows found (fuzzy queries with durations and without gap only, the others are sent as usual).'
+        )
+        self.parser_s.add_argument(
+            '-P', '--pitch-scan',
+            nargs='?',
+            const=DEFAULT_SCAN_DIR,
+            help=f'answer the query with a scan over the arrays of the directory PITCH_SCAN (default: {DEFAULT_SCAN_DIR}, see `scan-corpus`) instead of the database (fuzzy pitch tolerant queries without transposition only, the queries with a gap being answered with the onset search, see `onset_search`, the others are sent as usual). Not compatible with `-m`, `-R`, `-X`, `-C`, `-D` and `--profile`.'
+        )
+        self.parser_s.add_argument(
+            '--profile',
+            action='store_true',
+            help='run the query with cypher `PROFILE`, and print (on stderr) the operator tree with its rows and db hits, and the time spent in each phase (parse, compile, driver round trip, record fetch, ranking, serialization). Not compatible with `-m`.'
+        )
 
     def create_write(self):
         '''Creates the write subparser and add its arguments.'''
@@ -456,6 +461,240 @@ class Parser:
             help='the filename where to write the result. If omitted, print it to stdout.'
         )
 
+    def create_schema(self):
+        '''Creates the schema subparser and add its arguments.'''
+
+        #---Init
+        self.parser_sc = self.subparsers.add_parser('schema', help='create the indexes used by the compiled queries')
+
+        #---Add arguments
+        self.parser_sc.add_argument(
+            '-n', '--dry-run',
+            action='store_true',
+            help='only print the index creation statements.'
+        )
+        self.parser_sc.add_argument(
+            '-e', '--explain',
+            action='store_true',
+            help='after creating the indexes, run EXPLAIN on representative compiled queries and report whether they start with an index seek or a label scan.'
+        )
+        self.parser_sc.add_argument(
+            '-E', '--explain-only',
+            action='store_true',
+            help='only run the EXPLAIN report (do not create the indexes).'
+        )
+        self.parser_sc.add_argument(
+            '-w', '--wait',
+            type=int,
+            default=300,
+            help='the maximum number of seconds to wait for the indexes to be online. Default is 300. With 0, do not wait.'
+        )
+
+    def create_ngrams(self):
+        '''Creates the ngrams subparser and add its arguments.'''
+
+        #---Init
+        self.parser_n = self.subparsers.add_parser('ngrams', help='build the interval n-gram index used to anchor the transposition queries')
+
+        #---Add arguments
+        self.parser_n.add_argument(
+            '-k', '--size',
+            type=int,
+            default=NGRAM_SIZE,
+            help=f'the number of intervals in a gram. Default is {NGRAM_SIZE}.'
+        )
+        self.parser_n.add_argument(
+            '-s', '--source',
+            help='only (re)index the score SOURCE (e.g after adding it to the database).'
+        )
+        self.parser_n.add_argument(
+            '-o', '--output',
+            help='the catalog file where to write the gram counts. Default is $FUZZY_INTERVAL_GRAM_CATALOG or interval_grams.json.'
+        )
+
+    def create_interval_index(self):
+        '''Creates the interval-index subparser and add its arguments.'''
+
+        #---Init
+        self.parser_x = self.subparsers.add_parser('interval-index', help='build the suffix array over the interval sequences, used to answer the exact transposition queries (`send -X`)')
+
+        #---Add arguments
+        self.parser_x.add_argument(
+            '-o', '--output',
+            help=f'the directory where to write the index. Default is {DEFAULT_INDEX_DIR}.'
+        )
+
+    def create_contour_index(self):
+        '''Creates the contour-index subparser and add its arguments.'''
+
+        #---Init
+        self.parser_ci = self.subparsers.add_parser('contour-index', help='build the suffix automaton over the contour strings of the scores, used to answer the contour queries (`send -C`)')
+
+        #---Add arguments
+        self.parser_ci.add_argument(
+            '-o', '--output',
+            help=f'the directory where to write the index. Default is {DEFAULT_CONTOUR_INDEX_DIR}.'
+        )
+
+    def create_duration_index(self):
+        '''Creates the duration-index subparser and add its arguments.'''
+
+        #---Init
+        self.parser_di = self.subparsers.add_parser('duration-index', help='build the posting lists of the durations of each score, used to find the windows of the queries with durations (`send -D`)')
+
+        #---Add arguments
+        self.parser_di.add_argument(
+            '-o', '--output',
+            help=f'the directory where to write the index. Default is {DEFAULT_DURATION_INDEX_DIR}.'
+        )
+
+    def create_scan_corpus(self):
+        '''Creates the scan-corpus subparser and add its arguments.'''
+
+        #---Init
+        self.parser_scan = self.subparsers.add_parser('scan-corpus', help='save the events and facts of all the scores as arrays, used to scan for the pitch tolerant queries (`send -P`)')
+
+        #---Add arguments
+        self.parser_scan.add_argument(
+            '-o', '--output',
+            help=f'the directory where to write the arrays. Default is {DEFAULT_SCAN_DIR}.'
+        )
+
+    def create_warmup(self):
+        '''Creates the warmup subparser and add its arguments.'''
+
+        #---Init
+        self.parser_wu = self.subparsers.add_parser('warmup', help='fill the query plan cache of the database with the common shapes of compiled queries')
+
+        #---Add arguments
+        self.parser_wu.add_argument(
+            '-l', '--lengths',
+            type=int,
+            nargs=2,
+            metavar=('MIN', 'MAX'),
+            default=(WARMUP_LENGTHS.start, WARMUP_LENGTHS.stop - 1),
+            help=f'the range of the number of notes of the queries. Default is {WARMUP_LENGTHS.start} {WARMUP_LENGTHS.stop - 1}.'
+        )
+        self.parser_wu.add_argument(
+            '-m', '--modes',
+            nargs='+',
+            choices=list(WARMUP_MODES),
+            default=list(WARMUP_MODES),
+            help='the search modes to warm up. Default is all of them.'
+        )
+        self.parser_wu.add_argument(
+            '-r', '--ranking',
+            action='store_true',
+            help='also warm up the ranking version of the queries (`send -R`).'
+        )
+
+    def create_batch(self):
+        '''Creates the batch subparser and add its arguments.'''
+
+        #---Init
+        self.parser_b = self.subparsers.add_parser('batch', help='send many fuzzy queries, the queries of the same shape being sent in one statement')
+
+        #---Add arguments
+        self.parser_b.add_argument(
+            'FILES',
+            nargs='+',
+            help='the files of the fuzzy queries (one query per file). The results of each query are identified by its file name.'
+        )
+
+        self.parser_b.add_argument(
+            '-o', '--output',
+            help='the file where to write the results (json : {file: [results]}). If omitted, print them to stdout.'
+        )
+        self.parser_b.add_argument(
+            '-k', '--top-k',
+            type=int,
+            help='only keep the TOP_K best results of each query.'
+        )
+        self.parser_b.add_argument(
+            '-R', '--rank-in-db',
+            action='store_true',
+            help='compute the degrees and keep the TOP_K best results of each query in the database (needs `-k`).'
+        )
+        self.parser_b.add_argument(
+            '-b', '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help=f'the maximum number of queries sent in one statement. Default is {BATCH_SIZE}.'
+        )
+
+    def create_import(self):
+        '''Creates the import subparser and add its arguments.'''
+
+        #---Init
+        self.parser_i = self.subparsers.add_parser('import', help='import the MEI files of DATA_DIR/<collection>/mei/ into the database')
+
+        #---Add arguments
+        self.parser_i.add_argument(
+            '-d', '--data-dir',
+            default=DEFAULT_DATA_DIR,
+            help=f'the data directory, with one sub-directory per collection. Default is {DEFAULT_DATA_DIR}.'
+        )
+        self.parser_i.add_argument(
+            '-c', '--collections',
+            nargs='+',
+            help='only import the files of these collections. Default is all of them.'
+        )
+        self.parser_i.add_argument(
+            '-w', '--workers',
+            type=int,
+            help='the number of processes parsing the files. Default is the number of CPUs.'
+        )
+        self.parser_i.add_argument(
+            '-b', '--batch-size',
+            type=int,
+            default=BATCH_EVENTS,
+            help=f'the approximate number of events written in one statement. Default is {BATCH_EVENTS}.'
+        )
+        self.parser_i.add_argument(
+            '-n', '--dry-run',
+            action='store_true',
+            help='only parse the files (to measure the parsing throughput), without writing anything.'
+        )
+
+    def create_ingest(self):
+        '''Creates the ingest subparser and add its arguments.'''
+
+        #---Init
+        self.parser_in = self.subparsers.add_parser('ingest', help='add a score from an MEI file, or replace it if it is already in the database')
+
+        #---Add arguments
+        self.parser_in.add_argument(
+            'FILE',
+            help='the MEI file. Its name is the source of the score.'
+        )
+        self.parser_in.add_argument(
+            '-c', '--collection',
+            help='the collection of the score. Default is the name of the directory above `mei/`.'
+        )
+
+    def create_remove(self):
+        '''Creates the remove subparser and add its arguments.'''
+
+        #---Init
+        self.parser_rm = self.subparsers.add_parser('remove', help='remove a score from the database')
+
+        #---Add arguments
+        self.parser_rm.add_argument(
+            'SOURCE',
+            help='the source of the score (e.g Air_n_83.mei).'
+        )
+
+    def create_pitches(self):
+        '''Creates the pitches subparser and add its arguments.'''
+
+        #---Init
+        self.parser_pi = self.subparsers.add_parser('pitches', help='set the pitches of the events (`Event.pitches`, used by the chord queries) in a database not built with `import` or `ingest`')
+
+        #---Add arguments
+        self.parser_pi.add_argument(
+            '-s', '--source',
+            help='only update the events of this score (e.g Air_n_83.mei). Default is all of them.'
+        )
 
     def parse(self):
         '''Parse the args'''
@@ -464,6 +703,12 @@ class Parser:
         args = self.parser.parse_args()
         # print(args)
 
+        if args.cache_size != None:
+            if args.cache_size < 0:
+                self.parser.error('argument `-S` takes a positive value !')
+
+            compile_cache.resize(args.cache_size)
+
         #---Redirect towards the right method
         if args.subparser in ('c', 'compile'):
             self.parse_compile(args)
@@ -484,6 +729,42 @@ class Parser:
         elif args.subparser in ('l', 'list'):
             self.parse_list(args)
 
+        elif args.subparser == 'schema':
+            self.parse_schema(args)
+
+        elif args.subparser == 'ngrams':
+            self.parse_ngrams(args)
+
+        elif args.subparser == 'interval-index':
+            self.parse_interval_index(args)
+
+        elif args.subparser == 'contour-index':
+            self.parse_contour_index(args)
+
+        elif args.subparser == 'duration-index':
+            self.parse_duration_index(args)
+
+        elif args.subparser == 'scan-corpus':
+            self.parse_scan_corpus(args)
+
+        elif args.subparser == 'warmup':
+            self.parse_warmup(args)
+
+        elif args.subparser == 'batch':
+            self.parse_batch(args)
+
+        elif args.subparser == 'import':
+            self.parse_import(args)
+
+        elif args.subparser == 'ingest':
+            self.parse_ingest(args)
+
+        elif args.subparser == 'remove':
+            self.parse_remove(args)
+
+        elif args.subparser == 'pitches':
+            self.parse_pitches(args)
+
     def parse_compile(self, args):
         '''Parse the args for the compile mode'''
 
@@ -493,11 +774,15 @@ class Parser:
             query = args.QUERY
 
         try:
-            res = reformulate_fuzzy_query(query)
+            res = compile_cache.compile(query, args.ranking, args.parameterized)
         except:
             print('parse_compile: error: query may not be correctly formulated')
             return
 
+        if args.parameterized:
+            crisp_query, params = res
+            res = f'// parameters: {json.dumps(params)}\n{crisp_query}'
+
         if args.output == None:
             print(res)
 
@@ -512,34 +797,122 @@ class Parser:
         else:
             query = args.QUERY
 
+        if args.top_k != None and not args.fuzzy:
+            self.parser_s.error('`-k` can only be used with a fuzzy query (`-f`)')
+
+        if args.top_k != None and args.top_k < 0:
+            self.parser_s.error(f'TOP_K should be a positive integer, but {args.top_k} was given')
+
+        if args.rank_in_db and args.top_k == None:
+            self.parser_s.error('`-R` needs the number of results to keep (`-k`)')
+
+        if args.interval_index != None and not args.fuzzy:
+            self.parser_s.error('`-X` can only be used with a fuzzy query (`-f`)')
+
+        if args.interval_index != None and args.profile:
+            self.parser_s.error('`-X` can not be used with `--profile`')
+
+        if args.contour_index != None and not args.fuzzy:
+            self.parser_s.error('`-C` can only be used with a fuzzy query (`-f`)')
+
+        if args.contour_index != None and args.profile:
+            self.parser_s.error('`-C` can not be used with `--profile`')
+
+        if args.duration_index != None and not args.fuzzy:
+            self.parser_s.error('`-D` can only be used with a fuzzy query (`-f`)')
+
+        if args.duration_index != None and args.profile:
+            self.parser_s.error('`-D` can not be used with `--profile`')
+
+        if [args.interval_index, args.contour_index, args.duration_index].count(None) < 2:
+            self.parser_s.error('not possible to use more than one of `-X`, `-C` and `-D` at the same time')
+
+        # The ranked and anchored queries use `WITH` / `UNWIND`, that the in-memory engine does not evaluate
+        if args.URI.startswith(MEMORY_URI_PREFIX) and (args.rank_in_db or [args.interval_index, args.contour_index, args.duration_index].count(None) < 3):
+            self.parser_s.error(f'`-R`, `-X`, `-C` and `-D` can not be used with the in-memory engine ({MEMORY_URI_PREFIX}, see `memory_graph`)')
+
+        if args.pitch_scan != None:
+            if not args.fuzzy:
+                self.parser_s.error('`-P` can only be used with a fuzzy query (`-f`)')
+
+            if args.mp3 != None or args.rank_in_db or args.interval_index != None or args.contour_index != None or args.duration_index != None or args.profile:
+                self.parser_s.error('`-P` can not be used with `-m`, `-R`, `-X`, `-C`, `-D` or `--profile`')
+
+            if self.parse_send_scan(args, query):
+                return
+
+        if args.profile:
+            if args.mp3 != None:
+                self.parser_s.error('`--profile` can not be used with `-m`')
+
+            self.parse_send_profile(args, query)
+            return
+
         if args.fuzzy:
             try:
-                crisp_query = reformulate_fuzzy_query(query)
+                # Parse once : the same `FuzzyQuery` is used for the compilation and the ranking of the results
+                query = parse_fuzzy_query(query)
+                if args.inline:
+                    crisp_query, parameters = compile_cache.compile(query, args.rank_in_db), {}
+                else:
+                    crisp_query, parameters = compile_cache.compile(query, args.rank_in_db, parameterized=True)
             except:
                 print('parse_send: compile query: error: query may not be correctly written')
                 return
 
         else:
-            crisp_query = query
+            crisp_query, parameters = query, {}
+
+        # The ranking query only returns the `k` best records : they are ranked again (same degrees) to get the details
+        if args.rank_in_db:
+            parameters['k'] = args.top_k
+
+        if args.interval_index != None or args.contour_index != None or args.duration_index != None:
+            if args.interval_index != None:
+                name, index_class, restrict = 'interval', IntervalIndex, indexed_query
+            elif args.contour_index != None:
+                name, index_class, restrict = 'contour', ContourIndex, contour_indexed_query
+            else:
+                name, index_class, restrict = 'duration', DurationIndex, duration_indexed_query
+
+            try:
+                index = index_class.load(args.interval_index or args.contour_index or args.duration_index)
+            except (OSError, ValueError) as err:
+                self.parser_s.error(f'can not load the {name} index : {err}')
+
+            # Only some queries can be answered with the index (see `indexed_query`) : the others are sent unchanged
+            anchored = restrict(index, crisp_query, query, parameters)
+            if anchored != None:
+                crisp_query, parameters, _ = anchored
+            else:
+                print(f'parse_send: the query can not be answered with the {name} index, it is sent as usual', file=sys.stderr)
+
+        parameters = parameters or None
+
+        # With top-k, the records are ranked as they are read instead of being all fetched first (the numpy kernel needs all of them)
+        lazy = args.top_k != None and not args.vectorized and not (args.text_output != None and args.mp3 != None)
 
         self.init_driver(args.URI, args.user, args.password)
 
         try:
             if testing_mode:
                 logger.start("only_query")
-            res = run_query(self.driver, crisp_query)
+            if lazy:
+                res = iter_query(self.driver, crisp_query, parameters)
+            else:
+                res = run_query(self.driver, crisp_query, parameters)
             if testing_mode:
                 logger.end("only_query")
-        except neo4j.exceptions.CypherSyntaxError as err:
+        except (neo4j.exceptions.CypherSyntaxError, UnsupportedQueryError) as err:
             print('parse_send: query syntax error: ' + str(err))
             return
 
         if args.text_output == None and args.mp3 == None:
             if args.fuzzy:
                 if args.json:
-                    print(process_results_to_json(res, query))
+                    print(process_results_to_json(res, query, args.top_k, args.vectorized))
                 else:
-                    print(process_results_to_text(res, query))
+                    print(process_results_to_text(res, query, args.top_k, args.vectorized))
 
             else:
                 if args.json:
@@ -554,14 +927,110 @@ class Parser:
                     print(res)
                     self.parser_s.error('Can only process result to text if the query is fuzzy !\nThe result has been printed above.')
 
-                processed_res = process_results_to_text(res, query)
+                processed_res = process_results_to_text(res, query, args.top_k, args.vectorized)
                 write_to_file(args.text_output, processed_res)
 
             if args.mp3 != None:
-                process_results_to_mp3(res, query, args.mp3, self.driver)
+                process_results_to_mp3(res, query, args.mp3 if args.top_k == None else min(args.mp3, args.top_k), self.driver)
 
         self.close_driver()
 
+    def parse_send_scan(self, args, query):
+        '''Send mode with `-P` : answer the query with the scan (see `pitch_scan`), or with the onset search for the queries with a gap (see `onset_search`). Returns False if the query has to be sent as usual.'''
+
+        try:
+            corpus = ScanCorpus.load(args.pitch_scan)
+        except (OSError, ValueError) as err:
+            self.parser_s.error(f'can not load the scan corpus : {err}')
+
+        try:
+            query = parse_fuzzy_query(query)
+        except:
+            print('parse_send: compile query: error: query may not be correctly written')
+            return True
+
+        if query.duration_gap > 0:
+            sequence_details = gap_query(corpus, query, args.top_k)
+        else:
+            sequence_details = scan_query(corpus, query, args.top_k)
+
+        if sequence_details == None:
+            print('parse_send: the query can not be answered by the scan, it is sent as usual', file=sys.stderr)
+            return False
+
+        if args.text_output != None:
+            write_to_file(args.text_output, sequence_details_to_text(sequence_details, query))
+        elif args.json:
+            print(json.dumps([sequence_detail_to_dict(seq_detail) for seq_detail in sequence_details]))
+        else:
+            print(sequence_details_to_text(sequence_details, query))
+
+        return True
+
+    def parse_send_profile(self, args, query):
+        '''Send mode with `--profile` : same output as `parse_send`, followed by the profile report (see `profiling`)'''
+
+        timer = PhaseTimer()
+
+        if args.fuzzy:
+            try:
+                with timer.phase('parse'):
+                    query = parse_fuzzy_query(query)
+
+                with timer.phase('compile'):
+                    if args.inline:
+                        crisp_query, parameters = compile_cache.compile(query, args.rank_in_db), {}
+                    else:
+                        crisp_query, parameters = compile_cache.compile(query, args.rank_in_db, parameterized=True)
+            except:
+                print('parse_send: compile query: error: query may not be correctly written')
+                return
+
+        else:
+            crisp_query, parameters = query, {}
+
+        if args.rank_in_db:
+            parameters['k'] = args.top_k
+
+        self.init_driver(args.URI, args.user, args.password)
+
+        try:
+            records, summary = profile_query(self.driver, crisp_query, parameters or None, timer)
+        except (neo4j.exceptions.CypherSyntaxError, UnsupportedQueryError) as err:
+            print('parse_send: query syntax error: ' + str(err))
+            return
+        finally:
+            self.close_driver()
+
+        if args.fuzzy:
+            with timer.phase('ranking'):
+                sequence_details = get_ranked_results(records, query, args.top_k, args.vectorized)
+
+            with timer.phase('serialization'):
+                if args.json and args.text_output == None:
+                    res = json.dumps([sequence_detail_to_dict(seq_detail) for seq_detail in sequence_details])
+                else:
+                    res = sequence_details_to_text(sequence_details, query)
+
+        else:
+            if args.text_output != None:
+                print(records)
+                self.parser_s.error('Can only process result to text if the query is fuzzy !\nThe result has been printed above.')
+
+            with timer.phase('serialization'):
+                if args.json:
+                    res = process_crisp_results_to_json(records)
+                else:
+                    res = '\n'.join(str(k) for k in records)
+
+        if args.text_output != None:
+            write_to_file(args.text_output, res)
+        else:
+            print(res)
+
+        # On stderr, so that the results (e.g json) can still be piped
+        print(format_profile_report(summary, timer), file=sys.stderr)
+
     def parse_write(self, args):
         '''Parse the args for the write mode'''
 
@@ -590,8 +1059,8 @@ class Parser:
             # Normal mode: Validate that the input is a list of notes
             try:
                 notes = check_notes_input_format(notes_input)
-            except (ValueError, SyntaxError):
-                self.parser_w.error("NOTES must be a valid list format. Example: \"[[(\'c\', 5), 1], [(\'d\', 5), 4, 1]]\"")
+            except ValueError as e:
+                self.parser_w.error(str(e))
             query = create_query_from_list_of_notes(notes, args.pitch_distance, args.duration_factor, args.duration_gap, args.alpha, args.allow_transposition, args.contour_match, collections)
 
         if args.output == None:
@@ -617,6 +1086,233 @@ class Parser:
 
         self.close_driver()
 
+    def parse_schema(self, args):
+        '''Parse the args for the schema mode'''
+
+        if args.dry_run:
+            print(';\n'.join(index_statements()) + ';')
+            return
+
+        if args.wait < 0:
+            self.parser_sc.error('argument `-w` takes a positive value !')
+
+        self.init_driver(args.URI, args.user, args.password)
+
+        if not args.explain_only:
+            for name, state in create_indexes(self.driver, args.wait):
+                print(f'{name:<25} {state}')
+
+        if args.explain or args.explain_only:
+            if not args.explain_only:
+                print()
+            print(format_explain_report(explain_queries(self.driver)))
+
+        self.close_driver()
+
+    def parse_ngrams(self, args):
+        '''Parse the args for the ngrams mode'''
+
+        if args.size < 1:
+            self.parser_n.error('argument `-k` takes a strictly positive value !')
+
+        self.init_driver(args.URI, args.user, args.password)
+
+        counts = build_interval_gram_index(self.driver, args.size, args.source)
+        save_catalog(counts, args.size, args.output)
+
+        print(f'{len(counts)} distinct grams of {args.size} intervals, starting {sum(counts.values())} chains')
+
+        self.close_driver()
+
+    def parse_interval_index(self, args):
+        '''Parse the args for the interval-index mode'''
+
+        self.init_driver(args.URI, args.user, args.password)
+
+        try:
+            index = build_interval_index(self.driver, args.output)
+        finally:
+            self.close_driver()
+
+        print(f'{len(index)} intervals of {len(index.sources)} scores indexed in {args.output or DEFAULT_INDEX_DIR}')
+
+    def parse_contour_index(self, args):
+        '''Parse the args for the contour-index mode'''
+
+        self.init_driver(args.URI, args.user, args.password)
+
+        try:
+            index = build_contour_index(self.driver, args.output)
+        finally:
+            self.close_driver()
+
+        print(f'{len(index)} contour symbols of {len(index.sources)} scores indexed in {args.output or DEFAULT_CONTOUR_INDEX_DIR}')
+
+    def parse_duration_index(self, args):
+        '''Parse the args for the duration-index mode'''
+
+        self.init_driver(args.URI, args.user, args.password)
+
+        try:
+            index = build_duration_index(self.driver, args.output)
+        finally:
+            self.close_driver()
+
+        print(f'{len(index)} durations of {len(index.sources)} scores indexed in {args.output or DEFAULT_DURATION_INDEX_DIR}')
+
+    def parse_scan_corpus(self, args):
+        '''Parse the args for the scan-corpus mode'''
+
+        self.init_driver(args.URI, args.user, args.password)
+
+        try:
+            corpus = build_scan_corpus(self.driver, args.output)
+        finally:
+            self.close_driver()
+
+        print(f'{len(corpus)} events of {len(corpus.sources)} scores saved in {args.output or DEFAULT_SCAN_DIR}')
+
+    def parse_warmup(self, args):
+        '''Parse the args for the warmup mode'''
+
+        min_length, max_length = args.lengths
+        if min_length < 2 or max_length < min_length:
+            self.parser_wu.error('argument `-l` takes two lengths MIN <= MAX, with MIN >= 2 !')
+
+        self.init_driver(args.URI, args.user, args.password)
+
+        report = warm_up(self.driver, range(min_length, max_length + 1), args.modes, args.ranking)
+        print(format_warmup_report(report))
+
+        self.close_driver()
+
+    def parse_batch(self, args):
+        '''Parse the args for the batch mode'''
+
+        if args.top_k != None and args.top_k < 0:
+            self.parser_b.error(f'TOP_K should be a positive integer, but {args.top_k} was given')
+
+        if args.rank_in_db and args.top_k == None:
+            self.parser_b.error('`-R` needs the number of results to keep (`-k`)')
+
+        if args.batch_size < 1:
+            self.parser_b.error('argument `-b` takes a strictly positive value !')
+
+        # The queries of a batch are sent with `UNWIND`, that the in-memory engine does not evaluate
+        if args.URI.startswith(MEMORY_URI_PREFIX):
+            self.parser_b.error(f'batch can not be used with the in-memory engine ({MEMORY_URI_PREFIX}), send the queries one by one (`send`)')
+
+        queries = {fn: get_file_content(fn, self.parser_b) for fn in args.FILES}
+
+        self.init_driver(args.URI, args.user, args.password)
+
+        try:
+            results, fuzzy_queries, errors = run_batch(self.driver, queries, args.rank_in_db, args.top_k, args.batch_size)
+        except (neo4j.exceptions.CypherSyntaxError, UnsupportedQueryError) as err:
+            print('parse_batch: query syntax error: ' + str(err))
+            return
+        finally:
+            self.close_driver()
+
+        for fn, error in errors.items():
+            print(f'parse_batch: compile query: error: {fn}: {error}', file=sys.stderr)
+
+        res = json.dumps({
+            fn: process_results_to_dict(records, fuzzy_queries[fn], args.top_k)
+            for fn, records in results.items()
+        })
+
+        if args.output == None:
+            print(res)
+        else:
+            write_to_file(args.output, res)
+
+    def parse_import(self, args):
+        '''Parse the args for the import mode'''
+
+        if args.workers != None and args.workers < 1:
+            self.parser_i.error('argument `-w` takes a strictly positive value !')
+
+        if args.batch_size < 1:
+            self.parser_i.error('argument `-b` takes a strictly positive value !')
+
+        if not exists(args.data_dir):
+            self.parser_i.error(f'the data directory "{args.data_dir}" does not exist !')
+
+        files = find_mei_files(args.data_dir, args.collections)
+
+        if args.dry_run:
+            print(format_import_report(import_mei_files(None, files, args.workers, args.batch_size, dry_run=True)))
+            return
+
+        self.init_driver(args.URI, args.user, args.password)
+
+        try:
+            report = import_mei_files(self.driver, files, args.workers, args.batch_size)
+        finally:
+            self.close_driver()
+
+        print(format_import_report(report))
+
+    def parse_ingest(self, args):
+        '''Parse the args for the ingest mode'''
+
+        if not exists(args.FILE):
+            self.parser_in.error(f'the file "{args.FILE}" does not exist !')
+
+        self.init_driver(args.URI, args.user, args.password)
+
+        try:
+            report = ingest_mei_file(self.driver, args.FILE, args.collection)
+        finally:
+            self.close_driver()
+
+        replaced = f', replacing {report["removed_events"]} events' if report['removed_events'] else ''
+        print(f'{report["source"]} : {report["events"]} events ({report["grams"]} interval grams){replaced}, in {report["elapsed_ms"]:.1f} ms')
+        self.warn_static_indexes()
+
+    def parse_remove(self, args):
+        '''Parse the args for the remove mode'''
+
+        self.init_driver(args.URI, args.user, args.password)
+
+        try:
+            report = remove_score(self.driver, args.SOURCE)
+        finally:
+            self.close_driver()
+
+        if report['removed_events'] == 0:
+            print(f'parse_remove: no events for the score "{args.SOURCE}"', file=sys.stderr)
+
+        print(f'{report["source"]} : {report["removed_events"]} events ({report["removed_grams"]} interval grams) removed, in {report["elapsed_ms"]:.1f} ms')
+        self.warn_static_indexes()
+
+    def warn_static_indexes(self):
+        '''Tell which indexes saved on disk (in their default directory) should be rebuilt after a change of the scores (see `ingest`).'''
+
+        directories = {
+            'interval-index': DEFAULT_INDEX_DIR,
+            'contour-index': DEFAULT_CONTOUR_INDEX_DIR,
+            'duration-index': DEFAULT_DURATION_INDEX_DIR,
+            'scan-corpus': DEFAULT_SCAN_DIR
+        }
+
+        stale = [command for command, directory in directories.items() if exists(directory)]
+        if stale:
+            print(f'the indexes built with {", ".join(stale)} do not include this change : they should be rebuilt', file=sys.stderr)
+
+    def parse_pitches(self, args):
+        '''Parse the args for the pitches mode'''
+
+        self.init_driver(args.URI, args.user, args.password)
+
+        try:
+            nb_events = set_event_pitches(self.driver, args.source)
+        finally:
+            self.close_driver()
+
+        print(f'{nb_events} events updated')
+
     def parse_list(self, args):
         '''Parse the args for the list mode'''
 
@@ -668,7 +1364,7 @@ if __name__ == '__main__':
         app.parse()
         logger.save()
 
-        # Set up a driver just to clear the cache
+        # Set up a driver just to clear the cache (each run is measured cold, without the plans cached by the previous one)
         uri = "bolt://localhost:7687"  # Default URI for a local Neo4j instance
         user = "neo4j"                 # Default username
         password = "12345678"          # Replace with your actual password
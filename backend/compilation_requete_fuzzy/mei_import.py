@@ -0,0 +1,519 @@
+'''
+Bulk import of MEI files into the graph.
+
+The files are read from `<data dir>/<collection>/mei/*.mei` (e.g `backend/data/<author>/mei/`), parsed in a process
+pool (`parse_mei_file`), and written in large batches, each batch being a single `UNWIND $scores` statement
+(`write_scores`). The graph is :
+    (:Score {source, collection})-[:timeSeries]->(:TopRhythmic {source, collection})
+    (:TopRhythmic)-[:RHYTHMIC]->(:Measure {source, number, index})-[:HAS]->(:Event)-[:IS]->(:Fact)
+    (:TopRhythmic)-[:VOICE {staff, layer}]->(:Event)
+    (:Event)-[:NEXT {interval}]->(:Event)
+
+with the derived properties used by the compiled queries :
+    - `Event` / `Fact` : `duration` (in whole notes, with the dots and tuplets), `dur`, `dots` ;
+    - `Event` : `start` / `end` (from the beginning of the score, in whole notes ; each layer of a measure starts
+      with the measure), and `pitches`, the sorted `halfTonesFromA4` of its notes (one for a note, several for a
+      chord, none for a rest) ;
+    - `Fact` : `class`, `octave`, `accid`, `accid_ges`, `halfTonesFromA4` and `frequency` (A4 = 440 Hz) ;
+    - `NEXT` : `interval`, in tones, between the first notes of the two events (none if one of them is a rest).
+
+Every layer of every staff is imported : a voice is a `(staff, layer)` couple (their `n`), its events are linked by
+`NEXT` in time order (one chain per voice), and `VOICE` points to its first event, so that the scores can be reached
+from their events with `(e)<-[:timeSeries|VOICE|NEXT*]-(s:Score)` (see `reformulation_V2.create_collection_clause`).
+The `Measure` has the events of all its voices.
+
+The accidentals implied by the key signature or by a previous accidental of the staff in the measure are stored
+in `accid_ges`.
+'''
+
+import os
+import time
+import xml.etree.ElementTree as ET
+from fractions import Fraction
+from concurrent.futures import ProcessPoolExecutor
+
+from neo4j_connection import run_query
+from degree_computation import half_tones_from_a4
+
+# Default data directory : `backend/data/`
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+# Approximate number of events written per statement
+BATCH_EVENTS = 20000
+
+XML_ID = '{http://www.w3.org/XML/1998/namespace}id'
+
+# Order in which the sharps and the flats of a key signature are added
+SHARPS_ORDER = 'fcgdaeb'
+FLATS_ORDER = 'beadgcf'
+
+# Containers whose children are events of the layer
+CONTAINERS = ('beam', 'tuplet', 'ftrem', 'btrem', 'bTrem', 'fTrem', 'graceGrp', 'ligature')
+
+WRITE_SCORES_QUERY = '''
+UNWIND $scores AS s
+CREATE (score:Score {source: s.source, collection: s.collection})-[:timeSeries]->(tr:TopRhythmic {source: s.source, collection: s.collection})
+WITH s, tr
+UNWIND s.measures AS m
+CREATE (tr)-[:RHYTHMIC]->(measure:Measure {source: s.source, number: m.number, index: m.index})
+WITH s, tr, measure, m
+UNWIND m.events AS e
+CREATE (measure)-[:HAS]->(event:Event)
+SET event = e.event
+FOREACH (f IN e.facts | CREATE (event)-[:IS]->(fact:Fact) SET fact = f)
+WITH s, tr, event, e.position AS position
+ORDER BY position
+WITH s, tr, collect(event) AS events
+FOREACH (v IN s.voices | FOREACH (first IN [events[v.first]] | CREATE (tr)-[:VOICE {staff: v.staff, layer: v.layer}]->(first)))
+WITH s, events
+UNWIND s.next AS n
+WITH events[n.a] AS a, events[n.b] AS b, n.interval AS interval
+CREATE (a)-[:NEXT {interval: interval}]->(b)
+'''
+
+# Keys of a parsed score written by `WRITE_SCORES_QUERY`
+WRITE_KEYS = ('source', 'collection', 'measures', 'voices', 'next')
+
+# `Event.pitches` of a database that was not imported with `import_mei_files` (see the module documentation)
+EVENT_PITCHES_QUERY = '''
+MATCH (e:Event)--(f:Fact)
+WHERE f.halfTonesFromA4 IS NOT NULL AND ($source IS NULL OR e.source = $source)
+WITH e, f.halfTonesFromA4 AS pitch
+ORDER BY pitch
+WITH e, collect(pitch) AS pitches
+SET e.pitches = pitches
+RETURN count(e) AS events
+'''
+
+def local_name(element):
+    '''Return the tag of `element` without its namespace.'''
+
+    return element.tag.rsplit('}', 1)[-1]
+
+def parse_number(value):
+    '''Return the MEI number `value` (e.g the `n` of a measure) as an int if it is one, as it is otherwise.'''
+
+    return int(value) if value is not None and value.isdigit() else value
+
+def parse_key_signature(sig):
+    '''
+    Return the accidentals of a key signature, as a dict `{class: accid}`.
+
+    - sig : the MEI key signature, e.g '2s', '3f' or '0'.
+    '''
+
+    if not sig or sig in ('0', 'mixed'):
+        return {}
+
+    number, accid = int(sig[:-1]), sig[-1]
+    order = SHARPS_ORDER if accid == 's' else FLATS_ORDER
+
+    return {pname: accid for pname in order[:number]}
+
+def note_duration(dur, dots):
+    '''
+    Return the duration of a note in whole notes (e.g 3/8 for a dotted quarter), as a `Fraction`.
+
+    - dur  : the MEI duration (1 for whole, 2 for half, ..., 'breve', 'long') ;
+    - dots : the number of dots.
+    '''
+
+    value = {'breve': Fraction(2), 'long': Fraction(4), 'maxima': Fraction(8)}.get(dur)
+    if value is None:
+        value = 1 / Fraction(dur)
+
+    return value * (2 - Fraction(1, 2) ** dots)
+
+def frequency_from_half_tones(half_tones):
+    '''Return the frequency (in Hz) of the note `half_tones` half tones away from A4 (440 Hz).'''
+
+    return 440.0 * 2 ** (half_tones / 12)
+
+def interval_between(fact_1, fact_2):
+    '''Return the interval (in tones) between two facts, or None if one of them has no pitch.'''
+
+    if fact_1.get('halfTonesFromA4') is None or fact_2.get('halfTonesFromA4') is None:
+        return None
+
+    return (fact_2['halfTonesFromA4'] - fact_1['halfTonesFromA4']) / 2
+
+class _ScoreParser:
+    '''Parses the events of one MEI file (see `parse_mei_file`).'''
+
+    def __init__(self, source):
+        self.source = source
+        self.key_signature = {}
+        self.meter = (Fraction(4), Fraction(4))
+        self.time = Fraction(0)
+        self.last_dur = '4'
+        self.measure_accidentals = {}
+        self.count = 0
+
+    def update_score_definition(self, element):
+        '''Read the key signature and the meter of a `scoreDef` or `staffDef` (attributes or children).'''
+
+        sig = element.get('key.sig')
+        count, unit = element.get('meter.count'), element.get('meter.unit')
+
+        for child in element.iter():
+            if local_name(child) == 'keySig' and child.get('sig') is not None:
+                sig = child.get('sig')
+            elif local_name(child) == 'meterSig' and child.get('count') is not None:
+                count, unit = child.get('count'), child.get('unit')
+
+        if sig is not None:
+            self.key_signature = parse_key_signature(sig)
+
+        if count is not None and unit is not None:
+            try:
+                self.meter = (Fraction(count), Fraction(unit))
+            except ValueError:
+                pass
+
+    def make_id(self, element):
+        '''Return the `xml:id` of `element`, or a generated id.'''
+
+        self.count += 1
+        return element.get(XML_ID) or f'{self.source}_{self.count}'
+
+    def make_fact(self, note, dur, dots, duration):
+        '''Return the properties of the `Fact` of a note.'''
+
+        pname, octave = note.get('pname'), note.get('oct')
+        accid, accid_ges = note.get('accid'), note.get('accid.ges')
+
+        for child in note:
+            if local_name(child) == 'accid':
+                accid = accid or child.get('accid')
+                accid_ges = accid_ges or child.get('accid.ges')
+
+        fact = {'id': self.make_id(note), 'source': self.source, 'type': 'note', 'dur': dur, 'dots': dots, 'duration': float(duration)}
+
+        if pname is None or octave is None:
+            return fact
+
+        pname, octave = pname.lower(), int(octave)
+
+        # Accidental implied by a previous accidental of the measure, or by the key signature
+        if accid is not None:
+            self.measure_accidentals[(pname, octave)] = accid
+        elif accid_ges is None:
+            implied = self.measure_accidentals.get((pname, octave), self.key_signature.get(pname))
+            if implied is not None and implied != 'n':
+                accid_ges = implied
+
+        half_tones = half_tones_from_a4(pname, octave, accid if accid is not None else accid_ges)
+        fact.update({
+            'class': pname,
+            'octave': octave,
+            'accid': accid,
+            'accid_ges': accid_ges,
+            'halfTonesFromA4': half_tones,
+            'frequency': frequency_from_half_tones(half_tones)
+        })
+
+        return {key: value for key, value in fact.items() if value is not None}
+
+    def make_event(self, element, facts, dur, dots, duration, type_):
+        '''Return the event `{'event': properties, 'facts': [properties]}`, and move the time forward.'''
+
+        start = self.time
+        self.time += duration
+
+        pitches = sorted(fact['halfTonesFromA4'] for fact in facts if 'halfTonesFromA4' in fact)
+
+        event = {
+            'id': self.make_id(element), 'source': self.source, 'type': type_,
+            'dur': dur, 'dots': dots, 'duration': float(duration), 'start': float(start), 'end': float(self.time),
+            'pitches': pitches or None
+        }
+
+        return {'event': {key: value for key, value in event.items() if value is not None}, 'facts': facts}
+
+    def parse_layer(self, element, ratio=Fraction(1)):
+        '''Return the events of a layer (or of a container of the layer), in order.'''
+
+        events = []
+
+        for child in element:
+            name = local_name(child)
+
+            if name in CONTAINERS:
+                if name == 'tuplet' and child.get('num') and child.get('numbase'):
+                    events += self.parse_layer(child, ratio * Fraction(child.get('numbase')) / Fraction(child.get('num')))
+                else:
+                    events += self.parse_layer(child, ratio)
+                continue
+
+            if name not in ('note', 'chord', 'rest', 'mRest', 'space') or child.get('grace') is not None:
+                continue
+
+            if name == 'mRest':
+                count, unit = self.meter
+                duration = count / unit
+                facts = [{'id': self.make_id(child), 'source': self.source, 'type': 'rest', 'duration': float(duration)}]
+                events.append(self.make_event(child, facts, None, 0, duration, 'rest'))
+                continue
+
+            dur = child.get('dur') or self.last_dur
+            self.last_dur = dur
+            dots = int(child.get('dots', 0))
+            duration = note_duration(dur, dots) * ratio
+            dur = int(dur) if dur.isdigit() else dur
+
+            if name == 'space':
+                self.time += duration
+            elif name == 'rest':
+                facts = [{'id': self.make_id(child), 'source': self.source, 'type': 'rest', 'dur': dur, 'dots': dots, 'duration': float(duration)}]
+                events.append(self.make_event(child, facts, dur, dots, duration, 'rest'))
+            elif name == 'note':
+                events.append(self.make_event(child, [self.make_fact(child, dur, dots, duration)], dur, dots, duration, 'note'))
+            else:
+                facts = [self.make_fact(note, dur, dots, duration) for note in child.iter() if local_name(note) == 'note']
+                events.append(self.make_event(child, facts, dur, dots, duration, 'chord'))
+
+        return events
+
+    def parse(self, root):
+        '''
+        Return `(measures, voices)` : the measures `[{'number', 'index', 'events'}]` of the MEI tree `root`, and the
+        `(staff, layer)` of each voice. Each event has the index of its voice in `voice`.
+        '''
+
+        measures, voices = [], []
+        last_durs = {}
+
+        for element in root.iter():
+            name = local_name(element)
+
+            # The staff definitions inside the measures are for the other staves
+            if name == 'scoreDef' or (name == 'staffDef' and not measures):
+                self.update_score_definition(element)
+
+            elif name == 'measure':
+                start = end = self.time
+                events = []
+
+                for staff_idx, staff in enumerate(child for child in element if local_name(child) == 'staff'):
+                    # The accidentals of a staff last until the end of the measure, in all its layers
+                    self.measure_accidentals = {}
+
+                    for layer_idx, layer in enumerate(child for child in staff if local_name(child) == 'layer'):
+                        voice = (staff.get('n') or str(staff_idx + 1), layer.get('n') or str(layer_idx + 1))
+                        if voice not in voices:
+                            voices.append(voice)
+
+                        # Each layer starts with the measure, and keeps its own default duration
+                        self.time = start
+                        self.last_dur = last_durs.get(voice, '4')
+
+                        for event in self.parse_layer(layer):
+                            event['voice'] = voices.index(voice)
+                            events.append(event)
+
+                        last_durs[voice] = self.last_dur
+                        end = max(end, self.time)
+
+                self.time = end
+                measures.append({
+                    'number': parse_number(element.get('n')),
+                    'index': len(measures),
+                    'events': events
+                })
+
+        return measures, voices
+
+def parse_mei_file(path, collection=None):
+    '''
+    Parse an MEI file and return the score to write (see `write_scores`) :
+    `{'source', 'collection', 'measures': [...], 'voices': [...], 'next': [...], 'nb_events'}`.
+
+    The events are numbered in the order of the measures (`position`). `voices` gives the staff, the layer and the
+    first event of each voice, and `next` the `NEXT` relationships `{'a', 'b', 'interval'}` between the consecutive
+    events of each voice.
+
+    - path       : the MEI file. Its name is the `source` of the score ;
+    - collection : the collection of the score (by default, the name of the directory above `mei/`).
+    '''
+
+    source = os.path.basename(path)
+    if collection is None:
+        collection = os.path.basename(os.path.dirname(os.path.dirname(os.path.abspath(path))))
+
+    measures, voices = _ScoreParser(source).parse(ET.parse(path).getroot())
+
+    events = [event for measure in measures for event in measure['events']]
+
+    chains = [[] for _ in voices]
+    for position, event in enumerate(events):
+        event['position'] = position
+        chains[event['voice']].append(position)
+
+    next_ = [
+        {
+            'a': a, 'b': b,
+            'interval': interval_between(events[a]['facts'][0], events[b]['facts'][0]) if events[a]['facts'] and events[b]['facts'] else None
+        }
+        for chain in chains for a, b in zip(chain, chain[1:])
+    ]
+
+    voices = [
+        {'staff': parse_number(staff), 'layer': parse_number(layer), 'first': chain[0]}
+        for (staff, layer), chain in zip(voices, chains) if chain
+    ]
+
+    return {'source': source, 'collection': collection, 'measures': measures, 'voices': voices, 'next': next_, 'nb_events': len(events)}
+
+def _parse_task(task):
+    '''Parse `(path, collection)` in a worker. Returns `(path, score, error)`.'''
+
+    path, collection = task
+    try:
+        return path, parse_mei_file(path, collection), None
+    except Exception as e:
+        return path, None, f'{type(e).__name__}: {e}'
+
+def parse_mei_files(files, workers=None):
+    '''
+    Parse MEI files in a process pool, and yield `(path, score, error)` in the order of `files`
+    (`score` is None if the file could not be parsed, and `error` is then the error message).
+
+    - files   : the list of `(path, collection)` (see `find_mei_files`) ;
+    - workers : the number of processes (number of CPUs if None).
+    '''
+
+    with ProcessPoolExecutor(workers) as executor:
+        yield from executor.map(_parse_task, files, chunksize=8)
+
+def find_mei_files(data_dir=DEFAULT_DATA_DIR, collections=None):
+    '''
+    Return the list of `(path, collection)` of the MEI files of `<data_dir>/<collection>/mei/`.
+
+    - data_dir    : the data directory ;
+    - collections : if not None, only list the files of these collections.
+    '''
+
+    files = []
+    for collection in sorted(os.listdir(data_dir)):
+        mei_dir = os.path.join(data_dir, collection, 'mei')
+        if not os.path.isdir(mei_dir) or (collections is not None and collection not in collections):
+            continue
+
+        files += [(os.path.join(mei_dir, fn), collection) for fn in sorted(os.listdir(mei_dir)) if fn.lower().endswith('.mei')]
+
+    return files
+
+def existing_sources(driver, sources):
+    '''Return the set of the sources of `sources` that are already in the database.'''
+
+    records = run_query(driver, 'MATCH (s:Score) WHERE s.source IN $sources RETURN s.source AS source', {'sources': list(sources)})
+    return {record['source'] for record in records}
+
+def set_event_pitches(driver, source=None):
+    '''
+    Set `Event.pitches` from the Facts of the events, for a database that was not imported with `import_mei_files`.
+    Returns the number of events updated.
+
+    - driver : the neo4j driver ;
+    - source : if not None, only update the events of this score.
+    '''
+
+    return run_query(driver, EVENT_PITCHES_QUERY, {'source': source})[0]['events']
+
+def write_scores(driver, scores):
+    '''
+    Write parsed scores (see `parse_mei_file`) in a single statement.
+
+    - driver : the neo4j driver ;
+    - scores : the list of parsed scores.
+    '''
+
+    rows = [{key: score[key] for key in WRITE_KEYS} for score in scores]
+
+    with driver.session() as session:
+        session.execute_write(lambda tx: tx.run(WRITE_SCORES_QUERY, {'scores': rows}).consume())
+
+def import_mei_files(driver, files, workers=None, batch_events=BATCH_EVENTS, dry_run=False):
+    '''
+    Parse the MEI files in a process pool and write them by batches of about `batch_events` events.
+    The scores already in the database (same source) are skipped.
+
+    - driver       : the neo4j driver ;
+    - files        : the list of `(path, collection)` (see `find_mei_files`) ;
+    - workers      : the number of parsing processes (number of CPUs if None) ;
+    - batch_events : the number of events after which a batch is written ;
+    - dry_run      : if True, only parse the files (nothing is written, and `driver` is not used).
+
+    Returns a dict with the numbers of imported / skipped scores, of events, the failures (list of `(path, error)`),
+    the time spent writing and in total (in s), and the throughput.
+    '''
+
+    start = time.perf_counter()
+
+    skipped = set()
+    if not dry_run and files:
+        skipped = existing_sources(driver, {os.path.basename(path) for path, _ in files})
+    tasks = [(path, collection) for path, collection in files if os.path.basename(path) not in skipped]
+
+    nb_scores = nb_events = 0
+    failures = []
+    write_time = 0.0
+    batch, batch_size = [], 0
+
+    def flush():
+        nonlocal write_time, batch, batch_size
+        if batch and not dry_run:
+            t0 = time.perf_counter()
+            write_scores(driver, batch)
+            write_time += time.perf_counter() - t0
+        batch, batch_size = [], 0
+
+    for path, score, error in parse_mei_files(tasks, workers):
+        if error is not None:
+            failures.append((path, error))
+            continue
+
+        nb_scores += 1
+        nb_events += score['nb_events']
+        batch.append(score)
+        batch_size += score['nb_events']
+
+        if batch_size >= batch_events:
+            flush()
+
+    flush()
+
+    elapsed = time.perf_counter() - start
+
+    return {
+        'scores': nb_scores,
+        'events': nb_events,
+        'skipped': len(skipped),
+        'failures': failures,
+        'write_s': write_time,
+        'elapsed_s': elapsed,
+        'scores_per_s': nb_scores / elapsed if elapsed > 0 else 0.0,
+        'events_per_s': nb_events / elapsed if elapsed > 0 else 0.0
+    }
+
+def format_import_report(report):
+    '''
+    Format the result of `import_mei_files` as text.
+
+    - report : the result of `import_mei_files`.
+    '''
+
+    lines = [
+        f'{report["scores"]} scores ({report["events"]} events) imported in {report["elapsed_s"]:.2f} s '
+        f'(writing : {report["write_s"]:.2f} s) : {report["scores_per_s"]:.1f} scores/s, {report["events_per_s"]:.0f} events/s'
+    ]
+
+    if report['skipped']:
+        lines.append(f'{report["skipped"]} scores skipped (already in the database)')
+
+    if report['failures']:
+        lines.append(f'{len(report["failures"])} failed :')
+        for path, error in report['failures']:
+            lines.append(f'    {path} : {error}')
+
+    return '\n'.join(lines)
@@ -0,0 +1,1397 @@
+'''
+Embedded in-memory graph engine, to run the compiled queries without a neo4j server (CI, laptops, small corpora).
+
+The scores are parsed from MEI files (see `mei_import.parse_mei_file`) and kept as NumPy arrays per score
+(`ScoreArrays`). To run a query, the arrays of all the scores are concatenated (`MemoryGraph.tables`, rebuilt only
+when a score is added or removed), so that every step of a query is a vectorized operation over the whole corpus.
+
+The engine evaluates the subset of Cypher generated by `reformulation_V3` (without `ranking`) and `utils` :
+    - MATCH : chains of `(:Event)-[:NEXT]->(:Event)`, `-[:NEXT*a..b]->` gaps, `(:Event)--(:Fact)`,
+      `(:TopRhythmic)-[:RHYTHMIC]->(:Measure)-[:HAS]->(:Event)`, `(:Score)-[:timeSeries]->(:TopRhythmic)`,
+      and the `(:IntervalGram)-[:STARTS]->()` anchors (ignored : the WHERE clause checks the same intervals) ;
+    - WHERE : comparisons, arithmetic, `AND` / `OR` / `XOR` / `NOT`, `IS [NOT] NULL`, `IN`, `CONTAINS`,
+      `EXISTS(x.p)`, `toFloat`, `abs`, the `CASE` expressions with numeric results and the list predicates
+      `ALL` / `ANY` / `NONE` / `SINGLE(x IN list WHERE ...)`, with the three-valued logic of Cypher for the null values ;
+    - RETURN [DISTINCT] : expressions with aliases.
+
+The other clauses (`WITH`, `UNWIND`, `ORDER BY`, `OPTIONAL MATCH`, ...) raise an `UnsupportedQueryError`. So the
+queries ranked by the database (`send -R`, `reformulation_V3` with `ranking`), the queries anchored on the hits of an
+index (`send -X` / `-C` / `-D`, see `interval_index.anchor_query`) and the batches (`batch`, sent with `UNWIND`) can
+not be run : `main_parser.py` rejects these options for a `memory://` URI.
+
+The rows are built one variable at a time, starting from the events, and each condition of the WHERE clause is
+applied as soon as its variables are bound. The records are `neo4j.Record`s, with the same aliases as in neo4j
+(`pitch_i`, `duration_i`, `source`, ...), so `process_results` works unchanged.
+
+`MemoryDriver` wraps a `MemoryGraph` with the interface of the neo4j driver used in this project
+(`driver.session()`, `session.run(query, parameters)`), so that `neo4j_connection.run_query` and `iter_query`
+work with it. `neo4j_connection.connect_to_neo4j` returns one for a `memory://<data dir>` URI.
+'''
+
+import itertools
+import re
+import time
+
+import numpy as np
+from neo4j import Record
+
+from mei_import import DEFAULT_DATA_DIR, find_mei_files, parse_mei_files
+
+class UnsupportedQueryError(ValueError):
+    '''Raised for a query outside of the Cypher subset evaluated by the engine.'''
+
+#------Storage
+
+class Column:
+    '''
+    A property of the nodes of a table : a float array (NaN for null) for the numeric properties,
+    an object array (None for null) otherwise.
+    '''
+
+    def __init__(self, values):
+        '''
+        - values : the list of the values (None if the property is not set).
+        '''
+
+        present = [value for value in values if value is not None]
+        numeric = all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present)
+
+        if numeric:
+            self.kind = 'int' if all(isinstance(value, int) for value in present) else 'float'
+            self.data = np.array([np.nan if value is None else value for value in values], dtype=float)
+            self.null = np.isnan(self.data)
+        else:
+            self.kind = 'obj'
+            # `fromiter` keeps the list values (e.g `Event.pitches`) as objects, where an assignment would broadcast them
+            self.data = np.fromiter(values, dtype=object, count=len(values))
+            self.null = np.array([value is None for value in values], dtype=bool)
+
+    @staticmethod
+    def concatenate(columns, sizes):
+        '''Concatenate columns (a missing column, None, is a column of nulls of the given size).'''
+
+        values = []
+        for column, size in zip(columns, sizes):
+            values += column.values() if column is not None else [None] * size
+
+        return Column(values)
+
+    def values(self):
+        '''Return the values as a list of python values.'''
+
+        return to_python(self.data, self.null, self.kind)
+
+def to_python(data, null, kind):
+    '''Convert arrays (data and null mask) to a list of python values.'''
+
+    if kind == 'int':
+        return [None if n else int(x) for x, n in zip(data, null)]
+    if kind == 'float':
+        return [None if n else float(x) for x, n in zip(data, null)]
+    if kind == 'bool':
+        return [None if n else bool(x) for x, n in zip(data, null)]
+
+    return [None if n else x for x, n in zip(data, null)]
+
+def make_columns(rows):
+    '''Return the dict `{property: Column}` of a list of property dicts.'''
+
+    names = []
+    for row in rows:
+        names += [name for name in row if name not in names]
+
+    return {name: Column([row.get(name) for row in rows]) for name in names}
+
+class ScoreArrays:
+    '''The nodes of one score (see `mei_import.parse_mei_file`), as NumPy arrays.'''
+
+    def __init__(self, score):
+        '''
+        - score : the parsed score.
+        '''
+
+        self.source = score['source']
+
+        measures = score['measures']
+        events = [event for measure in measures for event in measure['events']]
+
+        self.score = make_columns([{'source': score['source'], 'collection': score['collection']}])
+        self.measures = make_columns([{'source': score['source'], 'number': m['number'], 'index': m['index']} for m in measures])
+        self.events = make_columns([event['event'] for event in events])
+        self.facts = make_columns([fact for event in events for fact in event['facts']])
+
+        self.nb_scores = 1
+        self.nb_measures = len(measures)
+        self.nb_events = len(events)
+        self.nb_facts = sum(len(event['facts']) for event in events)
+
+        # The events of each measure, and the facts of each event
+        self.event_measure = np.repeat(np.arange(len(measures)), [len(m['events']) for m in measures]).astype(np.int64)
+        self.fact_event = np.repeat(np.arange(len(events)), [len(event['facts']) for event in events]).astype(np.int64)
+
+        # The `NEXT` relationships (one chain per voice) : the next event of each event (-1 for the last one of its
+        # voice), and `NEXT.interval`, indexed by the first event (NaN for the last one)
+        self.next_event = np.full(len(events), -1, dtype=np.int64)
+        self.interval = np.full(len(events), np.nan, dtype=float)
+        for next_ in score['next']:
+            self.next_event[next_['a']] = next_['b']
+            self.interval[next_['a']] = np.nan if next_['interval'] is None else next_['interval']
+
+def offsets(parents, nb_parents):
+    '''Return the offsets (size `nb_parents + 1`) of the children of each parent, `parents` being sorted.'''
+
+    return np.concatenate(([0], np.cumsum(np.bincount(parents, minlength=nb_parents)))).astype(np.int64)
+
+class Tables:
+    '''The nodes of all the scores, concatenated (see `MemoryGraph.tables`).'''
+
+    def __init__(self, scores):
+        '''
+        - scores : the list of `ScoreArrays`.
+        '''
+
+        def concat(name, size):
+            names = []
+            for score in scores:
+                names += [n for n in getattr(score, name) if n not in names]
+            return {
+                n: Column.concatenate([getattr(score, name).get(n) for score in scores], [getattr(score, size) for score in scores])
+                for n in names
+            }
+
+        self.columns = {
+            'score': concat('score', 'nb_scores'),
+            'measure': concat('measures', 'nb_measures'),
+            'event': concat('events', 'nb_events'),
+            'fact': concat('facts', 'nb_facts'),
+        }
+
+        self.sizes = {
+            'score': len(scores),
+            'measure': sum(score.nb_measures for score in scores),
+            'event': sum(score.nb_events for score in scores),
+            'fact': sum(score.nb_facts for score in scores),
+        }
+
+        measure_base = np.cumsum([0] + [score.nb_measures for score in scores])
+        event_base = np.cumsum([0] + [score.nb_events for score in scores])
+
+        self.measure_score = np.repeat(np.arange(len(scores)), [score.nb_measures for score in scores]).astype(np.int64)
+        self.event_measure = np.concatenate([score.event_measure + base for score, base in zip(scores, measure_base)] or [np.zeros(0, np.int64)])
+        self.fact_event = np.concatenate([score.fact_event + base for score, base in zip(scores, event_base)] or [np.zeros(0, np.int64)])
+
+        # The next and the previous event of each event along the `NEXT` chains (-1 if none)
+        self.next_event = np.concatenate([np.where(score.next_event < 0, -1, score.next_event + base) for score, base in zip(scores, event_base)] or [np.zeros(0, np.int64)])
+        self.previous_event = np.full(len(self.next_event), -1, dtype=np.int64)
+        self.previous_event[self.next_event[self.next_event >= 0]] = np.flatnonzero(self.next_event >= 0)
+
+        self.score_measures = offsets(self.measure_score, len(scores))
+        self.measure_events = offsets(self.event_measure, self.sizes['measure'])
+        self.event_facts = offsets(self.fact_event, self.sizes['event'])
+
+        interval = np.concatenate([score.interval for score in scores] or [np.zeros(0)])
+        self.columns['next'] = {'interval': Column([None if np.isnan(i) else float(i) for i in interval])}
+
+    def column(self, table, name):
+        '''Return the column `name` of `table`, or None if no node has this property.'''
+
+        return self.columns[table].get(name)
+
+class MemoryGraph:
+    '''An in-memory graph of scores, queried with `run`.'''
+
+    def __init__(self):
+        '''Initiate an empty graph.'''
+
+        self.scores = {}
+        self.failures = []
+        self._tables = None
+
+    @classmethod
+    def load(cls, data_dir=DEFAULT_DATA_DIR, collections=None, workers=None):
+        '''
+        Create a graph from the MEI files of `<data_dir>/<collection>/mei/` (see `mei_import.find_mei_files`).
+        The files that can not be parsed are listed in `failures` (list of `(path, error)`).
+
+        - data_dir    : the data directory ;
+        - collections : if not None, only load the files of these collections ;
+        - workers     : the number of parsing processes (number of CPUs if None).
+        '''
+
+        graph = cls()
+
+        for path, score, error in parse_mei_files(find_mei_files(data_dir, collections), workers):
+            if error is not None:
+                graph.failures.append((path, error))
+            else:
+                graph.add_score(score)
+
+        return graph
+
+    def add_score(self, score):
+        '''
+        Add a parsed score (see `mei_import.parse_mei_file`), or replace the score with the same source.
+
+        - score : the parsed score.
+        '''
+
+        self.scores[score['source']] = ScoreArrays(score)
+        self._tables = None
+
+    def remove_score(self, source):
+        '''Remove the score `source`. Returns False if there is no such score.'''
+
+        self._tables = None
+        return self.scores.pop(source, None) is not None
+
+    @property
+    def tables(self):
+        '''The concatenated arrays of the scores (rebuilt after a change).'''
+
+        if self._tables is None:
+            self._tables = Tables(list(self.scores.values()))
+
+        return self._tables
+
+    def run(self, query, parameters=None):
+        '''
+        Run a query, and return its records (list of `neo4j.Record`).
+
+        Raises `UnsupportedQueryError` if the query is not in the supported subset (see the module documentation).
+
+        - query      : the Cypher query ;
+        - parameters : the parameters of the query (e.g `{'k': 10}` for `$k`), or None.
+        '''
+
+        return execute(parse_query(query), self.tables, parameters or {})
+
+#------Parsing
+
+TOKEN_RE = re.compile(r'''
+    (?P<space>\s+|//[^\n]*)
+  | (?P<number>\d+\.\d+(?:[eE][-+]?\d+)?|\d+[eE][-+]?\d+|\d+)
+  | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<param>\$\w+)
+  | (?P<name>[A-Za-z_]\w*|`[^`]+`)
+  | (?P<op><=|>=|<>|!=|\.\.|[-+*/%=<>(),.\[\]{}:|^])
+''', re.VERBOSE)
+
+# Keywords starting a clause
+CLAUSES = ('MATCH', 'OPTIONAL', 'WHERE', 'RETURN', 'WITH', 'UNWIND', 'CALL', 'ORDER', 'SKIP', 'LIMIT', 'CREATE',
+           'MERGE', 'SET', 'DELETE', 'DETACH', 'REMOVE', 'FOREACH', 'UNION', 'SHOW', 'USE', 'LOAD')
+
+# Labels of the nodes and the tables where they are stored
+LABELS = {'Score': 'score', 'TopRhythmic': 'score', 'Measure': 'measure', 'Event': 'event', 'Fact': 'fact'}
+
+def tokenize(text):
+    '''Return the list of the tokens `(kind, value)` of `text`.'''
+
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = TOKEN_RE.match(text, pos)
+        if match is None:
+            raise UnsupportedQueryError(f'Unexpected character "{text[pos]}" at position {pos}')
+
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group()
+
+        if kind == 'space':
+            continue
+        if kind == 'number':
+            value = float(value) if any(c in value for c in '.eE') else int(value)
+        elif kind == 'string':
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        elif kind == 'param':
+            value = value[1:]
+        elif kind == 'name' and value.startswith('`'):
+            value = value[1:-1]
+
+        tokens.append((kind, value))
+
+    return tokens
+
+class TokenStream:
+    '''The tokens of a clause, read from left to right.'''
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self, offset=0):
+        idx = self.pos + offset
+        return self.tokens[idx] if idx < len(self.tokens) else (None, None)
+
+    def next(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def at(self, value, offset=0):
+        '''Return True if the token at `offset` is the operator or keyword (case insensitive) `value`.'''
+
+        kind, token = self.peek(offset)
+        if kind == 'op':
+            return token == value
+        return kind == 'name' and token.upper() == value
+
+    def accept(self, value):
+        if self.at(value):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, value):
+        if not self.accept(value):
+            raise UnsupportedQueryError(f'Expected "{value}", but found "{self.peek()[1]}"')
+
+    def done(self):
+        return self.pos >= len(self.tokens)
+
+def split_clauses(tokens):
+    '''Split the tokens of a query into its clauses : list of `(keyword, tokens)`.'''
+
+    clauses = []
+    depth = 0
+
+    for kind, value in tokens:
+        if kind == 'op' and value in '([{':
+            depth += 1
+        elif kind == 'op' and value in ')]}':
+            depth -= 1
+
+        if depth == 0 and kind == 'name' and value.upper() in CLAUSES:
+            clauses.append((value.upper(), []))
+        elif not clauses:
+            raise UnsupportedQueryError(f'The query should start with a clause, not "{value}"')
+        else:
+            clauses[-1][1].append((kind, value))
+
+    return clauses
+
+# Precedence of the binary operators (higher binds tighter)
+BINARY_OPERATORS = {
+    'OR': 1, 'XOR': 2, 'AND': 3,
+    '=': 5, '<>': 5, '!=': 5, '<': 5, '>': 5, '<=': 5, '>=': 5, 'IN': 5, 'CONTAINS': 5, 'STARTS': 5, 'ENDS': 5,
+    '+': 6, '-': 6, '*': 7, '/': 7, '%': 7,
+}
+
+def parse_expression(stream, min_precedence=1):
+    '''
+    Parse an expression (precedence climbing). The expressions are tuples :
+    ('lit', value), ('param', name), ('prop', variable, property), ('var', name), ('list', items),
+    ('call', function, args), ('not', x), ('neg', x), ('isnull', x, negated), ('op', operator, a, b),
+    ('case', subject or None, [(when, then), ...], default), ('listpred', quantifier, variable, list, condition).
+    '''
+
+    if stream.accept('NOT'):
+        left = ('not', parse_expression(stream, 4))
+    else:
+        left = parse_operand(stream)
+
+    while True:
+        if stream.at('IS'):
+            stream.next()
+            negated = stream.accept('NOT')
+            stream.expect('NULL')
+            left = ('isnull', left, negated)
+            continue
+
+        kind, token = stream.peek()
+        operator = token.upper() if kind == 'name' else token if kind == 'op' else None
+        precedence = BINARY_OPERATORS.get(operator)
+
+        if precedence is None or precedence < min_precedence:
+            return left
+
+        stream.next()
+        if operator in ('STARTS', 'ENDS'):
+            stream.expect('WITH')
+
+        left = ('op', operator, left, parse_expression(stream, precedence + 1))
+
+def parse_operand(stream):
+    '''Parse a literal, a parameter, a variable, a property, a function call, a list, or a parenthesized expression.'''
+
+    kind, token = stream.next()
+
+    if kind in ('number', 'string'):
+        return ('lit', token)
+
+    if kind == 'param':
+        return ('param', token)
+
+    if kind == 'op' and token == '-':
+        return ('neg', parse_operand(stream))
+
+    if kind == 'op' and token == '(':
+        expression = parse_expression(stream)
+        stream.expect(')')
+        return expression
+
+    if kind == 'op' and token == '[':
+        items = []
+        while not stream.accept(']'):
+            items.append(parse_expression(stream))
+            stream.accept(',')
+        return ('list', items)
+
+    if kind == 'name':
+        upper = token.upper()
+        if upper in ('TRUE', 'FALSE'):
+            return ('lit', upper == 'TRUE')
+        if upper == 'NULL':
+            return ('lit', None)
+        if upper == 'CASE':
+            return parse_case(stream)
+        if upper in LIST_PREDICATES and stream.at('('):
+            return parse_list_predicate(stream, upper)
+
+        if stream.accept('('):
+            args = []
+            while not stream.accept(')'):
+                args.append(parse_expression(stream))
+                stream.accept(',')
+            return ('call', token.lower(), args)
+
+        if stream.accept('.'):
+            _, name = stream.next()
+            return ('prop', token, name)
+
+        return ('var', token)
+
+    raise UnsupportedQueryError(f'Unexpected token "{token}"')
+
+def parse_case(stream):
+    '''Parse the rest of a `CASE [subject] WHEN x THEN y ... [ELSE z] END` expression.'''
+
+    subject = None if stream.at('WHEN') else parse_expression(stream)
+
+    branches = []
+    while stream.accept('WHEN'):
+        when = parse_expression(stream)
+        stream.expect('THEN')
+        branches.append((when, parse_expression(stream)))
+
+    if not branches:
+        raise UnsupportedQueryError('A CASE expression should have at least one WHEN')
+
+    default = parse_expression(stream) if stream.accept('ELSE') else ('lit', None)
+    stream.expect('END')
+
+    return ('case', subject, branches, default)
+
+LIST_PREDICATES = ('ALL', 'ANY', 'NONE', 'SINGLE')
+
+def parse_list_predicate(stream, quantifier):
+    '''Parse the rest of a `ALL(x IN list WHERE condition)` expression (or `ANY`, `NONE`, `SINGLE`).'''
+
+    stream.expect('(')
+    kind, variable = stream.next()
+    if kind != 'name':
+        raise UnsupportedQueryError(f'Expected a variable in {quantifier}, but found "{variable}"')
+
+    stream.expect('IN')
+    items = parse_expression(stream)
+    stream.expect('WHERE')
+    condition = parse_expression(stream)
+    stream.expect(')')
+
+    return ('listpred', quantifier, variable, items, condition)
+
+def parse_properties(stream, variable):
+    '''Parse an inline property map `{p: value, ...}` as a list of equality conditions on `variable`.'''
+
+    conditions = []
+    while not stream.accept('}'):
+        _, name = stream.next()
+        stream.expect(':')
+        conditions.append(('op', '=', ('prop', variable, name), parse_expression(stream)))
+        stream.accept(',')
+
+    return conditions
+
+class Pattern:
+    '''A path of the MATCH clause : nodes `(variable, label)` and relationships between consecutive nodes.'''
+
+    def __init__(self):
+        self.nodes = []
+        self.relationships = []
+        self.conditions = []
+
+def parse_node(stream, pattern, anonymous):
+    '''Parse a node `(variable:Label {properties})` of a pattern.'''
+
+    stream.expect('(')
+
+    variable = None
+    if stream.peek()[0] == 'name':
+        variable = stream.next()[1]
+    if variable is None:
+        variable = f'  anon{next(anonymous)}'
+
+    label = None
+    if stream.accept(':'):
+        label = stream.next()[1]
+
+    if stream.accept('{'):
+        pattern.conditions += parse_properties(stream, variable)
+
+    stream.expect(')')
+    pattern.nodes.append((variable, label))
+
+def parse_relationship(stream, pattern, anonymous):
+    '''Parse a relationship `-[variable:TYPE*min..max]->`, `<-[...]-` or `--` of a pattern.'''
+
+    backward = stream.accept('<')
+    stream.expect('-')
+
+    variable = rel_type = None
+    hops = None
+
+    if stream.accept('['):
+        if stream.peek()[0] == 'name':
+            variable = stream.next()[1]
+        if stream.accept(':'):
+            rel_type = stream.next()[1]
+        if stream.accept('*'):
+            low = stream.next()[1] if stream.peek()[0] == 'number' else 1
+            high = low
+            if stream.accept('..'):
+                high = stream.next()[1]
+            hops = (low, high)
+        if stream.accept('{'):
+            if variable is None:
+                variable = f'  anon{next(anonymous)}'
+            pattern.conditions += parse_properties(stream, variable)
+        stream.expect(']')
+
+    stream.expect('-')
+    forward = stream.accept('>')
+
+    if backward and forward:
+        raise UnsupportedQueryError('A relationship can not have two directions')
+
+    direction = 1 if forward else -1 if backward else 0
+    pattern.relationships.append((variable, rel_type, hops, direction))
+
+def parse_match(tokens):
+    '''Parse the patterns of a MATCH clause.'''
+
+    stream = TokenStream(tokens)
+    patterns = []
+    anonymous = itertools.count()
+
+    while not stream.done():
+        pattern = Pattern()
+        parse_node(stream, pattern, anonymous)
+
+        while stream.at('-') or stream.at('<'):
+            parse_relationship(stream, pattern, anonymous)
+            parse_node(stream, pattern, anonymous)
+
+        patterns.append(pattern)
+
+        if not stream.done():
+            stream.expect(',')
+
+    return patterns
+
+def parse_return(tokens):
+    '''Parse the items of a RETURN clause. Returns `(distinct, [(alias, expression)])`.'''
+
+    stream = TokenStream(tokens)
+    distinct = stream.accept('DISTINCT')
+    items = []
+
+    while not stream.done():
+        start = stream.pos
+        expression = parse_expression(stream)
+
+        if stream.accept('AS'):
+            alias = stream.next()[1]
+        else:
+            alias = ''.join(str(value) for _, value in tokens[start:stream.pos])
+
+        items.append((alias, expression))
+        if not stream.done():
+            stream.expect(',')
+
+    return distinct, items
+
+def split_conjuncts(expression):
+    '''Return the list of the operands of the top-level ANDs of `expression`.'''
+
+    if expression[0] == 'op' and expression[1] == 'AND':
+        return split_conjuncts(expression[2]) + split_conjuncts(expression[3])
+    return [expression]
+
+def expression_variables(expression):
+    '''Return the set of the variables used in `expression`.'''
+
+    if expression[0] == 'prop':
+        return {expression[1]}
+    if expression[0] == 'var':
+        return {expression[1]}
+    if expression[0] in ('lit', 'param'):
+        return set()
+    if expression[0] == 'list':
+        return set().union(*[expression_variables(item) for item in expression[1]])
+    if expression[0] == 'call':
+        return set().union(*[expression_variables(arg) for arg in expression[2]])
+    if expression[0] == 'op':
+        return expression_variables(expression[2]) | expression_variables(expression[3])
+    if expression[0] == 'case':
+        parts = [expression[3]] + [part for branch in expression[2] for part in branch]
+        if expression[1] is not None:
+            parts.append(expression[1])
+        return set().union(*[expression_variables(part) for part in parts])
+    if expression[0] == 'listpred':
+        return expression_variables(expression[3]) | (expression_variables(expression[4]) - {expression[2]})
+
+    return expression_variables(expression[1])
+
+class Query:
+    '''A parsed query : the patterns, the conditions, the returned items.'''
+
+    def __init__(self, patterns, conditions, distinct, items, explain):
+        self.patterns = patterns
+        self.conditions = conditions
+        self.distinct = distinct
+        self.items = items
+        self.explain = explain
+
+def parse_query(query):
+    '''
+    Parse a query of the supported subset (see the module documentation).
+
+    - query : the Cypher query.
+    '''
+
+    tokens = tokenize(query)
+
+    explain = False
+    if tokens and tokens[0][0] == 'name' and tokens[0][1].upper() in ('EXPLAIN', 'PROFILE'):
+        explain = tokens[0][1].upper() == 'EXPLAIN'
+        tokens = tokens[1:]
+
+    patterns, conditions, returned = [], [], None
+
+    for keyword, clause in split_clauses(tokens):
+        if keyword == 'MATCH' and returned is None:
+            patterns += parse_match(clause)
+        elif keyword == 'WHERE' and returned is None and patterns:
+            stream = TokenStream(clause)
+            conditions += split_conjuncts(parse_expression(stream))
+            if not stream.done():
+                raise UnsupportedQueryError(f'Unexpected token "{stream.peek()[1]}" in the WHERE clause')
+        elif keyword == 'RETURN' and returned is None:
+            returned = parse_return(clause)
+        else:
+            raise UnsupportedQueryError(f'The {keyword} clause is not supported by the in-memory engine')
+
+    if not patterns or returned is None:
+        raise UnsupportedQueryError('The query should have a MATCH and a RETURN clause')
+
+    return Query(patterns, conditions, returned[0], returned[1], explain)
+
+#------Evaluation
+
+class Value:
+    '''The value of an expression for each row : data, null mask and kind ('int', 'float', 'bool' or 'obj').'''
+
+    def __init__(self, data, null, kind):
+        self.data = data
+        self.null = null
+        self.kind = kind
+
+    @staticmethod
+    def constant(value):
+        if value is None:
+            return Value(None, True, 'obj')
+        if isinstance(value, bool):
+            return Value(value, False, 'bool')
+        if isinstance(value, int):
+            return Value(float(value), False, 'int')
+        if isinstance(value, float):
+            return Value(value, False, 'float')
+        if isinstance(value, (list, tuple)):
+            return Value(list(value), False, 'list')
+        return Value(value, False, 'obj')
+
+    def numeric(self):
+        return self.kind in ('int', 'float')
+
+    def as_float(self):
+        '''Return the data as floats (NaN for the values that are not numbers).'''
+
+        if self.numeric():
+            return self.data
+        if self.kind == 'bool':
+            return np.where(self.null, np.nan, np.asarray(self.data, dtype=float))
+
+        convert = np.frompyfunc(lambda x: float(x) if isinstance(x, (int, float, str)) and _is_number(x) else np.nan, 1, 1)
+        return np.asarray(convert(self.data), dtype=float) if isinstance(self.data, np.ndarray) else convert(self.data)
+
+def _is_number(x):
+    try:
+        float(x)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+def _truth(value):
+    '''Return the boolean arrays (true, false) of a boolean value (both are False for null).'''
+
+    data, null = np.asarray(value.data, dtype=bool), np.asarray(value.null, dtype=bool)
+    return data & ~null, ~data & ~null
+
+def _kleene_and(a, b):
+    (true_a, false_a), (true_b, false_b) = _truth(a), _truth(b)
+    return Value(true_a & true_b, ~(true_a & true_b) & ~false_a & ~false_b, 'bool')
+
+def _kleene_or(a, b):
+    (true_a, false_a), (true_b, false_b) = _truth(a), _truth(b)
+    return Value(true_a | true_b, ~(true_a | true_b) & ~(false_a & false_b), 'bool')
+
+def _objects(value):
+    '''Return the data of a value as python objects (None for null).'''
+
+    if not isinstance(value.data, np.ndarray):
+        return None if value.null else value.data
+    if value.kind == 'obj':
+        return value.data
+
+    data = value.data.astype(object)
+    data[np.asarray(value.null, dtype=bool)] = None
+    return data
+
+COMPARISONS = {
+    '=': np.equal, '<>': np.not_equal, '!=': np.not_equal,
+    '<': np.less, '>': np.greater, '<=': np.less_equal, '>=': np.greater_equal,
+}
+
+def _compare(operator, a, b):
+    '''Compare two values. Values of different kinds (e.g a number and a string) are never equal.'''
+
+    null = a.null | b.null
+
+    if a.numeric() and b.numeric():
+        with np.errstate(invalid='ignore'):
+            return Value(COMPARISONS[operator](a.data, b.data), null, 'bool')
+
+    def compare(x, y):
+        if x is None or y is None:
+            return False
+        if isinstance(x, str) != isinstance(y, str):
+            return operator in ('<>', '!=')
+        try:
+            return bool(COMPARISONS[operator](x, y))
+        except TypeError:
+            return False
+
+    data = np.frompyfunc(compare, 2, 1)(_objects(a), _objects(b))
+    return Value(np.asarray(data, dtype=bool) if isinstance(data, np.ndarray) else bool(data), null, 'bool')
+
+def evaluate(expression, rows, tables, parameters):
+    '''
+    Evaluate an expression for the rows.
+
+    - expression : the parsed expression ;
+    - rows       : the `Rows` ;
+    - tables     : the `Tables` ;
+    - parameters : the parameters of the query.
+    '''
+
+    kind = expression[0]
+
+    if kind == 'lit':
+        return Value.constant(expression[1])
+
+    if kind == 'param':
+        if expression[1] not in parameters:
+            raise UnsupportedQueryError(f'Expected parameter(s): {expression[1]}')
+        return Value.constant(parameters[expression[1]])
+
+    if kind == 'prop':
+        variable, name = expression[1], expression[2]
+        table, idx = rows.table(variable), rows.indexes(variable)
+        column = tables.column(table, name)
+        if column is None:
+            return Value(np.full(len(idx), None, dtype=object), np.ones(len(idx), dtype=bool), 'obj')
+        return Value(column.data[idx], column.null[idx], column.kind)
+
+    if kind == 'var':
+        if expression[1] in rows.values:
+            return rows.values[expression[1]]
+        raise UnsupportedQueryError(f'Only properties of the variables can be used ("{expression[1]}")')
+
+    if kind == 'list':
+        items = [evaluate(item, rows, tables, parameters) for item in expression[1]]
+        if any(isinstance(item.data, np.ndarray) for item in items):
+            raise UnsupportedQueryError('Only lists of constants are supported')
+        return Value([None if item.null else item.data for item in items], False, 'list')
+
+    if kind == 'not':
+        value = evaluate(expression[1], rows, tables, parameters)
+        return Value(~np.asarray(value.data, dtype=bool), value.null, 'bool')
+
+    if kind == 'neg':
+        value = evaluate(expression[1], rows, tables, parameters)
+        return Value(-value.as_float(), value.null, value.kind if value.numeric() else 'float')
+
+    if kind == 'isnull':
+        value = evaluate(expression[1], rows, tables, parameters)
+        return Value(~value.null if expression[2] else value.null, False, 'bool')
+
+    if kind == 'call':
+        return evaluate_call(expression[1], [evaluate(arg, rows, tables, parameters) for arg in expression[2]])
+
+    if kind == 'case':
+        return evaluate_case(expression, rows, tables, parameters)
+
+    if kind == 'listpred':
+        return evaluate_list_predicate(expression, rows, tables, parameters)
+
+    operator = expression[1]
+    a = evaluate(expression[2], rows, tables, parameters)
+    b = evaluate(expression[3], rows, tables, parameters)
+
+    if operator == 'AND':
+        return _kleene_and(a, b)
+    if operator == 'OR':
+        return _kleene_or(a, b)
+    if operator == 'XOR':
+        return Value(np.asarray(a.data, dtype=bool) ^ np.asarray(b.data, dtype=bool), a.null | b.null, 'bool')
+
+    if operator in COMPARISONS:
+        return _compare(operator, a, b)
+
+    if operator == 'IN':
+        if b.kind == 'obj':
+            # A list per row (e.g `Event.pitches`)
+            data = np.frompyfunc(lambda x, y: isinstance(y, list) and x in y, 2, 1)(_objects(a), b.data)
+            return Value(np.asarray(data, dtype=bool), a.null | b.null, 'bool')
+        if b.kind != 'list':
+            raise UnsupportedQueryError('IN should be followed by a list')
+        data = np.isin(a.data, [x for x in b.data if x is not None]) if a.numeric() else np.frompyfunc(lambda x: x in b.data, 1, 1)(a.data)
+        return Value(np.asarray(data, dtype=bool), a.null, 'bool')
+
+    if operator in ('CONTAINS', 'STARTS', 'ENDS'):
+        test = {'CONTAINS': lambda x, y: y in x, 'STARTS': str.startswith, 'ENDS': str.endswith}[operator]
+        data = np.frompyfunc(lambda x, y: isinstance(x, str) and isinstance(y, str) and test(x, y), 2, 1)(a.data, b.data)
+        return Value(np.asarray(data, dtype=bool), a.null | b.null, 'bool')
+
+    # Arithmetic
+    x, y = a.as_float(), b.as_float()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        data = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.divide, '%': np.fmod}[operator](x, y)
+
+    integer = a.kind == 'int' and b.kind == 'int'
+    if operator == '/' and integer:
+        data = np.trunc(data)
+
+    return Value(data, a.null | b.null, 'int' if integer else 'float')
+
+def evaluate_case(expression, rows, tables, parameters):
+    '''
+    Evaluate a `CASE` expression (see `evaluate`) : each row takes the result of its first matching branch (or of the
+    `ELSE`, null by default). Only the numeric results (or null) are supported.
+    '''
+
+    _, subject, branches, default = expression
+
+    if subject is not None:
+        subject = evaluate(subject, rows, tables, parameters)
+
+    data = np.full(rows.size, np.nan)
+    null = np.ones(rows.size, dtype=bool)
+    pending = np.ones(rows.size, dtype=bool)
+    kinds = set()
+
+    for when, then in branches + [(None, default)]:
+        if when is None:
+            match = pending
+        else:
+            when = evaluate(when, rows, tables, parameters)
+            match = _truth(_compare('=', subject, when) if subject is not None else when)[0] & pending
+
+        value = evaluate(then, rows, tables, parameters)
+        if value.numeric():
+            kinds.add(value.kind)
+        elif not (value.data is None and value.null is True):
+            raise UnsupportedQueryError('Only the CASE expressions with numeric results are supported')
+
+        data[match] = np.broadcast_to(value.as_float(), rows.size)[match]
+        null[match] = np.broadcast_to(value.null, rows.size)[match]
+        pending &= ~match
+
+    return Value(data, null, 'float' if 'float' in kinds else 'int')
+
+def evaluate_list_predicate(expression, rows, tables, parameters):
+    '''
+    Evaluate a list predicate (see `evaluate`) : each row is repeated once per element of its list, with the element
+    bound to the variable, and the condition is counted per row (with the three-valued logic of Cypher).
+    '''
+
+    _, quantifier, variable, items, condition = expression
+
+    items = evaluate(items, rows, tables, parameters)
+    if items.kind == 'list':
+        lists = [items.data] * rows.size
+        null = np.zeros(rows.size, dtype=bool)
+    elif items.kind == 'obj' and isinstance(items.data, np.ndarray):
+        lists = [x if isinstance(x, list) else [] for x in items.data]
+        null = np.asarray(items.null, dtype=bool) | np.array([not isinstance(x, list) for x in items.data], dtype=bool)
+    else:
+        raise UnsupportedQueryError(f'{quantifier} should iterate over a list')
+
+    counts = np.array([len(x) for x in lists], dtype=np.int64)
+    owners = np.repeat(np.arange(rows.size), counts)
+
+    elements = Column([x for lst in lists for x in lst])
+    inner = rows.repeat(owners)
+    inner.values[variable] = Value(elements.data, elements.null, elements.kind)
+
+    true, false = _truth(evaluate(condition, inner, tables, parameters))
+    nb_true = np.bincount(owners, np.broadcast_to(true, owners.shape), minlength=rows.size)
+    nb_false = np.bincount(owners, np.broadcast_to(false, owners.shape), minlength=rows.size)
+    unknown = nb_true + nb_false < counts
+
+    if quantifier == 'ALL':
+        data, undecided = nb_false == 0, unknown & (nb_false == 0)
+    elif quantifier == 'ANY':
+        data, undecided = nb_true > 0, unknown & (nb_true == 0)
+    elif quantifier == 'NONE':
+        data, undecided = nb_true == 0, unknown & (nb_true == 0)
+    else:
+        data, undecided = nb_true == 1, unknown & (nb_true <= 1)
+
+    return Value(data & ~undecided, null | undecided, 'bool')
+
+def evaluate_call(function, args):
+    '''Evaluate the functions `exists`, `tofloat`, `tointeger` and `abs`.'''
+
+    if len(args) != 1:
+        raise UnsupportedQueryError(f'The function {function} takes one argument')
+
+    value = args[0]
+
+    if function == 'exists':
+        return Value(~np.asarray(value.null, dtype=bool), False, 'bool')
+
+    if function in ('tofloat', 'tointeger'):
+        data = value.as_float()
+        null = value.null | np.isnan(data)
+        if function == 'tointeger':
+            return Value(np.trunc(data), null, 'int')
+        return Value(data, null, 'float')
+
+    if function == 'abs':
+        return Value(np.abs(value.as_float()), value.null, value.kind if value.numeric() else 'float')
+
+    raise UnsupportedQueryError(f'The function {function} is not supported')
+
+class Rows:
+    '''The rows being built : for each bound variable, its table and the index of its node (or relationship) per row.'''
+
+    def __init__(self, variable, table, idx):
+        self.bound = {variable: (table, idx)}
+        self.size = len(idx)
+
+        # The values of the variables of the list predicates (see `evaluate_list_predicate`)
+        self.values = {}
+
+    def table(self, variable):
+        return self.bound[variable][0]
+
+    def indexes(self, variable):
+        return self.bound[variable][1]
+
+    def select(self, mask_or_idx):
+        '''Keep the rows of a boolean mask, or repeat the rows of an index array.'''
+
+        self.bound = {v: (table, idx[mask_or_idx]) for v, (table, idx) in self.bound.items()}
+        self.values = {v: Value(value.data[mask_or_idx], value.null[mask_or_idx], value.kind) for v, value in self.values.items()}
+        self.size = len(next(iter(self.bound.values()))[1])
+
+    def repeat(self, idx):
+        '''Return a copy of the rows of an index array.'''
+
+        rows = Rows.__new__(Rows)
+        rows.bound, rows.values, rows.size = dict(self.bound), dict(self.values), self.size
+        rows.select(idx)
+
+        return rows
+
+    def bind(self, variable, table, idx):
+        self.bound[variable] = (table, idx)
+
+def expand(parents, offsets):
+    '''
+    Expand each parent to its children (`offsets` as returned by `offsets`).
+    Returns `(rows, children)` : the row of each child, and its index.
+    '''
+
+    counts = offsets[parents + 1] - offsets[parents]
+    rows = np.repeat(np.arange(len(parents)), counts)
+    first = np.repeat(offsets[parents], counts)
+    position = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    return rows, first + position
+
+class Edge:
+    '''A relationship of the MATCH clause, between two variables.'''
+
+    def __init__(self, source, target, kind, hops=None, variable=None):
+        '''
+        - source / target : the variables (in the direction of the relationship) ;
+        - kind            : 'next', 'fact', 'measure' (measure -> event), 'rhythmic' (top -> measure) or 'timeseries' ;
+        - hops            : `(min, max)` for a variable length NEXT ;
+        - variable        : the variable of a NEXT relationship, if any.
+        '''
+
+        self.source, self.target, self.kind, self.hops, self.variable = source, target, kind, hops, variable
+
+    def cost(self, bound):
+        '''Order in which the edges are expanded : the edges to a single node first, the one-to-many edges last.'''
+
+        forward = self.source in bound
+        if self.kind == 'next':
+            return 2 if self.hops is None else 3
+        if self.kind == 'timeseries' or not forward:
+            return 0
+        return 1 if self.kind == 'fact' else 4
+
+EDGE_KINDS = {
+    ('event', 'event'): ('next', ('NEXT',)),
+    ('event', 'fact'): ('fact', (None, 'IS')),
+    ('measure', 'event'): ('measure', (None, 'HAS')),
+    ('score', 'measure'): ('rhythmic', (None, 'RHYTHMIC')),
+    ('score', 'score'): ('timeseries', (None, 'timeSeries')),
+}
+
+def build_edges(patterns):
+    '''
+    Return the labels of the variables, the patterns that are evaluated (the interval gram anchors are ignored),
+    and their edges.
+    '''
+
+    labels = {}
+    for pattern in patterns:
+        for variable, label in pattern.nodes:
+            if label is not None:
+                labels.setdefault(variable, label)
+
+    # The anchors only restrict the events to the ones the WHERE clause already selects
+    kept = [pattern for pattern in patterns if all(labels.get(variable) != 'IntervalGram' for variable, _ in pattern.nodes)]
+
+    edges = []
+    for pattern in kept:
+        for idx, (variable, rel_type, hops, direction) in enumerate(pattern.relationships):
+            a, b = pattern.nodes[idx][0], pattern.nodes[idx + 1][0]
+            if direction == -1:
+                a, b = b, a
+
+            table_a, table_b = table_of(a, labels), table_of(b, labels)
+            if direction == 0 and (table_a, table_b) not in EDGE_KINDS:
+                a, b, table_a, table_b = b, a, table_b, table_a
+
+            if (table_a, table_b) not in EDGE_KINDS:
+                raise UnsupportedQueryError(f'No relationship from {labels.get(a)} to {labels.get(b)} nodes')
+
+            kind, types = EDGE_KINDS[(table_a, table_b)]
+            if rel_type not in types:
+                raise UnsupportedQueryError(f'Unsupported relationship type "{rel_type}" from {labels.get(a)} to {labels.get(b)} nodes')
+
+            if kind == 'next' and direction == 0:
+                raise UnsupportedQueryError('The NEXT relationships should have a direction')
+            if kind != 'next' and hops is not None:
+                raise UnsupportedQueryError('Only the NEXT relationships can have a variable length')
+            if variable is not None and kind != 'next':
+                raise UnsupportedQueryError(f'Only the NEXT relationships can be named ("{variable}")')
+            if variable is not None and hops is not None:
+                raise UnsupportedQueryError(f'A variable length relationship can not be named ("{variable}")')
+
+            edges.append(Edge(a, b, kind, hops, variable))
+
+    for pattern in kept:
+        for variable, _ in pattern.nodes:
+            table_of(variable, labels)
+
+    return labels, kept, edges
+
+def table_of(variable, labels):
+    '''Return the table of a node variable.'''
+
+    label = labels.get(variable)
+    if label not in LABELS:
+        raise UnsupportedQueryError(f'The node "{variable.strip()}" should have one of the labels {", ".join(LABELS)}')
+
+    return LABELS[label]
+
+def step_along(pointers, events):
+    '''Return the event after (or before, with `Tables.previous_event`) each of `events` along its chain, -1 if none.'''
+
+    return np.where(events >= 0, pointers[np.maximum(events, 0)], -1)
+
+def follow(edge, rows, tables):
+    '''Bind the unbound end of `edge` (or check the edge if both ends are bound).'''
+
+    source_bound = edge.source in rows.bound
+    target_bound = edge.target in rows.bound
+
+    if source_bound and target_bound:
+        a, b = rows.indexes(edge.source), rows.indexes(edge.target)
+
+        if edge.kind == 'next':
+            low, high = edge.hops or (1, 1)
+            mask = np.zeros(len(a), dtype=bool)
+            reached = a
+            for hop in range(1, high + 1):
+                reached = step_along(tables.next_event, reached)
+                if hop >= low:
+                    mask |= reached == b
+        elif edge.kind == 'fact':
+            mask = tables.fact_event[b] == a
+        elif edge.kind == 'measure':
+            mask = tables.event_measure[b] == a
+        elif edge.kind == 'rhythmic':
+            mask = tables.measure_score[b] == a
+        else:
+            mask = a == b
+
+        rows.select(mask)
+        if edge.variable is not None:
+            rows.bind(edge.variable, 'next', rows.indexes(edge.source))
+        return
+
+    if edge.kind == 'next':
+        low, high = edge.hops or (1, 1)
+        bound_variable = edge.source if source_bound else edge.target
+        pointers = tables.next_event if source_bound else tables.previous_event
+        other = rows.indexes(bound_variable)
+
+        selected, others = [], []
+        for hop in range(1, high + 1):
+            other = step_along(pointers, other)
+            if hop >= low:
+                valid = np.nonzero(other >= 0)[0]
+                selected.append(valid)
+                others.append(other[valid])
+
+        order = np.concatenate(selected)
+        other = np.concatenate(others)
+        rows.select(order)
+
+        unbound = edge.target if source_bound else edge.source
+        rows.bind(unbound, 'event', other)
+        if edge.variable is not None:
+            rows.bind(edge.variable, 'next', rows.indexes(edge.source))
+        return
+
+    parents = {'fact': 'event', 'measure': 'measure', 'rhythmic': 'score', 'timeseries': 'score'}
+    children = {'fact': 'fact', 'measure': 'event', 'rhythmic': 'measure', 'timeseries': 'score'}
+
+    if source_bound:
+        idx = rows.indexes(edge.source)
+        if edge.kind == 'timeseries':
+            rows.bind(edge.target, 'score', idx)
+            return
+
+        offsets_ = {'fact': tables.event_facts, 'measure': tables.measure_events, 'rhythmic': tables.score_measures}[edge.kind]
+        selected, child = expand(idx, offsets_)
+        rows.select(selected)
+        rows.bind(edge.target, children[edge.kind], child)
+    else:
+        idx = rows.indexes(edge.target)
+        parent = {
+            'fact': tables.fact_event, 'measure': tables.event_measure, 'rhythmic': tables.measure_score
+        }.get(edge.kind)
+        rows.bind(edge.source, parents[edge.kind], idx if parent is None else parent[idx])
+
+def start_variable(labels, patterns):
+    '''Return the variables of the patterns, and the one the rows are built from (the first event, if any).'''
+
+    variables = []
+    for pattern in patterns:
+        variables += [v for v, _ in pattern.nodes if v not in variables]
+
+    # The chains of events are the most selective
+    return variables, next((v for v in variables if labels.get(v) == 'Event'), variables[0])
+
+def query_plan(query):
+    '''
+    Return the plan of a parsed query, in the format of `ResultSummary.plan` : the scan of the nodes of the
+    start variable (see `start_variable`), from which the other variables are expanded.
+    '''
+
+    labels, patterns, _ = build_edges(query.patterns)
+    _, start = start_variable(labels, patterns)
+
+    return {
+        'operatorType': 'NodeByLabelScan@memory',
+        'identifiers': [start],
+        'args': {'Details': f'{start}:{labels[start]}'},
+        'children': []
+    }
+
+def execute(query, tables, parameters):
+    '''Run a parsed query on the tables, and return its records.'''
+
+    labels, patterns, edges = build_edges(query.patterns)
+    variables, start = start_variable(labels, patterns)
+
+    conditions = query.conditions + [condition for pattern in patterns for condition in pattern.conditions]
+
+    defined = set(variables) | {edge.variable for edge in edges}
+    used = set().union(*[expression_variables(e) for e in conditions + [e for _, e in query.items]])
+    if used - defined:
+        raise UnsupportedQueryError(f'Variable `{sorted(used - defined)[0]}` not defined')
+
+    keys = [alias for alias, _ in query.items]
+    if query.explain:
+        return []
+
+    start_table = table_of(start, labels)
+    rows = Rows(start, start_table, np.arange(tables.sizes[start_table], dtype=np.int64))
+
+    pending_edges = list(edges)
+    pending_conditions = conditions
+
+    def apply_conditions():
+        nonlocal pending_conditions
+        remaining = []
+        for condition in pending_conditions:
+            if expression_variables(condition) <= set(rows.bound):
+                value = evaluate(condition, rows, tables, parameters)
+                mask = np.broadcast_to(np.asarray(value.data, dtype=bool) & ~np.asarray(value.null, dtype=bool), (rows.size,))
+                rows.select(mask)
+            else:
+                remaining.append(condition)
+        pending_conditions = remaining
+
+    apply_conditions()
+
+    while pending_edges:
+        candidates = [edge for edge in pending_edges if edge.source in rows.bound or edge.target in rows.bound]
+        if not candidates:
+            raise UnsupportedQueryError('The patterns of the MATCH clause should be connected')
+
+        edge = min(candidates, key=lambda e: (0 if e.source in rows.bound and e.target in rows.bound else 1, e.cost(rows.bound)))
+        pending_edges.remove(edge)
+
+        follow(edge, rows, tables)
+        apply_conditions()
+
+    unbound = [v for v in variables if v not in rows.bound]
+    if unbound:
+        raise UnsupportedQueryError(f'The node "{unbound[0]}" is not connected to the others')
+
+    values = []
+    for _, expression in query.items:
+        value = evaluate(expression, rows, tables, parameters)
+        data = np.broadcast_to(np.asarray(value.data, dtype=object if value.kind == 'obj' else None), (rows.size,))
+        null = np.broadcast_to(value.null, (rows.size,))
+        values.append(to_python(data, null, value.kind))
+
+    lines = zip(*values) if values else iter([])
+    if query.distinct:
+        lines = dict.fromkeys(lines)
+
+    return [Record(zip(keys, line)) for line in lines]
+
+#------Driver
+
+class MemorySummary:
+    '''The summary of a query (with `EXPLAIN`, the plan is given by `query_plan`).'''
+
+    def __init__(self, query, parameters, elapsed_ms, plan=None):
+        self.query = query
+        self.parameters = parameters
+        self.plan = plan
+        self.profile = None
+        self.result_available_after = elapsed_ms
+        self.result_consumed_after = 0
+
+class MemoryResult:
+    '''The result of `MemorySession.run` : an iterator over the records.'''
+
+    def __init__(self, records, keys, summary):
+        self._records = records
+        self._keys = keys
+        self._summary = summary
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def keys(self):
+        return list(self._keys)
+
+    def single(self):
+        return self._records[0] if len(self._records) == 1 else None
+
+    def data(self):
+        return [record.data() for record in self._records]
+
+    def consume(self):
+        return self._summary
+
+class MemorySession:
+    '''A session on a `MemoryGraph`, with the interface of `neo4j.Session` used in the project.'''
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def run(self, query, parameters=None, **kwargs):
+        start = time.perf_counter()
+        parameters = {**(parameters or {}), **kwargs}
+
+        parsed = parse_query(query)
+        records = execute(parsed, self.graph.tables, parameters)
+
+        plan = query_plan(parsed) if parsed.explain else None
+        summary = MemorySummary(query, parameters, int((time.perf_counter() - start) * 1000), plan)
+        return MemoryResult(records, [alias for alias, _ in parsed.items], summary)
+
+    def execute_read(self, work, *args, **kwargs):
+        return work(self, *args, **kwargs)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class MemoryDriver:
+    '''A driver on a `MemoryGraph`, with the interface of `neo4j.Driver` used in the project.'''
+
+    def __init__(self, graph):
+        '''
+        - graph : the `MemoryGraph`.
+        '''
+
+        self.graph = graph
+
+    def session(self, **kwargs):
+        return MemorySession(self.graph)
+
+    def verify_connectivity(self):
+        pass
+
+    def close(self):
+        pass
+
+def connect_to_memory_graph(data_dir=None, collections=None):
+    '''
+    Load the MEI files of `data_dir` (see `MemoryGraph.load`) and return a `MemoryDriver` on them.
+
+    - data_dir    : the data directory (`mei_import.DEFAULT_DATA_DIR` if None or empty) ;
+    - collections : if not None, only load the files of these collections.
+    '''
+
+    return MemoryDriver(MemoryGraph.load(data_dir or DEFAULT_DATA_DIR, collections))
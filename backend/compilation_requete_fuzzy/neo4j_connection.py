@@ -1,13 +1,48 @@
 from neo4j import GraphDatabase
 
+# Prefix of the URIs of the in-memory engine (`memory://<data dir>`, see `memory_graph`)
+MEMORY_URI_PREFIX = 'memory://'
+
 # Function to connect to the Neo4j database
 def connect_to_neo4j(uri, user, password):
+    if uri.startswith(MEMORY_URI_PREFIX):
+        # Imported here as the in-memory engine (numpy, MEI parsing) is only needed without a database
+        from memory_graph import connect_to_memory_graph
+        return connect_to_memory_graph(uri[len(MEMORY_URI_PREFIX):])
+
     driver = GraphDatabase.driver(uri, auth=(user, password))
     return driver
 
 # Function to run a query and fetch all results
-def run_query(driver, query):
+def run_query(driver, query, parameters=None):
     with driver.session() as session:
-        result = session.run(query)
+        result = session.run(query, parameters)
         # return result.data()
         return list(result)  # Collect all records into a list
+
+# Function to run a query and iterate lazily over the results
+def iter_query(driver, query, parameters=None):
+    '''
+    Run `query` and return an iterator over its records, fetched from the database as they are consumed
+    (contrary to `run_query`, the records are never all kept in memory).
+
+    The session is closed when the iterator is exhausted (or garbage collected).
+    Errors of the query (e.g syntax errors) are raised by this function, not during the iteration.
+
+    - parameters : the parameters of the query (e.g `{'k': 10}` for `$k`), or None.
+    '''
+
+    session = driver.session()
+    try:
+        result = session.run(query, parameters)
+    except:
+        session.close()
+        raise
+
+    def records():
+        try:
+            yield from result
+        finally:
+            session.close()
+
+    return records()
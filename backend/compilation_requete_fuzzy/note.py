@@ -1,5 +1,5 @@
 class Note:
-    def __init__(self, pitch, octave, dur, dots=None, duration=None, start=None, end=None, id_=None):
+    def __init__(self, pitch, octave, dur, dots=None, duration=None, start=None, end=None, id_=None, chord=None):
         self.pitch = pitch
         self.octave = octave
         self.dur = dur
@@ -13,6 +13,8 @@ class Note:
         self.start = start
         self.end = end
         self.id = id_
+        # The sorted pitches (half tones from A4) of the event, for the events matched by a chord of the query
+        self.chord = chord
     
     def to_list(self):
         if self.dots is not None and self.dots > 0:
@@ -0,0 +1,270 @@
+'''
+Onset search for the duration gap queries (`TOLERANT gap=g`), on the arrays of the scan corpus (see `pitch_scan`).
+
+With a gap, the compiled query links the events with variable length paths (`-[:NEXT*1..k]->`, see
+`reformulation_V3.create_match_clause`) and only then checks that they follow each other closely enough
+(`e0.end >= e1.start - $sequencing_gap`, see `make_sequencing_condition`) : the database expands every path of up to
+`k` events after each candidate, for each note of the query.
+
+Here, the events of a chain of `NEXT` relationships are consecutive in the arrays, in `NEXT` order (see
+`pitch_scan.ScanCorpus`), so the events that can follow an event `a` in a match are a range of indexes : the ones after
+`a` in its chain, at most `k` events further, whose start minus the gap is not after the end of `a`. The matches are
+found with a dynamic programming over these onset indexes, note by note :
+    - the candidates of a note are the events with a fact that passes its check (`pitch_scan.NotePredicate`), only
+      looked for after the events reached by the previous note ;
+    - the candidates reached by the previous note are kept (forward pass), and the ones that can not lead to the last
+      note are dropped (backward pass) ;
+    - the matches are the paths through the kept candidates.
+Each pass costs two binary searches per candidate, so that the search is linear in the length of the scores times
+the number of notes, whatever the gap.
+
+The matches give the same sequences as `process_results.get_ranked_results` on the records of the database.
+'''
+
+from itertools import product
+
+import numpy as np
+
+from fuzzy_query import parse_fuzzy_query
+from pitch_scan import note_plan
+from vectorized_ranking import sequencing_degrees
+
+# Shortest duration of a note, that bounds the number of events in a gap (as in `reformulation_V3.create_match_clause`)
+SHORTEST_DURATION = 0.0625
+
+def max_steps(duration_gap):
+    '''Return the maximum number of `NEXT` relationships between two consecutive notes of a match (`k`).'''
+
+    return max(int(duration_gap / SHORTEST_DURATION), 1) + 1
+
+def gap_plan(fuzzy_query):
+    '''
+    Return the `NotePredicate` of each note of a query, or None if the query can not be answered by the onset search :
+    the query should have a duration gap, and notes that can be checked on the arrays (see `pitch_scan.note_plan`).
+
+    - fuzzy_query : the parsed fuzzy query.
+    '''
+
+    if fuzzy_query.duration_gap <= 0:
+        return None
+
+    return note_plan(fuzzy_query)
+
+def concatenated_ranges(first, counts):
+    '''Return the concatenation of the ranges `[first[i], first[i] + counts[i])`.'''
+
+    return np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(first, counts)
+
+class OnsetLayer:
+    '''The candidates of one note of a query : their events, and the facts of these events that pass the check.'''
+
+    def __init__(self, corpus, note, events):
+        '''
+        Check a note on events.
+
+        - corpus : the `ScanCorpus` ;
+        - note   : the `NotePredicate` of the note ;
+        - events : the sorted indexes of the events to check.
+        '''
+
+        facts, owners = corpus.facts_of(events)
+        kept, self.pitch, self.duration, self.degree = note.evaluate(corpus, facts, events[owners])
+
+        self.facts = facts[kept]
+        self.events, self.owners = np.unique(events[owners[kept]], return_inverse=True)
+
+        # Filled by the search : the candidates reached from the previous note, the range (in `events`) of the
+        # candidates of the next note they can reach, and the candidates that lead to a match
+        self.reached = np.ones(len(self.events), dtype=bool)
+        self.lo = self.hi = None
+        self.alive = None
+
+    def __len__(self):
+        return len(self.events)
+
+    def choices(self):
+        '''Return the dict `{candidate: [(fact, pitch, duration, note degree), ...]}` of the alive candidates.'''
+
+        rows = np.flatnonzero(self.alive[self.owners])
+
+        choices = {}
+        for owner, fact, pitch, duration, degree in zip(self.owners[rows].tolist(), self.facts[rows].tolist(), self.pitch[rows].tolist(), self.duration[rows].tolist(), self.degree[rows].tolist()):
+            choices.setdefault(owner, []).append((fact, pitch, duration, degree))
+
+        return choices
+
+def following_events(corpus, events, steps):
+    '''
+    Return the sorted indexes of the events that are 1 to `steps` events after one of `events`, in the same chain
+    (i.e 1 to `steps` `NEXT` relationships further).
+
+    - corpus : the `ScanCorpus` ;
+    - events : the indexes of the events ;
+    - steps  : the maximum number of events (see `max_steps`).
+    '''
+
+    chain_ends = np.asarray(corpus.chain_events)[np.asarray(corpus.event_chain)[events] + 1]
+    last = np.minimum(events + steps, chain_ends - 1)
+
+    # Each event covers the range ]event, last] : +1 at its beginning, -1 after its end
+    size = len(corpus) + 1
+    cover = np.bincount(events + 1, minlength=size) - np.bincount(last + 1, minlength=size)
+
+    return np.flatnonzero(np.cumsum(cover[:-1]) > 0)
+
+def reachable_ranges(corpus, sources, targets, steps, sequencing_gap):
+    '''
+    Return `(lo, hi)` : for each event of `sources`, the range `[lo, hi)` of the indexes (in `targets`) of the events
+    that can follow it in a match. They are in the same chain, 1 to `steps` events after it, and
+    `end >= start - sequencing_gap` (the condition of `reformulation_V3.make_sequencing_condition`).
+
+    - corpus         : the `ScanCorpus` ;
+    - sources        : the indexes of the events ;
+    - targets        : the sorted indexes of the candidate events ;
+    - steps          : the maximum number of events (see `max_steps`) ;
+    - sequencing_gap : the gap of the condition (`duration_gap * (1 - alpha)`).
+    '''
+
+    lo = np.searchsorted(targets, sources, 'right')
+    hi = np.searchsorted(targets, sources + steps, 'right')
+
+    # The targets are sorted by (chain, start) : numpy orders the complex numbers on their real part, then on their
+    # imaginary part, so that a single binary search gives the last target of the chain of the source with
+    # `start - sequencing_gap <= end`
+    event_chain = np.asarray(corpus.event_chain)
+    keys = event_chain[targets] + 1j * (np.asarray(corpus.event_start)[targets] - sequencing_gap)
+    bounds = event_chain[sources] + 1j * np.asarray(corpus.event_end)[sources]
+    hi = np.minimum(hi, np.searchsorted(keys, bounds, 'right'))
+
+    return lo, np.maximum(hi, lo)
+
+def onset_search(corpus, plan, duration_gap, alpha, collection=None):
+    '''
+    Find the matches of a query with the dynamic programming over the onset indexes (see the module documentation).
+
+    Returns `(layers, paths)` : the `OnsetLayer` of each note, and the matches as an array of shape
+    `(nb_matches, nb_notes)` of indexes of candidates (in the `events` of each layer).
+
+    - corpus       : the `ScanCorpus` ;
+    - plan         : the `NotePredicate` of each note (see `gap_plan`) ;
+    - duration_gap : the duration gap of the query ;
+    - alpha        : the alpha cut ;
+    - collection   : if not None, only search the scores of this collection.
+    '''
+
+    steps = max_steps(duration_gap)
+    sequencing_gap = duration_gap * (1 - alpha)
+
+    #---Forward pass : the candidates of each note, reached from the candidates of the previous note
+    layers = [OnsetLayer(corpus, plan[0], corpus.windows(1, collection))]
+
+    for note in plan[1:]:
+        previous = layers[-1]
+        sources = previous.events[previous.reached]
+
+        layer = OnsetLayer(corpus, note, following_events(corpus, sources, steps))
+        previous.lo, previous.hi = reachable_ranges(corpus, sources, layer.events, steps, sequencing_gap)
+
+        cover = np.bincount(previous.lo, minlength=len(layer) + 1) - np.bincount(previous.hi, minlength=len(layer) + 1)
+        layer.reached = np.cumsum(cover[:-1]) > 0
+        layers.append(layer)
+
+    #---Backward pass : the reached candidates that lead to a reached candidate of the next note
+    layers[-1].alive = layers[-1].reached
+    for previous, layer in zip(layers[-2::-1], layers[:0:-1]):
+        counts = np.concatenate(([0], np.cumsum(layer.alive)))
+
+        previous.alive = np.zeros(len(previous), dtype=bool)
+        previous.alive[np.flatnonzero(previous.reached)[counts[previous.hi] > counts[previous.lo]]] = True
+
+    #---The paths through the alive candidates
+    paths = np.flatnonzero(layers[0].alive)[:, None]
+    for previous, layer in zip(layers, layers[1:]):
+        if len(paths) == 0:
+            break
+
+        # Range of each reached candidate of the previous note, indexed by candidate
+        lo = np.zeros(len(previous), dtype=np.int64)
+        hi = np.zeros(len(previous), dtype=np.int64)
+        lo[previous.reached], hi[previous.reached] = previous.lo, previous.hi
+
+        alive = np.flatnonzero(layer.alive)
+        first = np.searchsorted(alive, lo[paths[:, -1]])
+        counts = np.searchsorted(alive, hi[paths[:, -1]]) - first
+
+        paths = np.column_stack((np.repeat(paths, counts, axis=0), alive[concatenated_ranges(first, counts)]))
+
+    if paths.shape[1] < len(layers):
+        paths = np.zeros((0, len(layers)), dtype=np.int64)
+
+    return layers, paths
+
+def gap_sequences(corpus, layers, paths, duration_gap, alpha, top_k=None):
+    '''
+    Return the ranked `(source, start, end, sequence_degree, note_details)` of the matches, one per combination of
+    the facts that pass the checks (as `process_results.get_ranked_results`).
+
+    - corpus       : the `ScanCorpus` ;
+    - layers       : the `OnsetLayer` of each note ;
+    - paths        : the matches (see `onset_search`) ;
+    - duration_gap : the duration gap of the query ;
+    - alpha        : the alpha cut ;
+    - top_k        : if not None, only return the `top_k` best sequences.
+    '''
+
+    events = np.column_stack([layer.events[paths[:, idx]] for idx, layer in enumerate(layers)]) if len(paths) else paths
+    choices = [layer.choices() for layer in layers]
+
+    # Sequencing degree of each note (1 for the first one, as in `process_results.iter_scored_results_exact`)
+    sequencing = np.ones(events.shape, dtype=np.float64)
+    if len(paths):
+        sequencing[:, 1:] = sequencing_degrees(
+            np.asarray(corpus.event_end)[events[:, :-1]], np.asarray(corpus.event_start)[events[:, 1:]], duration_gap
+        )
+
+    candidates = []
+    for match, (path, path_sequencing) in enumerate(zip(paths.tolist(), sequencing.tolist())):
+        for combination in product(*(note_choices[candidate] for note_choices, candidate in zip(choices, path))):
+            note_degrees = [min(choice[3], degree) for choice, degree in zip(combination, path_sequencing)]
+            sequence_degree = min(note_degrees)
+
+            if sequence_degree >= alpha:
+                candidates.append((sequence_degree, match, combination, note_degrees))
+
+    # Stable sort, as `get_ordered_results`
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+    if top_k is not None:
+        candidates = candidates[:top_k]
+
+    sequence_details = []
+    for sequence_degree, match, combination, note_degrees in candidates:
+        match_events = events[match].tolist()
+        note_details = [
+            (corpus.note(fact, event), pitch, duration, sequencing_degree, note_degree)
+            for (fact, pitch, duration, _), event, sequencing_degree, note_degree
+            in zip(combination, match_events, sequencing[match].tolist(), note_degrees)
+        ]
+        source = corpus.sources[corpus.event_score[match_events[0]]]
+        sequence_details.append((source, float(corpus.event_start[match_events[0]]), float(corpus.event_end[match_events[-1]]), sequence_degree, note_details))
+
+    return sequence_details
+
+def gap_query(corpus, query, top_k=None):
+    '''
+    Answer a fuzzy query with the onset search. Returns the ranked sequences (as `process_results.get_ranked_results`),
+    or None if the query can not be answered by the onset search (see `gap_plan`).
+
+    - corpus : the `ScanCorpus` ;
+    - query  : the fuzzy query (string or `FuzzyQuery`) ;
+    - top_k  : if not None, only return the `top_k` best sequences.
+    '''
+
+    fuzzy_query = parse_fuzzy_query(query)
+
+    plan = gap_plan(fuzzy_query)
+    if plan is None:
+        return None
+
+    layers, paths = onset_search(corpus, plan, fuzzy_query.duration_gap, fuzzy_query.alpha, fuzzy_query.collection)
+
+    return gap_sequences(corpus, layers, paths, fuzzy_query.duration_gap, fuzzy_query.alpha, top_k)
@@ -0,0 +1,455 @@
+'''
+Scan engine for the pitch tolerant queries (`TOLERANT pitch=p`, without transposition nor duration gap).
+
+The compiled query turns each note into a frequency range predicate on its `Fact`, the database checks them on every
+candidate path, and the degrees are computed afterwards, record by record. Here, the events and facts of all the scores
+are read once (`build_scan_corpus`) into flat arrays (one row per event and per fact), saved as `.npy` files and read
+back memory-mapped (`ScanCorpus.load`). The events are in `NEXT` order : the events of a chain of `NEXT`
+relationships (a voice, see `interval_index.next_chains`) are consecutive, and the chains of a score are consecutive.
+
+A query is answered with a shift-and scan over these arrays (`ScanCorpus.scan`) : the candidate windows start as every
+event that has room for the whole query in its chain, and the notes are checked one after the other, each one only
+on the windows that passed the previous ones. The check of a note is the predicate of the compiled query (same
+frequency and duration bounds, see `reformulation_V3.create_where_clause`) and the degree of the note (same kernels as
+`vectorized_ranking`), cut at alpha : as the sequence degree is the minimum of the note degrees, a window with a note
+under alpha can not pass the alpha cut, and is dropped at once.
+
+The surviving windows give the same sequences as `process_results.get_ranked_results` on the records of the database
+(one sequence per combination of the facts of the events, e.g for the notes of a chord).
+'''
+
+import json
+import os
+from itertools import product
+
+import numpy as np
+
+from find_duration_range import find_duration_range_multiplicative_factor_sym
+from find_nearby_pitches import find_frequency_bounds
+from fuzzy_query import parse_fuzzy_query
+from interval_index import NEXT_QUERY, next_chains, next_events_by_score
+from neo4j_connection import run_query
+from process_results import record_to_note
+from vectorized_ranking import duration_degrees, pitch_degrees, semitone_column
+
+# Default directory of the arrays. Can be overridden with the `FUZZY_PITCH_SCAN` environment variable.
+DEFAULT_SCAN_DIR = os.environ.get(
+    'FUZZY_PITCH_SCAN',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pitch_scan')
+)
+
+CORPUS_QUERY = '''
+MATCH (tp:TopRhythmic)-[:RHYTHMIC]->(m:Measure), (m)-[:HAS]->(e:Event), (e)--(f:Fact)
+RETURN tp.collection AS collection, e.source AS source, e.start AS start, e.end AS end, e.duration AS duration,
+e.dots AS dots, e.id AS id, f.class AS class, f.octave AS octave, f.frequency AS frequency, f.type AS type,
+f.duration AS fact_duration, f.dots AS fact_dots
+'''
+
+# Attributes of the notes of a query that the scan checks itself
+NOTE_ATTRIBUTES = ('class', 'octave', 'dur', 'dots')
+
+def float_array(values):
+    '''Return the float64 array of a list of numbers, None being converted to NaN.'''
+
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+def string_array(values):
+    '''Return the unicode array of a list of strings, None being converted to ''.'''
+
+    return np.array(['' if value is None else str(value) for value in values], dtype=str)
+
+class NotePredicate:
+    '''The check of one note of a query (predicate of the compiled query, and degree cut at alpha).'''
+
+    def __init__(self, attributes, pitch_distance, duration_factor, alpha):
+        '''
+        - attributes      : the attributes of the `Fact` node of the note (`class`, `octave`, `dur`, `dots`) ;
+        - pitch_distance  : the pitch tolerance (in tones, strictly positive) ;
+        - duration_factor : the duration tolerance (multiplicative factor) ;
+        - alpha           : the alpha cut.
+        '''
+
+        self.pitch = attributes.get('class')
+        self.octave = attributes.get('octave')
+        self.dots = attributes.get('dots')
+        self.pitch_distance = pitch_distance
+        self.duration_factor = duration_factor
+        self.alpha = alpha
+
+        # Same bounds as `reformulation_V3.make_duration_condition`
+        self.duration = None
+        if attributes.get('dur') is not None:
+            self.duration = 1.0 / attributes['dur']
+            if self.dots:
+                self.duration *= 1.5
+
+            if duration_factor != 1:
+                self.duration_bounds = find_duration_range_multiplicative_factor_sym(self.duration, duration_factor, alpha)
+
+        # Same bounds as `reformulation_V3.make_pitch_condition`
+        if self.pitch is not None and self.pitch != 'r':
+            self.frequency_bounds = find_frequency_bounds(self.pitch, 4 if self.octave is None else self.octave, pitch_distance, alpha)
+
+    def evaluate(self, corpus, facts, events):
+        '''
+        Check the note against facts. Returns the arrays `(kept, pitch, duration, note)` : the positions (in `facts`) of
+        the facts that satisfy the predicate and whose note degree passes the alpha cut, and their pitch, duration and
+        note degrees.
+
+        - corpus : the `ScanCorpus` ;
+        - facts  : the indexes of the facts ;
+        - events : the indexes of their events.
+        '''
+
+        ok = np.ones(len(facts), dtype=bool)
+
+        if self.duration is not None:
+            fact_durations = corpus.fact_duration[facts]
+            if self.duration_factor != 1:
+                ok &= (fact_durations >= self.duration_bounds[0]) & (fact_durations <= self.duration_bounds[1])
+            else:
+                ok &= fact_durations == self.duration
+
+        if self.dots is not None:
+            ok &= corpus.fact_dots[facts] == self.dots
+
+        if self.pitch is None:
+            if self.octave is not None:
+                ok &= corpus.fact_octave[facts] == self.octave
+        elif self.pitch == 'r':
+            ok &= corpus.fact_rest[facts]
+        else:
+            frequencies = corpus.fact_frequency[facts]
+            ok &= (frequencies >= self.frequency_bounds[0]) & (frequencies <= self.frequency_bounds[1])
+
+        # The degrees are only computed for the facts that satisfy the predicate
+        kept = np.flatnonzero(ok)
+        facts, events = facts[kept], events[kept]
+
+        # Same degrees as `vectorized_ranking.compute_degrees` (the pitch degree of a rest is 1)
+        pitch_class = None if self.pitch == 'r' else self.pitch
+        pitch = pitch_degrees(pitch_class, self.octave, corpus.fact_semitone[facts], corpus.fact_octave[facts], self.pitch_distance)
+        duration = duration_degrees(self.duration, corpus.event_duration[events], self.duration_factor)
+
+        note = pitch if self.duration_factor == 1 else np.minimum(pitch, duration)
+        cut = note >= self.alpha
+
+        return kept[cut], pitch[cut], duration[cut], note[cut]
+
+def note_plan(fuzzy_query):
+    '''
+    Return the `NotePredicate` of each note of a query, or None if the notes can not be checked on the arrays :
+    the query should be pitch tolerant, without transposition nor contour nor chords, be a chain of events
+    `e0, e1, ...` with one fact each (`f0, f1, ...`), and only have conditions on the notes and the collection. The
+    duration gap is not checked (see `scan_plan` and `onset_search.gap_plan`).
+
+    - fuzzy_query : the parsed fuzzy query.
+    '''
+
+    pitch_distance, duration_factor, _, alpha, allow_transposition, contour, _, _ = fuzzy_query.parameters()
+
+    # The chords are checked on `Event.pitches` (see `reformulation_V3.make_chord_condition`), not on the arrays
+    if pitch_distance <= 0 or allow_transposition or contour or fuzzy_query.chords:
+        return None
+
+    facts = list(fuzzy_query.facts)
+    if fuzzy_query.events != [f'e{idx}' for idx in range(len(facts))] or facts != [f'f{idx}' for idx in range(len(facts))]:
+        return None
+
+    for pattern in fuzzy_query.patterns:
+        if any(element.type not in (None, 'NEXT', 'RHYTHMIC', 'HAS') for element in pattern.relationships):
+            return None
+
+    for condition in fuzzy_query.conditions:
+        if condition.operator != '=':
+            return None
+        if condition.attribute == 'collection' or (condition.variable in facts and condition.attribute in NOTE_ATTRIBUTES):
+            continue
+        return None
+
+    return [NotePredicate(fuzzy_query.nodes[name], pitch_distance, duration_factor, alpha) for name in facts]
+
+def scan_plan(fuzzy_query):
+    '''
+    Return the `NotePredicate` of each note of a query, or None if the query can not be answered by the scan : the
+    notes should be checkable on the arrays (see `note_plan`), and the query should not have a duration gap.
+
+    - fuzzy_query : the parsed fuzzy query.
+    '''
+
+    if fuzzy_query.duration_gap > 0:
+        return None
+
+    return note_plan(fuzzy_query)
+
+class ScanCorpus:
+    '''The events and facts of all the scores, as flat arrays (see the module documentation).'''
+
+    FILES = (
+        'score_events', 'chain_events', 'event_score', 'event_chain', 'event_start', 'event_end', 'event_duration', 'event_dots', 'event_id', 'event_facts',
+        'fact_class', 'fact_semitone', 'fact_octave', 'fact_frequency', 'fact_rest', 'fact_duration', 'fact_dots'
+    )
+
+    def __init__(self, arrays, sources, collections):
+        '''
+        Initiate the corpus from its arrays.
+
+        - arrays      : dict with an array for each name of `FILES` (`score_events`, `chain_events` and `event_facts`
+                        are the offsets of the events of each score, of the events of each chain, and of the facts of
+                        each event) ;
+        - sources     : the list of the sources ;
+        - collections : the collection of each score.
+        '''
+
+        for name in self.FILES:
+            setattr(self, name, arrays[name])
+
+        self.sources = sources
+        self.collections = collections
+
+    @classmethod
+    def from_records(cls, records, next_records):
+        '''
+        Build the corpus from the records of `CORPUS_QUERY` (one per fact) and of `interval_index.NEXT_QUERY`.
+
+        - records      : the records (or dicts) of the facts ;
+        - next_records : the records (or dicts) of the `NEXT` relationships.
+        '''
+
+        scores = {}
+        for record in records:
+            score = scores.setdefault(record['source'], {'collection': record['collection'], 'events': {}})
+            event = score['events'].setdefault(record['id'], {'event': record, 'facts': []})
+            event['facts'].append(record)
+
+        next_events = next_events_by_score(next_records)
+
+        sources = sorted(scores)
+        events = []
+        score_sizes, chain_sizes = [], []
+        for source in sources:
+            score_events = scores[source]['events']
+            starts = {event: score_events[event]['event']['start'] for event in score_events}
+
+            chains = next_chains(starts, next_events.get(source, {}))
+            for chain in chains:
+                events += [score_events[event] for event in chain]
+                chain_sizes.append(len(chain))
+            score_sizes.append(len(score_events))
+
+        facts = [fact for event in events for fact in event['facts']]
+        event_rows = [event['event'] for event in events]
+
+        def offsets(sizes):
+            return np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+
+        classes = [fact['class'] for fact in facts]
+
+        arrays = {
+            'score_events': offsets(score_sizes),
+            'chain_events': offsets(chain_sizes),
+            'event_score': np.repeat(np.arange(len(sources)), score_sizes).astype(np.int32),
+            'event_chain': np.repeat(np.arange(len(chain_sizes)), chain_sizes).astype(np.int64),
+            'event_start': float_array([event['start'] for event in event_rows]),
+            'event_end': float_array([event['end'] for event in event_rows]),
+            'event_duration': float_array([event['duration'] for event in event_rows]),
+            'event_dots': float_array([event['dots'] for event in event_rows]),
+            'event_id': string_array([event['id'] for event in event_rows]),
+            'event_facts': offsets([len(event['facts']) for event in events]),
+            'fact_class': string_array(classes),
+            'fact_semitone': semitone_column(classes),
+            'fact_octave': float_array([fact['octave'] for fact in facts]),
+            'fact_frequency': float_array([fact['frequency'] for fact in facts]),
+            'fact_rest': np.array([fact['type'] == 'rest' for fact in facts], dtype=bool),
+            'fact_duration': float_array([fact['fact_duration'] for fact in facts]),
+            'fact_dots': float_array([fact['fact_dots'] for fact in facts])
+        }
+
+        return cls(arrays, sources, [scores[source]['collection'] for source in sources])
+
+    def save(self, directory=None):
+        '''
+        Save the corpus in `directory` (`DEFAULT_SCAN_DIR` if None) : one `.npy` file per array, and `scores.json`.
+        '''
+
+        directory = directory or DEFAULT_SCAN_DIR
+        os.makedirs(directory, exist_ok=True)
+
+        for name in self.FILES:
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, name))
+
+        with open(os.path.join(directory, 'scores.json'), 'w') as f:
+            json.dump({'event_order': 'NEXT', 'sources': self.sources, 'collections': self.collections}, f)
+
+    @classmethod
+    def load(cls, directory=None):
+        '''
+        Load a corpus saved with `save`. The arrays are memory-mapped, not read.
+
+        - directory : the directory of the corpus (`DEFAULT_SCAN_DIR` if None).
+        '''
+
+        directory = directory or DEFAULT_SCAN_DIR
+
+        with open(os.path.join(directory, 'scores.json'), 'r') as f:
+            meta = json.load(f)
+
+        if meta.get('event_order') != 'NEXT':
+            raise ValueError(f'The corpus in {directory} was built by an older version (events in start order), it should be rebuilt')
+
+        arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r') for name in cls.FILES}
+
+        return cls(arrays, meta['sources'], meta['collections'])
+
+    def __len__(self):
+        return len(self.event_start)
+
+    def facts_of(self, events):
+        '''
+        Return `(facts, owners)` : the indexes of the facts of the events, and for each fact the index (in `events`)
+        of its event.
+
+        - events : the indexes of the events.
+        '''
+
+        first = np.asarray(self.event_facts[events])
+        counts = np.asarray(self.event_facts[events + 1]) - first
+
+        owners = np.repeat(np.arange(len(events)), counts)
+        facts = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(first, counts)
+
+        return facts, owners
+
+    def windows(self, nb_notes, collection=None):
+        '''
+        Return the first events of the windows of `nb_notes` consecutive events of a chain.
+
+        - nb_notes   : the number of events of a window ;
+        - collection : if not None, only the windows of the scores of this collection.
+        '''
+
+        starts = np.arange(len(self))
+        chain_ends = np.asarray(self.chain_events[1:])[np.asarray(self.event_chain)]
+        starts = starts[starts + nb_notes <= chain_ends]
+
+        if collection is not None:
+            in_collection = np.array([c == collection for c in self.collections], dtype=bool)
+            starts = starts[in_collection[np.asarray(self.event_score)[starts]]]
+
+        return starts
+
+    def scan(self, plan, collection=None):
+        '''
+        Return the first events of the windows where every note passes its check (see the module documentation).
+
+        - plan       : the `NotePredicate` of each note (see `scan_plan`) ;
+        - collection : if not None, only scan the scores of this collection.
+        '''
+
+        starts = self.windows(len(plan), collection)
+
+        for idx, note in enumerate(plan):
+            if len(starts) == 0:
+                break
+
+            events = starts + idx
+            facts, owners = self.facts_of(events)
+            kept = note.evaluate(self, facts, events[owners])[0]
+
+            # A window goes on if at least one fact of its event passes
+            keep = np.zeros(len(starts), dtype=bool)
+            keep[owners[kept]] = True
+            starts = starts[keep]
+
+        return starts
+
+    def note(self, fact, event):
+        '''Build the `Note` of a fact (as `process_results.record_to_note` on the record of a query).'''
+
+        octave = self.fact_octave[fact]
+        dots = self.event_dots[event]
+        record = {
+            'pitch_0': str(self.fact_class[fact]) or None,
+            'octave_0': None if np.isnan(octave) else int(octave),
+            'duration_0': float(self.event_duration[event]),
+            'dots_0': None if np.isnan(dots) else int(dots),
+            'start_0': float(self.event_start[event]),
+            'end_0': float(self.event_end[event]),
+            'id_0': str(self.event_id[event]) or None
+        }
+
+        return record_to_note(record, 0, 0)
+
+    def sequences(self, plan, starts, top_k=None):
+        '''
+        Return the ranked `(source, start, end, sequence_degree, note_details)` of the windows, one per combination of
+        the facts that pass the checks (as `process_results.get_ranked_results`).
+
+        - plan   : the `NotePredicate` of each note ;
+        - starts : the first events of the windows (see `scan`) ;
+        - top_k  : if not None, only return the `top_k` best sequences.
+        '''
+
+        # For each window and each note : the (fact, pitch, duration, note degrees) that pass
+        choices = [[[] for _ in range(len(starts))] for _ in plan]
+        for idx, note in enumerate(plan):
+            events = starts + idx
+            facts, owners = self.facts_of(events)
+            kept, pitch, duration, note_degree = note.evaluate(self, facts, events[owners])
+
+            for owner, fact, degrees in zip(owners[kept].tolist(), facts[kept].tolist(), zip(pitch.tolist(), duration.tolist(), note_degree.tolist())):
+                choices[idx][owner].append((fact, *degrees))
+
+        candidates = []
+        for window, start in enumerate(starts.tolist()):
+            for combination in product(*(note_choices[window] for note_choices in choices)):
+                candidates.append((min(choice[3] for choice in combination), start, combination))
+
+        # Stable sort, as `get_ordered_results`
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        if top_k is not None:
+            candidates = candidates[:top_k]
+
+        sequence_details = []
+        for sequence_degree, start, combination in candidates:
+            note_details = [
+                (self.note(fact, start + idx), pitch, duration, 1.0, note_degree)
+                for idx, (fact, pitch, duration, note_degree) in enumerate(combination)
+            ]
+            end = float(self.event_end[start + len(combination) - 1])
+            sequence_details.append((self.sources[self.event_score[start]], float(self.event_start[start]), end, sequence_degree, note_details))
+
+        return sequence_details
+
+def build_scan_corpus(driver, directory=None):
+    '''
+    Read the events and facts of all the scores, and save them (see `ScanCorpus.save`). Returns the corpus.
+
+    - driver    : the neo4j driver ;
+    - directory : the directory of the corpus (`DEFAULT_SCAN_DIR` if None).
+    '''
+
+    corpus = ScanCorpus.from_records(run_query(driver, CORPUS_QUERY), run_query(driver, NEXT_QUERY))
+    corpus.save(directory)
+
+    return corpus
+
+def scan_query(corpus, query, top_k=None):
+    '''
+    Answer a fuzzy query with the scan. Returns the ranked sequences (as `process_results.get_ranked_results`),
+    or None if the query can not be answered by the scan (see `scan_plan`).
+
+    - corpus : the `ScanCorpus` ;
+    - query  : the fuzzy query (string or `FuzzyQuery`) ;
+    - top_k  : if not None, only return the `top_k` best sequences.
+    '''
+
+    fuzzy_query = parse_fuzzy_query(query)
+
+    plan = scan_plan(fuzzy_query)
+    if plan is None:
+        return None
+
+    starts = corpus.scan(plan, fuzzy_query.collection)
+
+    return corpus.sequences(plan, starts, top_k)
@@ -1,13 +1,16 @@
 import os
 import shutil
 import json
+import heapq
+from itertools import count
 
-from extract_notes_from_query import extract_notes_from_query, extract_fuzzy_parameters, extract_attributes_with_membership_functions, extract_fuzzy_membership_functions, extract_notes_from_query_dict
+from fuzzy_query import parse_fuzzy_query
 from note import Note
-from degree_computation import pitch_degree, duration_degree, sequencing_degree, aggregate_note_degrees, aggregate_sequence_degrees, aggregate_degrees, pitch_degree_with_intervals, duration_degree_with_multiplicative_factor
+from degree_computation import pitch_degree, chord_degree, duration_degree, sequencing_degree, aggregate_note_degrees, aggregate_sequence_degrees, aggregate_degrees, pitch_degree_with_intervals, duration_degree_with_multiplicative_factor
 from generate_audio import generate_mp3
-from utils import get_notes_from_source_and_time_interval, calculate_pitch_interval, calculate_intervals_dict
+from utils import get_notes_from_source_and_time_interval, calculate_pitch_interval, calculate_intervals_dict, calculate_chord_pitches
 from neo4j_connection import connect_to_neo4j, run_query
+from vectorized_ranking import get_ordered_results_vectorized
 
 def min_aggregation(*degrees):
     return min(degrees)
@@ -49,44 +52,73 @@ def almost_all_aggregation_yager(*degrees):
 
     return max_min_alpha_degree
 
-def get_ordered_results(result, query):
-    # Extract the query notes and fuzzy parameters    
-    query_notes = extract_notes_from_query_dict(query)
-    query_notes = {node_name: attrs for node_name, attrs in query_notes.items() if attrs['type'] == 'Fact'}
-    pitch_gap, duration_factor, sequencing_gap, alpha, _, _, _, _ = extract_fuzzy_parameters(query)
+def record_to_note(record, fact_nb, event_nb):
+    '''
+    Build the `Note` of the event `event_nb` of a result record.
 
-    note_sequences = []
-    for record in result:
-        note_sequence = []
+    - record   : a record of the crisp query result ;
+    - fact_nb  : the index of the fact of the note (for `pitch_i` and `octave_i`) ;
+    - event_nb : the index of the event of the note (for `duration_i`, `dots_i`, `start_i`, `end_i`, `id_i`, and
+                 `chord_i` for the chords of the query).
+    '''
 
-        fact_nb = 0 # will correspond to the index of the first fact corresponding to the current event
-        for event_nb, event in enumerate(query_notes):
-            pitch = record[f"pitch_{fact_nb}"]
-            octave = record[f"octave_{fact_nb}"]
-            duration = record[f"duration_{event_nb}"]
-            dots = record[f"dots_{event_nb}"]
-            start = record[f"start_{event_nb}"]
-            end = record[f"end_{event_nb}"]
-            id_ = record[f"id_{event_nb}"]
-
-            if dots and dots > 0:
-                note = Note(pitch, octave, int(1 / (duration/1.5)), dots, duration, start, end, id_)
-            else:
-                note = Note(pitch, octave, int(1 / duration), dots, duration, start, end, id_)
-            note_sequence.append(note)
+    pitch = record[f"pitch_{fact_nb}"]
+    octave = record[f"octave_{fact_nb}"]
+    duration = record[f"duration_{event_nb}"]
+    dots = record[f"dots_{event_nb}"]
+    start = record[f"start_{event_nb}"]
+    end = record[f"end_{event_nb}"]
+    id_ = record[f"id_{event_nb}"]
+    chord = record.get(f"chord_{event_nb}")
+    chord = None if chord is None else tuple(chord)
+
+    if dots and dots > 0:
+        return Note(pitch, octave, int(1 / (duration/1.5)), dots, duration, start, end, id_, chord)
+    else:
+        return Note(pitch, octave, int(1 / duration), dots, duration, start, end, id_, chord)
+
+def iter_scored_results(result, query):
+    '''
+    Score the records of `result` one by one, in the order they are produced.
+
+    Yields a tuple `(source, start, end, sequence_degree, note_details)` for each record that passes the alpha cut
+    (the contour queries are not alpha cut, as in `get_ordered_results_contours`).
+    The results are *not* sorted : use `get_ordered_results*` to get them ordered by degree.
+
+    - result : the result of the crisp query (any iterable of records, e.g a lazy neo4j `Result`) ;
+    - query  : the *fuzzy* query (string or `FuzzyQuery`).
+    '''
+
+    fuzzy_query = parse_fuzzy_query(query)
+
+    if fuzzy_query.allow_transposition:
+        return iter_scored_results_with_transpose(result, fuzzy_query)
+    elif fuzzy_query.contour:
+        return iter_scored_results_contours(result, fuzzy_query)
+    else:
+        return iter_scored_results_exact(result, fuzzy_query)
 
-            # fact_nb += len(event) - 1 # -1 because event[-1] is duration and not a note
-            fact_nb += 1
-        note_sequences.append((note_sequence, record['source'], record['start'], record['end']))
+def iter_scored_results_exact(result, query):
+    # Extract the query notes and fuzzy parameters    
+    fuzzy_query = parse_fuzzy_query(query)
+    query_notes = fuzzy_query.facts
+    pitch_gap, duration_factor, sequencing_gap, alpha, _, _, _, _ = fuzzy_query.parameters()
+    chords = calculate_chord_pitches(fuzzy_query)
 
-    sequence_details = []
+    for record in result:
+        note_sequence = []
 
-    for seq_idx, (note_sequence, source, start, end) in enumerate(note_sequences):
         note_degrees = []
         note_details = []  # Buffer to store note details before writing
-        for idx, note in enumerate(note_sequence):
+        for idx in range(len(query_notes)):
+            # The notes are built as they are scored : the record can be dropped before the last one
+            note = record_to_note(record, idx, idx)
+            note_sequence.append(note)
+
             query_note = query_notes[f'f{idx}']
             pitch_deg = pitch_degree(query_note['class'], query_note['octave'], note.pitch, note.octave, pitch_gap)
+            if idx in chords:
+                pitch_deg = min(pitch_deg, chord_degree(chords[idx], note.chord, pitch_gap))
             if query_note['dur'] is not None:
                 expected_duration = 1.0/query_note['dur']
                 if query_note.get('dots', None):
@@ -107,68 +139,48 @@ def get_ordered_results(result, query):
                 # note_deg = aggregate_degrees(average_aggregation, relevant_note_degrees)
             else :
                 note_deg = 1.0
+
+            # Alpha cut : the sequence degree is the min of the note degrees, it can not reach alpha anymore
+            if note_deg < alpha:
+                break
+
             note_degrees.append(note_deg)
             
             note_detail = (note, pitch_deg, duration_deg, sequencing_deg, note_deg)
             note_details.append(note_detail)
-        
-        sequence_degree = aggregate_degrees(min_aggregation, note_degrees)
-        # sequence_degree = aggregate_degrees(average_aggregation, note_degrees)
-        
-        if sequence_degree >= alpha:  # Apply alpha cut
-        # if sequence_degree >= 0.0: 
-            sequence_details.append((source, start, end, sequence_degree, note_details))
-    
-    # Sort the sequences by their overall degree in descending order
-    sequence_details.sort(key=lambda x: x[3], reverse=True)
+        else:
+            sequence_degree = aggregate_degrees(min_aggregation, note_degrees)
+            # sequence_degree = aggregate_degrees(average_aggregation, note_degrees)
 
-    return sequence_details
+            if sequence_degree >= alpha:  # Apply alpha cut
+                yield (record['source'], record['start'], record['end'], sequence_degree, note_details)
 
-def get_ordered_results_with_transpose(result, query):
+def iter_scored_results_with_transpose(result, query):
     # Extract the query notes and fuzzy parameters    
-    query_notes = extract_notes_from_query_dict(query)
-    query_notes = {node_name: attrs for node_name, attrs in query_notes.items() if attrs['type'] == 'Fact'}
-    pitch_gap, duration_factor, sequencing_gap, alpha, allow_transpose, contour, fixed_notes, _ = extract_fuzzy_parameters(query)
+    fuzzy_query = parse_fuzzy_query(query)
+    query_notes = fuzzy_query.facts
+    pitch_gap, duration_factor, sequencing_gap, alpha, allow_transpose, contour, fixed_notes, _ = fuzzy_query.parameters()
 
     # Compute the intervals between consecutive notes
     intervals = calculate_intervals_dict(query_notes)
+    chords = calculate_chord_pitches(fuzzy_query)
 
-    note_sequences = []
     for record in result:
         note_sequence = []
 
-        fact_nb = 0 # will correspond to the index of the first fact corresponding to the current event
-        for event_nb, event in enumerate(query_notes):
-            pitch = record[f"pitch_{fact_nb}"]
-            octave = record[f"octave_{fact_nb}"]
-            duration = record[f"duration_{event_nb}"]
-            dots = record[f"dots_{event_nb}"]
-            start = record[f"start_{event_nb}"]
-            end = record[f"end_{event_nb}"]
-            id_ = record[f"id_{event_nb}"]
-
-            if dots and dots > 0:
-                note = Note(pitch, octave, int(1 / (duration/1.5)), dots, duration, start, end, id_)
-            else:
-                note = Note(pitch, octave, int(1 / duration), dots, duration, start, end, id_)
+        note_degrees = []
+        note_details = []  # Buffer to store note details before writing
+        for idx in range(len(query_notes)):
+            # The notes are built as they are scored : the record can be dropped before the last one
+            note = record_to_note(record, idx, idx)
 
-            if event_nb == 0:
+            if idx == 0:
                 interval = None
             else:
-                interval = record[f"interval_{event_nb - 1}"]
+                interval = record[f"interval_{idx - 1}"]
 
             note_sequence.append((note, interval))
-            # fact_nb += len(event) - 1 # -1 because event[-1] is duration and not a note
-            fact_nb += 1
 
-        note_sequences.append((note_sequence, record['source'], record['start'], record['end']))
-
-    sequence_details = []
-
-    for seq_idx, (note_sequence, source, start, end) in enumerate(note_sequences):
-        note_degrees = []
-        note_details = []  # Buffer to store note details before writing
-        for idx, (note, interval) in enumerate(note_sequence):
             query_note = query_notes[f'f{idx}']
             if idx == 0:
                 # When considering transposition, the first note always has its pitch degree equal to 1.0
@@ -176,6 +188,10 @@ def get_ordered_results_with_transpose(result, query):
             else:
                 pitch_deg = pitch_degree_with_intervals(intervals[idx - 1], interval, pitch_gap)
 
+            if idx in chords:
+                # The chord is relative to the note of the event
+                pitch_deg = min(pitch_deg, chord_degree(chords[idx], note.chord, pitch_gap, record[f"half_tones_{idx}"]))
+
             if query_note['dur'] is not None:
                 expected_duration = 1.0/query_note['dur']
                 if query_note.get('dots', None):
@@ -195,32 +211,28 @@ def get_ordered_results_with_transpose(result, query):
                 note_deg = aggregate_degrees(min_aggregation, relevant_note_degrees)
             else :
                 note_deg = 1.0
+
+            # Alpha cut : the sequence degree is the min of the note degrees, it can not reach alpha anymore
+            if note_deg < alpha:
+                break
+
             note_degrees.append(note_deg)
             
             note_detail = (note, pitch_deg, duration_deg, sequencing_deg, note_deg)
             note_details.append(note_detail)
-        
-        sequence_degree = aggregate_degrees(min_aggregation, note_degrees)
-        
-        if sequence_degree >= alpha:  # Apply alpha cut
-        # if sequence_degree >= 0.0:
-            sequence_details.append((source, start, end, sequence_degree, note_details))
-    
-    # Sort the sequences by their overall degree in descending order
-    sequence_details.sort(key=lambda x: x[3], reverse=True)
+        else:
+            sequence_degree = aggregate_degrees(min_aggregation, note_degrees)
 
-    return sequence_details
+            if sequence_degree >= alpha:  # Apply alpha cut
+                yield (record['source'], record['start'], record['end'], sequence_degree, note_details)
 
-def get_ordered_results_contours(result, query):
+def iter_scored_results_contours(result, query):
     # Extract the query notes and fuzzy parameters    
-    query_notes = extract_notes_from_query_dict(query)
-    query_notes = {node_name: attrs for node_name, attrs in query_notes.items() if attrs['type'] == 'Fact'}
+    fuzzy_query = parse_fuzzy_query(query)
+    query_notes = fuzzy_query.facts
 
-    notes = extract_notes_from_query_dict(query)
-    nb_facts = len([note_name for note_name, note in notes.items() if note['type'] == 'Fact'])
-    
     # Step 1: Extract attributes associated with membership functions
-    attributes_with_membership_functions = extract_attributes_with_membership_functions(query)
+    attributes_with_membership_functions = fuzzy_query.attributes_with_membership_functions
     
     # Step 2: Build the aliases used in the return clause for these attributes
     attribute_aliases = []
@@ -229,27 +241,14 @@ def get_ordered_results_contours(result, query):
         attribute_aliases.append((alias, node_name, attribute_name, membership_function_name))
     
     # Step 3: Extract the membership functions
-    membership_functions = extract_fuzzy_membership_functions(query)
+    membership_functions = fuzzy_query.membership_functions
     
     # Step 4: Process each record in the result
-    sequence_details = []
     for record in result:
         # Collect notes information
         notes = []
         for event_nb, event in enumerate(query_notes):
-            pitch = record[f"pitch_{event_nb}"]
-            octave = record[f"octave_{event_nb}"]
-            duration = record[f"duration_{event_nb}"]
-            dots = record[f"dots_{event_nb}"]
-            start = record[f"start_{event_nb}"]
-            end = record[f"end_{event_nb}"]
-            id_ = record[f"id_{event_nb}"]
-
-            if dots and dots > 0:
-                note = Note(pitch, octave, int(1 / (duration/1.5)), dots, duration, start, end, id_)
-            else:
-                note = Note(pitch, octave, int(1 / duration), dots, duration, start, end, id_)
-            notes.append(note)
+            notes.append(record_to_note(record, event_nb, event_nb))
 
         # Collect degrees for each note
         degrees = [1.0] * len(notes)  # Initialize all degrees to 1.0
@@ -287,13 +286,155 @@ def get_ordered_results_contours(result, query):
         end = record.get('end', None)
 
         # Construct the sequence details
-        sequence_details.append([source, start, end, sequence_degree, note_sequence])
-    
+        yield [source, start, end, sequence_degree, note_sequence]
+
+def get_ordered_results(result, query):
+    sequence_details = list(iter_scored_results_exact(result, query))
+
+    # Sort the sequences by their overall degree in descending order
+    sequence_details.sort(key=lambda x: x[3], reverse=True)
+
+    return sequence_details
+
+def get_ordered_results_with_transpose(result, query):
+    sequence_details = list(iter_scored_results_with_transpose(result, query))
+
+    # Sort the sequences by their overall degree in descending order
+    sequence_details.sort(key=lambda x: x[3], reverse=True)
+
+    return sequence_details
+
+def get_ordered_results_contours(result, query):
+    sequence_details = list(iter_scored_results_contours(result, query))
+
     # Step 7: Sort the sequences by their overall degree in descending order
     sequence_details.sort(key=lambda x: x[3], reverse=True)
     
     return sequence_details
 
+class TopK:
+    '''
+    Bounded min-heap keeping the `k` best sequences among the ones pushed (ties are kept in the order of the pushes).
+
+    Used by `get_top_k_results`, and to rank results arriving by chunks (e.g the async API).
+    '''
+
+    def __init__(self, k):
+        '''
+        Initiate the heap.
+
+        - k : the number of sequences to keep.
+        '''
+
+        if k < 0:
+            raise ValueError(f'k should be a positive integer, but {k} was given')
+
+        self.k = k
+        self.total = 0
+
+        # Heap of (degree, -arrival_index, sequence) : the root is the worst kept sequence (lowest degree, latest among ties)
+        self._heap = []
+        self._arrival = count()
+
+    def push(self, seq_detail):
+        '''Add a `(source, start, end, sequence_degree, note_details)` sequence, keeping it only if it is in the `k` best.'''
+
+        self.total += 1
+        item = (seq_detail[3], -next(self._arrival), seq_detail)
+
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif self.k > 0 and item[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, item)
+
+    def extend(self, seq_details):
+        '''Push every sequence of `seq_details`.'''
+
+        for seq_detail in seq_details:
+            self.push(seq_detail)
+
+    def results(self):
+        '''Return the kept sequences, sorted by degree in descending order.'''
+
+        return [seq_detail for _, _, seq_detail in sorted(self._heap, key=lambda x: x[:2], reverse=True)]
+
+def get_top_k_results(result, query, k):
+    '''
+    Rank the records of `result` and keep only the `k` best sequences, without materializing the whole result.
+
+    The records are consumed one by one (`result` can be the lazy iterator of `iter_query`) and only the `k` best
+    sequences (by `sequence_degree`) are kept in a bounded min-heap.
+    The top-k is exactly the `k` first elements of `get_ordered_results*` (ties are kept in the order of the records).
+
+    Returns `(top_k, total)` where `top_k` is the list of the best `(source, start, end, sequence_degree, note_details)`,
+    sorted by degree in descending order, and `total` the number of sequences that passed the alpha cut.
+
+    - result : the result of the crisp query (any iterable of records) ;
+    - query  : the *fuzzy* query (string or `FuzzyQuery`) ;
+    - k      : the number of results to keep.
+    '''
+
+    top_k = TopK(k)
+    top_k.extend(iter_scored_results(result, query))
+
+    return top_k.results(), top_k.total
+
+def get_ranked_results(result, query, top_k=None, vectorized=False):
+    '''
+    Return the sequences of `result` ordered by degree (all of them, or only the `top_k` best ones).
+
+    - result     : the result of the crisp query ;
+    - query      : the *fuzzy* query (string or `FuzzyQuery`) ;
+    - top_k      : if not None, only keep the `top_k` best sequences (see `get_top_k_results`) ;
+    - vectorized : if True, compute the degrees with numpy (see `vectorized_ranking.get_ordered_results_vectorized`).
+    '''
+
+    query = parse_fuzzy_query(query)
+
+    if vectorized:
+        return get_ordered_results_vectorized(result, query, top_k)
+
+    if top_k is not None:
+        return get_top_k_results(result, query, top_k)[0]
+
+    if query.allow_transposition:
+        return get_ordered_results_with_transpose(result, query)
+    elif query.contour:
+        return get_ordered_results_contours(result, query)
+    else:
+        return get_ordered_results(result, query)
+
+def sequence_detail_to_dict(seq_detail):
+    '''
+    Convert a tuple `(source, start, end, sequence_degree, note_details)` (from `get_ordered_results*` or `iter_scored_results`) to a dict.
+
+    - seq_detail : the details of a matched sequence.
+    '''
+
+    seq_dict = {}
+    seq_dict['source'] = seq_detail[0]
+    seq_dict['start'] = seq_detail[1]
+    seq_dict['end'] = seq_detail[2]
+    seq_dict['overall_degree'] = seq_detail[3]
+
+    seq_dict['notes'] = []
+    for note_details in seq_detail[4]:
+        note_dict = {}
+        note_dict['note'] = note_details[0].__dict__
+
+        if len(note_details) == 2:
+            # Contour match : only one degree per note
+            note_dict['contour_deg'] = note_details[1]
+        else:
+            note_dict['pitch_deg'] = note_details[1]
+            note_dict['duration_deg'] = note_details[2]
+            note_dict['sequencing_deg'] = note_details[3]
+            note_dict['note_deg'] = note_details[4]
+
+        seq_dict['notes'].append(note_dict)
+
+    return seq_dict
+
 def process_crisp_results_to_dict(result):
     '''
     Processes `result` from a crisp query to a python dict
@@ -344,75 +485,59 @@ def process_crisp_results_to_json(result):
 
     return json.dumps(process_crisp_results_to_dict(result))
 
-def process_results_to_dict(result, query):
+def process_results_to_dict(result, query, top_k=None, vectorized=False):
     # Obsolete
     '''
     Process the results of the query and return a sorted list of dictionaries.
     Each dictionary represent a song.
 
-    - result : the result of the query (list from `run_query`) ;
-    - query  : the *fuzzy* query (to extract info from it).
+    - result : the result of the query (list from `run_query`, or iterator from `iter_query`) ;
+    - query  : the *fuzzy* query (string or `FuzzyQuery`, to extract info from it) ;
+    - top_k      : if not None, only the `top_k` best results are kept (see `get_top_k_results`) ;
+    - vectorized : if True, rank the results with the numpy kernel (see `get_ranked_results`).
     '''
 
-    _, _, _, _, allow_transpose, contour, _, _ = extract_fuzzy_parameters(query)
-
-    if allow_transpose:
-        sequence_details = get_ordered_results_with_transpose(result, query)
-    elif contour:
-        sequence_details = get_ordered_results_contours(result, query)
-    else:
-        sequence_details = get_ordered_results(result, query)
+    sequence_details = get_ranked_results(result, query, top_k, vectorized)
     
-    res = []
-    for seq_detail in sequence_details:
-        seq_dict = {}
-        seq_dict['source'] = seq_detail[0]
-        seq_dict['start'] = seq_detail[1]
-        seq_dict['end'] = seq_detail[2]
-        seq_dict['overall_degree'] = seq_detail[3]
+    return [sequence_detail_to_dict(seq_detail) for seq_detail in sequence_details]
 
-        seq_dict['notes'] = []
-        for note_details in seq_detail[4]:
-            note_dict = {}
-            note_dict['note'] = note_details[0].__dict__
-            note_dict['pitch_deg'] = note_details[1]
-            note_dict['duration_deg'] = note_details[2]
-            note_dict['sequencing_deg'] = note_details[3]
-            note_dict['note_deg'] = note_details[4]
-
-            seq_dict['notes'].append(note_dict)
-
-        res.append(seq_dict)
-
-    return res
-
-def process_results_to_json(result, query):
+def process_results_to_json(result, query, top_k=None, vectorized=False):
     '''
     Process the results of the query and return a sorted list of dictionaries.
     Each dictionary represent a song.
 
-    - result : the result of the query (list from `run_query`) ;
-    - query  : the *fuzzy* query (to extract info from it).
+    - result : the result of the query (list from `run_query`, or iterator from `iter_query`) ;
+    - query  : the *fuzzy* query (string or `FuzzyQuery`, to extract info from it) ;
+    - top_k      : if not None, only the `top_k` best results are kept (see `get_top_k_results`) ;
+    - vectorized : if True, rank the results with the numpy kernel (see `get_ranked_results`).
     '''
 
-    return json.dumps(process_results_to_dict(result, query))
+    return json.dumps(process_results_to_dict(result, query, top_k, vectorized))
 
-def process_results_to_text(result, query):
+def process_results_to_text(result, query, top_k=None, vectorized=False):
     '''
     Process the results of the query and return a readable string.
 
-    - result : the result of the query (list from `run_query`) ;
-    - query  : the *fuzzy* query (to extract info from it).
+    - result : the result of the query (list from `run_query`, or iterator from `iter_query`) ;
+    - query  : the *fuzzy* query (string or `FuzzyQuery`, to extract info from it) ;
+    - top_k      : if not None, only the `top_k` best results are kept (see `get_top_k_results`) ;
+    - vectorized : if True, rank the results with the numpy kernel (see `get_ranked_results`).
     '''
 
-    _, _, _, _, allow_transpose, contour, _, _ = extract_fuzzy_parameters(query)
+    query = parse_fuzzy_query(query)
 
-    if allow_transpose:
-        sequence_details = get_ordered_results_with_transpose(result, query)
-    elif contour:
-        sequence_details = get_ordered_results_contours(result, query)
-    else:
-        sequence_details = get_ordered_results(result, query)
+    return sequence_details_to_text(get_ranked_results(result, query, top_k, vectorized), query)
+
+def sequence_details_to_text(sequence_details, query):
+    '''
+    Format ranked sequences (see `get_ranked_results`) as a readable string.
+
+    - sequence_details : the ranked sequences ;
+    - query            : the *fuzzy* query (string or `FuzzyQuery`).
+    '''
+
+    query = parse_fuzzy_query(query)
+    contour = query.contour and not query.allow_transposition
 
     res = ''
     for source, start, end, sequence_degree, note_details in sequence_details:
@@ -437,18 +562,8 @@ def process_results_to_text(result, query):
 
 
 def process_results_to_mp3(result, query, max_files, driver):
-    _, _, _, _, allow_transpose, contour, _, _ = extract_fuzzy_parameters(query)
-
-    if allow_transpose:
-        sequence_details = get_ordered_results_with_transpose(result, query)
-    elif contour:
-        sequence_details = get_ordered_results_contours(result, query)
-    else:
-        sequence_details = get_ordered_results(result, query)
-
-    if len(sequence_details) > max_files:
-        # Limit the number of files to generate
-        sequence_details = sequence_details[:max_files]
+    # Limit the number of files to generate : only the `max_files` best results are kept
+    sequence_details, _ = get_top_k_results(result, query, max_files)
 
     # Clear previous results in audio directory
     audio_dir = os.path.join(os.getcwd(), "audio")
@@ -0,0 +1,150 @@
+'''
+Profiling of a query : per-phase wall-clock times (`PhaseTimer`) and the operator tree of cypher's `PROFILE`.
+
+Used by `main_parser.py send --profile`, e.g :
+    python3 main_parser.py send -f -F fuzzy_query.cypher --profile
+
+The phases are :
+    - parse             : parsing of the fuzzy query ;
+    - compile           : compilation to a crisp query ;
+    - driver round trip : from sending the query to the first answer of the database (planning, and execution
+                          up to the first records) ;
+    - record fetch      : reading all the records ;
+    - ranking           : computation of the degrees and sorting of the results ;
+    - serialization     : formatting of the results (text or json).
+'''
+
+import time
+from contextlib import contextmanager
+
+class PhaseTimer:
+    '''Measures the wall-clock time of consecutive phases.'''
+
+    def __init__(self):
+        '''Initiate the timer, without any phase.'''
+
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        '''
+        Context manager measuring the time spent in its block as the phase `name`.
+        A phase entered several times is counted once, with the sum of the times.
+
+        - name : the name of the phase.
+        '''
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        '''Add `seconds` to the phase `name` (created at the end of the phases if it does not exist).'''
+
+        for idx, (phase_name, total) in enumerate(self.phases):
+            if phase_name == name:
+                self.phases[idx] = (name, total + seconds)
+                return
+
+        self.phases.append((name, seconds))
+
+    def total(self):
+        '''Return the time spent in all the phases (in seconds).'''
+
+        return sum(seconds for _, seconds in self.phases)
+
+    def format(self):
+        '''Format the phases as text : one line per phase, with its time (in ms) and its share of the total.'''
+
+        total = self.total()
+        width = max([len(name) for name, _ in self.phases] + [len('total')])
+
+        lines = []
+        for name, seconds in self.phases:
+            share = 100 * seconds / total if total > 0 else 0.0
+            lines.append(f'{name:<{width}} {seconds * 1000:>10.2f} ms {share:>5.1f} %')
+        lines.append(f'{"total":<{width}} {total * 1000:>10.2f} ms')
+
+        return '\n'.join(lines)
+
+def profile_query(driver, crisp_query, parameters=None, timer=None):
+    '''
+    Run `crisp_query` with `PROFILE`, and return its records and its summary (with the profiled plan in `summary.profile`).
+
+    - driver      : the neo4j driver ;
+    - crisp_query : the cypher query ;
+    - parameters  : the parameters of the query, or None ;
+    - timer       : if given, the `PhaseTimer` where the 'driver round trip' and 'record fetch' phases are measured.
+    '''
+
+    timer = timer or PhaseTimer()
+
+    with driver.session() as session:
+        # `run` returns once the database has answered (the query is planned and started)
+        with timer.phase('driver round trip'):
+            result = session.run('PROFILE ' + crisp_query, parameters)
+
+        with timer.phase('record fetch'):
+            records = list(result)
+            summary = result.consume()
+
+    return records, summary
+
+def plan_db_hits(plan):
+    '''Return the total number of db hits of the operators of a profiled plan.'''
+
+    return plan.get('dbHits', 0) + sum(plan_db_hits(child) for child in plan.get('children', []))
+
+def format_profile(plan, depth=0):
+    '''
+    Format a profiled plan as an indented operator tree. Each line gives the operator, its actual and estimated rows,
+    its db hits, the variables it produces and its details.
+
+    - plan  : the profiled plan, as given by `ResultSummary.profile` ;
+    - depth : the depth of `plan` in the tree (indentation).
+    '''
+
+    operator = plan['operatorType'].split('@')[0]
+    args = plan.get('args', {})
+    estimated = args.get('EstimatedRows')
+    estimated = f'{estimated:.0f}' if isinstance(estimated, (int, float)) else '?'
+
+    line = f'{"  " * depth}+{operator} rows={plan.get("rows", 0)} (estimated {estimated}) db_hits={plan.get("dbHits", 0)}'
+    if plan.get('identifiers'):
+        line += f' ({", ".join(plan["identifiers"])})'
+    if args.get('Details'):
+        line += f' {args["Details"]}'
+
+    lines = [line]
+    for child in plan.get('children', []):
+        lines.append(format_profile(child, depth + 1))
+
+    if depth == 0:
+        lines.append(f'Total db hits : {plan_db_hits(plan)}')
+
+    return '\n'.join(lines)
+
+def format_profile_report(summary, timer):
+    '''
+    Format the report of `send --profile` : the operator tree, the server-side times and the phases.
+
+    - summary : the summary of the profiled query (see `profile_query`) ;
+    - timer   : the `PhaseTimer` of the phases.
+    '''
+
+    lines = []
+    if summary.profile:
+        lines += ['Plan :', format_profile(summary.profile), '']
+
+    if summary.result_available_after is not None:
+        lines.append(
+            f'Server : result available after {summary.result_available_after} ms, '
+            f'consumed after {summary.result_consumed_after} ms'
+        )
+        lines.append('')
+
+    lines += ['Phases :', timer.format()]
+
+    return '\n'.join(lines)
@@ -1,12 +1,35 @@
 import re
 from find_nearby_pitches import find_frequency_bounds, find_nearby_pitches
-from extract_notes_from_query import extract_notes_from_query_dict, extract_fuzzy_parameters, extract_match_clause, extract_where_clause, extract_attributes_with_membership_functions, extract_membership_function_support_intervals
 from find_duration_range import find_duration_range_decimal, find_duration_range_multiplicative_factor_sym
-from utils import calculate_intervals_dict
+from fuzzy_query import parse_fuzzy_query
+from utils import calculate_intervals_dict, calculate_chord_pitches
+from interval_ngrams import get_catalog, rarest_interval_gram
 from degree_computation import convert_note_to_sharp
 from refactor import move_attribute_values_to_where_clause, refactor_variable_names
 
-def make_duration_condition(duration_factor, duration, node_name, alpha, dotted):
+def make_literal(value, name, params=None):
+    '''
+    Return the Cypher text of a value of the query : the value itself (quoted if it is a string),
+    or the parameter `$name` if `params` is given (the value is then stored in `params[name]`).
+
+    The names only depend on the position of the value in the query (e.g `f0_duration`), so that queries with the
+    same shape give the same Cypher text, and share the same plan in the Neo4j query cache.
+
+    - value  : the value ;
+    - name   : the name of the parameter ;
+    - params : the dict collecting the parameters of the query, or None to inline the value.
+    '''
+
+    if params is None:
+        return f"'{value}'" if isinstance(value, str) else f"{value}"
+
+    if name in params and params[name] != value:
+        raise ValueError(f'The parameter "{name}" is used with two different values ({params[name]} and {value})')
+
+    params[name] = value
+    return f"${name}"
+
+def make_duration_condition(duration_factor, duration, node_name, alpha, dotted, params=None):
     if duration == None:
         return ''
 
@@ -19,12 +42,12 @@ def make_duration_condition(duration_factor, duration, node_name, alpha, dotted)
 
     if duration_factor != 1:
         min_duration, max_duration = find_duration_range_multiplicative_factor_sym(duration, duration_factor, alpha)
-        res = f"{node_name}.duration >= {min_duration} AND {node_name}.duration <= {max_duration}"
+        res = f"{node_name}.duration >= {make_literal(min_duration, f'{node_name}_duration_min', params)} AND {node_name}.duration <= {make_literal(max_duration, f'{node_name}_duration_max', params)}"
     else:
-        res = f"{node_name}.duration = {duration}"
+        res = f"{node_name}.duration = {make_literal(duration, f'{node_name}_duration', params)}"
     return res
 
-def make_interval_condition(interval, duration_gap, pitch_distance, idx, alpha):
+def make_interval_condition(interval, duration_gap, pitch_distance, idx, alpha, params=None):
     if interval == 'NA':
         # No rest involved, but lack information for interval inference
         interval_condition = ''
@@ -34,30 +57,36 @@ def make_interval_condition(interval, duration_gap, pitch_distance, idx, alpha):
         else:
             interval_condition = f"NOT EXISTS(n{idx}.interval)"
     else :
+        if pitch_distance > 0:
+            interval_min = make_literal(interval - pitch_distance * (1 - alpha), f'n{idx}_interval_min', params)
+            interval_max = make_literal(interval + pitch_distance * (1 - alpha), f'n{idx}_interval_max', params)
+        else:
+            interval_value = make_literal(interval, f'n{idx}_interval', params)
+
         if duration_gap > 0:
             # Utiliser halfTonesFromA4 pour calculer les intervalles entre deux Fact nodes
             if pitch_distance > 0:
                 interval_condition = (
                     f"EXISTS(f{idx + 1}.halfTonesFromA4) AND EXISTS(f{idx}.halfTonesFromA4) AND "
-                    f"{interval - pitch_distance * (1 - alpha)} <= "
+                    f"{interval_min} <= "
                     f"toFloat(f{idx + 1}.halfTonesFromA4 - f{idx}.halfTonesFromA4)/2 AND "
                     f"toFloat(f{idx + 1}.halfTonesFromA4 - f{idx}.halfTonesFromA4)/2 <= "
-                    f"{interval + pitch_distance * (1 - alpha)}"
+                    f"{interval_max}"
                 )
             else:
                 interval_condition = (
                     f"EXISTS(f{idx + 1}.halfTonesFromA4) AND EXISTS(f{idx}.halfTonesFromA4) AND "
-                    f"toFloat(f{idx + 1}.halfTonesFromA4 - f{idx}.halfTonesFromA4)/2 = {interval}"
+                    f"toFloat(f{idx + 1}.halfTonesFromA4 - f{idx}.halfTonesFromA4)/2 = {interval_value}"
                 )
         else:
             # Construct interval conditions for direct connections
             if pitch_distance > 0:
                 interval_condition = (
-                    f"{interval - pitch_distance * (1 - alpha)} <= n{idx}.interval AND "
-                    f"n{idx}.interval <= {interval + pitch_distance * (1 - alpha)}"
+                    f"{interval_min} <= n{idx}.interval AND "
+                    f"n{idx}.interval <= {interval_max}"
                 )
             else:
-                interval_condition = f"n{idx}.interval = {interval}"
+                interval_condition = f"n{idx}.interval = {interval_value}"
     return interval_condition
 
 def split_note_accidental(note):
@@ -83,7 +112,7 @@ def split_note_accidental(note):
     else:
         raise ValueError(f"Invalid note name: {note}")
 
-def make_pitch_condition(pitch_distance, pitch, octave, name, alpha):
+def make_pitch_condition(pitch_distance, pitch, octave, name, alpha, params=None):
     """
     Creates a pitch condition for a given note, handling accidentals properly.
 
@@ -92,6 +121,7 @@ def make_pitch_condition(pitch_distance, pitch, octave, name, alpha):
         pitch (str): The pitch class.
         octave (int): The octave number.
         name (str): The variable name of the note in the query.
+        params (dict): If given, the values are passed as parameters and stored in this dict (see `make_literal`).
 
     Returns:
         str: The pitch condition as a string.
@@ -100,7 +130,7 @@ def make_pitch_condition(pitch_distance, pitch, octave, name, alpha):
         if octave is None:
             pitch_condition = ''
         else:
-            pitch_condition = f"{name}.octave = {octave}"
+            pitch_condition = f"{name}.octave = {make_literal(octave, f'{name}_octave', params)}"
     else:
         if pitch_distance == 0 or pitch == 'r':
             if pitch == 'r':
@@ -108,15 +138,16 @@ def make_pitch_condition(pitch_distance, pitch, octave, name, alpha):
             else:
                 # Split pitch into base note and accidental
                 base_note, accidental = split_note_accidental(pitch)
-                pitch_condition = f"{name}.class = '{base_note}'"
+                pitch_condition = f"{name}.class = {make_literal(base_note, f'{name}_class', params)}"
                 if accidental:
                     # Add condition for accidental, including accid and accid_ges
-                    pitch_condition += f" AND ({name}.accid = '{accidental}' OR {name}.accid_ges = '{accidental}')"
+                    accidental = make_literal(accidental, f'{name}_accid', params)
+                    pitch_condition += f" AND ({name}.accid = {accidental} OR {name}.accid_ges = {accidental})"
                 else:
                     # No accidental, so accid is NULL or empty
                     pitch_condition += f" AND NOT EXISTS({name}.accid)"
                 if octave is not None:
-                    pitch_condition += f" AND {name}.octave = {octave}"
+                    pitch_condition += f" AND {name}.octave = {make_literal(octave, f'{name}_octave', params)}"
         else:
             o = 4 if octave is None else octave  # Default octave if not specified
             near_pitches = find_nearby_pitches(pitch, o, pitch_distance)
@@ -137,75 +168,157 @@ def make_pitch_condition(pitch_distance, pitch, octave, name, alpha):
             # pitch_condition = pitch_condition.rstrip(' OR ') + '\n)'
 
             low_freq_bound, high_freq_bound = find_frequency_bounds(pitch, o, pitch_distance, alpha)
+            low_freq_bound = make_literal(low_freq_bound, f'{name}_frequency_min', params)
+            high_freq_bound = make_literal(high_freq_bound, f'{name}_frequency_max', params)
             pitch_condition = f"{low_freq_bound} <= {name}.frequency AND {name}.frequency <= {high_freq_bound}"
             
     return pitch_condition
 
-def make_sequencing_condition(duration_gap, name_1, name_2, alpha):
-    sequencing_condition = f"{name_1}.end >= {name_2}.start - {duration_gap * (1 - alpha)}"
-    return sequencing_condition
+def make_pitch_degree_condition(pitch_distance, pitch, octave, name, alpha, params=None):
+    '''
+    Return the alpha cut of the pitch degree of a note (`degree_computation.pitch_degree >= alpha`), or '' if the
+    frequency bounds of `make_pitch_condition` are enough.
+
+    The frequency bounds are computed on the sounding pitch, while the pitch degree is computed on the class and the
+    octave of the Fact (e.g an `f` with a sharp in the key is within a semitone of `gb`, but its degree is the one of
+    `f`) : without this condition, such notes are fetched, then dropped by the alpha cut of the ranking.
+
+    The degree only depends on the class and on the octave of the Fact, so the cut is evaluated here for every class
+    and compared on them : the classes kept for each octave around the one of the query (and for a Fact without
+    octave), and the octaves kept for a Fact without class (see `make_pitch_distance_expression`).
+
+    - pitch_distance : the pitch distance ;
+    - pitch          : the class of the query note (or None) ;
+    - octave         : the octave of the query note (or None) ;
+    - name           : the variable name of the Fact ;
+    - alpha          : the alpha cut ;
+    - params         : if given, the values are passed as parameters and stored in this dict (see `make_literal`).
+    '''
+
+    # Without class, the octave condition of `make_pitch_condition` already gives a degree of 1
+    if alpha <= 0 or pitch_distance == 0 or pitch is None or pitch == 'r':
+        return ''
+
+    # Same computation as the cut of `make_pitch_distance_expression`, for a distance (in tones)
+    kept = lambda distance: (1 - (distance / float(pitch_distance))) >= alpha
+
+    query_semitone = SEMITONES_FROM_C[convert_note_to_sharp(pitch)]
+    classes = make_literal(sorted(SEMITONE_CLASSES), 'pitch_classes', params)
+    same_octave = sorted(class_ for class_, semitone in SEMITONE_CLASSES.items() if kept(abs(semitone - query_semitone) / 2.0))
+
+    # A Fact without class (or with a class without pitch, e.g a rest) has the octave distance, 0 without octave
+    unknown_class = f"({name}.class IS NULL OR NOT {name}.class IN {classes})"
+    if octave is None:
+        return f"({unknown_class} OR {name}.class IN {make_literal(same_octave, f'{name}_classes', params)})"
+
+    max_octaves = 0
+    while kept(6.0 * (max_octaves + 1)):
+        max_octaves += 1
+
+    conditions = [
+        f"({unknown_class} AND ({name}.octave IS NULL OR abs({name}.octave - {make_literal(octave, f'{name}_octave', params)}) <= {make_literal(max_octaves, f'{name}_octaves', params)}))",
+        f"({name}.octave IS NULL AND {name}.class IN {make_literal(same_octave, f'{name}_classes', params)})"
+    ]
+
+    # The octaves where a class can be kept : the classes are less than an octave apart
+    max_semitones = 0
+    while kept((max_semitones + 1) / 2.0):
+        max_semitones += 1
+
+    span = (max_semitones + 11) // 12
+    for idx, offset in enumerate(range(-span, span + 1)):
+        offset_classes = sorted(class_ for class_, semitone in SEMITONE_CLASSES.items() if kept(abs(semitone + 12 * offset - query_semitone) / 2.0))
+        conditions.append(
+            f"({name}.octave = {make_literal(octave + offset, f'{name}_octave_{idx}', params)} AND {name}.class IN {make_literal(offset_classes, f'{name}_classes_{idx}', params)})"
+        )
 
-def create_match_clause(query):
+    return '(' + ' OR '.join(conditions) + ')'
+
+def make_chord_condition(chord, pitch_distance, idx, alpha, allow_transposition, params=None):
     '''
-    Create the MATCH clause for the compiled query.
+    Return the condition on the other notes of the chord of the event `e{idx}` : a single set membership test on the
+    sorted pitches of the event (`Event.pitches`), instead of one Fact per note of the chord.
+
+    Each note of the chord should be in the event, within the pitch distance (in half tones, at the alpha cut
+    `degree_computation.chord_degree >= alpha`). With transposition, the chord is relative to the note of the event.
+
+    - chord               : the other notes of the chord, in half tones (see `utils.calculate_chord_pitches`) ;
+    - pitch_distance      : the pitch distance ;
+    - idx                 : the index of the event ;
+    - alpha               : the alpha cut ;
+    - allow_transposition : if the query allows transposition ;
+    - params              : if given, the values are passed as parameters and stored in this dict (see `make_literal`).
+    '''
+
+    chord = make_literal(chord, f'e{idx}_chord', params)
+    reference = f" - f{idx}.halfTonesFromA4" if allow_transposition else ''
+
+    if pitch_distance == 0:
+        pitch = f"(x + f{idx}.halfTonesFromA4)" if allow_transposition else "x"
+        return f"ALL(x IN {chord} WHERE {pitch} IN e{idx}.pitches)"
+
+    tolerance = make_literal(2 * pitch_distance * (1 - alpha), 'chord_tolerance', params)
+    return f"ALL(x IN {chord} WHERE ANY(y IN e{idx}.pitches WHERE abs(y{reference} - x) <= {tolerance}))"
 
-    - query        : the entire query string;
+def make_sequencing_condition(duration_gap, name_1, name_2, alpha, params=None):
+    sequencing_condition = f"{name_1}.end >= {name_2}.start - {make_literal(duration_gap * (1 - alpha), 'sequencing_gap', params)}"
+    return sequencing_condition
+
+def make_interval_gram_anchor(fuzzy_query, catalog, params=None):
     '''
+    Create the pattern that anchors a transposition query on the rarest interval n-gram of the query
+    (see `interval_ngrams`), e.g `(ig:IntervalGram {k: 3, key: '1.0,1.0,-0.5'})-[:STARTS]->(e1)`.
 
-    _, _, duration_gap, _, allow_transposition, _, _, _ = extract_fuzzy_parameters(query)
+    Only exact transposition queries (pitch distance 0, no duration gap, no rest) are anchored, as the gram keys are
+    exact interval values of consecutive events. Returns '' if the query can not be anchored.
 
-    if duration_gap > 0:
-        # Proceed to create the MATCH clause as per current code
+    - fuzzy_query : the parsed fuzzy query ;
+    - catalog     : the n-gram catalog (see `interval_ngrams.get_catalog`), or None if the index has not been built ;
+    - params      : if given, the key of the gram is passed as the parameter `$anchor_key` (see `make_literal`).
+    '''
 
-        #---Extract notes from the query
-        notes = extract_notes_from_query_dict(query)
+    if catalog is None or not fuzzy_query.allow_transposition or fuzzy_query.pitch_distance != 0 or fuzzy_query.duration_gap > 0:
+        return ''
 
-        #---Init
-        event_nodes = [node for node, attrs in notes.items() if attrs.get('type') == 'Event']
+    if any(attrs.get('type') == 'rest' for attrs in fuzzy_query.nodes.values()):
+        return ''
 
-        nb_events = len(event_nodes)
+    anchor = rarest_interval_gram(calculate_intervals_dict(fuzzy_query.nodes), catalog)
+    if anchor is None:
+        return ''
 
-        # To give a higher bound to the number of intermediate notes, we suppose the shortest possible note has a duration of 0.0625
-        max_intermediate_nodes = max(int(duration_gap / 0.0625), 1)
+    offset, key = anchor
+    return f"(ig:IntervalGram {{k: {catalog['k']}, key: {make_literal(key, 'anchor_key', params)}}})-[:STARTS]->({fuzzy_query.events[offset]})"
 
-        # Create a simplified path without intervals
-        event_path = f'-[:NEXT*1..{max_intermediate_nodes + 1}]->'.join([f'({node}:Event)' for node in event_nodes])
+def create_match_clause(query, interval_gram_catalog=None, params=None):
+    '''
+    Create the MATCH clause for the compiled query.
 
-        #---Extract the rest of the MATCH clause (non-event chain patterns) from the input query
-        original_match_clause = extract_match_clause(query)
+    - query                 : the fuzzy query (string or `FuzzyQuery`);
+    - interval_gram_catalog : the interval n-gram catalog. If given, exact transposition queries are anchored
+                              on their rarest n-gram (see `make_interval_gram_anchor`) ;
+    - params                : if given, the key of the n-gram is passed as a parameter and stored in this dict.
+    '''
 
-        # Remove fuzzy parameters definitions (if any)
-        # Find the position of the first '(' after MATCH
-        match_start = original_match_clause.find('MATCH')
-        first_paren = original_match_clause.find('(', match_start)
-        if first_paren == -1:
-            raise ValueError('No node patterns found in MATCH clause')
+    fuzzy_query = parse_fuzzy_query(query)
 
-        # Extract the body of the MATCH clause
-        match_body = original_match_clause[first_paren:].strip()
+    if fuzzy_query.duration_gap > 0:
+        #---Init
+        event_nodes = fuzzy_query.events
 
-        # Split the MATCH clause into individual patterns separated by commas
-        patterns = [p.strip() for p in re.split(r',\s*\n?', match_body) if p.strip()]
-        # Now filter out the event chain patterns
-        # Assume event chain patterns involve only event nodes connected via :NEXT relationships
+        # To give a higher bound to the number of intermediate notes, we suppose the shortest possible note has a duration of 0.0625
+        max_intermediate_nodes = max(int(fuzzy_query.duration_gap / 0.0625), 1)
 
-        # Build a set of event node names
-        event_node_names = set(event_nodes)
+        # Create a simplified path without intervals
+        event_path = f'-[:NEXT*1..{max_intermediate_nodes + 1}]->'.join([f'({node}:Event)' for node in event_nodes])
 
-        # Define a function to check if a pattern is part of the event chain
+        # A pattern is part of the event chain if all its nodes are event nodes (start with 'e')
         def is_event_chain_pattern(pattern):
-            # Find all nodes in the pattern
-            nodes = re.findall(r'\(\s*(\w+)(?::[^\)]*)?\s*\)', pattern)
-            # Check if all nodes are event nodes (start with 'e')
-            for node in nodes:
-                if not node.startswith('e'):
-                    return False
-            # All nodes are event nodes
-            return True
-
-        # Replace the event chain patterns with event_path
+            return all(node.variable.startswith('e') for node in pattern.nodes)
+
+        # Replace the event chain patterns with event_path, keep the other patterns (collection filter, facts, ...)
         simplified_connections = [
-            event_path if is_event_chain_pattern(p) else p for p in patterns
+            event_path if is_event_chain_pattern(pattern) else pattern.text for pattern in fuzzy_query.patterns
         ]
 
         # Reconstruct the simplified connections as a string
@@ -217,21 +330,11 @@ def create_match_clause(query):
         return match_clause
     else:
         # duration_gap <= 0
-        # Extract the MATCH clause from the query
-        match_clause = extract_match_clause(query)
-
-        # Remove fuzzy parameters definitions (everything between MATCH and the first '(')
-        # Find the position of the first '(' after MATCH
-        match_start = match_clause.find('MATCH')
-        first_paren = match_clause.find('(', match_start)
-        if first_paren == -1:
-            raise ValueError('No node patterns found in MATCH clause')
-
-        # Extract the cleaned MATCH clause
-        match_clause_body = match_clause[first_paren:].strip()
+        # The MATCH clause without the fuzzy parameters definitions
+        match_clause_body = fuzzy_query.match_body
 
         # Additional step: when allow_transposition is True, ensure all [:NEXT] relationships are named
-        if allow_transposition:
+        if fuzzy_query.allow_transposition:
             # Initialize a relationship index
             rel_index = 0
 
@@ -248,7 +351,11 @@ def create_match_clause(query):
             # Replace unnamed [:NEXT] relationships with named ones
             match_clause_body = re.sub(pattern, replace_unnamed_next, match_clause_body)
 
-        # Reconstruct the match_clause
+        # Reconstruct the match_clause, starting with the n-gram anchor if any
+        anchor = make_interval_gram_anchor(fuzzy_query, interval_gram_catalog, params)
+        if anchor:
+            match_clause_body = anchor + ',\n' + match_clause_body
+
         match_clause = 'MATCH\n' + match_clause_body
 
         return match_clause
@@ -277,140 +384,112 @@ def create_with_clause_interval(nb_events, duration_gap):
 
     return with_clause
 
-def create_where_clause(query, allow_transposition, pitch_distance, duration_factor, duration_gap, alpha = 0.0):
-    # Step 1: Extract the WHERE clause from the query
-    try:
-        where_clause = extract_where_clause(query)
-        has_where_clause = True
-    except ValueError as e:
-        # No WHERE clause found
-        where_clause = ''
-        has_where_clause = False
+def make_preexisting_condition(condition, params=None):
+    '''
+    Return the text of a condition of the fuzzy WHERE clause. With `params`, the value of a `var.attribute = value`
+    condition (e.g `tp.collection = 'col 1'`) is passed as the parameter `$var_attribute`.
+
+    - condition : the `Condition` ;
+    - params    : the dict collecting the parameters of the query, or None to keep the condition as it is.
+    '''
+
+    if params is None or condition.operator != '=':
+        return condition.text
+
+    # The parser has already unquoted the value : a string is only a literal if it was quoted (not e.g `x.a = b`)
+    value = condition.value
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        return condition.text
+    if isinstance(value, str) and not condition.text.rstrip().endswith(("'", '"')):
+        return condition.text
 
-    # Extract attributes associated with membership functions
-    attributes_with_membership_functions = extract_attributes_with_membership_functions(query)
+    return f"{condition.variable}.{condition.attribute} = {make_literal(value, f'{condition.variable}_{condition.attribute}', params)}"
+
+def create_where_clause(query, allow_transposition, pitch_distance, duration_factor, duration_gap, alpha = 0.0, params=None):
+    '''
+    Create the WHERE clause for the compiled query.
+
+    - query  : the fuzzy query (string or `FuzzyQuery`) ;
+    - params : if given, the values of the conditions are passed as parameters and stored in this dict (see `make_literal`).
+    '''
+
+    fuzzy_query = parse_fuzzy_query(query)
+
+    # Step 1: Keep the conditions of the fuzzy WHERE clause (and the properties of the MATCH clause)
+    membership_function_names = list(fuzzy_query.membership_functions.keys())
 
     # Step 2: Remove conditions that specify specific attribute values or membership functions
-    if has_where_clause:
-        # Remove the 'WHERE' keyword
-        where_conditions_str = where_clause[len('WHERE'):].strip()
-
-        # Split conditions using 'AND' or 'OR', keeping the operators
-        tokens = re.split(r'(\bAND\b)', where_conditions_str, flags=re.IGNORECASE)
-        # Build a list of conditions with their preceding operators
-        conditions_with_operators = []
-        i = 0
-        while i < len(tokens):
-            token = tokens[i].strip()
-            if i == 0:
-                # First condition (no preceding operator)
-                condition = token
-                conditions_with_operators.append((None, condition))
-                i += 1
-            else:
-                # Operator and condition
-                operator = token
-                condition = tokens[i + 1].strip() if i + 1 < len(tokens) else ''
-                conditions_with_operators.append((operator, condition))
-                i += 2
-
-        # List to hold filtered conditions
-        filtered_conditions = []
-        for idx, (operator, condition) in enumerate(conditions_with_operators):
-            # Check if the condition matches the pattern to remove
-            match = re.match(
-                r"\b\w+\.(class|octave|dur|interval)\s*=\s*[^\s]+",
-                condition,
-                re.IGNORECASE
-            )
-            if match:
-                # Condition matches; decide whether to remove adjacent operator
-                condition_ends_with_paren = condition.endswith(')')
-                is_last_condition = idx == len(conditions_with_operators) - 1
-
-                if not condition_ends_with_paren and not is_last_condition:
-                    # Remove next operator (operator of the next condition)
-                    if idx + 1 < len(conditions_with_operators):
-                        next_operator, next_condition = conditions_with_operators[idx + 1]
-                        conditions_with_operators[idx + 1] = (None, next_condition)
-                else:
-                    # Remove previous operator (current operator)
-                    pass  # Operator is already excluded when we skip adding this condition
-                # Do not add this condition to filtered_conditions
-            else:
-                # Condition does not match; keep it
-                filtered_conditions.append((operator, condition))
-
-        membership_function_names = [membership_function_name for node_name, attribute_name, membership_function_name in attributes_with_membership_functions]
-
-        # Reconstruct the WHERE clause
-        if filtered_conditions:
-            # Build the conditions string
-            conditions = []
-            for operator, condition in filtered_conditions:
-                # Filter out membership function condition in the where clause
-                if isinstance(condition, str) and " IS " in condition:
-                    _, y = map(str.strip, condition.split(" IS ", 1))
-                    if y not in membership_function_names:
-                        conditions.append(condition)
-                else:
-                    conditions.append(condition)
-            preexisting_where_clause = ' AND '.join(conditions)
-        else:
-            # No conditions left after filtering
-            preexisting_where_clause = ''
-    else:
-        preexisting_where_clause = ''
+    conditions = []
+    for condition in fuzzy_query.conditions:
+        # Attribute values of the notes are replaced by the fuzzy conditions created below
+        if condition.operator == '=' and condition.attribute.lower() in ('class', 'octave', 'dur', 'interval'):
+            continue
+
+        # Membership function conditions are replaced by their support interval
+        if condition.operator == 'IS' and condition.value in membership_function_names:
+            continue
 
-    # Step 3: Extract notes and make conditions for each note
-    notes_dict = extract_notes_from_query_dict(query)
+        conditions.append(make_preexisting_condition(condition, params))
+
+    preexisting_where_clause = ' AND '.join(conditions)
+
+    # Step 3: Make conditions for each note
+    notes_dict = fuzzy_query.nodes
 
     where_clauses = []
     if allow_transposition:
         intervals = calculate_intervals_dict(notes_dict)
     # Extract Fact nodes (notes with durations)
     f_nodes = [node for node, attrs in notes_dict.items() if attrs.get('type') == 'Fact']
+    chords = calculate_chord_pitches(fuzzy_query)
 
     for idx, f_node in enumerate(f_nodes):
         attrs = notes_dict[f_node]
         duration = attrs.get('dur')
         if duration is not None:
-            duration_condition = make_duration_condition(duration_factor, duration, f_node, alpha, attrs.get('dots'))
+            duration_condition = make_duration_condition(duration_factor, duration, f_node, alpha, attrs.get('dots'), params)
             if duration_condition:
                 where_clauses.append(duration_condition)
         
         if allow_transposition:
             if idx < len(f_nodes) - 1:
-                interval_condition = make_interval_condition(intervals[idx], duration_gap, pitch_distance, idx, alpha)
+                interval_condition = make_interval_condition(intervals[idx], duration_gap, pitch_distance, idx, alpha, params)
                 if interval_condition:
                     where_clauses.append(interval_condition)
         else:
-            duration_condition = make_pitch_condition(pitch_distance, attrs.get('class'), attrs.get('octave'), f_node, alpha)
+            duration_condition = make_pitch_condition(pitch_distance, attrs.get('class'), attrs.get('octave'), f_node, alpha, params)
             if duration_condition:
                 where_clauses.append(duration_condition)
+
+            pitch_degree_condition = make_pitch_degree_condition(pitch_distance, attrs.get('class'), attrs.get('octave'), f_node, alpha, params)
+            if pitch_degree_condition:
+                where_clauses.append(pitch_degree_condition)
+
+        if idx in chords:
+            where_clauses.append(make_chord_condition(chords[idx], pitch_distance, idx, alpha, allow_transposition, params))
         
         if duration_gap > 0:
             if idx < len(f_nodes) - 1:
-                sequencing_condition = make_sequencing_condition(duration_gap, f'e{idx}', f'e{idx+1}', alpha)
+                sequencing_condition = make_sequencing_condition(duration_gap, f'e{idx}', f'e{idx+1}', alpha, params)
                 if sequencing_condition:
                     where_clauses.append(sequencing_condition)
 
     # Step 4: makes conditions for membership functions
-    # Extract support intervals of the membership functions
-    support_intervals = extract_membership_function_support_intervals(query)
+    # Support intervals of the membership functions
+    support_intervals = fuzzy_query.support_intervals
 
     # For each attribute associated with a membership function, add a condition to ensure the attribute is within the support interval
-    for node_name, attribute_name, membership_function_name in attributes_with_membership_functions:
+    for node_name, attribute_name, membership_function_name in fuzzy_query.attributes_with_membership_functions:
         # Get the support interval for the membership function
         min_value, max_value = support_intervals[membership_function_name]
 
         # Add condition for minimum value if it's greater than negative infinity
         if min_value != float('-inf'):
-            where_clauses.append(f"{node_name}.{attribute_name} >= {min_value}")
+            where_clauses.append(f"{node_name}.{attribute_name} >= {make_literal(min_value, f'{node_name}_{attribute_name}_{membership_function_name}_min', params)}")
 
         # Add condition for maximum value if it's less than positive infinity
         if max_value != float('inf'):
-            where_clauses.append(f"{node_name}.{attribute_name} <= {max_value}")
+            where_clauses.append(f"{node_name}.{attribute_name} <= {make_literal(max_value, f'{node_name}_{attribute_name}_{membership_function_name}_max', params)}")
 
     if preexisting_where_clause:
         preexisting_where_clause = preexisting_where_clause + ' AND\n'
@@ -422,7 +501,8 @@ def create_return_clause(query, notes_dict, duration_gap=0., intervals=False):
     Create the RETURN clause for the compiled query.
 
     Parameters:
-        - notes_dict   : dictionary of nodes and their attributes, as returned by `extract_notes_from_query`.
+        - query        : the fuzzy query (string or `FuzzyQuery`).
+        - notes_dict   : dictionary of nodes and their attributes, as returned by `extract_notes_from_query` (or `FuzzyQuery.nodes`).
         - duration_gap : the duration gap. Used only when `intervals` is True.
         - intervals    : indicates if the return clause is for a query that allows transposition or contour match.
                          If so, it will also add `interval_{idx}` to the clause.
@@ -430,6 +510,8 @@ def create_return_clause(query, notes_dict, duration_gap=0., intervals=False):
     The function uses the actual names of the nodes in the RETURN clause but keeps the aliases (e.g., `AS pitch_0`) consistent with the indexing for processing.
     '''
 
+    fuzzy_query = parse_fuzzy_query(query)
+
     # Extract event nodes and fact nodes from the notes dictionary
     event_nodes = [node_name for node_name, attrs in notes_dict.items() if attrs.get('type') == 'Event']
     fact_nodes = [node_name for node_name, attrs in notes_dict.items() if attrs.get('type') == 'Fact']
@@ -448,6 +530,10 @@ def create_return_clause(query, notes_dict, duration_gap=0., intervals=False):
             f"{event_node_name}.id AS id_{idx}"
         ])
 
+        # The pitches of a chord (and the note they are relative to, see `make_chord_condition`)
+        if event_node_name in fuzzy_query.chords:
+            return_clauses.extend([f"{event_node_name}.pitches AS chord_{idx}", f"f{idx}.halfTonesFromA4 AS half_tones_{idx}"])
+
         if intervals and idx < len(event_nodes) - 1:
             if duration_gap > 0:
                 return_clauses.append(f"toFloat(f{idx + 1}.halfTonesFromA4 - f{idx}.halfTonesFromA4)/2 AS interval_{idx}")
@@ -470,8 +556,8 @@ def create_return_clause(query, notes_dict, duration_gap=0., intervals=False):
         f"{last_event_node_name}.end AS end"
     ])
 
-    # Extract attributes associated with membership functions
-    attributes_with_membership_functions = extract_attributes_with_membership_functions(query)
+    # Attributes associated with membership functions
+    attributes_with_membership_functions = fuzzy_query.attributes_with_membership_functions
 
     # Collect existing return items to prevent duplicates
     existing_return_items = set(return_clauses)
@@ -489,27 +575,311 @@ def create_return_clause(query, notes_dict, duration_gap=0., intervals=False):
 
     return return_clause
 
-def reformulate_fuzzy_query(query):
+#------Ranking in the database (degrees as Cypher expressions)
+# Semitone distance from C of each note class that `degree_computation.note_distance_in_tones` accepts (after `convert_note_to_sharp`)
+SEMITONES_FROM_C = {'c': 0, 'c#': 1, 'd': 2, 'd#': 3, 'e': 4, 'f': 5, 'f#': 6, 'g': 7, 'g#': 8, 'a': 9, 'a#': 10, 'b': 11}
+
+# Semitone distance from C of each class of a Fact (e.g 'db' or 'cs'), the other classes having no pitch (e.g 'r')
+SEMITONE_CLASSES = {
+    letter + accidental: SEMITONES_FROM_C[convert_note_to_sharp(letter + accidental)]
+    for letter in 'abcdefg' for accidental in ('', '#', 's', 'b', 'f')
+    if convert_note_to_sharp(letter + accidental) in SEMITONES_FROM_C
+}
+
+def make_max_zero_expression(expression):
+    '''Cypher equivalent of `max(expression, 0.0)`.'''
+
+    return f"CASE WHEN {expression} > 0.0 THEN {expression} ELSE 0.0 END"
+
+def make_min_expression(expressions):
+    '''Cypher equivalent of `min(expressions)` (non empty list of Cypher expressions).'''
+
+    if len(expressions) == 1:
+        return expressions[0]
+
+    return f"reduce(m = {expressions[0]}, d IN [{', '.join(expressions[1:])}] | CASE WHEN d < m THEN d ELSE m END)"
+
+def make_semitone_expression(name):
+    '''Cypher expression of the semitone distance from C of the class of the Fact `name` (null if unknown).'''
+
+    cases = ' '.join(f"WHEN '{class_}' THEN {semitone}" for class_, semitone in SEMITONE_CLASSES.items())
+    return f"CASE {name}.class {cases} END"
+
+def make_pitch_distance_expression(pitch, octave, name, semitone, params=None):
+    '''
+    Cypher expression of `degree_computation.note_distance_in_tones` between the query note (`pitch`, `octave`)
+    and the note of the Fact `name` (its `class` and `octave`, as returned in `pitch_i` and `octave_i`).
+
+    - pitch    : the class of the query note (or None) ;
+    - octave   : the octave of the query note (or None) ;
+    - name     : the variable name of the Fact ;
+    - semitone : the variable holding the semitone distance from C of the Fact (see `make_semitone_expression`) ;
+    - params   : if given, the values are passed as parameters and stored in this dict (see `make_literal`).
     '''
-    Converts a fuzzy query to a cypher one.
 
-    - query : the fuzzy query.
+    # One of the classes is unspecified : only check for octave distance
+    if octave is None:
+        octave_distance = "0.0"
+    else:
+        octave_distance = f"CASE WHEN {name}.octave IS NULL THEN 0.0 ELSE 6.0 * abs({name}.octave - {make_literal(octave, f'{name}_octave', params)}) END"
+
+    if pitch is None:
+        distance = octave_distance
+    else:
+        query_semitone = SEMITONES_FROM_C[convert_note_to_sharp(pitch)]
+
+        # An unspecified octave is set to the other one
+        same_octave_distance = f"abs({semitone} - {make_literal(query_semitone, f'{name}_semitone', params)}) / 2.0"
+        if octave is None:
+            distance = f"CASE WHEN {semitone} IS NULL THEN {octave_distance} ELSE {same_octave_distance} END"
+        else:
+            distance = (
+                f"CASE WHEN {semitone} IS NULL THEN {octave_distance} "
+                f"WHEN {name}.octave IS NULL THEN {same_octave_distance} "
+                f"ELSE abs({semitone} + 12 * {name}.octave - {make_literal(query_semitone + 12 * octave, f'{name}_absolute_semitone', params)}) / 2.0 END"
+            )
+
+    return distance
+
+def make_pitch_degree_expression(pitch_distance, pitch, octave, name, semitone, params=None):
+    '''
+    Cypher expression of `degree_computation.pitch_degree` between the query note (`pitch`, `octave`)
+    and the note of the Fact `name` (see `make_pitch_distance_expression`).
+
+    - pitch_distance : the pitch distance (not 0) ;
+    - pitch          : the class of the query note (or None) ;
+    - octave         : the octave of the query note (or None) ;
+    - name           : the variable name of the Fact ;
+    - semitone       : the variable holding the semitone distance from C of the Fact (see `make_semitone_expression`) ;
+    - params         : if given, the values are passed as parameters and stored in this dict (see `make_literal`).
+    '''
+
+    distance = make_pitch_distance_expression(pitch, octave, name, semitone, params)
+
+    return make_max_zero_expression(f"(1 - (({distance}) / {make_literal(float(pitch_distance), 'pitch_distance', params)}))")
+
+def make_interval_degree_expression(interval, interval_expression, pitch_distance, idx=0, params=None):
+    '''
+    Cypher expression of `degree_computation.pitch_degree_with_intervals`.
+
+    - interval            : the interval of the query (None or 'NA' if unspecified) ;
+    - interval_expression : the Cypher expression of the interval in the data (as returned in `interval_i`) ;
+    - pitch_distance      : the pitch distance (not 0) ;
+    - idx                 : the index of the interval (name of the parameter) ;
+    - params              : if given, the values are passed as parameters and stored in this dict (see `make_literal`).
+    '''
+
+    if interval is None or interval == 'NA':
+        return "1.0"
+
+    interval = make_literal(float(interval), f'n{idx}_interval', params)
+    degree = make_max_zero_expression(f"(1 - (abs({interval} - {interval_expression}) / {make_literal(float(pitch_distance), 'pitch_distance', params)}))")
+    return f"CASE WHEN {interval_expression} IS NULL THEN 1.0 ELSE {degree} END"
+
+def make_duration_degree_expression(duration_factor, duration, dotted, event_name, params=None):
+    '''
+    Cypher expression of `degree_computation.duration_degree_with_multiplicative_factor`, for the Event `event_name`.
+
+    - duration_factor : the duration factor (not 1) ;
+    - duration        : the `dur` of the query note (1 for whole, 2 for half, ...), or None ;
+    - dotted          : if the query note is dotted ;
+    - event_name      : the variable name of the Event ;
+    - params          : if given, the values are passed as parameters and stored in this dict (see `make_literal`).
+    '''
+
+    if duration is None:
+        return "1.0"
+
+    expected_duration = 1.0/duration
+    if dotted:
+        expected_duration = expected_duration * 1.5
+
+    a = -1 / (duration_factor - 1)
+    b = 1 - a
+
+    expected_duration = make_literal(expected_duration, f'{event_name}_expected_duration', params)
+    ratio = f"{expected_duration} / {event_name}.duration"
+    inverse_ratio = f"{event_name}.duration / {expected_duration}"
+    z = f"CASE WHEN {ratio} >= {inverse_ratio} THEN {ratio} ELSE {inverse_ratio} END"
+
+    return f"({make_literal(a, 'duration_slope', params)} * ({z}) + {make_literal(b, 'duration_intercept', params)})"
+
+def make_sequencing_degree_expression(duration_gap, name_1, name_2, params=None):
+    '''Cypher expression of `degree_computation.sequencing_degree` between the Events `name_1` and `name_2`.'''
+
+    return make_max_zero_expression(f"(1 - (({name_2}.start - {name_1}.end) / {make_literal(float(duration_gap), 'duration_gap', params)}))")
+
+def make_membership_degree_expression(membership_function, expression, params=None):
+    '''
+    Cypher expression of a membership function (`DEFINETRAP`, `DEFINEASC` or `DEFINEDESC`) applied to `expression`.
+
+    - membership_function : the `MembershipFunction` ;
+    - expression          : the Cypher expression of the attribute (e.g 'n0.interval') ;
+    - params              : if given, the breakpoints are passed as parameters and stored in this dict (see `make_literal`).
+    '''
+
+    def literal(value, suffix):
+        return make_literal(value, f'{membership_function.name}_{suffix}', params)
+
+    x = expression
+    if membership_function.kind == 'TRAP':
+        a_minus, a, b, b_plus = (float(p) for p in membership_function.parameters)
+        return (
+            f"CASE WHEN {x} < {literal(a_minus, 'a_minus')} OR {x} > {literal(b_plus, 'b_plus')} THEN 0.0 "
+            f"WHEN {x} < {literal(a, 'a')} THEN ({x} - {literal(a_minus, 'a_minus')}) / {literal(a - a_minus, 'rise')} "
+            f"WHEN {x} <= {literal(b, 'b')} THEN 1.0 "
+            f"ELSE ({literal(b_plus, 'b_plus')} - {x}) / {literal(b_plus - b, 'fall')} END"
+        )
+
+    gamma, delta = (float(p) for p in membership_function.parameters)
+    if membership_function.kind == 'ASC':
+        return (
+            f"CASE WHEN {x} < {literal(gamma, 'gamma')} THEN 0.0 "
+            f"WHEN {x} <= {literal(delta, 'delta')} THEN ({x} - {literal(gamma, 'gamma')}) / {literal(delta - gamma, 'width')} ELSE 1.0 END"
+        )
+    else:
+        return (
+            f"CASE WHEN {x} < {literal(gamma, 'gamma')} THEN 1.0 "
+            f"WHEN {x} <= {literal(delta, 'delta')} THEN ({literal(delta, 'delta')} - {x}) / {literal(delta - gamma, 'width')} ELSE 0.0 END"
+        )
+
+def make_chord_degree_expression(chord, pitch_distance, idx, allow_transposition, params=None):
+    '''
+    Cypher expression of `degree_computation.chord_degree` for the event `e{idx}` (see `make_chord_condition`).
+
+    - chord               : the other notes of the chord, in half tones (see `utils.calculate_chord_pitches`) ;
+    - pitch_distance      : the pitch distance (not 0) ;
+    - idx                 : the index of the event ;
+    - allow_transposition : if the query allows transposition ;
+    - params              : if given, the values are passed as parameters and stored in this dict (see `make_literal`).
+    '''
+
+    chord = make_literal(chord, f'e{idx}_chord', params)
+    gap = f"abs(y{' - f' + str(idx) + '.halfTonesFromA4' if allow_transposition else ''} - x)"
+
+    # Distance of the farthest note of the chord to its closest pitch in the event
+    nearest = f"reduce(nearest = 1000.0, y IN e{idx}.pitches | CASE WHEN {gap} < nearest THEN {gap} ELSE nearest END)"
+    distance = f"reduce(farthest = 0.0, near IN [x IN {chord} | {nearest}] | CASE WHEN near > farthest THEN near ELSE farthest END)"
+
+    return make_max_zero_expression(f"(1 - (({distance}) / 2.0) / {make_literal(float(pitch_distance), 'pitch_distance', params)})")
+
+def create_degree_expression(query, params=None):
+    '''
+    Create the Cypher expression of the degree of a match, i.e the min aggregation of the degrees of `process_results`
+    (pitch, duration and sequencing degrees, or membership degrees for a contour query).
+
+    Returns `(definitions, degree)`, where `definitions` is the list of the `expression AS variable` needed by
+    `degree` (the semitones of the Facts), to be computed in a previous WITH clause.
+
+    - query  : the fuzzy query (string or `FuzzyQuery`) ;
+    - params : if given, the values are passed as parameters and stored in this dict (see `make_literal`).
     '''
 
-    query = move_attribute_values_to_where_clause(query)
+    fuzzy_query = parse_fuzzy_query(query)
+    pitch_distance, duration_factor, duration_gap, _, allow_transposition, contour_match, _, _ = fuzzy_query.parameters()
+
+    event_nodes = fuzzy_query.events
+    fact_nodes = list(fuzzy_query.facts.keys())
+
+    if contour_match and not allow_transposition:
+        # Each note starts with a degree of 1.0, decreased by the membership degrees associated with it
+        degrees = ["1.0"]
+        for node_name, attribute_name, membership_function_name in fuzzy_query.attributes_with_membership_functions:
+            idx = int(node_name[1:]) + 1 if node_name.startswith('n') else int(node_name[1:])
+            if 0 <= idx < len(fact_nodes):
+                degrees.append(make_membership_degree_expression(fuzzy_query.membership_functions[membership_function_name], f"{node_name}.{attribute_name}", params))
+
+        return [], make_min_expression(degrees)
+
+    if allow_transposition:
+        intervals = calculate_intervals_dict(fuzzy_query.nodes)
+    chords = calculate_chord_pitches(fuzzy_query)
+
+    definitions = []
+    degrees = []
+    for idx, fact_node in enumerate(fact_nodes):
+        attrs = fuzzy_query.facts[fact_node]
+        note_degrees = []
+
+        if pitch_distance != 0:
+            if not allow_transposition:
+                semitone = f"semitone_{idx}"
+                if attrs.get('class') is not None:
+                    definitions.append(f"{make_semitone_expression(fact_node)} AS {semitone}")
+                note_degrees.append(make_pitch_degree_expression(pitch_distance, attrs.get('class'), attrs.get('octave'), fact_node, semitone, params))
+            elif idx == 0:
+                # When considering transposition, the first note always has its pitch degree equal to 1.0
+                note_degrees.append("1.0")
+            else:
+                if duration_gap > 0:
+                    interval_expression = f"toFloat(f{idx}.halfTonesFromA4 - f{idx - 1}.halfTonesFromA4)/2"
+                else:
+                    interval_expression = f"n{idx - 1}.interval"
+                note_degrees.append(make_interval_degree_expression(intervals[idx - 1], interval_expression, pitch_distance, idx - 1, params))
+
+            if idx in chords:
+                note_degrees.append(make_chord_degree_expression(chords[idx], pitch_distance, idx, allow_transposition, params))
+
+        if duration_factor != 1:
+            note_degrees.append(make_duration_degree_expression(duration_factor, attrs.get('dur'), attrs.get('dots'), event_nodes[idx], params))
+
+        if duration_gap != 0:
+            if idx == 0:
+                note_degrees.append("1.0")
+            else:
+                note_degrees.append(make_sequencing_degree_expression(duration_gap, event_nodes[idx - 1], event_nodes[idx], params))
+
+        # No relevant degree : the degree of the note is 1.0
+        degrees.extend(note_degrees if note_degrees else ["1.0"])
+
+    return definitions, make_min_expression(degrees)
+
+def create_ranking_clauses(query, alpha, params=None):
+    '''
+    Create the clauses that rank the matches in the database :
+        - the WITH clauses computing the `degree` of each match, followed by the alpha cut ;
+        - the end of the query, that keeps the `$k` best matches.
+
+    - query  : the fuzzy query (string or `FuzzyQuery`) ;
+    - alpha  : the alpha cut ;
+    - params : if given, the values are passed as parameters and stored in this dict (see `make_literal`).
+    '''
+
+    definitions, degree = create_degree_expression(query, params)
+
+    with_clause = ''
+    if definitions:
+        with_clause += '\nWITH *,\n ' + ',\n '.join(definitions)
+    with_clause += f"\nWITH *, {degree} AS degree\nWHERE degree >= {make_literal(alpha, 'alpha', params)}"
+
+    order_clause = "\nORDER BY degree DESC\nLIMIT $k"
+
+    return with_clause, order_clause
+
+def reformulate_fuzzy_query(query, ranking=False, params=None):
+    '''
+    Converts a fuzzy query to a cypher one.
+
+    - query   : the fuzzy query (string, or `FuzzyQuery` if it has already been parsed) ;
+    - ranking : if True, the degrees are computed in the database, and the query returns (with a `degree` column)
+                only the `$k` best matches that pass the alpha cut, ordered by degree ;
+    - params  : if given, the values of the query (notes, durations, bounds, ...) are not written in the query but
+                replaced by parameters (`$e0_duration`, ...), whose values are stored in this dict.
+                See `reformulate_fuzzy_query_parameterized`.
+    '''
 
     #------Init
-    #---Extract the parameters from the augmented query
-    pitch_distance, duration_factor, duration_gap, alpha, allow_transposition, contour_match, fixed_notes, collections = extract_fuzzy_parameters(query)
+    #---Parse the query once (parameters, nodes, conditions, membership functions)
+    fuzzy_query = parse_fuzzy_query(query)
+    pitch_distance, duration_factor, duration_gap, alpha, allow_transposition, contour_match, fixed_notes, collections = fuzzy_query.parameters()
 
-    #---Extract notes using the new function
-    notes = extract_notes_from_query_dict(query)
+    notes = fuzzy_query.nodes
 
-    nb_events = len([note_name for note_name, note in notes.items() if note['type'] == 'Event'])
-    nb_facts = len([note_name for note_name, note in notes.items() if note['type'] == 'Fact'])
+    nb_events = len(fuzzy_query.events)
+    nb_facts = len(fuzzy_query.facts)
     
     #------Construct the MATCH clause
-    match_clause = create_match_clause(query)
+    match_clause = create_match_clause(fuzzy_query, get_catalog(), params)
 
     #------Construct WITH clause
     if allow_transposition:
@@ -518,19 +888,52 @@ def reformulate_fuzzy_query(query):
         with_clause = ''
 
     #------Construct the WHERE clause
-    where_clause = create_where_clause(query, allow_transposition, pitch_distance, duration_factor, duration_gap, alpha)
+    where_clause = create_where_clause(fuzzy_query, allow_transposition, pitch_distance, duration_factor, duration_gap, alpha, params)
 
     # #------Construct the collection filter
     # col_clause = create_collection_clause(collections, nb_events, nb_facts, duration_gap, allow_transposition or contour_match)
 
     #------Construct the return clause
-    return_clause = create_return_clause(query, notes, duration_gap, allow_transposition)
+    return_clause = create_return_clause(fuzzy_query, notes, duration_gap, allow_transposition)
     
+    # ------Construct the ranking clauses
+    if ranking:
+        ranking_clause, order_clause = create_ranking_clauses(fuzzy_query, alpha, params)
+        return_clause += ', degree'
+    else:
+        ranking_clause, order_clause = '', ''
+
     # ------Construct the final query
     # new_query = match_clause + '\n' + with_clause + where_clause + col_clause + '\n' + return_clause
-    new_query = match_clause + with_clause + where_clause + return_clause
+    new_query = match_clause + with_clause + where_clause + ranking_clause + return_clause + order_clause
     return new_query.strip('\n')
 
+def reformulate_fuzzy_query_parameterized(query, ranking=False):
+    '''
+    Converts a fuzzy query to a parameterized cypher one.
+
+    The parameter names only depend on the position of the values in the query (e.g `$e0_duration`, `$f1_class`),
+    so fuzzy queries of the same shape (same number of notes, same fuzzy parameters set) give the same cypher text,
+    and neo4j reuses the cached plan of the first one instead of planning each query again.
+
+    Returns the couple `(crisp_query, params)`, to be run with `run_query(driver, crisp_query, params)`
+    (with `params['k']` to set when `ranking` is True). The collection is a parameter too, so the queries on
+    different collections share a plan (`python -m doctest reformulation_V3.py` checks it) :
+
+    >>> from utils import create_query_from_list_of_notes
+    >>> crisp_query, params = reformulate_fuzzy_query_parameterized(create_query_from_list_of_notes([[('c', 5), 4]], 0, 1, 0, 0, False, False, 'Bach Chorales'))
+    >>> 'tp.collection = $tp_collection' in crisp_query, params['tp_collection']
+    (True, 'Bach Chorales')
+
+    - query   : the fuzzy query (string, or `FuzzyQuery` if it has already been parsed) ;
+    - ranking : see `reformulate_fuzzy_query`.
+    '''
+
+    params = {}
+    crisp_query = reformulate_fuzzy_query(query, ranking, params)
+
+    return crisp_query, params
+
 if __name__ == '__main__':
     with open('fuzzy_query.cypher', 'r') as file:
         fuzzy_query = file.read()
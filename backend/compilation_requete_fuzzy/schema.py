@@ -0,0 +1,171 @@
+'''
+Indexes needed by the compiled queries, and `EXPLAIN` report of how the queries are anchored.
+
+The crisp queries (see `reformulation_V3`) filter on :
+    - `Fact.frequency` (fuzzy pitch), `Fact.class` / `octave` / `accid` (exact pitch), `Fact.duration` / `dots` ;
+    - `Event.duration`, `Event.start` / `end`, `Event.source` (e.g `utils.get_notes_from_source_and_time_interval`) ;
+    - `Event.source` / `id` (the hits of the on-disk indexes, see `interval_index.anchor_query`) ;
+    - `NEXT.interval` (transposition) ;
+    - `Score.source` / `collection`, `TopRhythmic.collection` (collection filter) ;
+    - `IntervalGram.k` / `key` (anchor of the transposition queries, see `interval_ngrams`).
+
+`create_indexes` creates a range index for each of them (`CREATE INDEX ... IF NOT EXISTS`, so it can be run at each startup).
+`explain_queries` runs `EXPLAIN` on representative compiled queries and reports, for each of them, the operators
+used to find the first nodes of the pattern (index seek or label scan).
+'''
+
+from neo4j_connection import run_query
+from reformulation_V3 import reformulate_fuzzy_query_parameterized
+from utils import create_query_from_list_of_notes, create_query_from_contour
+
+# (index name, label or relationship type, properties, is on a relationship)
+INDEXES = [
+    ('fact_frequency', 'Fact', ('frequency',), False),
+    ('fact_class_octave', 'Fact', ('class', 'octave'), False),
+    ('fact_octave', 'Fact', ('octave',), False),
+    ('fact_accid', 'Fact', ('accid',), False),
+    ('fact_duration', 'Fact', ('duration',), False),
+    ('fact_dots', 'Fact', ('dots',), False),
+    ('event_duration', 'Event', ('duration',), False),
+    ('event_source_start', 'Event', ('source', 'start'), False),
+    ('event_source_id', 'Event', ('source', 'id'), False),
+    ('event_start', 'Event', ('start',), False),
+    ('event_end', 'Event', ('end',), False),
+    ('next_interval', 'NEXT', ('interval',), True),
+    ('score_source', 'Score', ('source',), False),
+    ('score_collection', 'Score', ('collection',), False),
+    ('top_rhythmic_collection', 'TopRhythmic', ('collection',), False),
+    ('interval_gram_key', 'IntervalGram', ('k', 'key'), False),
+]
+
+# Representative fuzzy queries : (name, fuzzy query). Each one gives a different shape of crisp query.
+NOTES = [[('c', 5), 4], [('d', 5), 8, 1], [('e', 5), 8]]
+REPRESENTATIVE_QUERIES = [
+    ('exact', create_query_from_list_of_notes(NOTES, 0.0, 1.0, 0.0, 0.0, False, False)),
+    ('pitch distance', create_query_from_list_of_notes(NOTES, 1.0, 1.0, 0.0, 0.0, False, False)),
+    ('duration factor', create_query_from_list_of_notes(NOTES, 0.0, 2.0, 0.0, 0.0, False, False)),
+    ('duration gap', create_query_from_list_of_notes(NOTES, 0.0, 1.0, 0.25, 0.0, False, False)),
+    ('transposition', create_query_from_list_of_notes(NOTES, 1.0, 1.0, 0.0, 0.0, True, False)),
+    ('exact transposition', create_query_from_list_of_notes(NOTES + [[('c', 5), 4], [('g', 5), 4]], 0.0, 1.0, 0.0, 0.0, True, False)),
+    ('collection', create_query_from_list_of_notes(NOTES, 0.0, 1.0, 0.0, 0.0, False, False, 'collection')),
+    ('contour', create_query_from_contour('*URd')),
+]
+
+# Operators that produce the first rows of a plan (leaves), with the kind of access
+SEEK, SCAN, LABEL_SCAN, ALL_NODES_SCAN, OTHER = 'index seek', 'index scan', 'label scan', 'all nodes scan', 'other'
+
+def index_statements():
+    '''Return the `CREATE INDEX ... IF NOT EXISTS` statements of `INDEXES`.'''
+
+    statements = []
+    for name, label, properties, relationship in INDEXES:
+        on = ', '.join(f'x.{p}' for p in properties)
+        pattern = f'()-[x:{label}]-()' if relationship else f'(x:{label})'
+        statements.append(f'CREATE INDEX {name} IF NOT EXISTS FOR {pattern} ON ({on})')
+
+    return statements
+
+def create_indexes(driver, wait=300):
+    '''
+    Create the indexes of `INDEXES` (the existing ones are left untouched), then wait for them to be online.
+
+    Returns the list of `(name, state)` of the indexes of `INDEXES`, as given by `SHOW INDEXES`.
+
+    - driver : the neo4j driver ;
+    - wait   : the maximum number of seconds to wait for the indexes to be populated. With 0, do not wait.
+    '''
+
+    for statement in index_statements():
+        run_query(driver, statement)
+
+    if wait > 0:
+        run_query(driver, 'CALL db.awaitIndexes($timeout)', {'timeout': wait})
+
+    names = [name for name, _, _, _ in INDEXES]
+    records = run_query(driver, 'SHOW INDEXES YIELD name, state WHERE name IN $names RETURN name, state', {'names': names})
+    states = {record['name']: record['state'] for record in records}
+
+    return [(name, states.get(name, 'MISSING')) for name in names]
+
+def classify_operator(operator):
+    '''
+    Return the kind of access of a leaf operator of a plan (`SEEK`, `SCAN`, `LABEL_SCAN`, `ALL_NODES_SCAN` or `OTHER`).
+
+    - operator : the operator type, e.g 'NodeIndexSeekByRange@neo4j'.
+    '''
+
+    operator = operator.split('@')[0]
+
+    if 'IndexSeek' in operator or 'IndexContainsScan' in operator or 'IndexEndsWithScan' in operator:
+        return SEEK
+    if 'IndexScan' in operator:
+        return SCAN
+    if operator in ('NodeByLabelScan', 'UnionNodeByLabelsScan', 'IntersectionNodeByLabelsScan') or 'TypeScan' in operator:
+        return LABEL_SCAN
+    if operator in ('AllNodesScan', 'DirectedAllRelationshipsScan', 'UndirectedAllRelationshipsScan'):
+        return ALL_NODES_SCAN
+
+    return OTHER
+
+def plan_anchors(plan):
+    '''
+    Return the leaves of an `EXPLAIN` plan (the operators that find the first nodes of the pattern),
+    as a list of `(operator, identifiers, details, kind)`.
+
+    - plan : the plan, as given by `ResultSummary.plan` (dict with `operatorType`, `identifiers`, `args`, `children`).
+    '''
+
+    if not plan.get('children'):
+        operator = plan['operatorType'].split('@')[0]
+        details = plan.get('args', {}).get('Details', '')
+        return [(operator, plan.get('identifiers', []), details, classify_operator(operator))]
+
+    anchors = []
+    for child in plan['children']:
+        anchors += plan_anchors(child)
+
+    return anchors
+
+def explain_query(driver, crisp_query, parameters=None):
+    '''
+    Run `EXPLAIN` on `crisp_query` (nothing is executed) and return its anchors (see `plan_anchors`).
+
+    - driver      : the neo4j driver ;
+    - crisp_query : the cypher query ;
+    - parameters  : the parameters of the query (see `reformulate_fuzzy_query_parameterized`).
+    '''
+
+    with driver.session() as session:
+        summary = session.run('EXPLAIN ' + crisp_query, parameters).consume()
+
+    return plan_anchors(summary.plan)
+
+def explain_queries(driver, queries=REPRESENTATIVE_QUERIES):
+    '''
+    Compile (with parameters, as the API does) and explain each fuzzy query of `queries`.
+
+    Returns a list of `(name, anchors)`, with `anchors` as returned by `explain_query`.
+
+    - driver  : the neo4j driver ;
+    - queries : a list of `(name, fuzzy query)`.
+    '''
+
+    return [(name, explain_query(driver, *reformulate_fuzzy_query_parameterized(query))) for name, query in queries]
+
+def format_explain_report(report):
+    '''
+    Format the result of `explain_queries` as text : one block per query, one line per anchor,
+    and whether every anchor of the query uses an index.
+
+    - report : the result of `explain_queries`.
+    '''
+
+    lines = []
+    for name, anchors in report:
+        indexed = all(kind in (SEEK, SCAN) for _, _, _, kind in anchors)
+        lines.append(f'{name} : {"index" if indexed else "NO INDEX"}')
+
+        for operator, identifiers, details, kind in anchors:
+            lines.append(f'    {kind:<14} {operator} ({", ".join(identifiers)}) {details}'.rstrip())
+
+    return '\n'.join(lines)
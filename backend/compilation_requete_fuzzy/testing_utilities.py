@@ -283,6 +283,20 @@ def execute_queries_v2(test_name, sequences, p_value, f_value, g_value, pattern_
         print(f"Running command: {command}")
         subprocess.run(command, shell=True)
 
+def execute_queries_batch(test_name, sequences, p_value, f_value, g_value, pattern_length, batch_size=100):
+    """
+    Comme `execute_queries_v2`, mais en une seule commande `main_parser.py batch` : les requêtes de même forme
+    sont envoyées ensemble (une instruction `UNWIND $batch` par paquet de `batch_size` requêtes).
+    """
+    dir_path = f"./test_queries/{test_name}/"
+    query_files = [
+        f"{dir_path}{test_name}_{p_value}_{f_value}_{g_value}_len_{pattern_length}_seq_{seq_index + 1}.cypher"
+        for seq_index in range(len(sequences))
+    ]
+    command = f"python3 main_parser.py batch -b {batch_size} {' '.join(query_files)}  > /dev/null"
+    print(f"Running command: {command}")
+    subprocess.run(command, shell=True)
+
 def process_and_generate_latex(test_name, param_values, max_length, nb_sequences):
     """
     Génère du code LaTeX pour les temps totaux et les temps d'exécution à partir d'un fichier CSV.
@@ -1,10 +1,148 @@
+from ast import literal_eval # safer than eval
+
 from neo4j_connection import connect_to_neo4j, run_query
 from generate_audio import generate_mp3
-from degree_computation import convert_note_to_sharp
+from degree_computation import convert_note_to_sharp, half_tones_from_a4
 from note import Note
 from refactor import move_attribute_values_to_where_clause
 
 
+def check_notes_input_format(notes_input: str|list) -> list[list[tuple[str|None, int|None] | int|float|None]]:
+    '''
+    Ensure that `notes_input` is in the correct format (see below for a description of the format).
+    If not, raise a ValueError.
+
+    Used by `main_parser.py write` and by the fuzzy search of the API (`fuzzy_search.build_fuzzy_query`), so that
+    both accept the same notes.
+
+    Input :
+        - notes_input : the user input (a string), or the already parsed list.
+
+    Output :
+        - a list of (char, int, int)  if the format is right ;
+        - ValueError                  otherwise.
+
+    Description for the format of `notes` :
+        `notes` should be a list of `note`s.
+        A `note` is a list of the following format : `[(class_1, octave_1), ..., (class_n, octave_n), duration, dots (optional)]`
+
+        For example : `[[('c', 5), 4, 0], [('b', 4), 8, 1], [('b', 4), 8], [('a', 4), ('d', 5), 16, 2]]`.
+
+        duration is in the following format: 1 for whole, 2 for half, ...
+        dots is an optional integer representing the number of dots.
+    '''
+
+    #---Init (functions to test each part)
+    def check_class(class_: str|None) -> bool:
+        '''Return True iff `class_` is in correct format.'''
+
+        return (
+            class_ == None
+            or (
+                isinstance(class_, str)
+                and (
+                    len(class_) == 1 or
+                    (len(class_) == 2 and class_[1] in '#sbf')
+                )
+                and
+                class_[0] in 'abcdefgr'
+            )
+        )
+
+    def check_octave(octave: int|None) -> bool:
+        '''Return True iff `octave` is in correct format.'''
+
+        return isinstance(octave, (int, type(None)))
+
+    def check_duration(duration: int|float|None) -> bool:
+        '''Return True iff `duration` is in correct format.'''
+
+        return isinstance(duration, (int, float, type(None)))
+
+    def check_dots(dots: int|None) -> bool:
+        '''Return True iff `dots` is in correct format.'''
+
+        return isinstance(dots, (int, type(None))) and (dots is None or dots >= 0)
+
+    format_notes = "Notes format: list of [(class, octave), duration, dots]: [[(class, octave), ..., duration, dots], ...]. E.g `[[(\'c\', 5), 4, 0], [(\'b\', 4), 8, 1], [(\'b\', 4), 8], [(\'a\', 4), (\'d\', 5), 16, 2]]`. It is possible to use \"None\" to ignore a criteria. Dots are optinal, with default value of 0."
+
+    #---Convert string to list
+    if isinstance(notes_input, str):
+        try:
+            notes = literal_eval(notes_input.replace("\\", ""))
+        except (ValueError, SyntaxError):
+            raise ValueError(f'"{notes_input}" is not a valid list of notes\n' + format_notes)
+    else:
+        notes = notes_input
+
+    #---Check
+    if type(notes) != list or len(notes) == 0:
+        raise ValueError(f'notes should be a non empty list, but "{notes}" found !\n' + format_notes)
+
+    for i, note_or_chord in enumerate(notes):
+        #-Check type of the current note/chord (e.g [('c', 5), 8])
+        if type(note_or_chord) != list:
+            raise ValueError(f'error with note {i}: should be a a list, but "{note_or_chord}", of type {type(note_or_chord)} found !\n' + format_notes)
+
+        #-Check the length of the current note/chord (e.g [('c', 5), 8])
+        if len(note_or_chord) < 2:
+            raise ValueError(f'error with note {i}: there should be at least two elements in the list, for example `[(\'c\', 5), 4]`, but "{note_or_chord}", with length {len(note_or_chord)} found !\n' + format_notes)
+
+        #-Split the notes of the chord (the tuples) from the duration and the dots
+        nb_pitches = 0
+        while nb_pitches < len(note_or_chord) and type(note_or_chord[nb_pitches]) == tuple:
+            nb_pitches += 1
+
+        rhythm = note_or_chord[nb_pitches:]
+        if nb_pitches == 0 or len(rhythm) not in (1, 2):
+            raise ValueError(f'error with note {i}: "{note_or_chord}" should be one or more (class, octave) tuples, followed by the duration and the dots (optional)\n' + format_notes)
+
+        #-Check the duration
+        duration = rhythm[0]
+        if not check_duration(duration):
+            raise ValueError(f'error with note {i}: "{note_or_chord}": "{duration}" (duration) is not a float (or None)\n' + format_notes)
+
+        #-Check the dots (if provided)
+        if len(rhythm) > 1:
+            dots = rhythm[1]
+            if not check_dots(dots):
+                raise ValueError(f'error with note {i}: "{note_or_chord}": "{dots}" (dots) is not a non-negative integer or None\n' + format_notes)
+        else:
+            dots = 0  # Default to 0 if dots are not provided
+
+        #-Check each note
+        for j, note in enumerate(note_or_chord[:nb_pitches]):
+            #-Check length of note tuple
+            if len(note) != 2:
+                raise ValueError(f'error with note {i}, element {j}: note tuple should have 2 elements (class, octave), but {len(note)} found !\n' + format_notes)
+
+            #-Check note class
+            if not check_class(note[0]):
+                raise ValueError(f'error with note {i}, element {j}: "{note}": "{note[0]}" is not a note class.\n' + format_notes)
+
+            #-Check note octave
+            if not check_octave(note[1]):
+                raise ValueError(f'error with note {i}, element {j}: "{note}": "{note[1]}" (octave) is not an int, or a float, or None.\n' + format_notes)
+
+            #-The notes of a chord are compared by pitch (see `utils.calculate_chord_pitches`)
+            if nb_pitches > 1 and (note[0] in (None, 'r') or note[1] is None):
+                raise ValueError(f'error with note {i}, element {j}: "{note}": the notes of a chord should have a class (not a rest) and an octave.\n' + format_notes)
+
+    return notes
+
+def check_pitch_distance(pitch_distance: float) -> float:
+    '''
+    Ensure that `pitch_distance` (in tones) is a positive integer or half an integer, and return it.
+    If not, raise a ValueError.
+    '''
+
+    is_int = lambda x : int(x) == x
+
+    if pitch_distance < 0 or not (is_int(pitch_distance) or is_int(2 * pitch_distance)):
+        raise ValueError(f'"{pitch_distance}" is not a positive integer or half an integer')
+
+    return pitch_distance
+
 def create_query_from_list_of_notes(notes, pitch_distance, duration_factor, duration_gap, alpha, allow_transposition, contour_match, collection=None):
     '''
     Create a fuzzy query.
@@ -29,6 +167,9 @@ def create_query_from_list_of_notes(notes, pitch_distance, duration_factor, dura
         For example : `[[('c', 5), 4], [('b', 4), 8], [('b', 4), 8], [('a', 4), ('d', 5), 16]]`.
 
         duration is in the following format: 1 for whole, 2 for half, ...
+
+        The first note of a chord is the note of its event (`f{i}`), the other ones (`f{i}_1`, ...) are only checked to
+        be in the event (see `FuzzyQuery.chords` and `reformulation_V3.make_chord_condition`).
     '''
 
     match_clause = 'MATCH\n'
@@ -42,26 +183,24 @@ def create_query_from_list_of_notes(notes, pitch_distance, duration_factor, dura
 
     events = []
     facts = []
-    fact_nb = 0
     for i, note_or_chord in enumerate(notes):
-        if len(note_or_chord) > 2:
-            note = Note(note_or_chord[0][0], note_or_chord[0][1], note_or_chord[1], note_or_chord[2])
-        else:
-            note = Note(note_or_chord[0][0], note_or_chord[0][1], note_or_chord[1])
-        duration = note.duration
+        # The pitches (one per note of the chord) are followed by the duration and the dots
+        pitches = [element for element in note_or_chord if isinstance(element, tuple)]
+        note = Note(pitches[0][0], pitches[0][1], *note_or_chord[len(pitches):])
 
         event = '(e{}:Event)'.format(i)
 
-        # for note in note_or_chord[:-1]:
-        #     class_, octave = note
+        for k, (class_, octave) in enumerate(pitches):
+            name = f'f{i}' if k == 0 else f'f{i}_{k}'
 
-        if note.dots:
-            fact = "(e{})--(f{}:Fact{{class:'{}', octave:{}, dur:{}, dots:{} }})".format(i, fact_nb, note.pitch, note.octave, note.dur, note.dots)
-        else:
-            fact = "(e{})--(f{}:Fact{{class:'{}', octave:{}, dur:{} }})".format(i, fact_nb, note.pitch, note.octave, note.dur)
+            if k > 0:
+                fact = "(e{})--({}:Fact{{class:'{}', octave:{} }})".format(i, name, class_, octave)
+            elif note.dots:
+                fact = "(e{})--({}:Fact{{class:'{}', octave:{}, dur:{}, dots:{} }})".format(i, name, note.pitch, note.octave, note.dur, note.dots)
+            else:
+                fact = "(e{})--({}:Fact{{class:'{}', octave:{}, dur:{} }})".format(i, name, note.pitch, note.octave, note.dur)
 
-        facts.append(fact)
-        fact_nb += 1
+            facts.append(fact)
 
         events.append(event)
     
@@ -392,6 +531,44 @@ def calculate_intervals_dict(notes_dict: dict) -> list[float]:
 
     return intervals
 
+def calculate_half_tones_from_a4(note, octave):
+    '''Return the number of half tones from A4 of a note (as `Fact.halfTonesFromA4`, e.g 3 for C5 and 2 for Cb5).'''
+
+    # Accidentals as in MEI ('s' or 'f')
+    accidental = {'#': 's', 's': 's', 'b': 'f', 'f': 'f'}.get(note[1:])
+
+    return half_tones_from_a4(note[0], octave, accidental)
+
+def calculate_chord_pitches(fuzzy_query) -> dict[int, list[int]]:
+    '''
+    Compute the pitches of the other notes of the chords of a query (see `FuzzyQuery.chords`), in half tones : from A4
+    (as `Fact.halfTonesFromA4`), or from the note of the event if the query allows transposition.
+
+    - fuzzy_query : the parsed fuzzy query.
+
+    Output: a dict `{event index: sorted list of half tones}`, for the events with a chord.
+    '''
+
+    facts = list(fuzzy_query.facts.values())
+
+    chords = {}
+    for idx, event in enumerate(fuzzy_query.events):
+        if event not in fuzzy_query.chords:
+            continue
+
+        notes = fuzzy_query.chords[event] + [facts[idx]]
+        if any(attrs.get('class') in (None, 'r') or attrs.get('octave') is None for attrs in notes):
+            raise ValueError(f'The notes of the chord of {event} should have a class and an octave')
+
+        pitches = [calculate_half_tones_from_a4(attrs['class'], attrs['octave']) for attrs in notes[:-1]]
+        if fuzzy_query.allow_transposition:
+            reference = calculate_half_tones_from_a4(facts[idx]['class'], facts[idx]['octave'])
+            pitches = [pitch - reference for pitch in pitches]
+
+        chords[idx] = sorted(pitches)
+
+    return chords
+
 if __name__ == "__main__":
     contour = 'URRUdD'
     query = create_query_from_contour(contour)
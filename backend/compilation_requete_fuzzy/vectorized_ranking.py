@@ -0,0 +1,321 @@
+from operator import itemgetter
+
+import numpy as np
+
+from fuzzy_query import parse_fuzzy_query
+from degree_computation import convert_note_to_sharp
+from utils import calculate_intervals_dict, calculate_chord_pitches
+
+# Semitone distance from C for each note class (same as `degree_computation.note_distance_in_tones`)
+SEMITONES_FROM_C = {
+    'c': 0, 'c#': 1, 'd': 2, 'd#': 3, 'e': 4, 'f': 5, 'f#': 6,
+    'g': 7, 'g#': 8, 'a': 9, 'a#': 10, 'b': 11
+}
+
+def float_column(values):
+    '''
+    Convert a column of numbers (that can contain None) to a float64 array, None being converted to NaN.
+
+    - values : the values of a column (list or object array).
+    '''
+
+    values = np.asarray(values, dtype=object)
+    try:
+        return values.astype(np.float64)
+    except TypeError:
+        return np.where(values == None, np.nan, values).astype(np.float64)
+
+def semitone_column(pitches):
+    '''
+    Convert a column of note classes (e.g 'c', 'db', 'f#', None) to an array of semitones from C.
+
+    The conversion of the class is done once per distinct class.
+    None and the classes without a pitch (e.g 'r' for rests) are converted to NaN, i.e treated as unspecified.
+
+    - pitches : the note classes of a column (list or object array).
+    '''
+
+    semitones = {p: np.nan if p is None else SEMITONES_FROM_C.get(convert_note_to_sharp(p), np.nan) for p in set(pitches)}
+
+    return np.fromiter(map(semitones.__getitem__, pitches), dtype=np.float64, count=len(pitches))
+
+def extract_columns(records, nb_notes, intervals=False, chords=()):
+    '''
+    Pull the columns needed to rank the results into numpy arrays.
+
+    Returns a dict with, for each column name, a 2D array of shape (nb_notes, nb_records) :
+        `semitone`, `octave`, `duration`, `start`, `end` (and `interval`, of shape (nb_notes - 1, nb_records), if `intervals`).
+    With `chords`, `chord` is the dict `{idx: (pitches, half_tones)}` of the `chord_idx` (object array of lists) and
+    `half_tones_idx` columns.
+
+    - records   : the list of records of the crisp query ;
+    - nb_notes  : the number of notes of the query ;
+    - intervals : if True, also extract the `interval_i` columns (transposition) ;
+    - chords    : the indexes of the events with a chord in the query.
+    '''
+
+    names = ['pitch', 'octave', 'duration', 'start', 'end']
+    keys = [f'{name}_{i}' for name in names for i in range(nb_notes)]
+    if intervals:
+        keys += [f'interval_{i}' for i in range(nb_notes - 1)]
+    keys += [f'half_tones_{i}' for i in chords]
+
+    # One pass on the records to get all the values, then one (nb_records, nb_keys) table
+    table = np.empty((len(records), len(keys)), dtype=object)
+    table[:] = list(map(itemgetter(*keys), records))
+
+    def column(name, i):
+        return table[:, keys.index(f'{name}_{i}')]
+
+    columns = {
+        'semitone': np.array([semitone_column(column('pitch', i)) for i in range(nb_notes)]),
+        'octave': np.array([float_column(column('octave', i)) for i in range(nb_notes)]),
+        'duration': np.array([float_column(column('duration', i)) for i in range(nb_notes)]),
+        'start': np.array([float_column(column('start', i)) for i in range(nb_notes)]),
+        'end': np.array([float_column(column('end', i)) for i in range(nb_notes)])
+    }
+
+    if intervals:
+        columns['interval'] = np.array([float_column(column('interval', i)) for i in range(nb_notes - 1)]).reshape(nb_notes - 1, len(records))
+
+    if chords:
+        # The lists of pitches are kept as objects (they would be broadcast by an assignment to the table)
+        columns['chord'] = {
+            i: (np.fromiter((record[f'chord_{i}'] for record in records), dtype=object, count=len(records)), float_column(column('half_tones', i)))
+            for i in chords
+        }
+
+    return columns
+
+def distance_in_tones(query_class, query_octave, semitones, octaves):
+    '''
+    Vectorized `degree_computation.note_distance_in_tones`, between one query note and a column of notes.
+
+    - query_class  : the class of the query note (or None, or a class without a pitch) ;
+    - query_octave : the octave of the query note (or None) ;
+    - semitones    : array of the semitones from C of the notes (NaN if the class is unspecified) ;
+    - octaves      : array of the octaves of the notes (NaN if unspecified).
+    '''
+
+    missing_octave = np.isnan(octaves)
+
+    # Distance when one of the classes is unspecified : only check for octave distance
+    if query_octave is None:
+        octave_distance = np.zeros_like(octaves)
+    else:
+        octave_distance = np.where(missing_octave, 0.0, 12 * np.abs(octaves - query_octave) / 2)
+
+    # A query class without a pitch (e.g 'r' for a rest) is treated as unspecified, as in `semitone_column`
+    query_semitone = None if query_class is None else SEMITONES_FROM_C.get(convert_note_to_sharp(query_class))
+    if query_semitone is None:
+        return octave_distance
+
+    # Manages when octave is None
+    if query_octave is None:
+        # Both None : same octave (4). Only the data one is None : set it to the other.
+        octave1 = np.where(missing_octave, 4.0, octaves)
+    else:
+        octave1 = np.full_like(octaves, query_octave)
+    octave2 = np.where(missing_octave, octave1, octaves)
+
+    semitone1 = query_semitone + octave1 * 12
+    semitone2 = semitones + octave2 * 12
+
+    distance = np.abs(semitone2 - semitone1) / 2
+
+    return np.where(np.isnan(semitones), octave_distance, distance)
+
+def pitch_degrees(query_class, query_octave, semitones, octaves, pitch_gap):
+    '''Vectorized `degree_computation.pitch_degree`.'''
+
+    if pitch_gap == 0:
+        return np.ones_like(octaves)
+
+    d = 1 - (distance_in_tones(query_class, query_octave, semitones, octaves) / pitch_gap)
+    return np.maximum(d, 0.0)
+
+def pitch_degrees_with_intervals(query_interval, intervals, pitch_gap):
+    '''Vectorized `degree_computation.pitch_degree_with_intervals` (NaN intervals are unspecified ones).'''
+
+    if pitch_gap == 0 or query_interval is None:
+        return np.ones_like(intervals)
+
+    d = np.maximum(1 - (np.abs(query_interval - intervals) / pitch_gap), 0.0)
+    return np.where(np.isnan(intervals), 1.0, d)
+
+def chord_degrees(chord, pitches, references, pitch_gap):
+    '''
+    Vectorized `degree_computation.chord_degree` : the pitches of the events are flattened, so that the distance of
+    each note of the chord to the closest pitch of each event is a reduction per event.
+
+    - chord      : the other notes of the chord of the query, in half tones ;
+    - pitches    : the pitches of each event (object array of lists, or None) ;
+    - references : the pitch the chord is relative to, per event (0 without transposition) ;
+    - pitch_gap  : the pitch distance.
+    '''
+
+    if pitch_gap == 0:
+        return np.ones(len(pitches))
+
+    counts = np.fromiter((0 if p is None else len(p) for p in pitches), dtype=np.int64, count=len(pitches))
+    flat = np.fromiter((y for p in pitches if p is not None for y in p), dtype=np.float64, count=counts.sum())
+    flat -= np.repeat(references, counts)
+
+    # Events without pitches keep an infinite distance (degree 0)
+    distance = np.zeros(len(pitches))
+    for x in chord:
+        nearest = np.full(len(pitches), np.inf)
+        np.minimum.at(nearest, np.repeat(np.arange(len(pitches)), counts), np.abs(flat - x))
+        distance = np.maximum(distance, nearest)
+
+    return np.maximum(1 - ((distance / 2.0) / pitch_gap), 0.0)
+
+def duration_degrees(expected_duration, durations, factor):
+    '''Vectorized `degree_computation.duration_degree_with_multiplicative_factor`.'''
+
+    if factor == 1.0 or expected_duration is None:
+        return np.ones_like(durations)
+
+    a = -1 / (factor - 1)
+    b = 1 - a
+
+    z = np.maximum(expected_duration / durations, durations / expected_duration)
+    return a * z + b
+
+def sequencing_degrees(end_times1, start_times2, max_gap):
+    '''Vectorized `degree_computation.sequencing_degree`.'''
+
+    if max_gap == 0:
+        return np.ones_like(start_times2)
+
+    return np.maximum(1 - ((start_times2 - end_times1) / max_gap), 0.0)
+
+def compute_degrees(columns, query, allow_transposition=False, alpha=None):
+    '''
+    Compute the pitch, duration, sequencing and note degrees of every note of every record, and the sequence degrees.
+
+    Returns a dict of arrays : `pitch`, `duration`, `sequencing`, `note` (shape (nb_notes, nb_records)) and `sequence` (shape (nb_records,)).
+    The values are the same as the ones of the scalar path (`process_results.iter_scored_results_exact` and
+    `iter_scored_results_with_transpose`).
+
+    With `alpha`, the notes are scored one after the other, each one only for the records whose previous notes passed
+    the alpha cut (as the scalar path) : the degrees of the notes after the first note under alpha are left to NaN,
+    and so is the sequence degree of the record.
+
+    - columns             : the columns, as returned by `extract_columns` ;
+    - query               : the *fuzzy* query (string or `FuzzyQuery`) ;
+    - allow_transposition : if True, compute the pitch degrees on the intervals ;
+    - alpha               : if not None, the alpha cut.
+    '''
+
+    fuzzy_query = parse_fuzzy_query(query)
+    query_notes = fuzzy_query.facts
+    pitch_gap, duration_factor, sequencing_gap, _, _, _, _, _ = fuzzy_query.parameters()
+
+    if allow_transposition:
+        query_intervals = calculate_intervals_dict(query_notes)
+    chords = calculate_chord_pitches(fuzzy_query)
+
+    nb_notes = len(query_notes)
+    shape = columns['duration'].shape
+
+    pitch = np.full(shape, np.nan)
+    duration = np.full(shape, np.nan)
+    sequencing = np.ones(shape)
+    note = np.full(shape, np.nan)
+
+    # The records still scored (all of them without alpha cut)
+    rows = np.arange(shape[1]) if alpha else slice(None)
+
+    for idx in range(nb_notes):
+        query_note = query_notes[f'f{idx}']
+
+        if not allow_transposition:
+            pitch[idx, rows] = pitch_degrees(query_note['class'], query_note['octave'], columns['semitone'][idx, rows], columns['octave'][idx, rows], pitch_gap)
+        elif idx == 0:
+            # When considering transposition, the first note always has its pitch degree equal to 1.0
+            pitch[idx, rows] = 1.0
+        else:
+            pitch[idx, rows] = pitch_degrees_with_intervals(query_intervals[idx - 1], columns['interval'][idx - 1, rows], pitch_gap)
+
+        if idx in chords:
+            pitches, half_tones = columns['chord'][idx]
+            references = half_tones[rows] if allow_transposition else np.zeros(len(pitches))[rows]
+            pitch[idx, rows] = np.minimum(pitch[idx, rows], chord_degrees(chords[idx], pitches[rows], references, pitch_gap))
+
+        if query_note['dur'] is not None:
+            expected_duration = 1.0/query_note['dur']
+            if query_note.get('dots', None):
+                expected_duration = expected_duration * 1.5
+        else:
+            expected_duration = None
+        duration[idx, rows] = duration_degrees(expected_duration, columns['duration'][idx, rows], duration_factor)
+
+        if idx > 0:
+            sequencing[idx, rows] = sequencing_degrees(columns['end'][idx - 1, rows], columns['start'][idx, rows], sequencing_gap)
+
+        relevant_degrees = [degrees[idx, rows] for degrees, gap in [(pitch, pitch_gap), (duration, duration_factor-1), (sequencing, sequencing_gap)] if gap != 0]
+        note[idx, rows] = np.minimum.reduce(relevant_degrees) if len(relevant_degrees) > 0 else 1.0
+
+        # Alpha cut : the sequence degree is the min of the note degrees, the records under alpha are not scored anymore
+        if alpha:
+            rows = rows[note[idx, rows] >= alpha]
+
+    sequence = note.min(axis=0) if nb_notes > 0 else np.ones(shape[1:])
+
+    return {'pitch': pitch, 'duration': duration, 'sequencing': sequencing, 'note': note, 'sequence': sequence}
+
+def get_ordered_results_vectorized(result, query, top_k=None):
+    '''
+    Columnar version of `process_results.get_ordered_results` and `get_ordered_results_with_transpose`.
+
+    The degrees of all the records are computed with a few numpy operations (each note only for the records whose
+    previous notes passed the alpha cut), then the alpha cut and the sort are applied on the sequence degrees. The `Note`s and the details are only built for the kept sequences.
+    Returns the same list of `(source, start, end, sequence_degree, note_details)` as the scalar path.
+
+    Contour queries are not vectorized (the degrees come from the membership functions) : they use the scalar path.
+
+    - result : the result of the crisp query (materialized as a list if it is an iterator) ;
+    - query  : the *fuzzy* query (string or `FuzzyQuery`) ;
+    - top_k  : if not None, only return the `top_k` best sequences.
+    '''
+
+    # Imported here as process_results imports this module
+    from process_results import get_ordered_results_contours, record_to_note
+
+    fuzzy_query = parse_fuzzy_query(query)
+    allow_transposition = fuzzy_query.allow_transposition
+
+    if fuzzy_query.contour and not allow_transposition:
+        sequence_details = get_ordered_results_contours(result, fuzzy_query)
+        return sequence_details if top_k is None else sequence_details[:top_k]
+
+    records = result if isinstance(result, list) else list(result)
+    nb_notes = len(fuzzy_query.facts)
+
+    if len(records) == 0:
+        return []
+
+    columns = extract_columns(records, nb_notes, allow_transposition, list(calculate_chord_pitches(fuzzy_query)))
+    degrees = compute_degrees(columns, fuzzy_query, allow_transposition, fuzzy_query.alpha)
+
+    # Alpha cut, then stable sort by degree in descending order (same order as `list.sort(reverse=True)`)
+    kept = np.flatnonzero(degrees['sequence'] >= fuzzy_query.alpha)
+    kept = kept[np.argsort(-degrees['sequence'][kept], kind='stable')]
+    if top_k is not None:
+        kept = kept[:top_k]
+
+    # Only the kept sequences are converted back to python objects
+    pitch, duration, sequencing, note = (degrees[name][:, kept].T.tolist() for name in ('pitch', 'duration', 'sequencing', 'note'))
+    sequence = degrees['sequence'][kept].tolist()
+
+    sequence_details = []
+    for k, r in enumerate(kept.tolist()):
+        record = records[r]
+        note_details = [
+            (record_to_note(record, idx, idx), pitch[k][idx], duration[k][idx], sequencing[k][idx], note[k][idx])
+            for idx in range(nb_notes)
+        ]
+        sequence_details.append((record['source'], record['start'], record['end'], sequence[k], note_details))
+
+    return sequence_details
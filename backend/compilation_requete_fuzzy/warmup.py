@@ -0,0 +1,129 @@
+'''
+Warm-up of the neo4j plan cache for the common shapes of compiled queries.
+
+The compiled queries are parameterized (see `reformulation_V3.reformulate_fuzzy_query_parameterized`), so every
+fuzzy query of a given shape (number of notes, search mode, ...) has the same cypher text, and neo4j plans it only
+once. The first search of each shape still pays the planning time : `warm_up` compiles a representative query of
+each shape and runs `EXPLAIN` on it (nothing is executed), so that the plans are cached before the first searches.
+
+The shapes also depend on the details of the notes (accidentals, unspecified octaves, contour symbols, ...) :
+the representative queries use natural notes with an octave, which is the most common case.
+'''
+
+import time
+
+from neo4j.exceptions import AuthError, DriverError
+
+from reformulation_V3 import reformulate_fuzzy_query_parameterized
+from schema import explain_query
+from utils import create_query_from_list_of_notes, create_query_from_contour
+
+# Number of notes of the warmed up queries
+WARMUP_LENGTHS = range(3, 16)
+
+# Search modes : (pitch distance, duration factor, duration gap, allow transposition), or None for a contour query
+WARMUP_MODES = {
+    'plain': (0.0, 1.0, 0.0, False),
+    'transposition': (0.0, 1.0, 0.0, True),
+    'contour': None,
+    'gap': (0.0, 1.0, 0.25, False),
+}
+
+# Notes and contour symbols cycled through to build the representative queries
+SCALE = ['c', 'd', 'e', 'f', 'g', 'a', 'b']
+CONTOUR_SYMBOLS = ['u', 'd', 'R', 'U', 'D']
+
+# Value of `$k` for the ranking queries (the plan does not depend on it)
+WARMUP_TOP_K = 10
+
+def make_warmup_query(mode, length):
+    '''
+    Return the representative fuzzy query of `length` notes for the search mode `mode`.
+
+    - mode   : a key of `WARMUP_MODES` ;
+    - length : the number of notes (at least 2).
+    '''
+
+    if length < 2:
+        raise ValueError(f'The length of a query should be at least 2, but {length} was given')
+
+    if WARMUP_MODES[mode] is None:
+        return create_query_from_contour(''.join(CONTOUR_SYMBOLS[i % len(CONTOUR_SYMBOLS)] for i in range(length - 1)))
+
+    pitch_distance, duration_factor, duration_gap, allow_transposition = WARMUP_MODES[mode]
+    notes = [[(SCALE[i % len(SCALE)], 5), 8] for i in range(length)]
+
+    return create_query_from_list_of_notes(notes, pitch_distance, duration_factor, duration_gap, 0.0, allow_transposition, False)
+
+def warm_up(driver, lengths=WARMUP_LENGTHS, modes=tuple(WARMUP_MODES), ranking=False):
+    '''
+    Compile and `EXPLAIN` the representative query of each length and mode, to fill the plan cache of neo4j.
+
+    A query that fails is reported, and the others are still warmed up. If the database can not be reached,
+    the warm-up stops at the first query.
+
+    - driver  : the neo4j driver ;
+    - lengths : the numbers of notes ;
+    - modes   : the search modes (keys of `WARMUP_MODES`) ;
+    - ranking : if True, also warm up the ranking version of each query (see `reformulate_fuzzy_query`).
+
+    Returns a dict with the number of warmed up queries, the failures (list of `(name, error)`),
+    and the time spent compiling, explaining and in total (in ms).
+    '''
+
+    start = time.perf_counter()
+    compile_ms = explain_ms = 0.0
+    warmed, failures = 0, []
+
+    shapes = [(mode, length, rank) for mode in modes for length in lengths for rank in ((False, True) if ranking else (False,))]
+
+    for mode, length, rank in shapes:
+        name = f'{mode} {length}{" ranking" if rank else ""}'
+
+        try:
+            t0 = time.perf_counter()
+            crisp_query, params = reformulate_fuzzy_query_parameterized(make_warmup_query(mode, length), rank)
+            if rank:
+                params['k'] = WARMUP_TOP_K
+            t1 = time.perf_counter()
+            explain_query(driver, crisp_query, params)
+            t2 = time.perf_counter()
+        except (DriverError, AuthError) as e:
+            # Connection problem : the other queries would fail the same way (after the same timeout)
+            failures.append((name, f'{type(e).__name__}: {e}'))
+            break
+        except Exception as e:
+            failures.append((name, f'{type(e).__name__}: {e}'))
+            continue
+
+        compile_ms += (t1 - t0) * 1000
+        explain_ms += (t2 - t1) * 1000
+        warmed += 1
+
+    return {
+        'queries': warmed,
+        'shapes': len(shapes),
+        'failures': failures,
+        'compile_ms': compile_ms,
+        'explain_ms': explain_ms,
+        'elapsed_ms': (time.perf_counter() - start) * 1000
+    }
+
+def format_warmup_report(report):
+    '''
+    Format the result of `warm_up` as text.
+
+    - report : the result of `warm_up`.
+    '''
+
+    lines = [
+        f'{report["queries"]} / {report["shapes"]} plans warmed up in {report["elapsed_ms"]:.0f} ms '
+        f'(compile : {report["compile_ms"]:.0f} ms, EXPLAIN : {report["explain_ms"]:.0f} ms)'
+    ]
+
+    if report['failures']:
+        lines.append(f'{len(report["failures"])} failed :')
+        for name, error in report['failures']:
+            lines.append(f'    {name} : {error}')
+
+    return '\n'.join(lines)
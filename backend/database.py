@@ -1,25 +1,56 @@
 # database.py
 from neo4j import GraphDatabase
-import os
+from flask import g, has_app_context
+import atexit
 
-NEO4J_URI = "bolt://10.211.55.4:7687"
-NEO4J_USER = "neo4j"
-PASSWORD_FILE = ".database_password"
+from db_config import (
+    NEO4J_URI, NEO4J_USER, NEO4J_MAX_POOL_SIZE, NEO4J_ACQUISITION_TIMEOUT, NEO4J_CONNECTION_TIMEOUT,
+    NEO4J_LIVENESS_CHECK, NEO4J_MAX_CONNECTION_LIFETIME, PoolMetrics, read_password,
+)
 
-try:
-    with open(PASSWORD_FILE, "r") as f:
-        NEO4J_PASSWORD = f.read().strip()
-except Exception as e:
-    print(f"Erreur de lecture du fichier {PASSWORD_FILE}: {e}")
-    NEO4J_PASSWORD = "12345678"
+NEO4J_PASSWORD = read_password()
+
+# Initialisation du driver Neo4j : un seul driver (et donc un seul pool) pour toute la durée du process
+driver = GraphDatabase.driver(
+    NEO4J_URI,
+    auth=(NEO4J_USER, NEO4J_PASSWORD),
+    max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+    connection_acquisition_timeout=NEO4J_ACQUISITION_TIMEOUT,
+    connection_timeout=NEO4J_CONNECTION_TIMEOUT,
+    liveness_check_timeout=NEO4J_LIVENESS_CHECK,
+    max_connection_lifetime=NEO4J_MAX_CONNECTION_LIFETIME,
+)
+
+pool_metrics = PoolMetrics()
+pool_metrics.instrument(driver)
 
-# Initialisation du driver Neo4j
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
 
 def get_db():
-    """ Retourne une session Neo4j """
-    return driver.session()
+    """
+    Retourne la session Neo4j de la requête HTTP en cours (créée au premier appel, fermée par `close_db`).
+    Hors d'une requête Flask, retourne une nouvelle session (à fermer par l'appelant).
+    """
+    if not has_app_context():
+        return driver.session()
+
+    if "neo4j_session" not in g:
+        g.neo4j_session = driver.session()
+    return g.neo4j_session
+
+
+def close_db(exception=None):
+    """ Ferme la session de la requête en cours : la connexion retourne dans le pool, le driver reste ouvert """
+    session = g.pop("neo4j_session", None)
+    if session is not None:
+        session.close()
+
+
+def get_pool_metrics():
+    """ Occupation et compteurs du pool de connexions """
+    return pool_metrics.snapshot(driver)
+
 
-def close_db():
-    """ Ferme la connexion proprement """
+@atexit.register
+def close_driver():
+    """ Ferme le driver (et toutes les connexions du pool) à l'arrêt du process """
     driver.close()
@@ -0,0 +1,131 @@
+# db_config.py
+# Réglages de connexion à Neo4j, communs aux drivers synchrone (`database.py`) et asynchrone (`async_database.py`).
+# Module sans effet de bord : aucun driver n'est créé et le mot de passe n'est lu qu'à l'appel de `read_password`.
+import os
+import threading
+import time
+
+NEO4J_URI = os.environ.get("NEO4J_URI", "bolt://10.211.55.4:7687")
+NEO4J_USER = os.environ.get("NEO4J_USER", "neo4j")
+PASSWORD_FILE = ".database_password"
+
+# ⚙️ Réglages du pool de connexions (surchargeables par variables d'environnement)
+NEO4J_MAX_POOL_SIZE = int(os.environ.get("NEO4J_MAX_POOL_SIZE", 50))                         # connexions max par serveur
+NEO4J_ACQUISITION_TIMEOUT = float(os.environ.get("NEO4J_ACQUISITION_TIMEOUT", 30.0))          # attente max d'une connexion libre (s)
+NEO4J_CONNECTION_TIMEOUT = float(os.environ.get("NEO4J_CONNECTION_TIMEOUT", 15.0))            # ouverture d'une connexion (s)
+NEO4J_LIVENESS_CHECK = float(os.environ.get("NEO4J_LIVENESS_CHECK", 60.0))                    # connexion inactive depuis plus longtemps : vérifiée avant réutilisation (s)
+NEO4J_MAX_CONNECTION_LIFETIME = float(os.environ.get("NEO4J_MAX_CONNECTION_LIFETIME", 3600))  # durée de vie max d'une connexion (s)
+
+
+def read_password():
+    """ Lit le mot de passe de la base dans `PASSWORD_FILE` (mot de passe par défaut si le fichier est illisible) """
+    try:
+        with open(PASSWORD_FILE, "r") as f:
+            return f.read().strip()
+    except Exception as e:
+        print(f"Erreur de lecture du fichier {PASSWORD_FILE}: {e}")
+        return "12345678"
+
+
+class PoolMetrics:
+    """
+    📊 Compteurs du pool de connexions du driver : acquisitions (et temps d'attente), connexions créées, occupation.
+
+    Le driver neo4j n'expose pas ces valeurs : `instrument` enveloppe l'acquisition et l'ouverture
+    des connexions de son pool. Si le pool interne n'a pas la forme attendue, seuls les réglages sont renvoyés.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.instrumented = False
+        self.acquisitions = 0
+        self.acquisition_failures = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.connections_created = 0
+        self.connection_failures = 0
+
+    def instrument(self, driver):
+        """ Enveloppe `acquire` et `opener` du pool de `driver` pour compter les acquisitions et les créations """
+        pool = getattr(driver, "_pool", None)
+        if pool is None or not callable(getattr(pool, "acquire", None)) or not callable(getattr(pool, "opener", None)):
+            return
+
+        acquire, opener = pool.acquire, pool.opener
+
+        def timed_acquire(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                connection = acquire(*args, **kwargs)
+            except Exception:
+                self._record_acquisition((time.perf_counter() - start) * 1000, failed=True)
+                raise
+            self._record_acquisition((time.perf_counter() - start) * 1000)
+            return connection
+
+        def counted_opener(*args, **kwargs):
+            try:
+                connection = opener(*args, **kwargs)
+            except Exception:
+                with self._lock:
+                    self.connection_failures += 1
+                raise
+            with self._lock:
+                self.connections_created += 1
+            return connection
+
+        pool.acquire = timed_acquire
+        pool.opener = counted_opener
+        self.instrumented = True
+
+    def _record_acquisition(self, wait_ms, failed=False):
+        with self._lock:
+            if failed:
+                self.acquisition_failures += 1
+            else:
+                self.acquisitions += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    @staticmethod
+    def occupancy(pool):
+        """ Nombre de connexions (ouvertes / utilisées / libres) par serveur du pool """
+        servers = {}
+        for address, conns in pool.connections.items():
+            in_use = sum(1 for connection in conns if connection.in_use)
+            servers[str(address)] = {"size": len(conns), "in_use": in_use, "idle": len(conns) - in_use}
+        return servers
+
+    def snapshot(self, driver):
+        """ Retourne l'état du pool de `driver` (occupation par serveur) et les compteurs, sous forme de dict """
+        servers = {}
+        pool = getattr(driver, "_pool", None)
+        if getattr(pool, "connections", None) is not None:
+            with pool.lock:
+                servers = self.occupancy(pool)
+
+        return self._report(servers)
+
+    def _report(self, servers):
+        """ Assemble les réglages, l'occupation `servers` et les compteurs """
+        with self._lock:
+            attempts = self.acquisitions + self.acquisition_failures
+            return {
+                "config": {
+                    "max_pool_size": NEO4J_MAX_POOL_SIZE,
+                    "acquisition_timeout_s": NEO4J_ACQUISITION_TIMEOUT,
+                    "connection_timeout_s": NEO4J_CONNECTION_TIMEOUT,
+                    "liveness_check_s": NEO4J_LIVENESS_CHECK,
+                    "max_connection_lifetime_s": NEO4J_MAX_CONNECTION_LIFETIME,
+                },
+                "instrumented": self.instrumented,
+                "servers": servers,
+                "in_use": sum(server["in_use"] for server in servers.values()),
+                "idle": sum(server["idle"] for server in servers.values()),
+                "acquisitions": self.acquisitions,
+                "acquisition_failures": self.acquisition_failures,
+                "avg_wait_ms": self.total_wait_ms / attempts if attempts > 0 else 0.0,
+                "max_wait_ms": self.max_wait_ms,
+                "connections_created": self.connections_created,
+                "connection_failures": self.connection_failures,
+            }
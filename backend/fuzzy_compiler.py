@@ -0,0 +1,89 @@
+# fuzzy_compiler.py
+import os
+import sys
+import time
+
+# 📂 Le compilateur flou vit dans `compilation_requete_fuzzy/` et ses modules s'importent "à plat"
+FUZZY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "compilation_requete_fuzzy")
+if FUZZY_DIR not in sys.path:
+    sys.path.insert(0, FUZZY_DIR)
+
+# Import unique au démarrage du serveur : les requêtes suivantes réutilisent les modules déjà chargés
+from compile_cache import compile_cache
+from fuzzy_query import FuzzyQuery
+from schema import create_indexes
+from warmup import warm_up, format_warmup_report
+
+
+class FuzzyCompilationError(Exception):
+    """ Erreur levée quand une requête floue ne peut pas être compilée """
+
+    def __init__(self, message, error_type="CompilationError", compile_time_ms=None):
+        super().__init__(message)
+        self.message = message
+        self.error_type = error_type
+        self.compile_time_ms = compile_time_ms
+
+    def to_dict(self):
+        """ Représentation JSON de l'erreur """
+        return {"type": self.error_type, "message": self.message}
+
+
+def compile_fuzzy_query(query, ranking=False, parameterized=False):
+    """
+    Compile une requête floue (texte ou `FuzzyQuery` déjà analysée) en requête Cypher, dans le process courant.
+    Les requêtes déjà compilées sont servies par le cache LRU partagé (`compile_cache`).
+    Avec `ranking`, les degrés sont calculés par la base, qui ne renvoie que les `$k` meilleurs résultats.
+    Avec `parameterized`, les valeurs (notes, durées, bornes...) sont passées en paramètres (`$f0_duration`, ...) :
+    les requêtes de même forme ont le même texte Cypher, et Neo4j réutilise le plan déjà calculé.
+
+    Retourne un dictionnaire `{"query": <requête cypher>, "parameters": <paramètres ou None>, "ranking": <ranking>, "compile_time_ms": <durée>}`.
+    Lève `FuzzyCompilationError` si la requête est vide ou mal formulée.
+    """
+    source = query.source if isinstance(query, FuzzyQuery) else query
+    if not isinstance(source, str) or not source.strip():
+        raise FuzzyCompilationError("The fuzzy query is empty", "EmptyQuery", 0.0)
+
+    start = time.perf_counter()
+    try:
+        if parameterized:
+            crisp_query, parameters = compile_cache.compile(query, ranking, parameterized=True)
+        else:
+            crisp_query, parameters = compile_cache.compile(query, ranking), None
+    except Exception as e:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        raise FuzzyCompilationError(str(e) or "query may not be correctly formulated", type(e).__name__, elapsed_ms) from e
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return {"query": crisp_query, "parameters": parameters, "ranking": ranking, "compile_time_ms": elapsed_ms}
+
+
+def get_compile_cache_stats():
+    """ Compteurs du cache de compilation (hits / misses / evictions) """
+    return compile_cache.stats()
+
+
+def ensure_indexes(driver, wait=0):
+    """
+    Crée les index utilisés par les requêtes compilées (`schema.INDEXES`), s'ils n'existent pas déjà.
+    Appelé au démarrage de l'API : une base injoignable est signalée mais n'empêche pas le démarrage.
+    """
+    try:
+        indexes = create_indexes(driver, wait)
+    except Exception as e:
+        print(f"⚠️ Index non créés : {e}")
+        return None
+
+    print(f"✅ Index : {', '.join(f'{name} ({state})' for name, state in indexes)}")
+    return indexes
+
+
+def warm_up_plans(driver):
+    """
+    Prépare les plans des formes de requêtes courantes (`warmup.warm_up` : longueurs 3 à 15, modes simple,
+    transposition, contour et écart) pour que les premières recherches ne paient pas la planification.
+    Appelé au démarrage de l'API, après la création des index. Affiche et retourne le rapport (durée comprise).
+    """
+    report = warm_up(driver)
+    print(f"🔥 Warm-up : {format_warmup_report(report)}")
+    return report
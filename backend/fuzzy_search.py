@@ -0,0 +1,245 @@
+# fuzzy_search.py
+import asyncio
+import re
+import time
+
+from fuzzy_compiler import compile_fuzzy_query, FuzzyCompilationError  # ✅ Ajoute aussi `compilation_requete_fuzzy/` au sys.path
+from fuzzy_query import parse_fuzzy_query
+from utils import create_query_from_list_of_notes, create_query_from_contour, check_notes_input_format, check_pitch_distance
+from process_results import iter_scored_results, get_top_k_results, sequence_detail_to_dict, TopK
+
+# Même syntaxe que `main_parser write -C`
+CONTOUR_RE = re.compile(r'^(\*?[UD]|[ud]|R)+$')
+
+# Nombre de records classés par tâche de l'exécuteur (API asynchrone)
+RANKING_CHUNK_SIZE = 1000
+
+
+def _float_param(payload, name, default, mn=None, mx=None):
+    """ Lit un paramètre flottant de `payload` et vérifie qu'il est dans [mn ; mx] """
+    value = payload.get(name, default)
+    if value is None:
+        return default
+
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'"{name}" should be a float, but "{value}" was given')
+
+    if (mn is not None and value < mn) or (mx is not None and value > mx):
+        raise ValueError(f'"{name}" should be in [{mn if mn is not None else "-inf"} ; {mx if mx is not None else "+inf"}], but {value} was given')
+
+    return value
+
+
+def _parse_notes(notes):
+    """
+    Convertit les notes reçues en liste au format de `create_query_from_list_of_notes`, et les vérifie comme
+    `main_parser write` (`utils.check_notes_input_format`).
+    Accepte le format texte de `main_parser write` ("[[('c', 5), 4], ...]") ou du JSON ([[["c", 5], 4], ...]).
+    """
+    if isinstance(notes, list):
+        # En JSON, les tuples (classe, octave) arrivent sous forme de listes
+        notes = [
+            [tuple(element) if isinstance(element, list) else element for element in note_or_chord] if isinstance(note_or_chord, list) else note_or_chord
+            for note_or_chord in notes
+        ]
+
+    return check_notes_input_format(notes)
+
+
+def build_fuzzy_query(payload):
+    """
+    Construit la requête floue à partir des paramètres de la recherche (les mêmes que `main_parser write`) :
+        - notes               : les notes (ou le contour si `contour_match`) ;
+        - pitch_distance      : distance de hauteur (en tons, entier ou demi-entier), 0.0 par défaut ;
+        - duration_factor     : facteur de durée, 1.0 par défaut ;
+        - duration_gap        : écart de durée, 0.0 par défaut ;
+        - alpha               : seuil alpha dans [0 ; 1], 0.0 par défaut ;
+        - allow_transposition : autorise la transposition ;
+        - contour_match       : recherche par contour (`notes` est alors une chaîne comme "*URRudD") ;
+        - collections         : filtre sur une collection.
+
+    Lève `ValueError` si un paramètre est invalide.
+    """
+    pitch_distance = check_pitch_distance(_float_param(payload, "pitch_distance", 0.0))
+
+    duration_factor = _float_param(payload, "duration_factor", 1.0, 0, None)
+    duration_gap = _float_param(payload, "duration_gap", 0.0, 0, None)
+    alpha = _float_param(payload, "alpha", 0.0, 0, 1)
+    allow_transposition = bool(payload.get("allow_transposition", False))
+    contour_match = bool(payload.get("contour_match", False))
+    collections = payload.get("collections") or None
+
+    if allow_transposition and contour_match:
+        raise ValueError('not possible to use "allow_transposition" and "contour_match" at the same time')
+
+    notes = payload.get("notes")
+    if contour_match:
+        if not isinstance(notes, str) or not CONTOUR_RE.match(notes):
+            raise ValueError("With \"contour_match\", notes must be a string containing only '*U', 'U', 'u', 'R', 'd', 'D', and '*D'. Example: '*URRudD'.")
+        return create_query_from_contour(notes)
+
+    notes = _parse_notes(notes)
+    return create_query_from_list_of_notes(notes, pitch_distance, duration_factor, duration_gap, alpha, allow_transposition, contour_match, collections)
+
+
+def parse_top_k(payload):
+    """ Lit le paramètre optionnel `top_k` (entier positif ou None) """
+    top_k = payload.get("top_k")
+    if top_k is None:
+        return None
+
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 0:
+        raise ValueError(f'"top_k" should be a positive integer, but "{top_k}" was given')
+
+    return top_k
+
+
+def prepare_fuzzy_search(payload):
+    """
+    Construit, analyse et compile la requête floue d'une recherche.
+
+    Retourne `(fuzzy_query, compiled, top_k)` où `fuzzy_query` est la `FuzzyQuery` (utilisée pour le classement),
+    `compiled` le résultat de `compile_fuzzy_query` et `top_k` le nombre de résultats demandés (ou None).
+    Avec `rank_in_db` (qui demande `top_k`), le classement est fait par la base (`ORDER BY degree DESC LIMIT $k`).
+    La requête est compilée avec paramètres, pour que Neo4j réutilise le plan des requêtes de même forme.
+    Lève `FuzzyCompilationError` si les paramètres ou la requête sont invalides.
+    """
+    try:
+        top_k = parse_top_k(payload)
+        rank_in_db = bool(payload.get("rank_in_db", False))
+        if rank_in_db and top_k is None:
+            raise ValueError('"rank_in_db" needs "top_k"')
+        fuzzy_query = parse_fuzzy_query(build_fuzzy_query(payload))
+    except Exception as e:
+        raise FuzzyCompilationError(str(e) or "invalid search parameters", "InvalidParameters", 0.0) from e
+
+    return fuzzy_query, compile_fuzzy_query(fuzzy_query, rank_in_db, parameterized=True), top_k
+
+
+def query_parameters(compiled, top_k=None):
+    """ Paramètres d'exécution d'une requête compilée : ceux de la compilation, plus `$k` pour le classement par la base """
+    parameters = dict(compiled.get("parameters") or {})
+    if compiled.get("ranking"):
+        parameters["k"] = top_k
+    return parameters or None
+
+
+def iter_fuzzy_search(session, fuzzy_query, compiled, top_k=None):
+    """
+    Exécute la requête compilée sur `session` et produit les résultats au fur et à mesure :
+        - un dict `{"type": "match", ...}` par séquence qui passe le seuil alpha, dans l'ordre d'arrivée des records ;
+        - un dict `{"type": "summary", ...}` à la fin (nombre de records / de résultats, temps).
+
+    Avec `top_k`, seuls les `top_k` meilleurs résultats sont gardés (tas borné, cf `get_top_k_results`)
+    et envoyés triés par degré, une fois tous les records lus.
+
+    Les records sont lus un par un sur le `Result` neo4j (jamais matérialisés en liste).
+    Si la requête a été compilée avec `ranking`, la base ne renvoie que les `top_k` meilleurs records (paramètre `$k`).
+    En cas d'erreur pendant l'exécution, un dict `{"type": "error", ...}` est produit à la place du résumé.
+    """
+    start = time.perf_counter()
+    first_match_ms = None
+    counts = {"records": 0, "matches": 0}
+
+    def counted(records):
+        for record in records:
+            counts["records"] += 1
+            yield record
+
+    try:
+        parameters = query_parameters(compiled, top_k)
+        result = session.run(compiled["query"], parameters)
+        if top_k is None:
+            for seq_detail in iter_scored_results(counted(result), fuzzy_query):
+                if first_match_ms is None:
+                    first_match_ms = (time.perf_counter() - start) * 1000
+                counts["matches"] += 1
+                yield {"type": "match", **sequence_detail_to_dict(seq_detail)}
+        else:
+            best, counts["matches"] = get_top_k_results(counted(result), fuzzy_query, top_k)
+            for seq_detail in best:
+                if first_match_ms is None:
+                    first_match_ms = (time.perf_counter() - start) * 1000
+                yield {"type": "match", **sequence_detail_to_dict(seq_detail)}
+    except Exception as e:
+        yield {"type": "error", "error": {"type": type(e).__name__, "message": str(e)}}
+        return
+
+    yield {
+        "type": "summary",
+        "records": counts["records"],
+        "matches": counts["matches"],
+        "compile_time_ms": compiled["compile_time_ms"],
+        "first_match_ms": first_match_ms,
+        "elapsed_ms": (time.perf_counter() - start) * 1000,
+    }
+
+
+async def _record_chunks(result, size):
+    """ Regroupe les records d'un `AsyncResult` neo4j par paquets de `size` """
+    chunk = []
+    async for record in result:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _score_chunk(chunk, fuzzy_query):
+    """ Classe un paquet de records (exécuté dans un thread de l'exécuteur) """
+    return list(iter_scored_results(chunk, fuzzy_query))
+
+
+async def aiter_fuzzy_search(session, fuzzy_query, compiled, top_k=None, executor=None):
+    """
+    Version asynchrone de `iter_fuzzy_search`, pour une session du driver asynchrone (`neo4j.AsyncGraphDatabase`).
+    Produit les mêmes dicts (`match`, puis `summary` ou `error`), dans le même ordre.
+
+    Les records sont lus sans bloquer la boucle d'événements, par paquets de `RANKING_CHUNK_SIZE`.
+    Le calcul des degrés (CPU) de chaque paquet est fait dans `executor` (l'exécuteur par défaut si None),
+    pour que les autres requêtes continuent d'être servies pendant le classement.
+    """
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    first_match_ms = None
+    counts = {"records": 0, "matches": 0}
+
+    try:
+        parameters = query_parameters(compiled, top_k)
+        result = await session.run(compiled["query"], parameters)
+        best = TopK(top_k) if top_k is not None else None
+
+        async for chunk in _record_chunks(result, RANKING_CHUNK_SIZE):
+            counts["records"] += len(chunk)
+            if best is not None:
+                await loop.run_in_executor(executor, best.extend, iter_scored_results(chunk, fuzzy_query))
+                continue
+
+            for seq_detail in await loop.run_in_executor(executor, _score_chunk, chunk, fuzzy_query):
+                if first_match_ms is None:
+                    first_match_ms = (time.perf_counter() - start) * 1000
+                counts["matches"] += 1
+                yield {"type": "match", **sequence_detail_to_dict(seq_detail)}
+
+        if best is not None:
+            counts["matches"] = best.total
+            for seq_detail in best.results():
+                if first_match_ms is None:
+                    first_match_ms = (time.perf_counter() - start) * 1000
+                yield {"type": "match", **sequence_detail_to_dict(seq_detail)}
+    except Exception as e:
+        yield {"type": "error", "error": {"type": type(e).__name__, "message": str(e)}}
+        return
+
+    yield {
+        "type": "summary",
+        "records": counts["records"],
+        "matches": counts["matches"],
+        "compile_time_ms": compiled["compile_time_ms"],
+        "first_match_ms": first_match_ms,
+        "elapsed_ms": (time.perf_counter() - start) * 1000,
+    }
@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify
-from database import driver  # ✅ Connexion à Neo4j
+from database import get_db  # ✅ Session Neo4j de la requête
 import os
 
 collections_routes = Blueprint("collections", __name__)  # ✅ Nom correct du Blueprint
@@ -13,9 +13,8 @@ def get_collections():
         print("🟢 JSON Body :", request.get_json(silent=True))
 
         query = "MATCH (s:Score) RETURN DISTINCT s.collection"
-        with driver.session() as session:
-            result = session.run(query)
-            authors = [record["s.collection"] for record in result]
+        result = get_db().run(query)
+        authors = [record["s.collection"] for record in result]
 
         response = jsonify({"authors": authors})
         response.headers["Content-Type"] = "application/json"
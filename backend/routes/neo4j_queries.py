@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify
-from database import driver  # Vérifie que le driver est bien importé
+from database import get_db, get_pool_metrics
 
 neo4j_routes = Blueprint("neo4j", __name__)  # 🔥 Définit bien le Blueprint AVANT les routes
 
@@ -9,10 +9,15 @@ def execute_query():
     if any(kw in query.lower() for kw in ["create", "delete", "set", "remove", "detach", "load"]):
         return jsonify({"error": "Operation not allowed."}), 403
     try:
-        with driver.session() as session:
-            result = session.run(query)
-            results = [record.values() for record in result]
+        result = get_db().run(query)
+        results = [record.values() for record in result]
         return jsonify({"results": results})
     except Exception as e:
         print(f"Erreur /query: {e}")
         return jsonify({"error": str(e)}), 500
+
+
+@neo4j_routes.route("/pool", methods=["GET"])
+def pool_metrics():
+    """ 📊 Occupation du pool de connexions Neo4j, temps d'attente et nombre de connexions créées """
+    return jsonify(get_pool_metrics())
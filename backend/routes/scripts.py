@@ -1,15 +1,20 @@
 from flask import Blueprint, request, jsonify
-import subprocess
+from fuzzy_compiler import compile_fuzzy_query, get_compile_cache_stats, FuzzyCompilationError  # ✅ Compilateur chargé une seule fois
 
 script_routes = Blueprint("scripts", __name__)  # ✅ Définition correcte du Blueprint
 
 @script_routes.route("/compileFuzzy", methods=["POST"])
 def compile_fuzzy():
     print("✅ /scripts/compileFuzzy a bien reçu une requête")  # LOG
-    query = request.json.get("query", "")
+    payload = request.get_json(silent=True) or {}
+    query = payload.get("query", "")
     try:
-        result = subprocess.run(["python3", "compilation_requete_fuzzy/main_parser.py", "compile", query],
-                                capture_output=True, text=True)
-        return jsonify({"results": result.stdout})
-    except Exception as e:
-        return jsonify({"error": str(e)})
+        compiled = compile_fuzzy_query(query)
+    except FuzzyCompilationError as e:
+        return jsonify({"error": e.to_dict(), "compile_time_ms": e.compile_time_ms}), 400
+    return jsonify({"results": compiled["query"], "compile_time_ms": compiled["compile_time_ms"]})
+
+@script_routes.route("/compileCache", methods=["GET"])
+def compile_cache_stats():
+    """ 📊 Statistiques du cache de compilation """
+    return jsonify(get_compile_cache_stats())
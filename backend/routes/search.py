@@ -1,5 +1,9 @@
-from flask import Blueprint, request, jsonify
-from database import driver  # Import du driver Neo4j
+import json
+
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from database import driver, get_db  # Import du driver Neo4j
+from fuzzy_compiler import FuzzyCompilationError
+from fuzzy_search import prepare_fuzzy_search, iter_fuzzy_search
 
 search_routes = Blueprint("search", __name__)  # 🔥 Correction du nom du Blueprint
 
@@ -9,9 +13,30 @@ def search():
     results = []
     try:
         search_query = "MATCH (s:Score) WHERE s.source CONTAINS $query RETURN s ORDER BY s.source DESC"
-        with driver.session() as session:
-            result = session.run(search_query, query=query_text)
-            results = [record["s"] for record in result]
+        result = get_db().run(search_query, {"query": query_text})
+        results = [record["s"] for record in result]
     except Exception as e:
         print(f"Erreur /search: {e}")
     return jsonify({"results": results})
+
+@search_routes.route("/fuzzy", methods=["POST"])
+def fuzzy_search():
+    """
+    🔎 Recherche floue complète : construit la requête floue (mêmes paramètres que `main_parser write`),
+    la compile, l'exécute et renvoie les résultats classés en NDJSON (une ligne JSON par résultat),
+    au fur et à mesure de leur calcul. La dernière ligne est un résumé (`"type": "summary"`).
+    Avec `top_k`, seuls les `top_k` meilleurs résultats sont renvoyés, triés par degré.
+    """
+    payload = request.get_json(silent=True) or {}
+    try:
+        fuzzy_query, compiled, top_k = prepare_fuzzy_search(payload)
+    except FuzzyCompilationError as e:
+        return jsonify({"error": e.to_dict(), "compile_time_ms": e.compile_time_ms}), 400
+
+    def generate():
+        # Session propre au flux : elle vit tant que les résultats sont envoyés
+        with driver.session() as session:
+            for line in iter_fuzzy_search(session, fuzzy_query, compiled, top_k):
+                yield json.dumps(line) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")